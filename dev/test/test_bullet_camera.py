@@ -0,0 +1,165 @@
+"""Tests for BulletCameraInterface rendering and the AsyncBulletRenderer.
+"""
+import os
+import numpy as np
+import pybullet
+import pybullet_data
+import pytest
+from perls2.utils.yaml_config import YamlConfig
+from perls2.worlds.bullet_world import BulletWorld
+
+
+@pytest.fixture
+def config():
+    config = YamlConfig('dev/test/test_bullet_cfg.yaml')
+    config['world']['robot'] = 'panda'
+    config['sensor']['cameras'] = {
+        'side_camera': {
+            'image': {'height': 64, 'width': 96},
+            'extrinsics': {'eye_position': [0.0, 1.0, 0.6],
+                           'target_position': [0.6, 0.0, 0.2],
+                           'up_vector': [0., 0., 1.]},
+            'intrinsics': {'fov': 60, 'near_plane': 0.02, 'far_plane': 10}}}
+    return config
+
+
+def legacy_frames(camera):
+    """Frames as processed before rendering into buffers.
+    """
+    params = camera.render_params()
+    height, width = params['image_height'], params['image_width']
+    near, far = params['near'], params['far']
+    _, _, rgba, depth, segmask = pybullet.getCameraImage(
+        height=height, width=width,
+        viewMatrix=params['view_matrix'],
+        projectionMatrix=params['projection_matrix'],
+        physicsClientId=camera._physics_id)
+    rgba = np.array(rgba).astype('uint8').reshape((height, width, 4))
+    z_n = 2.0 * np.array(depth).astype('float32').reshape((height, width)) - 1.0
+    depth = 2.0 * near * far / (far + near - z_n * (far - near))
+    segmask = np.array(segmask).astype('uint8').reshape((height, width))
+    return {'rgb': np.invert(rgba[:, :, :3]), 'depth': depth,
+            'segmask': segmask, 'rgba': rgba}
+
+
+def test_frames_match_legacy_processing(config):
+    config['sensor']['camera']['reuse_buffers'] = True
+    world = BulletWorld(config)
+    try:
+        assert set(world.camera_interfaces) == {'camera', 'side_camera'}
+        for camera in world.camera_interfaces.values():
+            expected = legacy_frames(camera)
+            frames = camera.frames()
+            for modality in ['rgb', 'segmask', 'rgba']:
+                np.testing.assert_array_equal(frames[modality], expected[modality])
+            np.testing.assert_allclose(frames['depth'], expected['depth'], rtol=1e-5)
+            np.testing.assert_array_equal(camera.frames_rgb()['rgb'], expected['rgba'][:, :, :3])
+
+        frames = world.camera_interface.frames(depth=False, segmask=False)
+        assert set(frames) == {'rgb', 'rgba'}
+        # Reused buffers alternate between two sets.
+        buffers = [world.camera_interface.frames()['rgba'] for _ in range(3)]
+        assert buffers[0] is not buffers[1] and buffers[0] is buffers[2]
+    finally:
+        pybullet.disconnect(world.physics_id)
+
+
+def test_async_frames_match_sync(config):
+    config['sensor']['async_render'] = {'num_workers': 2}
+    world = BulletWorld(config)
+    try:
+        renderer = world.async_renderer
+        assert renderer.num_workers == 2
+        world.robot_interface.set_joints_to_neutral_positions()
+        pybullet.resetJointState(world.arena.arm_id, 0, 0.5, physicsClientId=world.physics_id)
+        world.step()
+        for name, camera in world.camera_interfaces.items():
+            frames = camera.frames()
+            expected = legacy_frames(camera)
+            for modality in ['rgb', 'segmask', 'rgba']:
+                np.testing.assert_array_equal(frames[modality], expected[modality])
+            np.testing.assert_allclose(frames['depth'], expected['depth'], rtol=1e-5)
+
+        # Frames of a state changed outside of a step are rendered after
+        # discarding the request.
+        pybullet.resetJointState(world.arena.arm_id, 0, -0.5, physicsClientId=world.physics_id)
+        world.camera_interface.stop()
+        np.testing.assert_array_equal(world.camera_interface.frames()['segmask'],
+                                      legacy_frames(world.camera_interface)['segmask'])
+
+        # Moving a camera or resetting an object also discards the request.
+        world.step()
+        world.camera_interface.place([0.5, 0.1, 0.9])
+        np.testing.assert_array_equal(world.camera_interface.frames()['segmask'],
+                                      legacy_frames(world.camera_interface)['segmask'])
+        world.step()
+        world.object_interfaces['013_apple'].set_pose([0.6, -0.2, 0.1, 0, 0, 0, 1])
+        np.testing.assert_array_equal(world.camera_interface.frames()['segmask'],
+                                      legacy_frames(world.camera_interface)['segmask'])
+    finally:
+        world.async_renderer.close()
+        pybullet.disconnect(world.physics_id)
+
+
+def test_async_mirror_ids(config):
+    config['sensor']['async_render'] = {'num_workers': 1}
+    world = BulletWorld(config)
+    try:
+        # A body loaded outside of the arena is not mirrored, so the ids of
+        # objects added afterwards differ between the world and the mirror.
+        hidden_id = pybullet.loadURDF(os.path.join(pybullet_data.getDataPath(), 'cube_small.urdf'),
+                                      [5.0, 5.0, -5.0],
+                                      physicsClientId=world.physics_id)
+        obj = world.add_object(config['object']['object_dict']['object_0']['path'],
+                               'apple_2', [0.6, 0.2, 0.05, 0, 0, 0, 1])
+        renderer = world.async_renderer
+        assert obj.obj_id not in renderer._mirror_ids.values()
+        assert hidden_id not in renderer._mirror_ids
+        world.step()
+        expected = legacy_frames(world.camera_interface)
+        assert obj.obj_id in expected['segmask']
+        frames = world.camera_interface.frames()
+        np.testing.assert_array_equal(frames['segmask'], expected['segmask'])
+        np.testing.assert_array_equal(frames['rgb'], expected['rgb'])
+
+        world.remove_object('apple_2')
+        world.step()
+        np.testing.assert_array_equal(world.camera_interface.frames()['segmask'],
+                                      legacy_frames(world.camera_interface)['segmask'])
+    finally:
+        world.async_renderer.close()
+        pybullet.disconnect(world.physics_id)
+
+
+def test_deproject_image(config):
+    world = BulletWorld(config)
+    try:
+        camera = world.camera_interface
+        view_matrix = camera.view_matrix
+        assert camera.view_matrix is view_matrix
+        camera.place([0.5, 0.1, 0.9])
+        assert camera.view_matrix is not view_matrix
+
+        frames = camera.frames()
+        table_id = world.arena.scene_objects_dict['table']
+        mask = frames['segmask'] == table_id
+        points = camera.deproject_image(frames['depth'], mask=mask)
+        assert points.shape == (mask.sum(), 3)
+        rows, cols = np.nonzero(mask)
+        np.testing.assert_allclose(
+            camera.deproject((cols[0], rows[0]), frames['depth'][rows[0], cols[0]]), points[0])
+
+        # Rays from the camera through the points hit the table at the points.
+        eye = np.array(camera.cameraEyePosition)
+        points = points[::10]
+        hits = pybullet.rayTestBatch([eye.tolist()] * len(points),
+                                     (eye + 1.5 * (points - eye)).tolist(),
+                                     physicsClientId=world.physics_id)
+        assert np.mean([hit[0] == table_id for hit in hits]) > 0.95
+        errors = np.linalg.norm(np.array([hit[3] for hit in hits]) - points, axis=1)
+        assert np.median(errors) < 1e-3
+
+        camera_points = camera.deproject_image(frames['depth'], is_world_frame=False)
+        np.testing.assert_allclose(camera_points[:, 2], frames['depth'].ravel())
+    finally:
+        pybullet.disconnect(world.physics_id)
@@ -0,0 +1,68 @@
+"""Tests for the batched object states of BulletWorld.
+"""
+import numpy as np
+import pybullet
+import pytest
+from perls2.utils.yaml_config import YamlConfig
+from perls2.worlds.bullet_world import BulletWorld
+
+APPLE_PATH = 'objects/ycb/013_apple/google_16k/textured.urdf'
+
+
+@pytest.fixture
+def world():
+    config = YamlConfig('dev/test/test_bullet_cfg.yaml')
+    config['world']['robot'] = 'panda'
+    world = BulletWorld(config)
+    world.add_object(APPLE_PATH, 'apple2', [0.6, 0.2, 0.3, 0, 0, 0, 1])
+    yield world
+    pybullet.disconnect(world.physics_id)
+
+
+def test_poses_match_object_interfaces(world):
+    assert world.object_registry.names == ['013_apple', 'apple2']
+    states = world.object_registry.states()
+    assert world.object_registry.states() is states
+    poses = world.poses()
+    assert poses.shape == (2, 7)
+    for pose, name in zip(poses, world.object_registry.names):
+        np.testing.assert_allclose(pose, world.object_interfaces[name].pose)
+    assert world.velocities(['apple2']).shape == (1, 6)
+
+    new_poses = [[0.5, 0.0, 0.5, 0, 0, 0, 1], [0.6, -0.1, 0.6, 0, 0, 0, 1]]
+    world.set_poses(['apple2', '013_apple'], new_poses)
+    np.testing.assert_allclose(world.poses(['apple2', '013_apple']), new_poses)
+    assert world.object_interfaces['apple2'].pose == new_poses[0]
+
+    world.object_interfaces['apple2'].set_position([0.5, 0.1, 0.5])
+    np.testing.assert_allclose(world.object_interfaces['apple2'].position, [0.5, 0.1, 0.5])
+    world.step()
+    assert world.object_registry.states() is not states
+    assert world.object_interfaces['apple2'].position[2] < 0.5
+
+    world.remove_object('apple2')
+    assert world.poses().shape == (1, 7)
+
+
+def test_wait_until_stable(world):
+    world.set_poses(['apple2'], [[0.6, 0.2, 0.3, 0, 0, 0, 1]])
+    world.wait_until_stable(check_after_steps=10, min_stable_steps=20, max_steps=2000)
+    velocities = world.velocities()
+    assert np.all(np.linalg.norm(velocities[:, :3], axis=1) < 0.005)
+    assert np.all(np.linalg.norm(velocities[:, 3:], axis=1) < 0.005)
+    assert world.poses(['apple2'])[0, 2] < 0.3
+
+
+def test_clear_state_cache_after_restore(world):
+    assert world.object_registry.sim_step is world.sim_step
+    state_id = pybullet.saveState(physicsClientId=world.physics_id)
+    poses = world.poses()
+    q = world.robot_interface.q
+    world.set_poses(['apple2'], [[0.5, 0.0, 0.5, 0, 0, 0, 1]])
+    world.robot_interface.set_joints_pos_vel(q[:7] + 0.1)
+    assert world.poses(['apple2'])[0, 2] == 0.5
+
+    pybullet.restoreState(stateId=state_id, physicsClientId=world.physics_id)
+    world.clear_state_cache()
+    np.testing.assert_allclose(world.poses(), poses)
+    np.testing.assert_allclose(world.robot_interface.q, q)
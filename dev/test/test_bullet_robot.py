@@ -25,6 +25,11 @@ def get_robot_states(env):
     assert np.shape(env.robot_interface.angular_jacobian) == (3, 7)
     assert np.shape(env.robot_interface.mass_matrix) == (7, 7)
     assert len(env.robot_interface.N_q) == 7
+    assert len(env.robot_interface.gravity_vector) == 7
+    state = env.robot_interface.state_dict
+    assert np.shape(state['lambda']) == (6, 6)
+    assert np.shape(state['nullspace_matrix']) == (7, 7)
+    assert np.shape(state['N_x']) == (6, )
 
 
 env = Env(config='dev/test/test_bullet_cfg.yaml',
@@ -0,0 +1,68 @@
+"""Tests for the per step state cache of BulletRobotInterface.
+"""
+import numpy as np
+import pybullet
+import pytest
+from perls2.utils.yaml_config import YamlConfig
+from perls2.worlds.bullet_world import BulletWorld
+
+
+@pytest.fixture
+def world():
+    config = YamlConfig('dev/test/test_bullet_cfg.yaml')
+    config['world']['robot'] = 'panda'
+    world = BulletWorld(config)
+    yield world
+    pybullet.disconnect(world.physics_id)
+
+
+def test_cache_keyed_on_world_step(world):
+    robot = world.robot_interface
+    assert robot.sim_step is world.sim_step
+    q = robot.q
+    robot.mass_matrix
+    assert robot._dynamics_step == world.sim_step.value
+
+    # Changing the state through pybullet is not seen until the step is bumped.
+    pybullet.resetJointState(robot.arm_id, 0, q[0] + 0.5, physicsClientId=world.physics_id)
+    assert robot.q[0] == q[0]
+    state_id = pybullet.saveState(physicsClientId=world.physics_id)
+    world.step()
+    assert robot.q[0] == pytest.approx(q[0] + 0.5, abs=0.1)
+    assert robot._dynamics_step != world.sim_step.value
+
+    robot.set_joints_pos_vel(q[:7])
+    np.testing.assert_allclose(robot.q[:7], q[:7])
+    robot.reset()
+    np.testing.assert_allclose(robot.q[:7], robot.limb_neutral_positions[:7])
+
+    pybullet.restoreState(stateId=state_id, physicsClientId=world.physics_id)
+    step = world.sim_step.value
+    robot.step_simulation()
+    assert world.sim_step.value == step + 1
+    assert robot.q[0] == pytest.approx(q[0] + 0.5, abs=0.1)
+
+
+def test_model_filled_in_place(world):
+    robot = world.robot_interface
+    model = robot.model
+    arrays = [model.ee_pos, model.ee_ori_mat, model.joint_pos, model.J_full,
+              model.mass_matrix, model.torque_compensation]
+    robot.move_ee_delta(np.array([0.05, 0, 0, 0, 0, 0]))
+    world.step()
+
+    # The arrays are reused, with the state of the last substep.
+    assert all(new is old for new, old in zip(
+        [model.ee_pos, model.ee_ori_mat, model.joint_pos, model.J_full,
+         model.mass_matrix, model.torque_compensation], arrays))
+    assert model.J_pos.base is model.J_full
+    robot.update_model()
+    np.testing.assert_allclose(model.ee_pos, robot.ee_position)
+    np.testing.assert_allclose(model.ee_ori_mat, np.reshape(robot.rotation_matrix, (3, 3)), atol=1e-6)
+    np.testing.assert_allclose(model.joint_pos, robot.q)
+    np.testing.assert_allclose(model.joint_vel, robot.dq)
+    np.testing.assert_allclose(model.J_full, robot.jacobian)
+    np.testing.assert_allclose(model.torque_compensation, robot.N_q)
+    mass_matrix = robot.mass_matrix
+    mass_matrix[[4, 5, 6], [4, 5, 6]] += model.mass_matrix_offset_val
+    np.testing.assert_allclose(model.mass_matrix, mass_matrix)
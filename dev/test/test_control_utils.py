@@ -0,0 +1,86 @@
+"""Tests for the compiled control laws in control_utils.
+
+Compares the fused kernels with the control laws computed step by step.
+"""
+import numpy as np
+import perls2.controllers.utils.control_utils as C
+import perls2.controllers.utils.transform_utils as T
+
+
+def random_state(seed=0):
+    rng = np.random.RandomState(seed)
+    A = rng.randn(7, 7)
+    state = {
+        'desired_pos': rng.randn(3),
+        'desired_ori': T.quat2mat(T.random_quat(rng.rand(3))),
+        'ee_pos': rng.randn(3),
+        'ee_ori_mat': T.quat2mat(T.random_quat(rng.rand(3))),
+        'ee_pos_vel': rng.randn(3),
+        'ee_ori_vel': rng.randn(3),
+        'kp': np.ones(6) * 50.0,
+        'kv': np.ones(6) * 2 * np.sqrt(50.0),
+        'mass_matrix': np.dot(A, A.T) + np.eye(7),
+        'J_pos': rng.randn(3, 7),
+        'J_ori': rng.randn(3, 7),
+        'torque_compensation': rng.randn(7),
+        'joint_pos': rng.randn(7),
+        'joint_vel': rng.randn(7),
+        'goal_posture': rng.randn(7),
+    }
+    return state
+
+
+def reference_ee_impedance_torques(s, uncouple_pos_ori):
+    ori_error = C.orientation_error(s['desired_ori'], s['ee_ori_mat'])
+    desired_force = np.multiply(s['desired_pos'] - s['ee_pos'], s['kp'][0:3]) + \
+        np.multiply(-s['ee_pos_vel'], s['kv'][0:3])
+    desired_torque = np.multiply(ori_error, s['kp'][3:]) + np.multiply(-s['ee_ori_vel'], s['kv'][3:])
+    J_full = np.concatenate((s['J_pos'], s['J_ori']))
+    lambda_full, lambda_pos, lambda_ori, nullspace_matrix = C.opspace_matrices(
+        s['mass_matrix'], J_full, s['J_pos'], s['J_ori'])
+    if uncouple_pos_ori:
+        decoupled_wrench = np.concatenate([np.dot(lambda_pos, desired_force),
+                                           np.dot(lambda_ori, desired_torque)])
+    else:
+        decoupled_wrench = np.dot(lambda_full, np.concatenate([desired_force, desired_torque]))
+    torques = np.dot(J_full.T, decoupled_wrench) + s['torque_compensation']
+    return torques, nullspace_matrix
+
+
+def ee_args(s, uncouple_pos_ori):
+    return (s['desired_pos'], s['desired_ori'], s['ee_pos'], s['ee_ori_mat'],
+            s['ee_pos_vel'], s['ee_ori_vel'], s['kp'], s['kv'], s['mass_matrix'],
+            np.concatenate((s['J_pos'], s['J_ori'])), s['torque_compensation'], uncouple_pos_ori)
+
+
+def test_ee_impedance_torques():
+    s = random_state()
+    for uncouple_pos_ori in [False, True]:
+        torques, nullspace_matrix = C.ee_impedance_torques(*ee_args(s, uncouple_pos_ori))
+        expected_torques, expected_nullspace = reference_ee_impedance_torques(s, uncouple_pos_ori)
+        np.testing.assert_allclose(torques, expected_torques, rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(nullspace_matrix, expected_nullspace, rtol=1e-5, atol=1e-6)
+
+
+def test_ee_posture_torques():
+    s = random_state(1)
+    posture_gain = np.asarray(5.0)
+    torques, _ = C.ee_posture_torques(*ee_args(s, False) + (
+        s['goal_posture'], s['joint_pos'], s['joint_vel'], posture_gain))
+    expected_torques, nullspace_matrix = reference_ee_impedance_torques(s, False)
+    expected_torques = expected_torques + C.nullspace_torques(
+        s['mass_matrix'], nullspace_matrix, s['goal_posture'],
+        s['joint_pos'], s['joint_vel'], posture_gain)
+    np.testing.assert_allclose(torques, expected_torques, rtol=1e-5, atol=1e-6)
+
+
+def test_joint_impedance_torques():
+    s = random_state(2)
+    kp = np.ones(7) * 20.0
+    kv = np.ones(7) * 2 * np.sqrt(20.0)
+    torques = C.joint_impedance_torques(s['goal_posture'], s['joint_pos'], s['joint_vel'],
+                                        kp, kv, s['mass_matrix'], s['torque_compensation'])
+    desired_torque = np.multiply(s['goal_posture'] - s['joint_pos'], kp) + \
+        np.multiply(-s['joint_vel'], kv)
+    expected_torques = np.dot(s['mass_matrix'], desired_torque) + s['torque_compensation']
+    np.testing.assert_allclose(torques, expected_torques)
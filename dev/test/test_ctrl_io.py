@@ -0,0 +1,233 @@
+"""Tests for the redis I/O helpers of the Control Interfaces.
+
+Commands are exchanged through fakeredis, if it is installed.
+"""
+import threading
+import numpy as np
+import pytest
+from perls2.ros_interfaces.ctrl_io import LatestSlot, IOThread, dispatch_cmd_msgs, drain
+from perls2.ros_interfaces.redis_interface import RobotRedisInterface
+from perls2.ros_interfaces.redis_keys import *
+from perls2.ros_interfaces.redis_values import *
+
+
+def test_latest_slot_sequencing():
+    slot = LatestSlot()
+    assert slot.get() == (0, None)
+    slot.put('a')
+    slot.put('b')
+    # Readers only see the latest value, and can tell it is new by its seq.
+    assert slot.get() == (2, 'b')
+    assert slot.get() == (2, 'b')
+    slot.put(None)
+    assert slot.get() == (3, None)
+
+
+def test_latest_slot_concurrent_reader():
+    slot = LatestSlot()
+    num_puts = 10000
+    seen = []
+
+    def read():
+        while True:
+            seq, value = slot.get()
+            seen.append((seq, value))
+            if seq == num_puts:
+                break
+    reader = threading.Thread(target=read)
+    reader.start()
+    for index in range(1, num_puts + 1):
+        slot.put(index)
+    reader.join()
+    # Values always match their seq, and seqs never go back.
+    assert all(seq == (value or 0) for seq, value in seen)
+    seqs = [seq for seq, _ in seen]
+    assert seqs == sorted(seqs)
+
+
+def test_drain_concurrent_writer():
+    from collections import deque
+    queue = deque()
+    num_items = 10000
+    drained = []
+
+    def write():
+        for index in range(num_items):
+            queue.append(index)
+    writer = threading.Thread(target=write)
+    writer.start()
+    while writer.is_alive():
+        drained.extend(drain(queue))
+    writer.join()
+    drained.extend(drain(queue))
+    assert drained == list(range(num_items))
+
+
+def test_io_thread_error_stops_torque_loop():
+    def io_loop():
+        raise ConnectionError('redis went away')
+    running = threading.Event()
+    io_thread = IOThread(io_loop, running)
+    io_thread.start()
+    ticks = 0
+    while running.is_set() and ticks < 10 ** 7:
+        ticks += 1
+    assert not running.is_set()
+    with pytest.raises(ConnectionError):
+        io_thread.join()
+
+
+def test_io_thread_stops_on_disconnect():
+    running = threading.Event()
+    io_thread = IOThread(lambda: None, running)
+    io_thread.start()
+    io_thread.join()
+    assert not running.is_set()
+
+
+@pytest.fixture
+def redis_pair():
+    fakeredis = pytest.importorskip('fakeredis')
+    server = fakeredis.FakeServer()
+    env, ctrl = [RobotRedisInterface('localhost', 6379, cmd_transport=CMD_TRANSPORT_PUBSUB)
+                 for _ in range(2)]
+    for interface in [env, ctrl]:
+        interface._client = fakeredis.FakeRedis(server=server)
+    ctrl.subscribe_cmds()
+    return env, ctrl
+
+
+def test_state_history_batched_from_torque_loop(redis_pair):
+    from collections import deque
+    env, ctrl = redis_pair
+    ctrl.state_history_len = 1000
+    history_queue = deque(maxlen=ctrl.state_history_len)
+    num_ticks = 500
+
+    def torque_loop():
+        for tick in range(num_ticks):
+            history_queue.append(tick)
+    writer = threading.Thread(target=torque_loop)
+    writer.start()
+    # The I/O thread appends every queued tick, not only the latest.
+    while writer.is_alive() or history_queue:
+        ctrl.append_state_history([
+            {'tstamp': str(float(tick)), 'q': ctrl.encode_ndarray(np.full(7, tick, dtype=np.float64))}
+            for tick in drain(history_queue)])
+    writer.join()
+    states = env.get_state_history()
+    assert [state['tstamp'] for state in states] == list(range(num_ticks))
+    assert states[-1]['q'][0] == num_ticks - 1
+
+
+def test_dispatch_cmd_msgs(redis_pair):
+    env, ctrl = redis_pair
+    dispatched = []
+    gripper_values = []
+
+    def dispatch(cmd_type, goal):
+        dispatched.append((cmd_type, goal))
+
+    assert dispatch_cmd_msgs(ctrl, dispatch, gripper_values.append) == (True, None)
+    assert ctrl.get(ROBOT_CMD_LATENCY_KEY) is None
+
+    env.send_cmd(MOVE_EE_DELTA, {'delta': [0.1] * 6})
+    env.send_cmd(SET_GRIPPER_VALUE, {'value': 0.3})
+    env.send_cmd(RESET)
+    connected, latency = dispatch_cmd_msgs(ctrl, dispatch, gripper_values.append)
+    assert connected and latency >= 0
+    assert [cmd_type for cmd_type, _ in dispatched] == [MOVE_EE_DELTA.encode(), RESET.encode()]
+    np.testing.assert_allclose(dispatched[0][1]['delta'], [0.1] * 6)
+    assert [float(value) for value in gripper_values] == [0.3]
+    assert float(ctrl.get(ROBOT_CMD_LATENCY_KEY)) == pytest.approx(latency)
+
+    # Commands after a DISCONNECT are not dispatched.
+    env.send_cmd(DISCONNECT)
+    env.send_cmd(RESET)
+    del dispatched[:]
+    assert dispatch_cmd_msgs(ctrl, dispatch, gripper_values.append)[0] is False
+    assert dispatched == []
+
+
+def test_ingest_cmds_queues_for_torque_loop(redis_pair):
+    pytest.importorskip('rospy')
+    from collections import deque
+    from perls2.ros_interfaces.sawyer_ctrl_interface import SawyerCtrlInterface
+    env, ctrl = redis_pair
+    interface = SawyerCtrlInterface.__new__(SawyerCtrlInterface)
+    interface.redisClient = ctrl
+    interface.last_cmd_latency = None
+    interface._cmd_queue = deque()
+    interface.prev_gripper_state = 0.3
+    # The first read after subscribing only gets the subscribe confirmation.
+    assert interface._ingest_cmds()
+    env.send_cmd(SET_JOINT_POSITIONS, {'set_qpos': [0.0] * 7})
+    env.send_cmd(SET_GRIPPER_VALUE, {'value': 0.3})
+    assert interface._ingest_cmds()
+    assert [cmd_type for cmd_type, _ in interface._cmd_queue] == [SET_JOINT_POSITIONS.encode()]
+    env.send_cmd(DISCONNECT)
+    assert not interface._ingest_cmds()
+
+
+def test_run_threaded_stops_on_io_error(redis_pair):
+    pytest.importorskip('rospy')
+    from collections import deque
+    from perls2.ros_interfaces.sawyer_ctrl_interface import SawyerCtrlInterface
+    from perls2.utils.loop_scheduler import LoopScheduler
+    _, ctrl = redis_pair
+    interface = SawyerCtrlInterface.__new__(SawyerCtrlInterface)
+    interface.redisClient = ctrl
+    interface.io_rate = 100
+    interface.loop_scheduler = LoopScheduler(0.001)
+    interface._cmd_queue = deque()
+    interface._state_slot = LatestSlot()
+    interface._loop_stats_slot = LatestSlot()
+    interface._history_queue = deque()
+    interface._io_running = threading.Event()
+    interface.step = lambda: None
+    interface.get_robot_state = lambda: {}
+
+    def ingest_cmds():
+        raise ConnectionError('redis went away')
+    interface._ingest_cmds = ingest_cmds
+    with pytest.raises(ConnectionError):
+        interface.run_threaded()
+
+
+def test_run_threaded_records_every_tick(redis_pair):
+    pytest.importorskip('rospy')
+    from collections import deque
+    from perls2.ros_interfaces.sawyer_ctrl_interface import SawyerCtrlInterface
+    from perls2.utils.loop_scheduler import LoopScheduler
+    env, ctrl = redis_pair
+    ctrl.state_history_len = 10000
+    interface = SawyerCtrlInterface.__new__(SawyerCtrlInterface)
+    interface.redisClient = ctrl
+    interface.io_rate = 20
+    interface.loop_scheduler = LoopScheduler(0.001)
+    interface._cmd_queue = deque()
+    interface._state_slot = LatestSlot()
+    interface._loop_stats_slot = LatestSlot()
+    interface._history_queue = deque(maxlen=ctrl.state_history_len)
+    interface._io_running = threading.Event()
+    ticks = []
+
+    def step():
+        ticks.append(len(ticks))
+    interface.step = step
+    interface.get_robot_state = lambda: {'tstamp': float(ticks[-1]), 'q': np.zeros(7),
+                                         'dq': np.zeros(7), 'tau': np.zeros(7),
+                                         'ee_pose': np.zeros(7), 'ee_v': np.zeros(3)}
+    interface.update_redis = lambda state, history=True: None
+    io_iterations = []
+
+    def ingest_cmds():
+        io_iterations.append(len(ticks))
+        return len(io_iterations) < 5
+    interface._ingest_cmds = ingest_cmds
+    interface.run_threaded()
+
+    # The history has every tick, not one per I/O loop iteration.
+    tstamps = [state['tstamp'] for state in env.get_state_history()]
+    assert tstamps == ticks
+    assert len(ticks) > 10 * len(io_iterations)
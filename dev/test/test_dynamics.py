@@ -0,0 +1,144 @@
+"""Tests for the compiled rigid body dynamics of ik Chains.
+
+Compares the mass matrix and inverse dynamics of the Panda URDF from
+pybullet_data with pybullet. The finger joints are not in the chain, so
+they are lumped into the hand at position zero. The jacobian and mass
+matrix of the Sawyer chain used by SawyerCtrlInterface are compared too.
+"""
+import os
+import xml.etree.ElementTree as ET
+import numpy as np
+import pybullet
+import pybullet_data
+import pytest
+from perls2.utils.math.ik import Chain
+from perls2.utils.math.ik.urdf_utils import PYBULLET_DEFAULT_INERTIAL
+
+PANDA_URDF = os.path.join(pybullet_data.getDataPath(), 'franka_panda/panda.urdf')
+NUM_FINGER_JOINTS = 2
+
+
+@pytest.fixture(scope='module')
+def panda():
+    client = pybullet.connect(pybullet.DIRECT)
+    pybullet.setGravity(0, 0, -9.81, physicsClientId=client)
+    robot = pybullet.loadURDF(PANDA_URDF, useFixedBase=True,
+                              flags=pybullet.URDF_USE_INERTIA_FROM_FILE,
+                              physicsClientId=client)
+    yield client, robot
+    pybullet.disconnect(client)
+
+
+def panda_chain():
+    return Chain.from_urdf_file(PANDA_URDF, base_elements=['panda_link0'],
+                                active_links=[True] * 7 + [False] * 3,
+                                use_symbolic_matrix=False)
+
+
+def random_motion(seed):
+    rng = np.random.RandomState(seed)
+    q, dq, ddq = np.zeros((3, 10))
+    q[:7] = rng.uniform(-2.0, 2.0, 7)
+    dq[:7] = rng.randn(7)
+    ddq[:7] = rng.randn(7)
+    return q, dq, ddq
+
+
+def pybullet_joints(values):
+    return list(values[:7]) + [0.0] * NUM_FINGER_JOINTS
+
+
+def test_mass_matrix_matches_pybullet(panda):
+    client, robot = panda
+    dynamics = panda_chain().dynamics
+    for seed in range(3):
+        q, _, _ = random_motion(seed)
+        expected = np.array(pybullet.calculateMassMatrix(
+            robot, pybullet_joints(q), physicsClientId=client))[:7, :7]
+        np.testing.assert_allclose(dynamics.mass_matrix(q), expected, atol=1e-8)
+
+
+def test_inverse_dynamics_matches_pybullet(panda):
+    client, robot = panda
+    dynamics = panda_chain().dynamics
+    for seed in range(3):
+        q, dq, ddq = random_motion(seed)
+        expected = np.array(pybullet.calculateInverseDynamics(
+            robot, pybullet_joints(q), pybullet_joints(dq), pybullet_joints(ddq),
+            physicsClientId=client))[:7]
+        np.testing.assert_allclose(dynamics.inverse_dynamics(q, dq, ddq), expected, atol=1e-8)
+
+
+def test_batched_dynamics():
+    dynamics = panda_chain().dynamics
+    q, dq, ddq = [np.stack(values) for values in zip(*[random_motion(seed) for seed in range(4)])]
+    M = dynamics.mass_matrix(q)
+    assert M.shape == (4, 7, 7)
+    # M ddq + N(q, dq) = tau
+    tau = dynamics.inverse_dynamics(q, dq, ddq)
+    N = dynamics.coriolis_gravity_torques(q, dq)
+    np.testing.assert_allclose(np.einsum('kij,kj->ki', M, ddq[:, :7]) + N, tau, atol=1e-8)
+    np.testing.assert_allclose(dynamics.gravity_torques(q[0]),
+                               dynamics.inverse_dynamics(q[0], np.zeros(10), np.zeros(10)))
+
+
+SAWYER_URDF = 'data/robot/rethink/sawyer_description/urdf/sawyer_urdf.urdf'
+SAWYER_JOINTS = ['right_j{}'.format(i) for i in range(7)]
+SAWYER_EE = 'right_gripper_base'
+
+
+@pytest.fixture(scope='module')
+def sawyer(tmp_path_factory):
+    """Sawyer loaded as in SawyerCtrlInterface.
+
+    Visual and collision elements are removed, as not every mesh of the
+    urdf is in the repo. They do not change the dynamics.
+    """
+    tree = ET.parse(SAWYER_URDF)
+    for urdf_link in tree.getroot().iter('link'):
+        for element in urdf_link.findall('visual') + urdf_link.findall('collision'):
+            urdf_link.remove(element)
+    urdf_file = str(tmp_path_factory.mktemp('sawyer') / 'sawyer_urdf.urdf')
+    tree.write(urdf_file)
+
+    client = pybullet.connect(pybullet.DIRECT)
+    robot = pybullet.loadURDF(
+        urdf_file, useFixedBase=True,
+        flags=pybullet.URDF_USE_SELF_COLLISION_EXCLUDE_PARENT | pybullet.URDF_USE_INERTIA_FROM_FILE,
+        physicsClientId=client)
+    base_link_name = pybullet.getBodyInfo(robot, physicsClientId=client)[0].decode('utf-8')
+    chain = Chain.from_urdf_file(SAWYER_URDF, base_elements=[base_link_name],
+                                 tip_link=SAWYER_EE, use_symbolic_matrix=False,
+                                 default_inertial=PYBULLET_DEFAULT_INERTIAL)
+    chain.active_links = np.array([link.name in SAWYER_JOINTS for link in chain.links])
+    yield client, robot, chain
+    pybullet.disconnect(client)
+
+
+def test_sawyer_matches_pybullet(sawyer):
+    client, robot, chain = sawyer
+    joint_infos = [pybullet.getJointInfo(robot, i, physicsClientId=client)
+                   for i in range(pybullet.getNumJoints(robot, physicsClientId=client))]
+    free_joints = [info[1].decode('utf-8') for info in joint_infos
+                   if info[2] != pybullet.JOINT_FIXED]
+    ee_index = [info[12].decode('utf-8') for info in joint_infos].index(SAWYER_EE)
+    arm = [free_joints.index(name) for name in SAWYER_JOINTS]
+
+    rng = np.random.RandomState(0)
+    for _ in range(3):
+        q = rng.uniform(-2.0, 2.0, 7)
+        pb_q = np.zeros(len(free_joints))
+        pb_q[arm] = q
+        zeros = [0.0] * len(free_joints)
+        # With a zero local position, pybullet takes the jacobian at the link
+        # frame origin, not at the center of mass of the link.
+        linear, angular = pybullet.calculateJacobian(
+            robot, ee_index, [0, 0, 0], list(pb_q), zeros, zeros, physicsClientId=client)
+        expected_J = np.vstack([np.array(linear)[:, arm], np.array(angular)[:, arm]])
+        expected_M = np.array(pybullet.calculateMassMatrix(
+            robot, list(pb_q), physicsClientId=client))[np.ix_(arm, arm)]
+
+        positions = chain.active_to_full(q, np.zeros(len(chain.links)))
+        np.testing.assert_allclose(
+            chain.dynamics.jacobian(positions), expected_J, atol=1e-8)
+        np.testing.assert_allclose(chain.dynamics.mass_matrix(positions), expected_M, atol=1e-6)
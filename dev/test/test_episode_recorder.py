@@ -0,0 +1,64 @@
+"""Tests for the EpisodeRecorder.
+"""
+import os
+import numpy as np
+import pytest
+from perls2.utils.episode_recorder import EpisodeRecorder, load_episode
+
+
+def make_step(index):
+    return {'action': np.full(3, index, dtype=np.float64),
+            'reward': float(index),
+            'frames': {'rgb': np.full((8, 16, 3), index, dtype=np.uint8),
+                       'depth': np.full((8, 16), index / 10., dtype=np.float32)}}
+
+
+def test_record_and_load(tmpdir):
+    recorder = EpisodeRecorder(str(tmpdir), chunk_size=4, queue_size=2)
+    try:
+        for num_steps in [10, 3]:
+            episode_dir = recorder.start_episode()
+            for index in range(num_steps):
+                step = make_step(index)
+                recorder.record(step)
+                # Steps are copied, so buffers may be reused.
+                step['frames']['rgb'][:] = 255
+            assert recorder.end_episode() == episode_dir
+    finally:
+        recorder.close()
+
+    assert sorted(os.listdir(str(tmpdir))) == ['episode_0000', 'episode_0001']
+    episode = load_episode(os.path.join(str(tmpdir), 'episode_0000'))
+    assert sorted(episode) == ['action', 'frames/depth', 'frames/rgb', 'reward']
+    assert episode['frames/rgb'].shape == (10, 8, 16, 3)
+    np.testing.assert_array_equal(episode['frames/rgb'][:, 0, 0, 0], np.arange(10))
+    np.testing.assert_allclose(episode['frames/depth'][:, 0, 0], np.arange(10) / 10.)
+    np.testing.assert_array_equal(episode['reward'], np.arange(10))
+
+    episode = load_episode(os.path.join(str(tmpdir), 'episode_0001'), keys=['action'])
+    assert episode['action'].shape == (3, 3)
+
+
+def test_record_checks_step_structure(tmpdir):
+    recorder = EpisodeRecorder(str(tmpdir))
+    try:
+        with pytest.raises(ValueError):
+            recorder.record(make_step(0))
+        recorder.start_episode()
+        recorder.record(make_step(0))
+        step = make_step(1)
+        step['action'] = np.zeros(4)
+        with pytest.raises(ValueError):
+            recorder.record(step)
+    finally:
+        recorder.close()
+
+
+def test_video_encoding(tmpdir):
+    pytest.importorskip('cv2')
+    recorder = EpisodeRecorder(str(tmpdir), video_keys=['frames/rgb'])
+    recorder.start_episode(ep_num=3)
+    for index in range(5):
+        recorder.record(make_step(index))
+    recorder.close()
+    assert os.path.getsize(os.path.join(str(tmpdir), 'episode_0003', 'frames.rgb.mp4')) > 0
@@ -0,0 +1,218 @@
+"""Tests for the binary frame codec of the Kinect redis keys.
+"""
+import struct
+import numpy as np
+import pytest
+from perls2.ros_interfaces.frame_codec import (encode_frame, decode_frame,
+                                               set_frameset, get_frameset,
+                                               set_synced_frameset, get_synced_frameset,
+                                               get_latest_seq, FrameEncoder,
+                                               FrameBufferPool, copy_image_msg)
+from perls2.ros_interfaces.stream_config import StreamConfig
+
+
+def redis_encode(value):
+    """Encode a value as the Encoder of the pinned redis-py (3.3.8), which
+    rejects other bytes-like types such as memoryviews.
+    """
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise TypeError("Invalid input of type: '{}'".format(type(value).__name__))
+    return value.encode() if isinstance(value, str) else repr(value).encode()
+
+
+class DictRedis(object):
+    """Stores MSET / MGET values in a dict, like a redis client.
+    """
+    def __init__(self):
+        self.values = {}
+        self.published = []
+        self.num_calls = 0
+
+    def mset(self, mapping):
+        self.num_calls += 1
+        self.values.update((key, redis_encode(value)) for key, value in mapping.items())
+
+    def mget(self, keys):
+        self.num_calls += 1
+        return [self.values.get(key) for key in keys]
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    def pipeline(self, transaction=True):
+        return DictPipeline(self)
+
+
+class DictPipeline(object):
+    """Queues commands of a DictRedis until execute.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name, args))
+
+    def execute(self):
+        # The pipeline is a single round trip.
+        num_calls = self.client.num_calls
+        for name, args in self.commands:
+            getattr(self.client, name)(*args)
+        self.client.num_calls = num_calls + 1
+
+
+def random_frames(seed=0):
+    rng = np.random.RandomState(seed)
+    return {'rgb': rng.randint(0, 256, (48, 64, 3)).astype(np.uint8),
+            'depth': rng.randint(0, 8000, (48, 64)).astype(np.uint16),
+            'ir': rng.randint(0, 65536, (48, 64)).astype(np.uint16)}
+
+
+@pytest.mark.parametrize('compression', [None, 'zlib', 'png'])
+def test_lossless_roundtrip(compression):
+    for frame in random_frames().values():
+        decoded = decode_frame(encode_frame(frame, compression))
+        assert decoded.dtype == frame.dtype
+        np.testing.assert_array_equal(decoded, frame)
+
+
+def test_jpeg_is_lossy_for_uint8_only():
+    frames = random_frames()
+    smooth = np.tile(np.linspace(0, 255, 64).astype(np.uint8)[None, :, None], (48, 1, 3))
+    decoded = decode_frame(encode_frame(smooth, 'jpeg', jpeg_quality=95))
+    assert decoded.shape == smooth.shape
+    assert np.abs(decoded.astype(int) - smooth).mean() < 2.0
+    with pytest.raises(ValueError):
+        encode_frame(frames['depth'], 'jpeg')
+
+
+@pytest.mark.parametrize('compression', ['png', 'jpeg'])
+def test_image_compression_payload_is_encoded_bytes(compression):
+    rgb = np.tile(np.linspace(0, 255, 64).astype(np.uint8)[None, :, None], (48, 1, 3))
+    encoded = encode_frame(rgb, compression, jpeg_quality=95)
+    assert isinstance(encoded, bytes)
+    # The payload is the raw png / jpeg file, not a repr of the array.
+    header_size = len(encode_frame(rgb[:1, :1])) - 3
+    assert encoded[header_size:header_size + 3] in (b'\x89PN', b'\xff\xd8\xff')
+    decoded = decode_frame(encoded)
+    assert decoded.shape == rgb.shape and decoded.dtype == np.uint8
+    assert np.abs(decoded.astype(int) - rgb).max() <= (0 if compression == 'png' else 8)
+
+
+def test_compression_reduces_depth_size():
+    depth = np.tile(np.arange(64, dtype=np.uint16) * 10 + 500, (48, 1))
+    assert len(encode_frame(depth, 'png')) < len(encode_frame(depth)) / 4
+
+
+def test_decode_legacy_frame():
+    rgb = random_frames()['rgb']
+    legacy = struct.pack('>II', 48, 64) + rgb.tobytes()
+    np.testing.assert_array_equal(decode_frame(legacy), rgb)
+
+
+def test_frameset_roundtrip():
+    client = DictRedis()
+    frames = random_frames()
+    set_frameset(client, frames, 1234.5, {'rgb': 'jpeg', 'depth': 'png'})
+    frameset = get_frameset(client)
+    assert client.num_calls == 2
+    assert float(frameset['image_stamp']) == 1234.5
+    np.testing.assert_array_equal(frameset['depth'], frames['depth'])
+    np.testing.assert_array_equal(frameset['ir'], frames['ir'])
+    assert frameset['rgb'].shape == (48, 64, 3)
+
+
+def test_synced_frameset_ring_buffer():
+    client = DictRedis()
+    assert get_synced_frameset(client) is None
+    assert get_latest_seq(client) == 0
+    client.num_calls = 0
+    for seq in range(1, 7):
+        frames = random_frames(seq)
+        set_synced_frameset(client, frames, 1000.0 + seq, seq, ring_size=4)
+    assert client.num_calls == 6
+    assert [message for _, message in client.published] == [str(seq) for seq in range(1, 7)]
+    assert get_latest_seq(client) == 6
+
+    latest = get_synced_frameset(client)
+    assert latest['seq'] == 6
+    np.testing.assert_array_equal(latest['depth'], random_frames(6)['depth'])
+    assert float(get_synced_frameset(client, ('rgb',), seq=3)['image_stamp']) == 1003.0
+    # Framesets older than the ring buffer are overwritten.
+    with pytest.raises(ValueError):
+        get_synced_frameset(client, seq=2)
+
+
+def test_synced_frameset_stream_config_change():
+    client = DictRedis()
+    full_config = StreamConfig()
+    rgb_config = StreamConfig(['rgb'], size={'rgb': [32, 24]})
+    configs = [full_config, full_config, rgb_config, rgb_config, full_config]
+    for seq, config in enumerate(configs, 1):
+        set_synced_frameset(client, config.apply(random_frames(seq)), 1000.0 + seq, seq,
+                            ring_size=2)
+        frameset = get_synced_frameset(client)
+        assert frameset['seq'] == seq
+        # Frames of modalities dropped from the stream config are not read
+        # from an older frameset in the same ring buffer slot.
+        for modality in ['depth', 'ir']:
+            if modality in config.modalities:
+                np.testing.assert_array_equal(frameset[modality],
+                                              random_frames(seq)[modality])
+            else:
+                assert frameset[modality] is None
+        assert frameset['rgb'].shape[:2] == ((24, 32) if config is rgb_config else (48, 64))
+
+
+class ImageMsg(object):
+    """Fields of a sensor_msgs/Image used by copy_image_msg.
+    """
+    def __init__(self, frame, encoding):
+        self.height, self.width = frame.shape[:2]
+        self.encoding = encoding
+        self.is_bigendian = 0
+        self.step = frame.strides[0]
+        self.data = frame.tobytes()
+
+
+def test_encoder_reuses_buffer():
+    frames = random_frames()
+    for compression in [None, 'png']:
+        encoder = FrameEncoder(compression)
+        for frame in [frames['depth'], frames['ir'][:24]]:
+            encoded = encoder.encode(frame)
+            assert redis_encode(encoded) == encode_frame(frame, compression)
+            np.testing.assert_array_equal(decode_frame(encoded), frame)
+        # Smaller frames are written into the same buffer.
+        buffer = encoder._buffer
+        encoder.encode(frames['ir'][:12])
+        assert encoder._buffer is buffer
+
+    client = DictRedis()
+    encoders = {'rgb': FrameEncoder('jpeg'), 'depth': FrameEncoder(), 'ir': FrameEncoder('zlib')}
+    set_synced_frameset(client, frames, 1000.0, 1, encoders=encoders)
+    frameset = get_synced_frameset(client)
+    np.testing.assert_array_equal(frameset['depth'], frames['depth'])
+    np.testing.assert_array_equal(frameset['ir'], frames['ir'])
+
+
+def test_copy_image_msg():
+    frames = random_frames()
+    pool = FrameBufferPool(2)
+    buffers = [copy_image_msg(ImageMsg(frames['rgb'], 'bgr8'), 'bgr8', pool) for _ in range(3)]
+    np.testing.assert_array_equal(buffers[0], frames['rgb'])
+    assert buffers[0] is not buffers[1] and buffers[0] is buffers[2]
+
+    depth = copy_image_msg(ImageMsg(frames['depth'], '16UC1'), '16UC1', FrameBufferPool(2))
+    np.testing.assert_array_equal(depth, frames['depth'])
+    # Other encodings are left to cv_bridge.
+    assert copy_image_msg(ImageMsg(frames['rgb'], 'rgb8'), 'bgr8', pool) is None
@@ -0,0 +1,47 @@
+"""Tests for the approximate time synchronization of camera streams.
+"""
+import threading
+from perls2.ros_interfaces.frame_sync import ApproximateTimeSynchronizer
+
+
+def test_matches_closest_messages():
+    sync = ApproximateTimeSynchronizer(['rgb', 'depth'], slop=10.0)
+    assert sync.add('depth', 95.0, 'd0') is None
+    assert sync.add('depth', 101.0, 'd1') is None
+    frameset = sync.add('rgb', 100.0, 'r0')
+    assert frameset['seq'] == 1
+    assert frameset['timestamp'] == 100.0
+    assert frameset['frames'] == {'rgb': 'r0', 'depth': 'd1'}
+
+    # Messages further than slop apart are not matched.
+    assert sync.add('rgb', 133.0, 'r1') is None
+    assert sync.add('depth', 120.0, 'd2') is None
+    frameset = sync.add('depth', 134.0, 'd3')
+    assert frameset['seq'] == 2
+    assert frameset['frames'] == {'rgb': 'r1', 'depth': 'd3'}
+    # Matched messages are not reused.
+    assert sync.add('depth', 135.0, 'd4') is None
+
+
+def test_wait_for_frameset():
+    sync = ApproximateTimeSynchronizer(['rgb', 'depth'], slop=10.0)
+    assert sync.wait_for_frameset(0, timeout=0.01) is None
+
+    def capture():
+        sync.add('rgb', 0.0, 'r0')
+        sync.add('depth', 1.0, 'd0')
+
+    thread = threading.Thread(target=capture)
+    thread.start()
+    frameset = sync.wait_for_frameset(0, timeout=5.0)
+    thread.join()
+    assert frameset['seq'] == 1
+    assert sync.wait_for_frameset(1, timeout=0.01) is None
+    assert sync.latest() is frameset
+
+
+def test_start_seq():
+    sync = ApproximateTimeSynchronizer(['rgb', 'depth'], slop=10.0, start_seq=7)
+    assert sync.wait_for_frameset(7, timeout=0.01) is None
+    sync.add('rgb', 0.0, 'r0')
+    assert sync.add('depth', 1.0, 'd0')['seq'] == 8
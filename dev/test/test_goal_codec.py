@@ -0,0 +1,41 @@
+"""Test script for the binary command and goal codec.
+"""
+import numpy as np
+import pytest
+from perls2.ros_interfaces.goal_codec import encode_cmd_msg, decode_cmd_msg
+from perls2.ros_interfaces.redis_values import *
+
+
+def test_roundtrip_move_ee_delta():
+    delta = np.random.rand(6)
+    cmd_msg = decode_cmd_msg(encode_cmd_msg(MOVE_EE_DELTA, {'delta': delta, 'set_pos': None}, 1.5))
+    assert cmd_msg['cmd_type'] == MOVE_EE_DELTA
+    assert cmd_msg['tstamp'] == 1.5
+    assert np.array_equal(cmd_msg['goal']['delta'], delta)
+    assert cmd_msg['goal']['set_pos'] is None
+    assert cmd_msg['goal']['set_ori'] is None
+
+
+def test_roundtrip_gripper_value():
+    cmd_msg = decode_cmd_msg(encode_cmd_msg(SET_GRIPPER_VALUE, {'value': 0.25}))
+    assert cmd_msg['goal'] == {'value': 0.25}
+
+
+def test_cmd_without_goal():
+    cmd_msg = decode_cmd_msg(encode_cmd_msg(RESET))
+    assert cmd_msg['cmd_type'] == RESET
+    assert cmd_msg['goal'] is None
+
+
+def test_malformed_goals_fail():
+    with pytest.raises(ValueError):
+        encode_cmd_msg(SET_JOINT_TORQUES, {'torques': [0.0] * 6})
+    with pytest.raises(ValueError):
+        encode_cmd_msg(SET_EE_POSE, {'set_pos': [0.0] * 3})
+    with pytest.raises(ValueError):
+        encode_cmd_msg(SET_JOINT_DELTA, {'delta': [0.0] * 7, 'set_qpos': [0.0] * 7})
+
+
+def test_decode_legacy_json():
+    cmd_msg = decode_cmd_msg(b'{"cmd_type": "IDLE", "tstamp": 1.0, "goal": null}')
+    assert cmd_msg['cmd_type'] == IDLE
@@ -0,0 +1,98 @@
+"""Tests for the damped least squares IK solver on the Panda URDF.
+"""
+import os
+import numpy as np
+import pybullet_data
+from perls2.utils.math.ik.ik_solver import DLSIKSovler
+from perls2.utils.math.ik.inverse_kinematics import _pose_error
+
+PANDA_URDF = os.path.join(pybullet_data.getDataPath(), 'franka_panda/panda.urdf')
+
+
+def make_solver(**kwargs):
+    return DLSIKSovler(PANDA_URDF, base_elements=['panda_link0'],
+                       active_links=[True] * 7 + [False] * 3, **kwargs)
+
+
+def random_positions(solver, num_configs, seed=0):
+    rng = np.random.RandomState(seed)
+    links = solver._chain.links[:7]
+    positions = np.zeros((num_configs, len(solver._chain.links)))
+    positions[:, :7] = rng.uniform([link.bounds[0] for link in links],
+                                   [link.bounds[1] for link in links],
+                                   size=(num_configs, 7))
+    return positions
+
+
+def test_batch_solves_reachable_targets():
+    solver = make_solver()
+    goals = random_positions(solver, 20)
+    targets = solver._chain.forward_kinematics(goals)
+    # Start near the goals, as when warm starting along a trajectory.
+    positions, solved = solver.inverse_kinematics_batch(targets, goals + 0.2)
+    assert solved.all()
+    np.testing.assert_allclose(solver._chain.forward_kinematics(positions), targets, atol=1e-5)
+
+    bounds = np.array([link.bounds for link in solver._chain.links[:7]])
+    assert np.all(positions[:, :7] >= bounds[:, 0]) and np.all(positions[:, :7] <= bounds[:, 1])
+
+
+def test_warm_start_and_cache():
+    solver = make_solver(cache_size=2)
+    goals = random_positions(solver, 3, seed=1)
+    targets = solver._chain.forward_kinematics(goals)
+
+    first = solver.inverse_kinematics(targets[0], initial_positions=goals[0] + 0.1)
+    # Warm started from the previous solution, the arm stays in the same
+    # configuration although it is redundant.
+    nearby = solver._chain.forward_kinematics(np.array(first) + 0.01)
+    second = solver.inverse_kinematics(nearby)
+    np.testing.assert_allclose(solver._chain.forward_kinematics(second), nearby, atol=1e-5)
+    assert np.abs(np.array(second) - first).max() < 0.05
+
+    # Cached solutions are returned for targets within the cache resolution.
+    target = targets[0].copy()
+    target[:3, 3] += 1e-6
+    assert solver.inverse_kinematics(target) == first
+
+    # Least recently used solutions are evicted.
+    solver.inverse_kinematics(targets[2], initial_positions=goals[2] + 0.1)
+    assert len(solver._cache) == 2
+    assert solver._cache_key(nearby) not in solver._cache
+    assert solver._cache_key(targets[0]) in solver._cache
+
+
+def test_explicit_seed_bypasses_cache():
+    solver = make_solver()
+    goal = random_positions(solver, 1, seed=3)[0]
+    target = solver._chain.forward_kinematics(goal)
+    cached = solver.inverse_kinematics(target, initial_positions=goal + 0.3)
+    assert np.abs(np.array(cached) - goal).max() > 1e-3
+
+    # The goal is another solution of the redundant arm. Seeded with it,
+    # the solver keeps it instead of returning the cached solution.
+    seeded = solver.inverse_kinematics(target, initial_positions=goal)
+    np.testing.assert_allclose(seeded, goal, atol=1e-6)
+    # Its solution replaces the cached one.
+    assert solver.inverse_kinematics(target) == seeded
+
+
+def test_target_rotated_by_pi():
+    solver = make_solver()
+    start = random_positions(solver, 1, seed=2)[0]
+    # The last joint can turn the hand by pi within its limits.
+    start[6] = 1.5
+    frame = solver._chain.forward_kinematics(start)
+    # Flip the target 180 degrees about the z axis of the end effector.
+    target = frame.dot(np.diag([-1.0, -1.0, 1.0, 1.0]))
+    error = _pose_error(target, frame, 1.0)
+    np.testing.assert_allclose(error[:3], 0.0, atol=1e-12)
+    np.testing.assert_allclose(np.abs(error[3:]), np.pi * np.abs(frame[:3, 2]), atol=1e-8)
+
+    # The start is not a solution of the flipped target, and the solution
+    # found and cached has the target orientation.
+    positions, solved = solver.inverse_kinematics_batch([target], initial_positions=start)
+    assert solved[0]
+    assert np.abs(positions[0] - start).max() > 1.0
+    np.testing.assert_allclose(solver._chain.forward_kinematics(positions[0]), target, atol=1e-5)
+    np.testing.assert_array_equal(solver._cache[solver._cache_key(target)], positions[0])
@@ -0,0 +1,45 @@
+"""Tests for the intrinsics of the streams of KinectCameraInterface.
+
+The interface is created without its constructor, which connects to the
+KinectROSInterface, and writes to a stub redis client.
+"""
+import numpy as np
+import perls2.utils.image_utils as IU
+from perls2.sensors.kinect_camera_interface import KinectCameraInterface
+from perls2.ros_interfaces.stream_config import StreamConfig
+
+
+class SetRedis(object):
+    def __init__(self):
+        self.values = {}
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+def make_interface():
+    camera = KinectCameraInterface.__new__(KinectCameraInterface)
+    camera.redisClient = SetRedis()
+    camera.res_mode = 'sd'
+    camera.config = {'sensor': {}}
+    camera._load_calibration()
+    return camera
+
+
+def test_deproject_depth_with_depth_roi():
+    camera = make_interface()
+    rgb_roi, depth_roi = [100, 50, 200, 150], [40, 20, 320, 240]
+    camera.set_stream_config(['rgb', 'depth'], {'rgb': rgb_roi, 'depth': depth_roi},
+                             {'rgb': [100, 75]})
+    full_size = (512, 424)
+    np.testing.assert_allclose(
+        camera.K, StreamConfig(roi={'rgb': rgb_roi}, size={'rgb': [100, 75]}).intrinsics(
+            camera._full_K, 'rgb', full_size))
+    np.testing.assert_allclose(camera.depth_K[:2, 2], camera._full_K[:2, 2] - [40, 20])
+
+    # A depth frame cropped to its roi deprojects to the same points as the
+    # full depth frame.
+    full_depth = np.full((424, 512), 2.0)
+    expected = IU.deproject_image(full_depth, camera._full_K).reshape(424, 512, 3)
+    points = camera.deproject_image(full_depth[20:260, 40:360], is_world_frame=False)
+    np.testing.assert_allclose(points.reshape(240, 320, 3), expected[20:260, 40:360])
@@ -0,0 +1,121 @@
+"""Tests for the compiled kinematics of ik Chains.
+
+Uses the Panda URDF from pybullet_data, comparing forward kinematics with
+pybullet and the jacobians with finite differences.
+"""
+import os
+import numpy as np
+import pybullet
+import pybullet_data
+from perls2.utils.math.ik import Chain
+from perls2.utils.math.ik.urdf_utils import get_urdf_parameters
+
+PANDA_URDF = os.path.join(pybullet_data.getDataPath(), 'franka_panda/panda.urdf')
+
+
+def panda_chain():
+    # Joints 1-7 are revolute, followed by 3 fixed joints to the grasp target.
+    active_links = [True] * 7 + [False] * 3
+    return Chain.from_urdf_file(PANDA_URDF, base_elements=['panda_link0'],
+                                active_links=active_links,
+                                use_symbolic_matrix=False)
+
+
+def random_positions(chain, num_configs, seed=0):
+    rng = np.random.RandomState(seed)
+    positions = np.zeros((num_configs, len(chain.links)))
+    positions[:, :7] = rng.uniform(-2.0, 2.0, size=(num_configs, 7))
+    return positions
+
+
+def test_forward_kinematics_matches_pybullet():
+    chain = panda_chain()
+    positions = random_positions(chain, 5)
+    frames = chain.forward_kinematics(positions)
+    assert frames.shape == (5, 4, 4)
+
+    client = pybullet.connect(pybullet.DIRECT)
+    try:
+        robot = pybullet.loadURDF(PANDA_URDF, useFixedBase=True, physicsClientId=client)
+        link_names = [pybullet.getJointInfo(robot, i, physicsClientId=client)[12].decode()
+                      for i in range(pybullet.getNumJoints(robot, physicsClientId=client))]
+        tip = link_names.index('panda_grasptarget')
+        for q, frame in zip(positions, frames):
+            for i in range(7):
+                pybullet.resetJointState(robot, i, q[i], physicsClientId=client)
+            state = pybullet.getLinkState(robot, tip, computeForwardKinematics=1,
+                                          physicsClientId=client)
+            rotation = np.array(pybullet.getMatrixFromQuaternion(state[5])).reshape(3, 3)
+            np.testing.assert_allclose(frame[:3, 3], state[4], atol=1e-6)
+            np.testing.assert_allclose(frame[:3, :3], rotation, atol=1e-6)
+    finally:
+        pybullet.disconnect(client)
+
+    # Single configurations match the batch.
+    np.testing.assert_allclose(chain.forward_kinematics(positions[0]), frames[0])
+
+
+def test_jacobian_matches_finite_differences():
+    chain = panda_chain()
+    q = random_positions(chain, 1, seed=1)[0]
+    J = chain.jacobian(q)
+    assert J.shape == (6, 7)
+
+    eps = 1e-6
+    frame = chain.forward_kinematics(q)
+    for i in range(7):
+        dq = np.zeros_like(q)
+        dq[i] = eps
+        next_frame = chain.forward_kinematics(q + dq)
+        linear = (next_frame[:3, 3] - frame[:3, 3]) / eps
+        # Skew symmetric part of dR R^T gives the angular velocity.
+        dR = np.dot((next_frame[:3, :3] - frame[:3, :3]) / eps, frame[:3, :3].T)
+        angular = np.array([dR[2, 1], dR[0, 2], dR[1, 0]])
+        np.testing.assert_allclose(J[:3, i], linear, atol=1e-5)
+        np.testing.assert_allclose(J[3:, i], angular, atol=1e-5)
+
+
+def test_jacobian_dot_matches_finite_differences():
+    chain = panda_chain()
+    positions = random_positions(chain, 4, seed=2)
+    velocities = random_positions(chain, 4, seed=3)
+    Jdot = chain.jacobian_dot(positions, velocities)
+    assert Jdot.shape == (4, 6, 7)
+
+    eps = 1e-6
+    expected = (chain.jacobian(positions + eps * velocities) -
+                chain.jacobian(positions - eps * velocities)) / (2 * eps)
+    np.testing.assert_allclose(Jdot, expected, atol=1e-5)
+
+
+ORIGINLESS_URDF = """<robot name="originless">
+  <link name="base"/>
+  <link name="arm"/>
+  <link name="tip"/>
+  <joint name="shoulder" type="revolute">
+    <parent link="base"/>
+    <child link="arm"/>
+    <axis xyz="0 0 1"/>
+    <limit lower="-1" upper="1"/>
+  </joint>
+  <joint name="wrist" type="continuous">
+    <parent link="arm"/>
+    <child link="tip"/>
+    <origin xyz="0.5 0 0"/>
+  </joint>
+</robot>
+"""
+
+
+def test_joint_without_origin(tmp_path):
+    urdf_file = tmp_path / 'originless.urdf'
+    urdf_file.write_text(ORIGINLESS_URDF)
+    shoulder, wrist = get_urdf_parameters(str(urdf_file), base_elements=['base'],
+                                          use_symbolic_matrix=False)
+    np.testing.assert_array_equal(shoulder.translation, [0, 0, 0])
+    np.testing.assert_array_equal(shoulder.orientation, [0, 0, 0])
+    np.testing.assert_array_equal(shoulder.rotation, [0, 0, 1])
+    # Missing rpy and axis take their URDF defaults.
+    np.testing.assert_array_equal(wrist.translation, [0.5, 0, 0])
+    np.testing.assert_array_equal(wrist.orientation, [0, 0, 0])
+    np.testing.assert_array_equal(wrist.rotation, [1, 0, 0])
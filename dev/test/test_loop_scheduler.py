@@ -0,0 +1,97 @@
+"""Tests for the fixed rate LoopScheduler, with a simulated clock.
+"""
+import pytest
+import perls2.utils.loop_scheduler as loop_scheduler
+from perls2.utils.loop_scheduler import LoopScheduler, SKIP_MISSED, CATCH_UP
+
+PERIOD = 0.01
+# Time advanced by each clock read, so the spin tail terminates.
+CLOCK_STEP = 1e-6
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        self.now += CLOCK_STEP
+        return self.now
+
+    def sleep(self, duration):
+        self.sleeps.append(duration)
+        self.now += duration
+
+    def work(self, duration):
+        self.now += duration
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(loop_scheduler, '_clock', clock)
+    monkeypatch.setattr(loop_scheduler.time, 'sleep', clock.sleep)
+    return clock
+
+
+def run_ticks(scheduler, clock, work_times):
+    for work_time in work_times:
+        clock.work(work_time)
+        scheduler.wait()
+
+
+def test_deadlines_on_fixed_grid(clock):
+    scheduler = LoopScheduler(PERIOD, spin_time=0.0005)
+    run_ticks(scheduler, clock, [0.002, 0.004, 0.001])
+    # Ticks end on the deadlines, without accumulating drift.
+    assert clock.now == pytest.approx(3 * PERIOD, abs=1e-4)
+    # Sleeps stop spin_time before each deadline.
+    assert clock.sleeps[0] == pytest.approx(PERIOD - 0.002 - 0.0005, abs=1e-4)
+    assert len(clock.sleeps) == 3
+
+    stats = scheduler.stats()
+    assert stats['missed_deadlines'] == 0
+    assert stats['period'] == pytest.approx(PERIOD, abs=1e-4)
+    assert stats['max_period'] == pytest.approx(PERIOD, abs=1e-4)
+    assert stats['compute_time'] == pytest.approx(0.007 / 3, abs=1e-4)
+    assert stats['max_compute_time'] == pytest.approx(0.004, abs=1e-4)
+    assert stats['min_slack'] == pytest.approx(PERIOD - 0.004, abs=1e-4)
+
+
+def test_skip_missed_reschedules_from_now(clock):
+    scheduler = LoopScheduler(PERIOD, overrun_policy=SKIP_MISSED)
+    run_ticks(scheduler, clock, [0.025, 0.001, 0.001])
+    assert scheduler.missed_deadlines == 1
+    assert scheduler.stats()['min_slack'] == pytest.approx(PERIOD - 0.025, abs=1e-4)
+    # The schedule restarts from the end of the overrun tick.
+    assert clock.now == pytest.approx(0.025 + 2 * PERIOD, abs=1e-4)
+
+
+def test_catch_up_runs_missed_ticks(clock):
+    scheduler = LoopScheduler(PERIOD, overrun_policy=CATCH_UP, max_catch_up=5)
+    run_ticks(scheduler, clock, [0.025, 0.001, 0.001])
+    # The second tick is also late, the third is back on the grid.
+    assert scheduler.missed_deadlines == 2
+    assert clock.now == pytest.approx(3 * PERIOD, abs=1e-4)
+
+
+def test_catch_up_skips_beyond_max(clock):
+    scheduler = LoopScheduler(PERIOD, overrun_policy=CATCH_UP, max_catch_up=1)
+    run_ticks(scheduler, clock, [0.025, 0.001])
+    assert scheduler.missed_deadlines == 1
+    assert clock.now == pytest.approx(0.025 + PERIOD, abs=1e-4)
+
+
+def test_reset_stats_keeps_schedule(clock):
+    scheduler = LoopScheduler(PERIOD)
+    run_ticks(scheduler, clock, [0.025, 0.001])
+    scheduler.reset_stats()
+    assert scheduler.stats() == {'period': 0.0, 'max_period': 0.0, 'compute_time': 0.0,
+                                 'max_compute_time': 0.0, 'min_slack': PERIOD,
+                                 'missed_deadlines': 0}
+    run_ticks(scheduler, clock, [0.001])
+    assert scheduler.ticks == 1
+    assert clock.now == pytest.approx(0.025 + 2 * PERIOD, abs=1e-4)
+
+    with pytest.raises(ValueError):
+        LoopScheduler(PERIOD, overrun_policy='drop')
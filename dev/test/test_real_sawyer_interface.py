@@ -0,0 +1,67 @@
+"""Tests for the state snapshot of RealSawyerInterface.
+
+The interface is created without its constructor, which waits for the
+Control Interface, and reads from a stub redis client.
+"""
+import numpy as np
+from perls2.robots.real_sawyer_interface import RealSawyerInterface, STATE_SNAPSHOT_KEYS
+from perls2.ros_interfaces.redis_interface import RobotRedisInterface
+from perls2.ros_interfaces.redis_keys import *
+
+
+class CountingRedis(object):
+    """Stores values in a dict and counts round trips.
+    """
+    def __init__(self, values):
+        self.values = values
+        self.calls = []
+
+    def get(self, key):
+        self.calls.append(('get', [key]))
+        return self.values.get(key)
+
+    def mget(self, keys):
+        self.calls.append(('mget', list(keys)))
+        return [self.values.get(key) for key in keys]
+
+
+def make_interface():
+    redis_client = RobotRedisInterface('localhost', 6379)
+    values = {}
+    for index, key in enumerate(STATE_SNAPSHOT_KEYS.values()):
+        values[key] = (str(float(index)).encode() if key == ROBOT_STATE_TSTAMP_KEY
+                       else redis_client.encode_ndarray(np.full(3, float(index))))
+    redis_client._client = CountingRedis(values)
+
+    robot = RealSawyerInterface.__new__(RealSawyerInterface)
+    robot.redisClient = redis_client
+    robot._state_snapshot = None
+    return robot, redis_client._client
+
+
+def test_snapshot_is_one_mget():
+    robot, client = make_interface()
+    snapshot = robot.get_state_snapshot()
+    assert client.calls == [('mget', list(STATE_SNAPSHOT_KEYS[name] for name in snapshot))]
+    assert set(snapshot) == set(STATE_SNAPSHOT_KEYS)
+    for index, name in enumerate(STATE_SNAPSHOT_KEYS):
+        if name == 'tstamp':
+            assert snapshot[name] == float(index)
+        else:
+            np.testing.assert_array_equal(snapshot[name], np.full(3, float(index)))
+
+    # State properties are served from the snapshot.
+    np.testing.assert_array_equal(robot.q, snapshot['q'])
+    np.testing.assert_array_equal(robot.mass_matrix, snapshot['mass_matrix'])
+    assert len(client.calls) == 1
+
+
+def test_step_clears_snapshot():
+    robot, client = make_interface()
+    robot.get_state_snapshot()
+    robot.step()
+    assert robot._state_snapshot is None
+    # Without a snapshot, states are read from redis again.
+    index = list(STATE_SNAPSHOT_KEYS).index('ee_pose')
+    np.testing.assert_array_equal(robot.ee_pose, np.full(3, float(index)))
+    assert client.calls[1:] == [('get', [ROBOT_STATE_EE_POSE_KEY])]
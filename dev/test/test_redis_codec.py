@@ -0,0 +1,48 @@
+"""Test script for the binary redis codec used for robot states and models.
+"""
+import numpy as np
+import pytest
+import json
+from perls2.ros_interfaces.redis_codec import encode_ndarray, decode_ndarray
+
+
+def test_roundtrip_is_lossless():
+    q = np.random.rand(7) * 1e-7 + np.pi
+    decoded = decode_ndarray(encode_ndarray(q))
+    assert decoded.dtype == np.float64
+    assert np.array_equal(decoded, q)
+
+
+def test_roundtrip_keeps_shape():
+    jacobian = np.random.rand(6, 7)
+    decoded = decode_ndarray(encode_ndarray(jacobian))
+    assert decoded.shape == (6, 7)
+    assert np.array_equal(decoded, jacobian)
+
+
+def test_decode_legacy_list():
+    decoded = decode_ndarray(str([0.1, -0.2, 0.3]).encode())
+    assert np.allclose(decoded, [0.1, -0.2, 0.3])
+
+
+def test_decode_legacy_matrix():
+    mass_matrix = np.arange(49, dtype=np.float64).reshape(7, 7)
+    decoded = decode_ndarray(str(mass_matrix).encode())
+    assert decoded.shape == (7, 7)
+    assert np.allclose(decoded, mass_matrix)
+
+
+def test_decode_legacy_json_dict():
+    # The legacy ros redis interface wrote dq and tau as json dicts of the
+    # intera joint velocities and efforts, in no particular order.
+    joint_names = ['right_j{}'.format(i) for i in range(7)]
+    dq = dict((name, 0.1 * i) for i, name in enumerate(joint_names))
+    value = json.dumps(dict(reversed(list(dq.items())))).encode()
+    np.testing.assert_allclose(decode_ndarray(value), [0.1 * i for i in range(7)])
+    np.testing.assert_allclose(decode_ndarray(value, joint_names=joint_names[::-1]),
+                               [0.1 * i for i in range(7)][::-1])
+
+
+def test_legacy_disabled():
+    with pytest.raises(ValueError):
+        decode_ndarray(b'[0.1, 0.2]', legacy=False)
@@ -0,0 +1,146 @@
+"""Test script for redis connection pooling and the robot redis interface.
+
+Connections are made lazily, so no redis server is needed. Commands and
+state history are tested against fakeredis, if it is installed.
+"""
+import socket
+import numpy as np
+import pytest
+import perls2.ros_interfaces.redis_interface as redis_interface
+from perls2.ros_interfaces.redis_interface import (RedisInterface, RobotRedisInterface,
+                                                   get_connection_pool, resolve_host)
+from perls2.ros_interfaces.redis_keys import *
+from perls2.ros_interfaces.redis_values import *
+
+
+def test_interfaces_share_pool():
+    first = RedisInterface('localhost', 6379)
+    second = RedisInterface('localhost', 6379)
+    assert first._client.connection_pool is second._client.connection_pool
+
+
+def test_pools_per_server():
+    assert get_connection_pool('localhost', 6379) is not get_connection_pool('localhost', 6380)
+
+
+def test_pools_per_options():
+    pool = get_connection_pool('localhost', 6379)
+    assert get_connection_pool('localhost', 6379) is pool
+    assert get_connection_pool('localhost', 6379, health_check_interval=0) is not pool
+    assert get_connection_pool('localhost', 6379, reconnect_retries=0) is not pool
+    no_keepalive = get_connection_pool('localhost', 6379, socket_keepalive=False)
+    assert no_keepalive is not pool
+    assert not no_keepalive.connection_kwargs.get('socket_keepalive')
+
+
+def test_unix_socket_pool():
+    pool = get_connection_pool(unix_socket_path='/tmp/perls2_test_redis.sock')
+    assert pool.connection_kwargs['path'] == '/tmp/perls2_test_redis.sock'
+
+
+def test_resolve_host_cached(monkeypatch):
+    calls = []
+
+    def gethostbyname(host):
+        calls.append(host)
+        return '10.0.0.1'
+    monkeypatch.setattr(socket, 'gethostbyname', gethostbyname)
+    monkeypatch.setattr(redis_interface, '_RESOLVED_HOSTS', {})
+    assert resolve_host('robot-ctrl') == '10.0.0.1'
+    assert resolve_host('robot-ctrl') == '10.0.0.1'
+    assert calls == ['robot-ctrl']
+
+
+@pytest.fixture
+def fake_server():
+    fakeredis = pytest.importorskip('fakeredis')
+    return fakeredis, fakeredis.FakeServer()
+
+
+def fake_robot_redis(fake_server, **kwargs):
+    """RobotRedisInterface connected to a fake redis server.
+    """
+    fakeredis, server = fake_server
+    interface = RobotRedisInterface('localhost', 6379, **kwargs)
+    interface._client = fakeredis.FakeRedis(server=server)
+    return interface
+
+
+@pytest.mark.parametrize('use_binary_codec', [True, False])
+def test_pubsub_cmds_in_order(fake_server, use_binary_codec):
+    env = fake_robot_redis(fake_server, cmd_transport=CMD_TRANSPORT_PUBSUB,
+                           use_binary_codec=use_binary_codec)
+    ctrl = fake_robot_redis(fake_server, cmd_transport=CMD_TRANSPORT_PUBSUB)
+    # Commands sent before subscribing are not received.
+    env.send_cmd(RESET)
+    ctrl.subscribe_cmds()
+    assert ctrl.get_cmd_msgs() == []
+
+    for step in range(3):
+        env.send_cmd(MOVE_EE_DELTA, {'delta': [0.01 * step] * 6})
+    env.send_cmd(SET_GRIPPER_VALUE, {'value': 0.5})
+    env.send_cmd(DISCONNECT)
+
+    # All commands since the last tick are drained at once, in order.
+    cmd_msgs = ctrl.get_cmd_msgs()
+    assert [msg['cmd_type'] for msg in cmd_msgs] == [MOVE_EE_DELTA] * 3 + [SET_GRIPPER_VALUE,
+                                                                          DISCONNECT]
+    for step, msg in enumerate(cmd_msgs[:3]):
+        np.testing.assert_allclose(msg['goal']['delta'], [0.01 * step] * 6)
+    assert float(cmd_msgs[3]['goal']['value']) == 0.5
+    assert not cmd_msgs[4]['goal']
+    tstamps = [msg['tstamp'] for msg in cmd_msgs]
+    assert tstamps == sorted(tstamps)
+    assert ctrl.get_cmd_msgs() == []
+
+
+def history_state(interface, step):
+    encode = interface.encode_ndarray
+    return {'tstamp': str(float(step)),
+            'q': encode(np.full(7, step, dtype=np.float64)),
+            'dq': encode(np.zeros(7)),
+            'tau': encode(np.zeros(7)),
+            'ee_pose': encode(np.zeros(7)),
+            'ee_v': encode(np.zeros(3))}
+
+
+def test_state_history_capped_and_decoded(fake_server):
+    ctrl = fake_robot_redis(fake_server, state_history_len=10)
+    env = fake_robot_redis(fake_server)
+    for step in range(300):
+        ctrl.set_robot_state({ROBOT_STATE_Q_KEY: ctrl.encode_ndarray(np.full(7, step))},
+                             history_state(ctrl, step))
+    np.testing.assert_array_equal(env.get(ROBOT_STATE_Q_KEY), np.full(7, 299))
+    # MAXLEN is approximate, redis trims whole stream nodes of up to 100 entries.
+    assert 10 <= ctrl._client.xlen(ROBOT_STATE_HISTORY_KEY) <= 110
+
+    states = env.get_state_history(count=5)
+    assert [state['tstamp'] for state in states] == [295.0, 296.0, 297.0, 298.0, 299.0]
+    np.testing.assert_array_equal(states[-1]['q'], np.full(7, 299.0))
+    assert set(states[0]) == {'tstamp', 'q', 'dq', 'tau', 'ee_pose', 'ee_v'}
+
+    # Entries are added at increasing redis server times.
+    since = float(env._client.xrange(ROBOT_STATE_HISTORY_KEY, count=1)[0][0].split(b'-')[0])
+    assert len(env.get_state_history(since=since / 1000.0, count=3)) == 3
+
+
+def test_state_history_disabled(fake_server):
+    ctrl = fake_robot_redis(fake_server)
+    ctrl.set_robot_state({ROBOT_STATE_Q_KEY: ctrl.encode_ndarray(np.zeros(7))},
+                         history_state(ctrl, 0))
+    assert ctrl._client.xlen(ROBOT_STATE_HISTORY_KEY) == 0
+    assert ctrl.get_state_history() == []
+
+
+def test_real_sawyer_state_history_stacked(fake_server):
+    from perls2.robots.real_sawyer_interface import RealSawyerInterface
+    ctrl = fake_robot_redis(fake_server, state_history_len=100)
+    for step in range(4):
+        ctrl.set_robot_state({ROBOT_STATE_TSTAMP_KEY: str(float(step))},
+                             history_state(ctrl, step))
+    robot = RealSawyerInterface.__new__(RealSawyerInterface)
+    robot.redisClient = fake_robot_redis(fake_server)
+    history = robot.get_state_history()
+    assert history['q'].shape == (4, 7) and history['ee_v'].shape == (4, 3)
+    np.testing.assert_array_equal(history['tstamp'], [0.0, 1.0, 2.0, 3.0])
+    np.testing.assert_array_equal(history['q'][:, 0], [0.0, 1.0, 2.0, 3.0])
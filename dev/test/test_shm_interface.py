@@ -0,0 +1,72 @@
+"""Test script for the shared memory robot transport.
+
+Only exercises the shared memory, so no redis-server is needed.
+"""
+import time
+import numpy as np
+import pytest
+from perls2.ros_interfaces.redis_interface import make_robot_redis_interface
+from perls2.ros_interfaces.redis_keys import *
+from perls2.ros_interfaces.redis_values import *
+from perls2.ros_interfaces.shm_interface import CMD_RING_SLOTS
+
+
+def make_pair(tmp_path, **kwargs):
+    shm_path = str(tmp_path / 'perls2_robot')
+    ctrl = make_robot_redis_interface(transport='shm', host='localhost', port=6379,
+                                      shm_path=shm_path, **kwargs)
+    env = make_robot_redis_interface(transport='shm', host='localhost', port=6379,
+                                     shm_path=shm_path, **kwargs)
+    return ctrl, env
+
+
+def test_state_roundtrip(tmp_path):
+    ctrl, env = make_pair(tmp_path)
+    q = np.random.rand(7)
+    mass_matrix = np.random.rand(7, 7)
+    ctrl.set_robot_state({ROBOT_STATE_TSTAMP_KEY: '12.5',
+                          ROBOT_STATE_Q_KEY: ctrl.encode_ndarray(q),
+                          ROBOT_MODEL_MASS_MATRIX_KEY: ctrl.encode_ndarray(mass_matrix)})
+    tstamp, env_q, env_mass_matrix = env.mget(
+        [ROBOT_STATE_TSTAMP_KEY, ROBOT_STATE_Q_KEY, ROBOT_MODEL_MASS_MATRIX_KEY])
+    assert tstamp == 12.5
+    assert np.array_equal(env_q, q)
+    assert np.array_equal(env_mass_matrix, mass_matrix)
+
+
+def test_cmds_in_order(tmp_path):
+    ctrl, env = make_pair(tmp_path)
+    ctrl.subscribe_cmds()
+    env.send_cmd(CHANGE_CONTROLLER)
+    env.send_cmd(MOVE_EE_DELTA, {'delta': [0.1] * 6})
+    cmd_msgs = ctrl.get_cmd_msgs()
+    assert [msg['cmd_type'] for msg in cmd_msgs] == [CHANGE_CONTROLLER, MOVE_EE_DELTA]
+    assert np.array_equal(cmd_msgs[1]['goal']['delta'], [0.1] * 6)
+    assert ctrl.get_cmd_msgs() == []
+
+
+def test_cmd_ring_overflow_keeps_newest(tmp_path):
+    ctrl, env = make_pair(tmp_path)
+    ctrl.subscribe_cmds()
+    for i in range(CMD_RING_SLOTS + 3):
+        env.send_cmd(SET_JOINT_DELTA, {'delta': [i] * 7})
+    cmd_msgs = ctrl.get_cmd_msgs()
+    assert len(cmd_msgs) == CMD_RING_SLOTS
+    assert cmd_msgs[-1]['goal']['delta'][0] == CMD_RING_SLOTS + 2
+
+
+def test_reads_time_out_on_unfinished_write(tmp_path):
+    ctrl, env = make_pair(tmp_path, seqlock_timeout=0.05)
+    ctrl.set_robot_state({ROBOT_STATE_Q_KEY: ctrl.encode_ndarray(np.zeros(7))})
+    ctrl.subscribe_cmds()
+    # Writers that stopped in the middle of a write leave the seq odd.
+    ctrl._state_seq[0] += 1
+    env._cmd_slots[0, 0] += 1
+    env._cmd_count[0] += 1
+
+    start = time.time()
+    with pytest.raises(RuntimeError):
+        env.get(ROBOT_STATE_Q_KEY)
+    with pytest.raises(RuntimeError):
+        ctrl.get_cmd_msgs()
+    assert time.time() - start < 1.0
@@ -0,0 +1,57 @@
+"""Tests for the region of interest and resizing of the Kinect streams.
+"""
+import numpy as np
+import pytest
+from perls2.ros_interfaces.stream_config import StreamConfig
+
+
+def full_frames():
+    rng = np.random.RandomState(0)
+    return {'rgb': rng.randint(0, 256, (108, 192, 3)).astype(np.uint8),
+            'depth': rng.randint(0, 8000, (108, 192)).astype(np.uint16),
+            'ir': rng.randint(0, 65536, (42, 51)).astype(np.uint16)}
+
+
+def test_json_roundtrip():
+    config = StreamConfig(['rgb', 'depth'], {'rgb': [48, 27, 96, 54]}, [32, 18])
+    parsed = StreamConfig.from_json(config.to_json().encode())
+    assert parsed.modalities == ('rgb', 'depth')
+    assert parsed.roi == {'rgb': (48, 27, 96, 54)}
+    assert parsed.size['depth'] == (32, 18)
+    assert StreamConfig.from_json(None).modalities == ('rgb', 'depth', 'ir')
+    with pytest.raises(ValueError):
+        StreamConfig(['rgb', 'color'])
+    with pytest.raises(ValueError):
+        StreamConfig(roi=[0, 0, 0, 10])
+
+
+def test_apply_crops_and_resizes():
+    frames = full_frames()
+    config = StreamConfig(['rgb', 'depth'], roi=[48, 27, 96, 54],
+                          size={'rgb': [48, 27], 'depth': [96, 54]})
+    out = config.apply(frames)
+    assert set(out) == {'rgb', 'depth'}
+    assert out['rgb'].shape == (27, 48, 3) and out['rgb'].dtype == np.uint8
+    # Depth is cropped without resizing, as a view of the full frame.
+    np.testing.assert_array_equal(out['depth'], frames['depth'][27:81, 48:144])
+    # Resized frames reuse their buffer.
+    assert config.apply(frames)['rgb'] is out['rgb']
+
+    with pytest.raises(ValueError):
+        StreamConfig(['ir'], roi=[48, 27, 96, 54]).apply(frames)
+
+
+def test_intrinsics_follow_crop_and_resize():
+    K = np.array([[100., 0., 95.5], [0., 100., 53.5], [0., 0., 1.]])
+    point = np.array([0.1, -0.05, 1.0])
+    config = StreamConfig(roi=[48, 27, 96, 54], size=[48, 27])
+    uv_full = K.dot(point)[:2]
+    uv = config.intrinsics(K).dot(point)[:2]
+    # Pixel (u, v) of the full frame maps to ((u - x + 0.5) * s - 0.5) after
+    # cropping at x and resizing by s = 0.5.
+    np.testing.assert_allclose(uv, (uv_full - [48, 27] + 0.5) * 0.5 - 0.5)
+
+    with pytest.raises(ValueError):
+        StreamConfig(size=[96, 54]).intrinsics(K)
+    np.testing.assert_allclose(StreamConfig(size=[96, 54]).intrinsics(K, full_size=(192, 108)),
+                               [[50., 0., 47.5], [0., 50., 26.5], [0., 0., 1.]])
@@ -0,0 +1,80 @@
+"""Tests for VectorEnv with BulletPanda worlds.
+"""
+import numpy as np
+import pytest
+from perls2.utils.yaml_config import YamlConfig
+from perls2.envs.env import Env
+from perls2.envs.vector_env import VectorEnv, flatten_observation, unflatten_observation
+
+
+class VectorTestEnv(Env):
+    """Env moving the end effector by a delta position each step.
+    """
+    def get_observation(self):
+        return {'q': self.robot_interface.q,
+                'ee_pose': self.robot_interface.ee_pose,
+                'num_steps': self.num_steps}
+
+    def _exec_action(self, action):
+        self.robot_interface.move_ee_delta(np.hstack((action, [0, 0, 0])))
+
+
+@pytest.fixture
+def config():
+    config = YamlConfig('dev/test/test_bullet_cfg.yaml')
+    config['world']['robot'] = 'panda'
+    config['sim_params']['MAX_STEPS'] = 2
+    return config
+
+
+def test_flatten_observation():
+    observation = (np.zeros(3), {'pose': [0.0] * 7, 'step': 1}, np.zeros((2, 2), dtype=np.uint8))
+    structure, leaves = flatten_observation(observation)
+    assert [leaf.shape for leaf in leaves] == [(3,), (7,), (), (2, 2)]
+    rebuilt = unflatten_observation(structure, leaves)
+    assert isinstance(rebuilt, tuple)
+    assert rebuilt[2].dtype == np.uint8
+    assert rebuilt[1]['step'] == 1
+
+    with pytest.raises(ValueError):
+        flatten_observation({'image': None})
+
+
+def test_vector_env_step_and_reset(config):
+    envs = VectorEnv(VectorTestEnv, config, num_envs=3, num_workers=2)
+    try:
+        observations = envs.reset()
+        assert observations['q'].shape == (3, 7)
+        assert observations['ee_pose'].shape == (3, 7)
+        np.testing.assert_array_equal(observations['num_steps'], [0, 0, 0])
+
+        actions = np.zeros((3,) + envs.action_space.shape)
+        observations, rewards, dones, infos = envs.step(actions)
+        assert rewards.shape == (3,)
+        assert len(infos) == 3
+        assert not dones.any()
+        np.testing.assert_array_equal(observations['num_steps'], [1, 1, 1])
+
+        # Episodes terminate at MAX_STEPS and are reset automatically.
+        observations, rewards, dones, infos = envs.step(actions)
+        assert dones.all()
+        np.testing.assert_array_equal(observations['num_steps'], [0, 0, 0])
+        assert infos[0]['terminal_observation']['num_steps'] == 0
+
+        envs.step(actions)
+        observations = envs.reset(mask=[False, True, False])
+        np.testing.assert_array_equal(observations['num_steps'], [1, 0, 1])
+
+        with pytest.raises(ValueError):
+            envs.step(np.zeros((2,) + envs.action_space.shape))
+
+        # The step replies are not read as reset or close replies.
+        envs.step_async(actions)
+        with pytest.raises(ValueError):
+            envs.reset()
+        assert len(envs.step_wait()[3]) == 3
+        envs.step_async(actions)
+    finally:
+        envs.close()
+    # Workers close their Envs and exit cleanly.
+    assert [process.exitcode for process in envs._processes] == [0, 0]
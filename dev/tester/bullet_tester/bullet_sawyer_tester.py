@@ -64,7 +64,7 @@ def step_till_close_enough_fn(
         joint_torques = getattr(bullet_sawyer,exec_fn)(goal)
 
         bullet_sawyer.set_torques(joint_torques)
-        pybullet.stepSimulation(physics_id)
+        bullet_sawyer.step_simulation()
         steps+=1
 
         # Log the state
@@ -98,7 +98,7 @@ def step_till_close_enough(
             atol) and
         (steps < max_steps))):
 
-        pybullet.stepSimulation(physics_id)
+        bullet_sawyer.step_simulation()
         steps+=1
     if (np.allclose(
             getattr(bullet_sawyer,attribute),
@@ -128,7 +128,7 @@ def step_till_close_enough_index(
             atol) and
          (steps <= max_steps))):
 
-        pybullet.stepSimulation(physics_id)
+        bullet_sawyer.step_simulation()
         steps += 1
     print("result " + attribute + " " + str(
             np.allclose(
@@ -267,7 +267,7 @@ while ((np.allclose(
             rtol=1e-02,
             atol=1e-02) is False) and
         (steps < 200)):
-        pybullet.stepSimulation(physics_id)
+        bullet_sawyer.step_simulation()
         steps += 1
 
 if (np.allclose(
@@ -327,7 +327,7 @@ step_till_close_enough_index(
 #             rtol=1e-02,
 #             atol=1e-02) == False) and
 #         (steps < 5000)):
-#         pybullet.stepSimulation(physics_id)
+#         bullet_sawyer.step_simulation()
 #         steps+=1
 if (not(np.allclose(
                 bullet_sawyer.q[0],
@@ -111,7 +111,7 @@ while (steps <max_steps):
         bullet_sawyer.controller.compute_torques_compensated(
             bullet_sawyer.state_dict, posture, xd))
     set_torques = bullet_sawyer.set_torques(comp_torques)
-    pybullet.stepSimulation()
+    bullet_sawyer.step_simulation()
 
     # Save all the values at each step
     grav_list.append(bullet_sawyer.N_q)
@@ -90,7 +90,7 @@ steps=0
 bullet_sawyer.ee_pose = des_ee_pose
 while (steps < max_steps):
     bullet_sawyer.ee_pose = des_ee_pose
-    pybullet.stepSimulation()
+    bullet_sawyer.step_simulation()
     ee_pose_list.append(bullet_sawyer.ee_pose)
     torque_list.append(bullet_sawyer.last_torques)
     steps+=1
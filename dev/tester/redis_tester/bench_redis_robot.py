@@ -0,0 +1,288 @@
+"""Latency benchmark for the real robot redis path, without a robot.
+
+Runs the SawyerCtrlInterface on a mock Sawyer limb (see mock_sawyer.py) in a
+child process, and a RealSawyerInterface env in this process, both connected
+to a local redis-server. For each scenario (command transport, state codec,
+I/O thread, shared memory) reports:
+
+    cmd -> torque latency: time from the env sending a goal command to the
+        Control Interface applying the first torques for it.
+    state staleness: age of the robot state the env reads each policy step.
+    state read time: time for the env to get a state snapshot.
+    ctrl loop period: histogram of the control loop period.
+    throughput: state snapshots per second the env can read, and control
+        loop ticks per second.
+
+The Control Interface flushes redis on startup, so use a redis-server
+dedicated to benchmarking. Run from the perls2 root directory:
+
+    redis-server --port 6379 &
+    python dev/tester/redis_tester/bench_redis_robot.py --duration 10
+"""
+from __future__ import division
+import os
+import copy
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+import numpy as np
+import yaml
+
+from mock_sawyer import MockLimb, install_mock_robot
+
+# Redis and io_thread config overrides for each scenario.
+SCENARIOS = OrderedDict([
+    ('keys_str', {'redis': {'cmd_transport': 'keys', 'use_binary_codec': False}}),
+    ('keys_binary', {'redis': {'cmd_transport': 'keys'}}),
+    ('pubsub_binary', {'redis': {'cmd_transport': 'pubsub'}}),
+    ('pubsub_io_thread', {'redis': {'cmd_transport': 'pubsub'},
+                          'io_thread': {'enabled': True, 'rate': 500}}),
+    ('shm', {'redis': {'transport': 'shm'}}),
+])
+
+# Loop period histogram bin edges (ms).
+PERIOD_BINS_MS = [0.0, 1.5, 1.9, 2.1, 2.5, 3.0, 5.0, 10.0, np.inf]
+
+ENV_CONNECT_TIMEOUT = 60.0
+
+
+def merge_config(config, overrides):
+    """Recursively update a copy of config with overrides.
+    """
+    merged = copy.deepcopy(config)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def write_kinematic_urdf(urdf_path, urdf_dir):
+    """Write a copy of the urdf without visual and collision elements.
+
+    The Control Interface only needs the kinematics and inertials of its
+    pybullet sim, and not every sawyer mesh is in the repo.
+
+    Returns:
+        (str): path to the new urdf.
+    """
+    tree = ET.parse(urdf_path)
+    for urdf_link in tree.getroot().iter('link'):
+        for element in urdf_link.findall('visual') + urdf_link.findall('collision'):
+            urdf_link.remove(element)
+    kinematic_path = os.path.join(urdf_dir, os.path.basename(urdf_path))
+    tree.write(kinematic_path)
+    return kinematic_path
+
+
+def run_ctrl_interface(config_path, joint_state_rate, ready, results):
+    """Run the SawyerCtrlInterface on a mock limb until the env disconnects.
+
+    Args:
+        config_path (str): path to the scenario config file.
+        joint_state_rate (float): mock joint state publishing rate (Hz).
+        ready (multiprocessing.Event): set once redis is flushed and the
+            env may connect.
+        results (multiprocessing.Queue): queue to put the results on.
+    """
+    limb = MockLimb(rate=joint_state_rate)
+    install_mock_robot(limb)
+    from perls2.ros_interfaces.sawyer_ctrl_interface import SawyerCtrlInterface, bGOAL_CMDS
+
+    class BenchCtrlInterface(SawyerCtrlInterface):
+        """Control Interface recording command and torque times.
+
+        Without the io_thread, states are set to redis every tick, as the
+        ROS state publisher would on the robot.
+        """
+        def __init__(self, **kwargs):
+            self.tick_times = []
+            self.cmd_times = []
+            self.torque_times = []
+            self._cmd_pending = False
+            SawyerCtrlInterface.__init__(self, **kwargs)
+
+        def process_cmd(self, cmd_type, goal=None):
+            SawyerCtrlInterface.process_cmd(self, cmd_type, goal)
+            if cmd_type in bGOAL_CMDS:
+                self.cmd_times.append(time.time())
+                self._cmd_pending = True
+
+        def set_torques(self, desired_torques):
+            SawyerCtrlInterface.set_torques(self, desired_torques)
+            if self._cmd_pending:
+                self.torque_times.append(time.time())
+                self._cmd_pending = False
+
+        def step(self, start=None):
+            self.tick_times.append(time.time())
+            SawyerCtrlInterface.step(self, start)
+            if not self.use_io_thread and not self.redisClient.publish_every_tick:
+                self.update_redis()
+
+    limb.start()
+    ctrl = BenchCtrlInterface(config=config_path)
+    ready.set()
+
+    start = time.time()
+    while ctrl.env_connected != b'True':
+        if time.time() - start > ENV_CONNECT_TIMEOUT:
+            raise RuntimeError("Env did not connect.")
+        time.sleep(0.01)
+    ctrl.run()
+    limb.stop()
+
+    results.put({'tick_times': ctrl.tick_times,
+                 'cmd_times': ctrl.cmd_times,
+                 'torque_times': ctrl.torque_times,
+                 'joint_state_times': limb.joint_state_times})
+
+
+def run_env(config, duration):
+    """Send goal commands at the policy frequency and read robot states.
+
+    Args:
+        config (dict): scenario config.
+        duration (float): time to send commands for (s).
+
+    Returns:
+        (dict): command send times, state staleness and read times, and
+            the state snapshot read rate.
+    """
+    from perls2.robots.real_sawyer_interface import RealSawyerInterface
+    robot = RealSawyerInterface(config=config, controlType=config['controller']['selected_type'])
+
+    policy_period = 1.0 / config['policy_freq']
+    send_times = []
+    staleness = []
+    read_times = []
+    start = time.time()
+    next_time = start
+    while time.time() - start < duration:
+        read_start = time.time()
+        snapshot = robot.get_state_snapshot()
+        read_end = time.time()
+        read_times.append(read_end - read_start)
+        staleness.append(read_end - snapshot['tstamp'])
+
+        send_times.append(time.time())
+        robot.move_ee_delta(np.zeros(6))
+        robot.step()
+
+        next_time += policy_period
+        time.sleep(max(0.0, next_time - time.time()))
+
+    # Throughput of back to back snapshot reads.
+    num_reads = 0
+    read_start = time.time()
+    while time.time() - read_start < 1.0:
+        robot.get_state_snapshot()
+        num_reads += 1
+    read_rate = num_reads / (time.time() - read_start)
+
+    robot.disconnect()
+    return {'send_times': send_times,
+            'staleness': staleness,
+            'read_times': read_times,
+            'read_rate': read_rate}
+
+
+def summarize(samples):
+    """Percentiles of samples in ms.
+    """
+    samples = np.asarray(samples) * 1000.0
+    if samples.size == 0:
+        return "no samples"
+    return "p50 {:7.3f}  p90 {:7.3f}  p99 {:7.3f}  max {:7.3f} ms (n={})".format(
+        np.percentile(samples, 50), np.percentile(samples, 90),
+        np.percentile(samples, 99), samples.max(), samples.size)
+
+
+def print_histogram(periods):
+    counts, edges = np.histogram(np.asarray(periods) * 1000.0, bins=PERIOD_BINS_MS)
+    total = max(counts.sum(), 1)
+    for count, low, high in zip(counts, edges[:-1], edges[1:]):
+        print("    [{:5.1f}, {:5.1f}) ms {:8d} {}".format(
+            low, high, count, '#' * int(50 * count / total)))
+
+
+def report(name, env_results, ctrl_results):
+    send_times = np.asarray(env_results['send_times'])
+    torque_times = np.asarray(ctrl_results['torque_times'])
+    num_cmds = min(len(send_times), len(torque_times))
+    if len(send_times) != len(torque_times):
+        print("  warning: {} commands sent, {} applied. Latency assumes no dropped commands.".format(
+            len(send_times), len(torque_times)))
+    latency = torque_times[:num_cmds] - send_times[:num_cmds]
+
+    tick_times = np.asarray(ctrl_results['tick_times'])
+    periods = np.diff(tick_times)
+    joint_state_periods = np.diff(ctrl_results['joint_state_times'])
+
+    print("=== {} ===".format(name))
+    print("  cmd -> torque latency: {}".format(summarize(latency)))
+    print("  state staleness:       {}".format(summarize(env_results['staleness'])))
+    print("  state read time:       {}".format(summarize(env_results['read_times'])))
+    print("  joint state period:    {}".format(summarize(joint_state_periods)))
+    print("  ctrl loop period:      {}".format(summarize(periods)))
+    print_histogram(periods)
+    if tick_times.size > 1:
+        print("  ctrl loop rate:        {:.1f} Hz".format(
+            (tick_times.size - 1) / (tick_times[-1] - tick_times[0])))
+    print("  state read rate:       {:.1f} Hz".format(env_results['read_rate']))
+
+
+def run_scenario(name, base_config, duration, joint_state_rate):
+    config = merge_config(base_config, SCENARIOS[name])
+    with tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False) as config_file:
+        yaml.safe_dump(config, config_file)
+    ready = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    ctrl_process = multiprocessing.Process(
+        target=run_ctrl_interface,
+        args=(config_file.name, joint_state_rate, ready, results))
+    ctrl_process.start()
+    try:
+        if not ready.wait(ENV_CONNECT_TIMEOUT):
+            raise RuntimeError("Control Interface did not start.")
+        env_results = run_env(config, duration)
+        ctrl_results = results.get(timeout=ENV_CONNECT_TIMEOUT)
+        ctrl_process.join()
+    finally:
+        if ctrl_process.is_alive():
+            ctrl_process.terminate()
+        os.remove(config_file.name)
+    report(name, env_results, ctrl_results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the real robot redis path on a mock robot.")
+    parser.add_argument('--config', default='dev/tester/redis_tester/redis_tester_config.yaml',
+                        help='benchmark config file')
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='time to send commands for in each scenario (s)')
+    parser.add_argument('--joint_state_rate', type=float, default=800.0,
+                        help='mock joint state publishing rate (Hz)')
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS.keys()),
+                        choices=list(SCENARIOS.keys()))
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as config_file:
+        base_config = yaml.safe_load(config_file)
+    urdf_dir = tempfile.mkdtemp()
+    try:
+        base_config['sawyer']['arm']['path'] = write_kinematic_urdf(
+            base_config['sawyer']['arm']['path'], urdf_dir)
+        for name in args.scenarios:
+            run_scenario(name, base_config, args.duration, args.joint_state_rate)
+    finally:
+        shutil.rmtree(urdf_dir)
+
+
+if __name__ == '__main__':
+    main()
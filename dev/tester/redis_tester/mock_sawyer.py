@@ -0,0 +1,184 @@
+"""Mock Sawyer robot backend for running the SawyerCtrlInterface without ROS.
+
+Provides a fake intera limb that publishes joint states from a background
+thread at a configurable rate (500-800 Hz on the real robot), and stand-in
+rospy / intera_interface / intera_core_msgs modules so the
+SawyerCtrlInterface can be imported and run against a local redis-server.
+
+Usage:
+    from mock_sawyer import MockLimb, install_mock_robot
+    limb = MockLimb(rate=800)
+    install_mock_robot(limb)
+    from perls2.ros_interfaces.sawyer_ctrl_interface import SawyerCtrlInterface
+"""
+from __future__ import division
+import sys
+import time
+import types
+import logging
+import threading
+import numpy as np
+
+SAWYER_JOINT_NAMES = ['right_j{}'.format(i) for i in range(7)]
+
+
+class MockLimb(object):
+    """Fake intera_interface.Limb with joint states updated at a fixed rate.
+
+    Joint states are integrated from the last commanded torques with a
+    damped double integrator, so torque commands visibly change the state.
+    The end effector pose is held fixed, as the mock has no kinematics.
+
+    Attributes:
+        rate (float): joint state publishing rate (Hz).
+        joint_state_times (list): time of each joint state update.
+        torque_times (list): time of each set_joint_torques call.
+    """
+    def __init__(self, rate=800, joint_names=SAWYER_JOINT_NAMES,
+                 neutral_joint_angles=(0.00, -1.18, 0.00, 2.18, 0.00, 0.57, 1.5708),
+                 damping=20.0):
+        self.rate = rate
+        self.damping = damping
+        self._joint_names = list(joint_names)
+        self._lock = threading.Lock()
+        self._q = np.array(neutral_joint_angles, dtype=np.float64)
+        self._dq = np.zeros(len(self._joint_names))
+        self._tau = np.zeros(len(self._joint_names))
+        self._ee_position = (0.5, 0.0, 0.3)
+        self._ee_orientation = (0.0, 1.0, 0.0, 0.0)
+        self.joint_state_times = []
+        self.torque_times = []
+        self._running = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start publishing joint states.
+        """
+        self._running.set()
+        self._thread = threading.Thread(target=self._publish_loop, name='mock_joint_states')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _publish_loop(self):
+        dt = 1.0 / self.rate
+        next_time = time.time()
+        while self._running.is_set():
+            with self._lock:
+                ddq = self._tau - self.damping * self._dq
+                self._dq = self._dq + ddq * dt
+                self._q = self._q + self._dq * dt
+            self.joint_state_times.append(time.time())
+            next_time += dt
+            sleep_time = next_time - time.time()
+            if sleep_time > 0:
+                time.sleep(sleep_time)
+            else:
+                next_time = time.time()
+
+    # intera_interface.Limb API used by the SawyerCtrlInterface.
+    def joint_names(self):
+        return list(self._joint_names)
+
+    def joint_ordered_angles(self):
+        with self._lock:
+            return self._q.tolist()
+
+    def joint_angles(self):
+        return dict(zip(self._joint_names, self.joint_ordered_angles()))
+
+    def joint_velocities(self):
+        with self._lock:
+            return dict(zip(self._joint_names, self._dq.tolist()))
+
+    def joint_efforts(self):
+        with self._lock:
+            return dict(zip(self._joint_names, self._tau.tolist()))
+
+    def endpoint_pose(self):
+        return {'position': self._ee_position,
+                'orientation': self._ee_orientation}
+
+    def endpoint_velocity(self):
+        return {'linear': (0.0, 0.0, 0.0),
+                'angular': (0.0, 0.0, 0.0)}
+
+    def endpoint_effort(self):
+        return {'force': (0.0, 0.0, 0.0),
+                'torque': (0.0, 0.0, 0.0)}
+
+    def set_joint_torques(self, command):
+        self.torque_times.append(time.time())
+        with self._lock:
+            self._tau = np.array([command[name] for name in self._joint_names])
+
+    def set_joint_position_speed(self, speed=0.3):
+        pass
+
+    def move_to_joint_positions(self, positions, timeout=15.0, threshold=0.008726646):
+        with self._lock:
+            self._q = np.array([positions[name] for name in self._joint_names])
+            self._dq = np.zeros(len(self._joint_names))
+            self._tau = np.zeros(len(self._joint_names))
+
+
+class _MockRobotParams(object):
+    def get_robot_name(self):
+        return 'mock_sawyer'
+
+
+class _MockRobotEnable(object):
+    def __init__(self, versioned=False):
+        pass
+
+
+def _unavailable(*args, **kwargs):
+    raise RuntimeError("Not available on the mock robot.")
+
+
+def install_mock_robot(limb):
+    """Install mock rospy, intera_interface and intera_core_msgs modules.
+
+    Must be called before importing the SawyerCtrlInterface. The head,
+    gripper and IK service are reported as unavailable, as on a robot
+    without them.
+
+    Args:
+        limb (MockLimb): limb returned by intera_interface.Limb.
+    """
+    rospy = types.ModuleType('rospy')
+    rospy.loginfo = logging.info
+    rospy.logdebug = logging.debug
+    rospy.logwarn = logging.warning
+    rospy.logerr = logging.error
+    rospy.init_node = lambda *args, **kwargs: None
+    rospy.is_shutdown = lambda: False
+    rospy.sleep = time.sleep
+    rospy.ServiceProxy = lambda *args, **kwargs: None
+    rospy.wait_for_service = _unavailable
+    rospy.DEBUG = logging.DEBUG
+
+    iif = types.ModuleType('intera_interface')
+    iif.Limb = lambda *args, **kwargs: limb
+    iif.Head = _unavailable
+    iif.HeadDisplay = _unavailable
+    iif.Lights = _unavailable
+    iif.Gripper = _unavailable
+    iif.RobotEnable = _MockRobotEnable
+    iif.RobotParams = _MockRobotParams
+
+    msgs = types.ModuleType('intera_core_msgs')
+    msgs.msg = types.ModuleType('intera_core_msgs.msg')
+    msgs.msg.JointCommand = object
+    msgs.srv = types.ModuleType('intera_core_msgs.srv')
+    msgs.srv.SolvePositionIK = object
+
+    sys.modules['rospy'] = rospy
+    sys.modules['intera_interface'] = iif
+    sys.modules['intera_core_msgs'] = msgs
+    sys.modules['intera_core_msgs.msg'] = msgs.msg
+    sys.modules['intera_core_msgs.srv'] = msgs.srv
@@ -163,6 +163,7 @@ class ReplayEnv(SimpleReachEnv):
          Args: state_id (int): in-memory identifier of state in pybullet. 
         """
         pb.restoreState(stateId=state_id, physicsClientId=self.world.physics_id)
+        self.world.clear_state_cache()
 
     def restore_state_bullet(self, bullet_state):
         """ Restore bullet state from filepath. 
@@ -171,6 +172,7 @@ class ReplayEnv(SimpleReachEnv):
 
         """
         pb.restoreState(fileName=bullet_state, physicsClientId=self.world.physics_id)
+        self.world.clear_state_cache()
 
     def get_observation(self): 
         """
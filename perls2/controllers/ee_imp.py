@@ -134,7 +134,7 @@ class EEImpController(Controller):
 
         # Set kv using damping if kv not explicitly set.
         if kv is not None:
-            self.kv = kv
+            self.kv = np.ones(6) * kv
         else:
             self.kv = np.ones(6) * 2 * np.sqrt(self.kp) * damping
 
@@ -179,6 +179,48 @@ class EEImpController(Controller):
 
         C.orientation_error(dummy_mat, dummy_mat)
 
+        C.ee_impedance_torques(*self._control_law_args())
+
+    def _get_desired_pose(self):
+        """ Get the desired position and orientation matrix for this control step,
+        from the interpolators if they are set.
+        """
+        # Get interpolated goal for position
+        if self.interpolator_pos is not None:
+            desired_pos = self.interpolator_pos.get_interpolated_goal()
+        else:
+            desired_pos = np.array(self.goal_pos)
+
+        # Get interpolated goal for orientation.
+        if self.interpolator_ori is not None:
+            desired_ori = T.quat2mat(self.interpolator_ori.get_interpolated_goal())
+        else:
+            desired_ori = np.array(self.goal_ori)
+
+        return desired_pos, desired_ori
+
+    def _control_law_args(self, desired_pos=None, desired_ori=None):
+        """ Arguments for the fused control law, C.ee_impedance_torques.
+
+        Desired position and orientation default to the current goal.
+        """
+        if desired_pos is None:
+            desired_pos = np.asarray(self.goal_pos)
+        if desired_ori is None:
+            desired_ori = np.asarray(self.goal_ori)
+        return (desired_pos,
+                desired_ori,
+                self.model.ee_pos,
+                self.model.ee_ori_mat,
+                self.model.ee_pos_vel,
+                self.model.ee_ori_vel,
+                self.kp,
+                self.kv,
+                self.model.mass_matrix,
+                self.model.J_full,
+                self.model.torque_compensation,
+                self.uncoupling)
+
     def set_goal(self, delta, set_pos=None, set_ori=None, **kwargs):
         """ Set goal for controller.
 
@@ -274,60 +316,13 @@ class EEImpController(Controller):
         if self.goal_pos is None or self.goal_ori is None:
             raise ValueError("Set goal first.")
 
-        # Default desired velocities and accelerations are zero.
-        desired_vel_pos = np.asarray([0.0, 0.0, 0.0])
-        desired_acc_pos = np.asarray([0.0, 0.0, 0.0])
-        desired_vel_ori = np.asarray([0.0, 0.0, 0.0])
-        desired_acc_ori = np.asarray([0.0, 0.0, 0.0])
-
-        # Get interpolated goal for position
-        if self.interpolator_pos is not None:
-            desired_pos = self.interpolator_pos.get_interpolated_goal()
-        else:
-            desired_pos = np.array(self.goal_pos)
-
-        # Get interpolated goal for orientation.
-        if self.interpolator_ori is not None:
-
-            desired_ori = T.quat2mat(self.interpolator_ori.get_interpolated_goal())
-            ori_error = C.orientation_error(desired_ori, self.model.ee_ori_mat)
-        else:
-            desired_ori = np.array(self.goal_ori)
-
-            ori_error = C.orientation_error(desired_ori, self.model.ee_ori_mat)
-
-        # Calculate desired force, torque at ee using control law and error.
-        position_error = desired_pos - self.model.ee_pos
-        vel_pos_error = desired_vel_pos - self.model.ee_pos_vel
-        desired_force = (
-            np.multiply(np.array(position_error),
-                        np.array(self.kp[0:3])) + np.multiply(vel_pos_error, self.kv[0:3])) + desired_acc_pos
-
-        vel_ori_error = desired_vel_ori - self.model.ee_ori_vel
-        desired_torque = (
-            np.multiply(np.array(ori_error),
-                        np.array(self.kp[3:])) + np.multiply(vel_ori_error, self.kv[3:])) + desired_acc_ori
-
-        # Calculate Operational Space mass matrix and nullspace.
-        lambda_full, lambda_pos, lambda_ori, nullspace_matrix = \
-            C.opspace_matrices(self.model.mass_matrix,
-                               self.model.J_full,
-                               self.model.J_pos,
-                               self.model.J_ori)
-
-        self.nullspace_matrix = nullspace_matrix
-
-        # If uncoupling position and orientation use separated lambdas.
-        if self.uncoupling:
-            decoupled_force = np.dot(lambda_pos, desired_force)
-            decoupled_torque = np.dot(lambda_ori, desired_torque)
-            decoupled_wrench = np.concatenate([decoupled_force, decoupled_torque])
-        else:
-            desired_wrench = np.concatenate([desired_force, desired_torque])
-            decoupled_wrench = np.dot(lambda_full, desired_wrench)
+        desired_pos, desired_ori = self._get_desired_pose()
 
-        # Project torques that acheive goal into task space.
-        self.torques = np.dot(self.model.J_full.T, decoupled_wrench) + self.model.torque_compensation
+        # Compute the pose error, operational space matrices and the torques
+        # projected from task space in a single compiled call. Desired
+        # velocities and accelerations are zero.
+        self.torques, self.nullspace_matrix = C.ee_impedance_torques(
+            *self._control_law_args(desired_pos, desired_ori))
 
         return self.torques
 
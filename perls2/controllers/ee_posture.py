@@ -128,6 +128,17 @@ class EEPostureController(EEImpController):
             joint_vel=self.model.joint_vel,
         )
 
+        C.ee_posture_torques(*self._posture_control_law_args())
+
+    def _posture_control_law_args(self, desired_pos=None, desired_ori=None):
+        """ Arguments for the fused control law, C.ee_posture_torques.
+        """
+        return self._control_law_args(desired_pos, desired_ori) + (
+            self.goal_posture,
+            self.model.joint_pos,
+            self.model.joint_vel,
+            self.posture_gain)
+
     def set_goal(self, delta, set_pos=None, set_ori=None, **kwargs):
         """ Set goal for controller.
 
@@ -160,13 +171,12 @@ class EEPostureController(EEImpController):
 
         Runs impedance controllers and adds nullspace constrained posture compensation.
         """
+        # Check if the goal has been set.
+        if self.goal_pos is None or self.goal_ori is None:
+            raise ValueError("Set goal first.")
 
-        torques = super(EEPostureController, self).run_controller()
-        self.torques = torques + C.nullspace_torques(self.model.mass_matrix,
-                                                     self.nullspace_matrix,
-                                                     self.goal_posture,
-                                                     self.model.joint_pos,
-                                                     self.model.joint_vel,
-                                                     self.posture_gain)
+        desired_pos, desired_ori = self._get_desired_pose()
+        self.torques, self.nullspace_matrix = C.ee_posture_torques(
+            *self._posture_control_law_args(desired_pos, desired_ori))
 
         return self.torques
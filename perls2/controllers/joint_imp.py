@@ -35,16 +35,11 @@ class JointImpController(Controller):
         # joint dimension (action space for control)
         self.joint_dim = robot_model.joint_dim
 
-        # kp kv
-        if kp is list:
-            self.kp = np.ones(self.joint_dim) * kp
-        else:
-            self.kp = kp
+        # kp kv as arrays of joint_dim for the compiled control law.
+        self.kp = np.ones(self.joint_dim) * kp
 
         if kv is None:
             self.kv = np.ones(self.joint_dim) * 2 * np.sqrt(self.kp) * damping
-        elif kv is list:
-            self.kv = kv
         else:
             self.kv = np.ones(self.joint_dim) * kv
 
@@ -62,6 +57,15 @@ class JointImpController(Controller):
         self.prev_goal = None
         self.set_goal(np.zeros(self.joint_dim))
 
+        # Run calculations with numba to reduce first call penalties.
+        C.joint_impedance_torques(np.asarray(self.goal_qpos, dtype=np.float64),
+                                  self.model.joint_pos,
+                                  self.model.joint_vel,
+                                  self.kp,
+                                  self.kv,
+                                  self.model.mass_matrix,
+                                  self.model.torque_compensation)
+
     def set_goal(self, delta, set_qpos=None, **kwargs):
         """Set goal for controller.
         Args:
@@ -112,25 +116,23 @@ class JointImpController(Controller):
         # Next, check whether goal has been set
         assert self.goal_qpos is not None, "Error: Joint qpos goal has not been set yet!"
 
-        desired_qpos = 0
-        desired_vel_pos = 0  # Note that this is currently unused
-        desired_acc_pos = 0  # Note that this is currently unused
-
+        # Desired velocities and accelerations are zero.
         if self.interpolator_qpos is not None:
             if self.interpolator_qpos.order == 1:
                 # Linear case
                 desired_qpos = self.interpolator_qpos.get_interpolated_goal()
             else:
                 # Nonlinear case not currently supported
-                pass
+                desired_qpos = np.zeros(self.joint_dim)
         else:
-            desired_qpos = np.array(self.goal_qpos)
-
-        position_error = desired_qpos - self.model.joint_pos
-        vel_pos_error = desired_vel_pos - self.model.joint_vel
-        desired_torque = (
-            np.multiply(np.array(position_error), np.array(self.kp)) + np.multiply(vel_pos_error, self.kv)) + desired_acc_pos
-
-        self.torques = np.dot(self.model.mass_matrix, desired_torque) + self.model.torque_compensation
+            desired_qpos = np.asarray(self.goal_qpos, dtype=np.float64)
+
+        self.torques = C.joint_impedance_torques(desired_qpos,
+                                                 self.model.joint_pos,
+                                                 self.model.joint_vel,
+                                                 self.kp,
+                                                 self.kv,
+                                                 self.model.mass_matrix,
+                                                 self.model.torque_compensation)
 
         return self.torques
@@ -58,6 +58,39 @@ class Model:
         self.torque_compensation = None
         self.nullspace = None
 
+    def allocate(self, joint_dim):
+        """Allocate the state and model arrays, to be filled in place.
+
+        For robots that write their state into the model arrays each control
+        step instead of calling update_states and update_model. J_pos and
+        J_ori are views of J_full.
+
+        Args:
+          joint_dim (int): number of joints of the robot arm.
+        """
+        self.joint_dim = joint_dim
+        self.ee_pos = np.zeros(3)
+        self.ee_ori_quat = np.zeros(4)
+        self.ee_ori_mat = np.eye(3)
+        self.ee_pos_vel = np.zeros(3)
+        self.ee_ori_vel = np.zeros(3)
+        self.joint_pos = np.zeros(joint_dim)
+        self.joint_vel = np.zeros(joint_dim)
+        self.joint_tau = np.zeros(joint_dim)
+        self.J_full = np.zeros((6, joint_dim))
+        self.J_pos = self.J_full[:3]
+        self.J_ori = self.J_full[3:]
+        self.mass_matrix = np.zeros((joint_dim, joint_dim))
+        self.torque_compensation = np.zeros(joint_dim)
+
+    def offset_mass_matrix_diagonal(self):
+        """Add the mass matrix offsets to the last three diagonal elements, in place.
+        """
+        if self.offset_mass_matrix:
+          mm_weight_indices = [(4,4), (5,5), (6,6)]
+          for i in range(3):
+            self.mass_matrix[mm_weight_indices[i]] += self.mass_matrix_offset_val[i]
+
     def update_states(self,
                       ee_pos,
                       ee_ori,
@@ -105,10 +138,7 @@ class Model:
                      mass_matrix):
 
         self.mass_matrix = mass_matrix
-        if self.offset_mass_matrix:
-          mm_weight_indices = [(4,4), (5,5), (6,6)]
-          for i in range(3):
-            self.mass_matrix[mm_weight_indices[i]] += self.mass_matrix_offset_val[i]
+        self.offset_mass_matrix_diagonal()
 
         self.J_full = np.concatenate((J_pos, J_ori))
         self.J_pos = J_pos
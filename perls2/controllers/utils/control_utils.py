@@ -92,6 +92,67 @@ def orientation_error(desired, current):
     error = 0.5 * (cross_product(rc1, rd1) + cross_product(rc2, rd2) + cross_product(rc3, rd3))
     return error
 
+@numba.jit(nopython=True, cache=True)
+def ee_impedance_torques(desired_pos, desired_ori, ee_pos, ee_ori_mat, ee_pos_vel, ee_ori_vel,
+                         kp, kv, mass_matrix, J_full, torque_compensation, uncouple_pos_ori):
+    """
+    Fused end-effector impedance control law. Computes the pose error, the desired wrench with zero desired
+     velocity and acceleration, the operational space matrices and the joint torques in a single compiled call.
+    @J_full is the 6 x n jacobian, the linear jacobian stacked on the angular jacobian.
+    Returns the joint torques and the nullspace matrix of the task.
+    """
+    # orientation_error, summing the cross products of the matrix columns in place.
+    ori_error = np.zeros(3)
+    for i in range(3):
+        c0, c1, c2 = ee_ori_mat[0, i], ee_ori_mat[1, i], ee_ori_mat[2, i]
+        d0, d1, d2 = desired_ori[0, i], desired_ori[1, i], desired_ori[2, i]
+        ori_error[0] += 0.5 * (c1 * d2 - c2 * d1)
+        ori_error[1] += 0.5 * (c2 * d0 - c0 * d2)
+        ori_error[2] += 0.5 * (c0 * d1 - c1 * d0)
+
+    desired_force = kp[0:3] * (desired_pos - ee_pos) - kv[0:3] * ee_pos_vel
+    desired_torque = kp[3:6] * ori_error - kv[3:6] * ee_ori_vel
+
+    J_pos = J_full[0:3]
+    J_ori = J_full[3:6]
+    lambda_full, lambda_pos, lambda_ori, nullspace_matrix = opspace_matrices(
+        mass_matrix, J_full, J_pos, J_ori)
+
+    decoupled_wrench = np.empty(6)
+    if uncouple_pos_ori:
+        decoupled_wrench[0:3] = np.dot(lambda_pos, desired_force)
+        decoupled_wrench[3:6] = np.dot(lambda_ori, desired_torque)
+    else:
+        desired_wrench = np.empty(6)
+        desired_wrench[0:3] = desired_force
+        desired_wrench[3:6] = desired_torque
+        decoupled_wrench[:] = np.dot(lambda_full, desired_wrench)
+
+    torques = np.dot(J_full.T, decoupled_wrench) + torque_compensation
+    return torques, nullspace_matrix
+
+@numba.jit(nopython=True, cache=True)
+def ee_posture_torques(desired_pos, desired_ori, ee_pos, ee_ori_mat, ee_pos_vel, ee_ori_vel,
+                       kp, kv, mass_matrix, J_full, torque_compensation, uncouple_pos_ori,
+                       goal_posture, joint_pos, joint_vel, posture_gain):
+    """
+    Fused end-effector impedance control law with nullspace torques maintaining the joint posture @goal_posture.
+    Returns the joint torques and the nullspace matrix of the task.
+    """
+    torques, nullspace_matrix = ee_impedance_torques(
+        desired_pos, desired_ori, ee_pos, ee_ori_mat, ee_pos_vel, ee_ori_vel,
+        kp, kv, mass_matrix, J_full, torque_compensation, uncouple_pos_ori)
+    torques += nullspace_torques(mass_matrix, nullspace_matrix, goal_posture, joint_pos, joint_vel, posture_gain)
+    return torques, nullspace_matrix
+
+@numba.jit(nopython=True, cache=True)
+def joint_impedance_torques(desired_qpos, joint_pos, joint_vel, kp, kv, mass_matrix, torque_compensation):
+    """
+    Fused joint impedance control law with zero desired velocity and acceleration.
+    """
+    desired_torque = kp * (desired_qpos - joint_pos) - kv * joint_vel
+    return np.dot(mass_matrix, desired_torque) + torque_compensation
+
 #@numba.jit(nopython=True, cache=True)
 def set_goal_position(delta,
                       current_position,
@@ -0,0 +1,444 @@
+"""Vectorized environment running multiple perls2 Envs in worker processes.
+
+Each worker process creates one or more Envs, and with them their own
+BulletWorld and pybullet DIRECT client, through the world_factory. Actions,
+observations, rewards and termination flags are exchanged through a memory
+mapped file (in /dev/shm by default) shared by all workers, so only the
+commands and infos go through the worker pipes.
+
+Observations may be arrays, lists of numbers, or dicts / tuples / lists
+nesting them, as long as every leaf has the same shape and dtype on every
+step. Batched observations have the same structure, with each leaf stacked
+along a first dimension of size num_envs.
+
+Example:
+    envs = VectorEnv(MyEnv, 'cfg/my_config.yaml', num_envs=8)
+    observations = envs.reset()
+    for _ in range(1000):
+        actions = policy(observations)
+        observations, rewards, dones, infos = envs.step(actions)
+    envs.close()
+"""
+import os
+import mmap
+import logging
+import traceback
+import multiprocessing
+import numpy as np
+import pybullet
+
+from perls2.utils.shared_buffers import BUFFER_ALIGNMENT, aligned_size, create_shared_file
+
+
+def flatten_observation(observation):
+    """Split an observation into its array leaves.
+
+    Args:
+        observation: array, list of numbers, or dict / tuple / list nesting them.
+
+    Returns:
+        (tuple): structure of the observation with each leaf replaced by its
+            index in leaves, and the list of leaves as ndarrays.
+    """
+    leaves = []
+
+    def _flatten(value):
+        if isinstance(value, dict):
+            return dict((key, _flatten(item)) for key, item in value.items())
+        if isinstance(value, (list, tuple)) and any(
+                isinstance(item, (dict, list, tuple, np.ndarray)) for item in value):
+            return type(value)(_flatten(item) for item in value)
+        leaf = np.asarray(value)
+        if leaf.dtype == object:
+            raise ValueError("Observation leaf {} is not numeric.".format(value))
+        leaves.append(leaf)
+        return len(leaves) - 1
+
+    structure = _flatten(observation)
+    return structure, leaves
+
+
+def unflatten_observation(structure, leaves):
+    """Rebuild an observation from its structure and leaves.
+
+    Args:
+        structure: structure returned by flatten_observation.
+        leaves (list): leaves, indexed by the structure.
+    """
+    if isinstance(structure, dict):
+        return dict((key, unflatten_observation(item, leaves))
+                    for key, item in structure.items())
+    if isinstance(structure, (list, tuple)):
+        return type(structure)(unflatten_observation(item, leaves) for item in structure)
+    return leaves[structure]
+
+
+def _layout_buffers(num_envs, leaf_specs, action_shape):
+    """Offsets of the shared buffers.
+
+    Args:
+        num_envs (int): number of environments.
+        leaf_specs (list): (shape, dtype str) of each observation leaf.
+        action_shape (tuple): shape of the action of one env.
+
+    Returns:
+        (list, int): (name, offset, shape, dtype str) of each buffer and the
+            total size in bytes.
+    """
+    specs = [('observation_{}'.format(index), tuple(shape), dtype)
+             for index, (shape, dtype) in enumerate(leaf_specs)]
+    specs += [('actions', tuple(action_shape), '<f8'),
+              ('rewards', (), '<f8'),
+              ('dones', (), '|b1')]
+    layout = []
+    offset = 0
+    for name, shape, dtype in specs:
+        shape = (num_envs,) + shape
+        layout.append((name, offset, shape, dtype))
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        offset += aligned_size(size)
+    return layout, max(offset, BUFFER_ALIGNMENT)
+
+
+def _map_buffers(mm, layout):
+    """ndarray views of the shared buffers, keyed by name.
+    """
+    return dict((name, np.ndarray(shape, dtype, buffer=mm, offset=offset))
+                for name, offset, shape, dtype in layout)
+
+
+def _close_env(env):
+    """Stop the async renderer of an Env's world and disconnect its pybullet client.
+    """
+    world = env.world
+    if getattr(world, 'async_renderer', None) is not None:
+        world.async_renderer.close()
+    pybullet.disconnect(physicsClientId=world.physics_id)
+
+
+def _worker(conn, env_class, config, env_indices, name):
+    """Run Envs in a worker process, executing commands from the VectorEnv.
+
+    Args:
+        conn (multiprocessing.Connection): pipe to the VectorEnv.
+        env_class (type): Env subclass to create.
+        config (str, YamlConfig): config for the Envs.
+        env_indices (list): indices of the worker's Envs in the VectorEnv.
+        name (str): name of the VectorEnv. Envs are named name_index.
+    """
+    try:
+        envs = [env_class(config, False, '{}_{}'.format(name, index)) for index in env_indices]
+        observations = [env.reset() for env in envs]
+        structure, leaves = flatten_observation(observations[0])
+        conn.send(('ok', (structure,
+                          [(leaf.shape, leaf.dtype.str) for leaf in leaves],
+                          envs[0].observation_space,
+                          envs[0].action_space)))
+
+        shm_path, layout, size = conn.recv()
+        with open(shm_path, 'r+b') as shm_file:
+            mm = mmap.mmap(shm_file.fileno(), size)
+        buffers = _map_buffers(mm, layout)
+        num_leaves = len(leaves)
+
+        def write_observation(index, observation):
+            _, leaves = flatten_observation(observation)
+            if len(leaves) != num_leaves:
+                raise ValueError("Observation structure of env {} changed.".format(index))
+            for leaf_index, leaf in enumerate(leaves):
+                buffers['observation_{}'.format(leaf_index)][index] = leaf
+
+        for index, observation in zip(env_indices, observations):
+            write_observation(index, observation)
+        conn.send(('ok', None))
+
+        while True:
+            cmd, data = conn.recv()
+            if cmd == 'step':
+                infos = []
+                for index, env in zip(env_indices, envs):
+                    observation, reward, done, info = env.step(buffers['actions'][index])
+                    info = dict(info or {})
+                    if done and data:
+                        info['terminal_observation'] = observation
+                        observation = env.reset()
+                    write_observation(index, observation)
+                    buffers['rewards'][index] = reward
+                    buffers['dones'][index] = done
+                    infos.append(info)
+                conn.send(('ok', infos))
+            elif cmd == 'reset':
+                for index, env in zip(env_indices, envs):
+                    if index in data:
+                        write_observation(index, env.reset())
+                conn.send(('ok', None))
+            elif cmd == 'call':
+                method, args, kwargs = data
+                conn.send(('ok', [getattr(env, method)(*args, **kwargs) for env in envs]))
+            elif cmd == 'close':
+                for env in envs:
+                    _close_env(env)
+                conn.send(('ok', None))
+                break
+            else:
+                raise ValueError("Invalid VectorEnv command {}".format(cmd))
+    except (KeyboardInterrupt, EOFError):
+        pass
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+class VectorEnv(object):
+    """Runs num_envs copies of an Env across a pool of worker processes.
+
+    Envs are split evenly across the workers, and each worker steps its
+    Envs in sequence. Every Env has its own BulletWorld and pybullet DIRECT
+    client, so sim throughput scales with the number of workers up to the
+    number of cores.
+
+    Attributes:
+        num_envs (int): number of environments.
+        num_workers (int): number of worker processes.
+        auto_reset (bool): reset Envs when their episode terminates. The last
+            observation of the episode is returned in the Env's info as
+            terminal_observation.
+        observation_space (gym.Space): observation space of a single Env.
+        action_space (gym.Space): action space of a single Env.
+    """
+
+    def __init__(self,
+                 env_class,
+                 config,
+                 num_envs,
+                 num_workers=None,
+                 auto_reset=True,
+                 name='VectorEnv',
+                 start_method=None,
+                 shm_dir=None):
+        """Start the workers and create the Envs.
+
+        Args:
+            env_class (type): Env subclass to create. Created as
+                env_class(config, use_visualizer=False, name).
+            config (str, YamlConfig): config for the Envs. Must be a Bullet world.
+            num_envs (int): number of environments.
+            num_workers (int): number of worker processes. Defaults to the
+                number of cpus, up to num_envs.
+            auto_reset (bool): reset Envs when their episode terminates.
+            name (str): name of the VectorEnv.
+            start_method (str): multiprocessing start method for the workers,
+                e.g. 'fork' or 'spawn'. Defaults to the platform default.
+                With 'spawn', env_class and config must be picklable.
+            shm_dir (str): directory for the shared memory file. Defaults
+                to /dev/shm if it exists, otherwise the temp directory.
+        """
+        if num_envs < 1:
+            raise ValueError("num_envs must be at least 1.")
+        if num_workers is None:
+            num_workers = min(num_envs, multiprocessing.cpu_count())
+        if not 1 <= num_workers <= num_envs:
+            raise ValueError("num_workers must be between 1 and num_envs.")
+
+        self.num_envs = num_envs
+        self.num_workers = num_workers
+        self.auto_reset = auto_reset
+        self.name = name
+        self._mm = None
+        self._closed = False
+        self._waiting = False
+
+        ctx = multiprocessing.get_context(start_method)
+        self._worker_indices = [list(indices) for indices in
+                                np.array_split(np.arange(num_envs), num_workers)]
+        self._conns = []
+        self._processes = []
+        for env_indices in self._worker_indices:
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(child_conn, env_class, config, env_indices, name),
+                name='{}_worker_{}'.format(name, len(self._processes)))
+            process.daemon = True
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+
+        try:
+            specs = self._recv_all()
+            structure, leaf_specs, self.observation_space, self.action_space = specs[0]
+            for worker_structure, worker_leaf_specs, _, _ in specs[1:]:
+                if worker_structure != structure or worker_leaf_specs != leaf_specs:
+                    raise ValueError("Envs returned observations with different structures.")
+            self._structure = structure
+            self._num_leaves = len(leaf_specs)
+            self._init_buffers(leaf_specs, shm_dir)
+        except Exception:
+            self.close()
+            raise
+
+    def _init_buffers(self, leaf_specs, shm_dir):
+        """Create the shared memory file and map it in all processes.
+
+        The file is removed once all workers have mapped it.
+        """
+        layout, size = _layout_buffers(self.num_envs, leaf_specs, self.action_space.shape)
+
+        self._mm, shm_path = create_shared_file('perls2_vector_env_', size, shm_dir)
+        try:
+            self._buffers = _map_buffers(self._mm, layout)
+            for conn in self._conns:
+                conn.send((shm_path, layout, size))
+            self._recv_all()
+        finally:
+            os.remove(shm_path)
+
+    def _recv_all(self):
+        """Wait for a reply from every worker.
+
+        Returns:
+            (list): reply data of each worker.
+        """
+        replies = []
+        errors = []
+        for conn, process in zip(self._conns, self._processes):
+            try:
+                status, data = conn.recv()
+            except EOFError:
+                status, data = 'error', "Worker {} exited.".format(process.name)
+            if status == 'error':
+                errors.append(data)
+            replies.append(data)
+        if errors:
+            raise RuntimeError("VectorEnv worker failed:\n{}".format('\n'.join(errors)))
+        return replies
+
+    def _get_observations(self):
+        """Copy the batched observations from the shared buffers.
+        """
+        leaves = [self._buffers['observation_{}'.format(index)].copy()
+                  for index in range(self._num_leaves)]
+        return unflatten_observation(self._structure, leaves)
+
+    def reset(self, mask=None):
+        """Reset environments.
+
+        Args:
+            mask (ndarray): bool array of size num_envs, True for the Envs to
+                reset. Defaults to resetting all Envs.
+
+        Returns:
+            Batched observations of all Envs.
+        """
+        if self._waiting:
+            raise ValueError("reset called before step_wait.")
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=bool)
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != (self.num_envs,):
+            raise ValueError("mask must have shape ({},)".format(self.num_envs))
+
+        reset_indices = set(np.flatnonzero(mask).tolist())
+        conns = []
+        for conn, env_indices in zip(self._conns, self._worker_indices):
+            if reset_indices.intersection(env_indices):
+                conn.send(('reset', reset_indices))
+                conns.append(conn)
+        for conn in conns:
+            status, data = conn.recv()
+            if status == 'error':
+                raise RuntimeError("VectorEnv worker failed:\n{}".format(data))
+        return self._get_observations()
+
+    def step_async(self, actions):
+        """Send actions to the Envs and step them without waiting.
+
+        Args:
+            actions (ndarray): actions of shape (num_envs,) + action_space.shape.
+        """
+        actions = np.asarray(actions)
+        if actions.shape != self._buffers['actions'].shape:
+            raise ValueError("actions must have shape {}".format(self._buffers['actions'].shape))
+        if self._waiting:
+            raise ValueError("step_async called before step_wait.")
+        self._buffers['actions'][:] = actions
+        for conn in self._conns:
+            conn.send(('step', self.auto_reset))
+        self._waiting = True
+
+    def step_wait(self):
+        """Wait for the Envs to finish the step sent with step_async.
+
+        Returns:
+            Batched observations, rewards (ndarray), dones (ndarray) and
+                infos (list of dicts) of all Envs.
+        """
+        if not self._waiting:
+            raise ValueError("step_wait called before step_async.")
+        self._waiting = False
+        infos = [info for worker_infos in self._recv_all() for info in worker_infos]
+        return (self._get_observations(),
+                self._buffers['rewards'].copy(),
+                self._buffers['dones'].copy(),
+                infos)
+
+    def step(self, actions):
+        """Step all Envs with a batch of actions.
+
+        Args:
+            actions (ndarray): actions of shape (num_envs,) + action_space.shape.
+
+        Returns:
+            Batched observations, rewards (ndarray), dones (ndarray) and
+                infos (list of dicts) of all Envs.
+        """
+        self.step_async(actions)
+        return self.step_wait()
+
+    def call(self, method, *args, **kwargs):
+        """Call a method on every Env.
+
+        Returns:
+            (list): return value for each Env.
+        """
+        for conn in self._conns:
+            conn.send(('call', (method, args, kwargs)))
+        return [result for worker_results in self._recv_all() for result in worker_results]
+
+    def close(self):
+        """Close the Envs and stop the workers.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for conn, process in zip(self._conns, self._processes):
+            if not process.is_alive():
+                continue
+            try:
+                # Wait for the step of step_async, so its reply is not read
+                # as the reply to close.
+                if self._waiting:
+                    conn.recv()
+                conn.send(('close', None))
+                conn.recv()
+            except (EOFError, BrokenPipeError):
+                pass
+        self._waiting = False
+        for process in self._processes:
+            process.join(timeout=5.0)
+            if process.is_alive():
+                logging.warning("Terminating VectorEnv worker {}".format(process.name))
+                process.terminate()
+        for conn in self._conns:
+            conn.close()
+        if self._mm is not None:
+            self._buffers = None
+            self._mm.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
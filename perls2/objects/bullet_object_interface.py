@@ -23,14 +23,21 @@ class BulletObjectInterface(ObjectInterface):
             xdot, ydot, zdot
         angular_velocity (ndarray 3f): ang. vel. of object in world frame.
             wx, wy, wz.
-
+        registry (BulletObjectRegistry): registry the state is read from,
+            once per simulation step for all objects, or None to read it
+            from pybullet on each access.
+        clear_state_cache (callable): called after the object state is
+            reset, see BulletWorld.clear_state_cache. Defaults to clearing
+            the registry.
 
     """
 
     def __init__(self,
                  physics_id,
                  obj_id,
-                 name='object'):
+                 name='object',
+                 registry=None,
+                 clear_state_cache=None):
         """
         Initialize variables
 
@@ -38,6 +45,10 @@ class BulletObjectInterface(ObjectInterface):
             physics_id (int): physicsClientId from Pybullet
             obj_id (int): bodyId from Bullet loadURDF
             name (str): identifer for the object, best to keep unique.
+            registry (BulletObjectRegistry): registry of the world the object
+                is added to, see BulletWorld.object_registry.
+            clear_state_cache (callable): invalidates the states cached by
+                the world the object is added to.
         # TODO: support multiple copies of the same object
 
         Returns:
@@ -47,6 +58,47 @@ class BulletObjectInterface(ObjectInterface):
         self._physics_id = physics_id
         self._obj_id = obj_id
         self.name = name
+        self.registry = registry
+        self._clear_state_cache = clear_state_cache
+
+    def _registry_state(self):
+        """State of the object in the registry, None if it is not registered.
+        """
+        if (self.registry is not None and self.name in self.registry
+                and self.registry.obj_id(self.name) == self._obj_id):
+            return self.registry.state(self.name)
+        return None
+
+    def _base_pose(self):
+        """Position and orientation, from the registry if there is one.
+        """
+        state = self._registry_state()
+        if state is not None:
+            return state['position'], tuple(state['orientation'])
+        position, orientation = pybullet.getBasePositionAndOrientation(
+            self._obj_id, self._physics_id)
+        return np.asarray(position), orientation
+
+    def _base_velocity(self):
+        """Linear and angular velocity, from the registry if there is one.
+        """
+        state = self._registry_state()
+        if state is not None:
+            return state['linear_velocity'], state['angular_velocity']
+        return pybullet.getBaseVelocity(
+            bodyUniqueId=self._obj_id,
+            physicsClientId=self._physics_id)
+
+    def _state_changed(self):
+        if self._clear_state_cache is not None:
+            self._clear_state_cache()
+        elif self.registry is not None:
+            self.registry.clear_state_cache()
+
+    def _reset_base(self, position, orientation):
+        pybullet.resetBasePositionAndOrientation(
+            self._obj_id, position, orientation, self._physics_id)
+        self._state_changed()
 
     @property
     def position(self):
@@ -54,9 +106,7 @@ class BulletObjectInterface(ObjectInterface):
 
         Returns numpy array
         """
-        obj_position, _ = pybullet.getBasePositionAndOrientation(
-            self._obj_id, self._physics_id)
-        return np.asarray(obj_position)
+        return np.array(self._base_pose()[0])
 
     def set_position(self, des_position):
         """ Set position of object in world frame.
@@ -69,18 +119,13 @@ class BulletObjectInterface(ObjectInterface):
 
         Note: does not check for collisions
         """
-        _, obj_orn = pybullet.getBasePositionAndOrientation(
-            self._obj_id, self._physics_id)
-        pybullet.resetBasePositionAndOrientation(
-            self._obj_id, des_position, obj_orn, self._physics_id)
+        self._reset_base(des_position, self._base_pose()[1])
 
     @property
     def orientation(self):
         """Orientation of object in world frame expressed as quaternion.
         """
-        _, obj_orn = pybullet.getBasePositionAndOrientation(
-            self._obj_id, self._physics_id)
-        return obj_orn
+        return self._base_pose()[1]
 
     def set_orientation(self, des_ori):
         """ Set position of object in world frame.
@@ -92,10 +137,7 @@ class BulletObjectInterface(ObjectInterface):
             None
         Note: does not check for collisions
         """
-        obj_pos, _ = pybullet.getBasePositionAndOrientation(
-            self._obj_id, self._physics_id)
-        pybullet.resetBasePositionAndOrientation(
-            self._obj_id, obj_pos, des_ori, self._physics_id)
+        self._reset_base(self._base_pose()[0].tolist(), des_ori)
 
     @property
     def pose(self):
@@ -103,9 +145,8 @@ class BulletObjectInterface(ObjectInterface):
 
         [x, y, z, qx, qy, qz, w]
         """
-        obj_position, obj_orn = pybullet.getBasePositionAndOrientation(
-            self._obj_id, self._physics_id)
-        return list(obj_position + obj_orn)
+        obj_position, obj_orn = self._base_pose()
+        return obj_position.tolist() + list(obj_orn)
 
     def set_pose(self, des_pose):
         """Set pose of object in world frame.
@@ -120,8 +161,7 @@ class BulletObjectInterface(ObjectInterface):
         """
         if len(des_pose) != 7:
             raise ValueError("Invalid dim for des_pose, should be list 7f")
-        pybullet.resetBasePositionAndOrientation(
-            self._obj_id, des_pose[:3], des_pose[3:], self._physics_id)
+        self._reset_base(des_pose[:3], des_pose[3:])
 
     @property
     def physics_id(self):
@@ -156,23 +196,20 @@ class BulletObjectInterface(ObjectInterface):
             If both are None, does nothing.
         """
         # Get the current orietation so it is maintained during reset
-
-        self.obj_pos, self.obj_orn = pybullet.getBasePositionAndOrientation(
-            self._obj_id, self._physics_id)
+        self.obj_pos, self.obj_orn = self._base_pose()
+        self.obj_pos = self.obj_pos.tolist()
 
         if new_object_pos is not None:
             self.obj_pos = new_object_pos
         if new_object_orn is not None:
             self.obj_orn = new_object_orn
 
-        pybullet.resetBasePositionAndOrientation(
-            self._obj_id, self.obj_pos, self.obj_orn, self._physics_id)
+        self._reset_base(self.obj_pos, self.obj_orn)
 
     def reset(self):
         """Reset object to last placed pose.
         """
-        pybullet.resetBasePositionAndOrientation(
-            self._obj_id, self.obj_pos, self.obj_orn, self._physics_id)
+        self._reset_base(self.obj_pos, self.obj_orn)
 
     @property
     def linear_velocity(self):
@@ -189,9 +226,7 @@ class BulletObjectInterface(ObjectInterface):
             A 3-dimensional float32 numpy array.
 
         """
-        linear_velocity, _ = pybullet.getBaseVelocity(
-            bodyUniqueId=self._obj_id,
-            physicsClientId=self._physics_id)
+        linear_velocity, _ = self._base_velocity()
         return np.array(linear_velocity, dtype=np.float32)
 
     def set_linear_velocity(self, des_linear_vel):
@@ -200,8 +235,9 @@ class BulletObjectInterface(ObjectInterface):
         pybullet.resetBaseVelocity(
             objectUniqueId=self.obj_id,
             linearVelocity=des_linear_vel,
-            angularVelocity=self.angular_velocity,
+            angularVelocity=self.angular_velocity.tolist(),
             physicsClientId=self.physics_id)
+        self._state_changed()
 
     @property
     def angular_velocity(self):
@@ -212,9 +248,7 @@ class BulletObjectInterface(ObjectInterface):
             A 3-dimensional float32 numpy array.
 
         """
-        _, angular_velocity = pybullet.getBaseVelocity(
-            bodyUniqueId=self._obj_id,
-            physicsClientId=self._physics_id)
+        _, angular_velocity = self._base_velocity()
         return np.array(angular_velocity, dtype=np.float32)
 
     def set_angular_velocity(self, des_angular_vel):
@@ -225,6 +259,7 @@ class BulletObjectInterface(ObjectInterface):
         """
         pybullet.resetBaseVelocity(
             objectUniqueId=self.obj_id,
-            linearVelocity=self.linear_velocity,
+            linearVelocity=self.linear_velocity.tolist(),
             angularVelocity=des_angular_vel,
             physicsClientId=self.physics_id)
+        self._state_changed()
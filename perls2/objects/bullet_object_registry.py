@@ -0,0 +1,178 @@
+"""Registry of the object states of a BulletWorld.
+
+pybullet has no batched query for base states, so the poses and velocities
+of all objects are read in one pass, at most once per simulation step, into
+a structured numpy array. BulletObjectInterfaces read their state from the
+registry, and the BulletWorld queries all objects at once with poses,
+velocities and set_poses.
+"""
+import pybullet
+import numpy as np
+from perls2.utils.sim_step_token import SimStepToken
+
+OBJECT_STATE_DTYPE = np.dtype([('position', np.float64, 3),
+                               ('orientation', np.float64, 4),
+                               ('linear_velocity', np.float64, 3),
+                               ('angular_velocity', np.float64, 3)])
+
+
+class BulletObjectRegistry(object):
+    """Object states of a pybullet simulation, cached per simulation step.
+
+    States are keyed on sim_step, which the BulletWorld replaces with its
+    own token, as for the BulletRobotInterface.
+
+    Attributes:
+        physics_id (int): physicsClientId from Pybullet.
+        names (list): names of the objects, in the order of the states.
+        sim_step (SimStepToken): token of the current simulation step.
+    """
+
+    def __init__(self, physics_id):
+        self.physics_id = physics_id
+        self.names = []
+        self._obj_ids = []
+        self._indices = {}
+        self.sim_step = SimStepToken()
+        self._states_step = -1
+        self._states = None
+
+    def __contains__(self, name):
+        return name in self._indices
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, obj_id):
+        """Add an object, replacing any object with the same name.
+
+        Args:
+            name (str): name of the object.
+            obj_id (int): bodyId of the object.
+        """
+        if name in self._indices:
+            self.remove(name)
+        self._indices[name] = len(self.names)
+        self.names.append(name)
+        self._obj_ids.append(obj_id)
+        self.clear_state_cache()
+
+    def remove(self, name):
+        """Remove an object.
+
+        Args:
+            name (str): name of the object.
+        """
+        index = self._indices.pop(name)
+        del self.names[index]
+        del self._obj_ids[index]
+        self._indices = dict((name, index) for index, name in enumerate(self.names))
+        self.clear_state_cache()
+
+    def clear(self):
+        """Remove all objects.
+        """
+        self.names = []
+        self._obj_ids = []
+        self._indices = {}
+        self.clear_state_cache()
+
+    def obj_id(self, name):
+        """bodyId of an object.
+        """
+        return self._obj_ids[self._indices[name]]
+
+    def clear_state_cache(self):
+        """Invalidate the states cached for the current simulation step.
+        """
+        self.sim_step.bump()
+
+    def states(self):
+        """States of all objects, read from pybullet if not cached for the
+        current simulation step.
+
+        Returns:
+            read-only structured ndarray of OBJECT_STATE_DTYPE, with the
+                state of each object in the order of names.
+        """
+        if self._states_step != self.sim_step.value:
+            rows = []
+            for obj_id in self._obj_ids:
+                position, orientation = pybullet.getBasePositionAndOrientation(
+                    obj_id, physicsClientId=self.physics_id)
+                linear_velocity, angular_velocity = pybullet.getBaseVelocity(
+                    obj_id, physicsClientId=self.physics_id)
+                rows.append(position + orientation + linear_velocity + angular_velocity)
+            states = np.empty(len(rows), OBJECT_STATE_DTYPE)
+            if rows:
+                states.view(np.float64).reshape(len(rows), -1)[:] = rows
+            states.flags.writeable = False
+            self._states = states
+            self._states_step = self.sim_step.value
+        return self._states
+
+    def _select(self, names):
+        states = self.states()
+        if names is None:
+            return states
+        return states[[self._indices[name] for name in names]]
+
+    def state(self, name):
+        """State of an object, as a record of OBJECT_STATE_DTYPE.
+        """
+        return self.states()[self._indices[name]]
+
+    def poses(self, names=None):
+        """Poses of objects in the world frame.
+
+        Args:
+            names (list): names of the objects. Defaults to all objects.
+
+        Returns:
+            (n, 7) ndarray of [x, y, z, qx, qy, qz, w] poses.
+        """
+        states = self._select(names)
+        return np.concatenate([states['position'], states['orientation']], axis=1)
+
+    def velocities(self, names=None):
+        """Velocities of objects in the world frame.
+
+        Args:
+            names (list): names of the objects. Defaults to all objects.
+
+        Returns:
+            (n, 6) ndarray of [vx, vy, vz, wx, wy, wz] velocities.
+        """
+        states = self._select(names)
+        return np.concatenate([states['linear_velocity'], states['angular_velocity']], axis=1)
+
+    def set_poses(self, names, poses):
+        """Reset the poses of objects. Does not check for collisions.
+
+        Args:
+            names (list): names of the objects.
+            poses (ndarray): (n, 7) [x, y, z, qx, qy, qz, w] poses in the
+                world frame.
+        """
+        poses = np.asarray(poses, dtype=np.float64)
+        if poses.shape != (len(names), 7):
+            raise ValueError("poses must be of shape ({}, 7), got {}".format(
+                len(names), poses.shape))
+        obj_ids = [self.obj_id(name) for name in names]
+        for obj_id, pose in zip(obj_ids, poses.tolist()):
+            pybullet.resetBasePositionAndOrientation(
+                obj_id, pose[:3], pose[3:], physicsClientId=self.physics_id)
+        self.clear_state_cache()
+
+    def is_stable(self, linear_velocity_threshold, angular_velocity_threshold):
+        """Whether the velocities of all objects are within thresholds of 0.
+
+        Args:
+            linear_velocity_threshold (float): max linear speed (m/s).
+            angular_velocity_threshold (float): max angular speed (rad/s).
+        """
+        states = self.states()
+        return bool(
+            np.all(np.linalg.norm(states['linear_velocity'], axis=1) < linear_velocity_threshold)
+            and np.all(np.linalg.norm(states['angular_velocity'], axis=1)
+                       < angular_velocity_threshold))
@@ -5,6 +5,9 @@ import numpy as np
 import abc
 
 from perls2.robots.robot_interface import RobotInterface
+from perls2.utils.sim_step_token import SimStepToken
+import perls2.controllers.utils.control_utils as C
+import perls2.controllers.utils.transform_utils as T
 
 
 def nested_tuple_to_list(tuple_input):
@@ -18,8 +21,16 @@ def nested_tuple_to_list(tuple_input):
 class BulletRobotInterface(RobotInterface):
     """Abstract class that extends RobotInterface for BulletWorlds.
 
+    Joint states, the end-effector link state and the dynamics model
+    (jacobian, mass matrix, gravity and coriolis torques) are computed from
+    pybullet at most once per simulation step and cached, keyed on
+    sim_step. The BulletWorld replaces sim_step with its own token, which it
+    bumps whenever it steps or restores the simulation. Without a world, use
+    step_simulation to step the simulation.
+
     Attributes:
         physics_id (int): id for PyBullet physics client.
+        sim_step (SimStepToken): token of the current simulation step.
         arm_id (int): id for robot arm in PyBullet. Returned by pb.loadURDF
         config (dict): config parameters for the perls2 env.
         robot_cfg (dict): config parameters specific to the robot.
@@ -49,8 +60,16 @@ class BulletRobotInterface(RobotInterface):
         self.robot_cfg = self.config[robot_name]
         self._ee_index = 7  # Default
         self._num_joints = pybullet.getNumJoints(self._arm_id, physicsClientId=self._physics_id)
+        self._joint_indices = list(range(self._num_joints))
         self._motor_joint_indices = self._get_motor_joint_indices()
 
+        # States and dynamics cached for the current simulation step.
+        self.sim_step = SimStepToken()
+        self._joint_states_step = -1
+        self._ee_link_state_step = -1
+        self._dynamics_step = -1
+        self._gravity_step = -1
+
         # set the default values
         self._speed = self.robot_cfg['limb_max_velocity_ratio']
         self._position_threshold = (
@@ -66,6 +85,9 @@ class BulletRobotInterface(RobotInterface):
         self.gripper_width = 0.99
         self.last_torques_cmd = [0] * 7
 
+        # Model arrays are filled in place each control step.
+        self._arm_motor_indices = np.array(self._motor_joint_indices[:7])
+        self.model.allocate(joint_dim=7)
         self.update_model()
 
         self.controller = self.make_controller(controlType)
@@ -115,22 +137,111 @@ class BulletRobotInterface(RobotInterface):
         self.update_model()
         self.action_set = False
 
+    @property
+    def _state_step(self):
+        return self.sim_step.value
+
+    def step_simulation(self):
+        """Step the simulation forward once, without a BulletWorld.
+        """
+        pybullet.stepSimulation(physicsClientId=self._physics_id)
+        self.sim_step.bump()
+
+    def _update_joint_states(self):
+        """Read the states of all joints with a single pybullet call, if
+        they are not cached for the current simulation step.
+        """
+        if self._joint_states_step == self._state_step:
+            return
+        joint_states = pybullet.getJointStates(
+            self._arm_id, self._joint_indices, physicsClientId=self._physics_id)
+        self._joint_positions = np.array([state[0] for state in joint_states])
+        self._joint_velocities = np.array([state[1] for state in joint_states])
+        self._joint_torques = np.array([state[3] for state in joint_states])
+        self._joint_states_step = self._state_step
+
+    def _update_ee_link_state(self):
+        """Read the end-effector pose and velocity with a single pybullet
+        call, if they are not cached for the current simulation step.
+        """
+        if self._ee_link_state_step == self._state_step:
+            return
+        link_state = pybullet.getLinkState(
+            self._arm_id,
+            self._ee_index,
+            computeLinkVelocity=1,
+            computeForwardKinematics=1,
+            physicsClientId=self._physics_id)
+        self._ee_link_state = link_state
+        self._ee_link_state_step = self._state_step
+
+    def _update_dynamics(self):
+        """Compute the jacobian, mass matrix and gravity and coriolis torques
+        at the current joint state, if they are not cached for the current
+        simulation step.
+        """
+        if self._dynamics_step == self._state_step:
+            return
+        # pybullet requires lists for the joint states, with an entry for
+        # every degree of freedom.
+        motor_pos = self.motor_joint_positions.tolist()
+        motor_vel = self.motor_joint_velocities.tolist()
+        zeros = [0] * len(motor_pos)
+
+        mass_matrix = pybullet.calculateMassMatrix(
+            self._arm_id,
+            motor_pos,
+            physicsClientId=self._physics_id)
+        self._mass_matrix = np.array(mass_matrix)[:7, :7]
+
+        linear, angular = pybullet.calculateJacobian(
+            bodyUniqueId=self._arm_id,
+            linkIndex=self._ee_index,
+            localPosition=[0, 0, 0],
+            objPositions=motor_pos,
+            objVelocities=zeros,
+            objAccelerations=zeros,
+            physicsClientId=self._physics_id)
+        self._linear_jacobian = np.asarray(linear)[:, :7]
+        self._angular_jacobian = np.asarray(angular)[:, :7]
+
+        Nq = pybullet.calculateInverseDynamics(
+            bodyUniqueId=self._arm_id,
+            objPositions=motor_pos,
+            objVelocities=motor_vel,
+            objAccelerations=zeros,
+            physicsClientId=self._physics_id)
+        self._N_q = np.asarray(Nq)[:7]
+        self._dynamics_step = self._state_step
+
     def update_model(self):
         """Update model for controller with robot state and dynamics.
+
+        Fills the model arrays in place from the cached pybullet queries of
+        the current simulation step, without going through the properties,
+        which return copies. J_pos and J_ori of the model are views of
+        J_full, which the control law kernels take directly.
         """
-        self.model.update_states(ee_pos=np.asarray(self.ee_position),
-                                 ee_ori=np.asarray(self.ee_orientation),
-                                 ee_pos_vel=np.asarray(self.ee_v),
-                                 ee_ori_vel=np.asarray(self.ee_w),
-                                 joint_pos=np.asarray(self.motor_joint_positions[:7]),
-                                 joint_vel=np.asarray(self.motor_joint_velocities[:7]),
-                                 joint_tau=np.asarray(self.last_torques_cmd[:7]),
-                                 joint_dim=7,
-                                 torque_compensation=np.asarray(self.N_q[:7]))
-
-        self.model.update_model(J_pos=self.linear_jacobian,
-                                J_ori=self.angular_jacobian,
-                                mass_matrix=self.mass_matrix)
+        self._update_joint_states()
+        self._update_ee_link_state()
+        self._update_dynamics()
+        model = self.model
+
+        model.ee_pos[:] = self._ee_link_state[0]
+        model.ee_ori_quat[:] = self._ee_link_state[1]
+        model.ee_ori_mat[:] = T.quat2mat(model.ee_ori_quat)
+        model.ee_pos_vel[:] = self._ee_link_state[6]
+        model.ee_ori_vel[:] = self._ee_link_state[7]
+
+        np.take(self._joint_positions, self._arm_motor_indices, out=model.joint_pos)
+        np.take(self._joint_velocities, self._arm_motor_indices, out=model.joint_vel)
+        model.joint_tau[:] = self.last_torques_cmd[:7]
+        model.torque_compensation[:] = self._N_q
+
+        model.J_pos[:] = self._linear_jacobian
+        model.J_ori[:] = self._angular_jacobian
+        model.mass_matrix[:] = self._mass_matrix
+        model.offset_mass_matrix_diagonal()
 
     @property
     def num_joints(self):
@@ -167,6 +278,7 @@ class BulletRobotInterface(RobotInterface):
                 targetValue=joint_pos[i],
                 targetVelocity=joint_vel[i],
                 physicsClientId=self.physics_id)
+        self.sim_step.bump()
 
     def inverse_kinematics(self, position, orientation):
         """Calculate inverse kinematics to get joint angles for a pose.
@@ -227,6 +339,7 @@ class BulletRobotInterface(RobotInterface):
                     positionGain=0.1,
                     velocityGain=1.2,
                     physicsClientId=self.physics_id)
+            self.sim_step.bump()
 
     @property
     def ee_index(self):
@@ -451,24 +564,18 @@ class BulletRobotInterface(RobotInterface):
         """list of three floats [x, y, z] of the position of the
         end-effector.
 
-        Updates every call. Does not store property.
+        Cached for the current simulation step.
         """
-        ee_position, _, _, _, _, _, = pybullet.getLinkState(
-            self._arm_id,
-            self._ee_index,
-            computeForwardKinematics=1,
-            physicsClientId=self._physics_id)
-        return list(ee_position)
+        self._update_ee_link_state()
+        return list(self._ee_link_state[0])
 
     @property
     def ee_orientation(self):
-        _, ee_orientation, _, _, _, _, = pybullet.getLinkState(
-            self._arm_id,
-            self._ee_index,
-            computeForwardKinematics=1,
-            physicsClientId=self._physics_id)
-
-        return list(ee_orientation)
+        """list of four floats [qx, qy, qz, qw] of the orientation of the
+        end-effector.
+        """
+        self._update_ee_link_state()
+        return list(self._ee_link_state[1])
 
     @property
     def ee_pose(self):
@@ -482,66 +589,38 @@ class BulletRobotInterface(RobotInterface):
     @property
     def q(self):
         """
-        Get the joint configuration of the robot arm.
+        Get the joint configuration of the robot arm as a 7f ndarray.
         """
-        q = []
-        for joint_index in range(self.num_joints):
-            q_i, _, _, _, = pybullet.getJointState(
-                self._arm_id,
-                joint_index,
-                physicsClientId=self._physics_id)
-            q.append(q_i)
-
-        return q[:7]
+        self._update_joint_states()
+        return self._joint_positions[:7].copy()
 
     @property
     def _q_full(self):
         """Get all joint positions including gripper.
         """
-        q = []
-        for joint_index in range(self.num_joints):
-            q_i, _, _, _, = pybullet.getJointState(
-                self._arm_id,
-                joint_index,
-                physicsClientId=self._physics_id)
-            q.append(q_i)
-
-        return q
+        self._update_joint_states()
+        return self._joint_positions.copy()
 
     @property
     def dq(self):
         """
         Get the joint velocities of the robot arm.
-        :return: a list of joint velocities in radian/s ordered by
+        :return: a 7f ndarray of joint velocities in radian/s ordered by
         indices from small to large.
         Typically the order goes from base to end effector.
         """
-        dq = []
-        for joint_index in range(self.num_joints):
-            _, dq_i, _, _, = pybullet.getJointState(
-
-                self._arm_id, joint_index,
-                physicsClientId=self._physics_id)
-            dq.append(dq_i)
-        return dq[:7]
+        self._update_joint_states()
+        return self._joint_velocities[:7].copy()
 
     @property
     def ee_v(self):
-        link_state = pybullet.getLinkState(
-            self._arm_id,
-            self._ee_index,
-            computeLinkVelocity=1,
-            physicsClientId=self.physics_id)
-        return link_state[6]
+        self._update_ee_link_state()
+        return self._ee_link_state[6]
 
     @property
     def ee_w(self):
-        link_state = pybullet.getLinkState(
-            self._arm_id,
-            self._ee_index,
-            computeLinkVelocity=1,
-            physicsClientId=self.physics_id)
-        return link_state[7]
+        self._update_ee_link_state()
+        return self._ee_link_state[7]
 
     @property
     def ee_twist(self):
@@ -558,18 +637,23 @@ class BulletRobotInterface(RobotInterface):
     def state_dict(self):
         """ Return a dictionary containing the robot state,
         useful for controllers"""
+        jacobian = self.jacobian
+        mass_matrix = self.mass_matrix
+        N_q = self.N_q
+        lambda_full, _, _, nullspace_matrix = C.opspace_matrices(
+            mass_matrix, jacobian, self._linear_jacobian, self._angular_jacobian)
         state = {
             "ee_pose": self.ee_pose,
             "ee_twist": self.ee_twist,
             "R": self.rotation_matrix,
-            "jacobian": self.jacobian,
-            "lambda": self.op_space_mass_matrix,
-            "mass_matrix": self.mass_matrix,
-            "N_x": self.N_x,
-            "N_q": self.N_q,
+            "jacobian": jacobian,
+            "lambda": lambda_full,
+            "mass_matrix": mass_matrix,
+            "N_x": np.dot(np.linalg.pinv(np.transpose(jacobian)), N_q),
+            "N_q": N_q,
             "joint_positions": self.motor_joint_positions[:7],
             "joint_velocities": self.motor_joint_velocities[:7],
-            "nullspace_matrix": self.nullspace_matrix
+            "nullspace_matrix": nullspace_matrix
         }
         return state
 
@@ -584,28 +668,18 @@ class BulletRobotInterface(RobotInterface):
 
     @property
     def N_q(self):
-        """Joint space gravity vector.
+        """Joint space gravity, coriolis and centrifugal torques.
         """
-        Nq = pybullet.calculateInverseDynamics(
-            bodyUniqueId=self._arm_id,
-            objPositions=self.motor_joint_positions,
-            objVelocities=self.motor_joint_velocities,
-            objAccelerations=[0] * len(self.motor_joint_positions),
-            physicsClientId=self._physics_id)
-
-        return np.asarray(Nq)[:7]
+        self._update_dynamics()
+        return self._N_q.copy()
 
     @property
     def mass_matrix(self):
         """ compute the system inertia given its joint positions. Uses
         rbdl Composite Rigid Body Algorithm.
         """
-
-        mass_matrix = pybullet.calculateMassMatrix(
-            self._arm_id,
-            self.q,
-            physicsClientId=self.physics_id)
-        return np.array(mass_matrix)[:7, :7]
+        self._update_dynamics()
+        return self._mass_matrix.copy()
 
     @property
     def jacobian(self):
@@ -613,8 +687,8 @@ class BulletRobotInterface(RobotInterface):
         joint state.
 
         Returns:
-            jacobian tuple(mat3x, mat3x): translational jacobian ((dof), (dof), (dof))
-                and angular jacobian  ((dof), (dof), (dof))
+            jacobian (ndarray): 6x7 jacobian, the translational jacobian
+                stacked on the angular jacobian.
 
         Notes:
             localPosition: point on the specified link to compute the jacobian for, in
@@ -624,51 +698,22 @@ class BulletRobotInterface(RobotInterface):
         TODO: Verify this jacobian cdis what we want or if ee position is further from
             com.
         """
-        motor_pos, motor_vel, motor_accel = self.getMotorJointStates()
-        linear, angular = pybullet.calculateJacobian(
-            bodyUniqueId=self._arm_id,
-            linkIndex=self._ee_index,
-            localPosition=[0.0, 0, 0],
-            objPositions=motor_pos,
-            objVelocities=[0] * len(motor_pos),
-            objAccelerations=[0] * len(motor_pos),
-            physicsClientId=self._physics_id)
-
-        jacobian = np.vstack((linear, angular))
-        jacobian = jacobian[:7, :7]
-        return jacobian
+        self._update_dynamics()
+        return np.vstack((self._linear_jacobian, self._angular_jacobian))
 
     @property
     def linear_jacobian(self):
         """The linear jacobian x_dot = J_t*q_dot
         """
-        motor_pos = self.motor_joint_positions
-        linear, _ = pybullet.calculateJacobian(
-            bodyUniqueId=self._arm_id,
-            linkIndex=self._ee_index,
-            localPosition=[0, 0, 0],
-            objPositions=motor_pos,
-            objVelocities=[0] * len(motor_pos),
-            objAccelerations=[0] * len(motor_pos),
-            physicsClientId=self._physics_id)
-
-        return np.asarray(linear)[:, :7]
+        self._update_dynamics()
+        return self._linear_jacobian.copy()
 
     @property
     def angular_jacobian(self):
         """ The angular jacobian rdot= J_r*qdot
         """
-        motor_pos = self.motor_joint_positions
-        _, angular = pybullet.calculateJacobian(
-            bodyUniqueId=self._arm_id,
-            linkIndex=self._ee_index,
-            localPosition=[0, 0, 0],
-            objPositions=motor_pos,
-            objVelocities=[0] * len(motor_pos),
-            objAccelerations=[0] * len(motor_pos),
-            physicsClientId=self._physics_id)
-
-        return np.asarray(angular)[:, :7]
+        self._update_dynamics()
+        return self._angular_jacobian.copy()
 
     def set_ee_pose_position_control(
             self,
@@ -888,20 +933,13 @@ class BulletRobotInterface(RobotInterface):
         Pybullet model includes extra joints not relevant for robot control.
 
         Returns:
-            joint_positions, joint velocities, joint_torques (tuple): tuple of lists of
+            joint_positions, joint velocities, joint_torques (tuple): tuple of ndarrays of
                 joint positions, velocities and torques.
         """
-        joint_states = pybullet.getJointStates(
-            self._arm_id, range(pybullet.getNumJoints(self._arm_id, physicsClientId=self.physics_id)), physicsClientId=self.physics_id)
-
-        joint_infos = [pybullet.getJointInfo(self._arm_id, i, physicsClientId=self.physics_id) for i in range(
-            pybullet.getNumJoints(self._arm_id, physicsClientId=self.physics_id))]
-        joint_states = [j for j, i in zip(joint_states, joint_infos) if i[2] != pybullet.JOINT_FIXED]
-        joint_positions = [state[0] for state in joint_states]
-        joint_velocities = [state[1] for state in joint_states]
-        joint_torques = [state[3] for state in joint_states]
-
-        return joint_positions, joint_velocities, joint_torques
+        self._update_joint_states()
+        return (self._joint_positions[self._motor_joint_indices],
+                self._joint_velocities[self._motor_joint_indices],
+                self._joint_torques[self._motor_joint_indices])
 
     @property
     def motor_joint_positions(self):
@@ -909,19 +947,8 @@ class BulletRobotInterface(RobotInterface):
 
         Note: fixed joints have 0 degrees of freedoms.
         """
-        joint_states = pybullet.getJointStates(
-            self._arm_id, range(pybullet.getNumJoints(self._arm_id,
-                                                      physicsClientId=self.physics_id)), physicsClientId=self.physics_id)
-        # Joint info specifies type of joint ("fixed" or not)
-        joint_infos = [pybullet.getJointInfo(
-            self._arm_id, i, physicsClientId=self.physics_id) for i in range(pybullet.getNumJoints(self._arm_id, physicsClientId=self.physics_id))]
-
-        # Only get joint states of free joints
-        joint_states = [j for j, i in zip(joint_states, joint_infos) if i[2] != pybullet.JOINT_FIXED]
-
-        joint_positions = [state[0] for state in joint_states]
-
-        return joint_positions
+        self._update_joint_states()
+        return self._joint_positions[self._motor_joint_indices]
 
     @property
     def motor_joint_velocities(self):
@@ -929,35 +956,17 @@ class BulletRobotInterface(RobotInterface):
 
         Note: fixed joints have 0 degrees of freedoms.
         """
-        joint_states = pybullet.getJointStates(
-            self._arm_id, range(pybullet.getNumJoints(self._arm_id, physicsClientId=self.physics_id)),
-            physicsClientId=self.physics_id)
-
-        # Joint info specifies type of joint ("fixed" or not)
-        joint_infos = [pybullet.getJointInfo(
-            self._arm_id, i,
-            physicsClientId=self.physics_id) for i in range(pybullet.getNumJoints(self._arm_id, physicsClientId=self.physics_id))]
-        # Only get joint states of free joints
-        joint_states = [j for j, i in zip(joint_states, joint_infos) if i[2] != pybullet.JOINT_FIXED]
-
-        joint_velocities = [state[1] for state in joint_states]
-
-        return joint_velocities
+        self._update_joint_states()
+        return self._joint_velocities[self._motor_joint_indices]
 
     @property
     def motor_joint_accelerations(self):
-        """ returns the motor joint positions for "each DoF" according to pybullet.
+        """ returns the applied joint torques of all joints according to pybullet.
 
-        Note: fixed joints have 0 degrees of freedoms.
+        Note: pybullet does not report joint accelerations.
         """
-        joint_states = []
-        for joint_num in range(self.num_joints):
-            joint_states.append(pybullet.getJointState(self._arm_id, joint_num, physicsClientId=self.physics_id))
-
-        # Only get joint states of free joints
-
-        joint_accelerations = [state[3] for state in joint_states]
-        return joint_accelerations
+        self._update_joint_states()
+        return self._joint_torques.copy()
 
     @property
     def gravity_vector(self):
@@ -973,14 +982,18 @@ class BulletRobotInterface(RobotInterface):
         Notes: to ignore coriolis forces we set the object velocities to zero.
         """
 
-        gravity_torques = pybullet.calculateInverseDynamics(
-            bodyUniqueId=self._arm_id,
-            objPositions=self.motor_joint_positions,
-            objVelocities=[0] * len(self.motor_joint_positions),
-            objAccelerations=[0] * len(self.motor_joint_positions),
-            physicsClientId=self._physics_id)
+        if self._gravity_step != self._state_step:
+            motor_pos = self.motor_joint_positions.tolist()
+            gravity_torques = pybullet.calculateInverseDynamics(
+                bodyUniqueId=self._arm_id,
+                objPositions=motor_pos,
+                objVelocities=[0] * len(motor_pos),
+                objAccelerations=[0] * len(motor_pos),
+                physicsClientId=self._physics_id)
+            self._gravity_torques = list(gravity_torques[:7])
+            self._gravity_step = self._state_step
 
-        return gravity_torques[:7]
+        return list(self._gravity_torques)
 
     def set_torques(self, joint_torques):
         """Set torques to the motor. Useful for keeping torques constant through
@@ -1011,14 +1024,8 @@ class BulletRobotInterface(RobotInterface):
     def last_torques(self):
         """Last torques commanded to the robot.
         """
-        last_torques = []
-        for joint in range(7):
-            positions, velocities, forces, torque = pybullet.getJointState(
-                self._arm_id,
-                joint,
-                physicsClientId=self._physics_id)
-            last_torques.append(torque)
-        return last_torques
+        self._update_joint_states()
+        return self._joint_torques[:7].copy()
 
     @property
     def tau(self):
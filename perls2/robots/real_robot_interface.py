@@ -104,9 +104,7 @@ class RealRobotInterface(RobotInterface):
             logging.debug("Changing controller to {} with params: {}".format(self.controlType, control_config))
 
             # Command to send
-            cmd_type = CHANGE_CONTROLLER
-            control_cmd = {ROBOT_CMD_TSTAMP_KEY: time.time(), ROBOT_CMD_TYPE_KEY: cmd_type}
-            self.redisClient.mset(control_cmd)
+            self.redisClient.send_cmd(CHANGE_CONTROLLER)
             return self.controlType
         else:
             raise ValueError("Invalid control type " + "\nChoose from EEImpedance, JointVelocity, JointImpedance, JointTorque")
@@ -215,10 +213,15 @@ class RealRobotInterface(RobotInterface):
         self.set_controller_goal(**kwargs)
 
     def set_controller_goal(self, cmd_type, **kwargs):
-        """ Set the appropriate redis keys for the robot command. Internal use only.
+        """ Send the robot command to the Control Interface. Internal use only.
 
-            Sets the command timestamp, command type and controller goal.
-            This version is specific for real robots.
+            Sets the command timestamp, command type and controller goal keys,
+            or publishes them as a single message if the redis cmd_transport
+            is pubsub. This version is specific for real robots.
+
+            The goal is encoded with the schema for cmd_type in
+            goal_codec.GOAL_SCHEMAS, and a ValueError is raised if it does not
+            match, before anything is sent.
 
             Args:
                 cmd_type (str): string identifier for fn to execute. Must exactly match
@@ -237,10 +240,7 @@ class RealRobotInterface(RobotInterface):
         """
         logging.debug("cmd_type {}".format(cmd_type))
 
-        control_cmd = {ROBOT_CMD_TSTAMP_KEY: time.time(),
-                       ROBOT_CMD_TYPE_KEY: cmd_type,
-                       CONTROLLER_GOAL_KEY: json.dumps(kwargs)}
-        self.redisClient.mset(control_cmd)
+        self.redisClient.send_cmd(cmd_type, kwargs)
         self.action_set = True
 
     def set_joint_torques(self, torques, **kwargs):
@@ -8,7 +8,7 @@ import numpy as np
 import logging
 import time
 from perls2.robots.real_robot_interface import RealRobotInterface
-from perls2.ros_interfaces.redis_interface import RobotRedisInterface
+from perls2.ros_interfaces.redis_interface import make_robot_redis_interface
 from perls2.ros_interfaces.redis_keys import *
 from perls2.ros_interfaces.redis_values import *
 # For dumping config dict to redis
@@ -21,6 +21,24 @@ def bstr_to_ndarray(array_bstr):
     return np.fromstring(array_bstr[1:-1], dtype=np.float, sep=',')
 
 
+# Redis keys fetched together for a state snapshot, by snapshot field.
+STATE_SNAPSHOT_KEYS = {
+    'tstamp': ROBOT_STATE_TSTAMP_KEY,
+    'q': ROBOT_STATE_Q_KEY,
+    'dq': ROBOT_STATE_DQ_KEY,
+    'tau': ROBOT_STATE_TAU_KEY,
+    'ee_position': ROBOT_STATE_EE_POS_KEY,
+    'ee_orientation': ROBOT_STATE_EE_ORN_KEY,
+    'ee_pose': ROBOT_STATE_EE_POSE_KEY,
+    'ee_v': ROBOT_STATE_EE_V_KEY,
+    'ee_w': ROBOT_STATE_EE_OMEGA_KEY,
+    'jacobian': ROBOT_MODEL_JACOBIAN_KEY,
+    'linear_jacobian': ROBOT_MODEL_L_JACOBIAN_KEY,
+    'angular_jacobian': ROBOT_MODEL_A_JACOBIAN_KEY,
+    'mass_matrix': ROBOT_MODEL_MASS_MATRIX_KEY,
+}
+
+
 class RealSawyerInterface(RealRobotInterface):
     """Abstract interface to be implemented for each real and simulated
     robot.
@@ -36,7 +54,8 @@ class RealSawyerInterface(RealRobotInterface):
         Initialize variables and wrappers
         """
         super().__init__(controlType=controlType, config=config)
-        self.redisClient = RobotRedisInterface(**self.config['redis'])
+        self.redisClient = make_robot_redis_interface(**self.config['redis'])
+        self._state_snapshot = None
         logging.info("warming up redis connection - sleep for 10s")
         time.sleep(10.0)
         self.update_model()
@@ -54,8 +73,69 @@ class RealSawyerInterface(RealRobotInterface):
     def connect(self):
         self.redisClient.set(ROBOT_ENV_CONN_KEY, 'True')
 
+    def step(self):
+        """Clear the state snapshot so the next step reads fresh states.
+        """
+        self.clear_state_snapshot()
+
+    def get_state_snapshot(self):
+        """Get all robot states and models in a single redis round trip.
+
+        The snapshot is cached, and state properties (q, dq, ee_pose,
+        jacobian, mass_matrix ...) are served from it until the next call
+        to step or clear_state_snapshot.
+
+        Returns:
+            snapshot (dict): states and models as ndarrays, keyed by property
+                name, with 'tstamp' the time the states were set by the
+                Control Interface.
+        """
+        names = list(STATE_SNAPSHOT_KEYS.keys())
+        values = self.redisClient.mget([STATE_SNAPSHOT_KEYS[name] for name in names])
+        self._state_snapshot = dict(zip(names, values))
+        return self._state_snapshot
+
+    def get_state_history(self, since=None, count=None):
+        """Get robot states from every control tick, stacked as arrays.
+
+        Requires state_history_len to be set in the Control Interface redis
+        config.
+
+        Args:
+            since (float): only get states added at or after this redis
+                server time (seconds). If None, get the most recent states.
+            count (int): maximum number of states to get. If None, get all.
+
+        Returns:
+            history (dict): 'tstamp' (N,) and 'q', 'dq', 'tau', 'ee_pose',
+                'ee_v' as (N, dim) arrays, ordered from oldest to newest.
+                Empty dict if there are no states.
+        """
+        states = self.redisClient.get_state_history(since=since, count=count)
+        if not states:
+            return {}
+        return {field: np.stack([state[field] for state in states])
+                for field in states[0]}
+
+    def clear_state_snapshot(self):
+        """Read state properties directly from redis again.
+        """
+        self._state_snapshot = None
+
+    def _get_state(self, name):
+        """Get state from the snapshot if there is one, otherwise from redis.
+
+        Args:
+            name (str): name of the state in STATE_SNAPSHOT_KEYS.
+        """
+        if self._state_snapshot is not None:
+            return self._state_snapshot[name]
+        return self.redisClient.get(STATE_SNAPSHOT_KEYS[name])
+
     def disconnect(self):
         self.redisClient.set(ROBOT_ENV_CONN_KEY, 'False')
+        if self.redisClient.cmd_transport == CMD_TRANSPORT_PUBSUB:
+            self.redisClient.send_cmd(DISCONNECT)
 
     def reset(self):
         """ Reset arm to neutral configuration. Blocking call
@@ -64,9 +144,8 @@ class RealSawyerInterface(RealRobotInterface):
         TODO: This doesn't actually work, it just waits for the timeout.
         """
         logging.debug("Resetting robot")
-        reset_cmd = {ROBOT_CMD_TSTAMP_KEY: time.time(),
-                     ROBOT_CMD_TYPE_KEY: RESET}
-        self.redisClient.mset(reset_cmd)
+        self.clear_state_snapshot()
+        self.redisClient.send_cmd(RESET)
         # Wait for reset to be read by contrl interface.
         time.sleep(5)
         start = time.time()
@@ -101,8 +180,7 @@ class RealSawyerInterface(RealRobotInterface):
         Get the position of the end-effector.
         :return: a list of floats for the position [x, y, z]
         """
-        # Get position as bytes string
-        return self.redisClient.get(ROBOT_STATE_EE_POS_KEY)
+        return self._get_state('ee_position')
 
     @property
     def ee_orientation(self):
@@ -111,7 +189,7 @@ class RealSawyerInterface(RealRobotInterface):
         :return: a list of floats for the orientation quaternion [qx,
         qy, qz, qw]
         """
-        return self.redisClient.get(ROBOT_STATE_EE_ORN_KEY)
+        return self._get_state('ee_orientation')
 
     @property
     def ee_pose(self):
@@ -120,7 +198,7 @@ class RealSawyerInterface(RealRobotInterface):
         :return: a list of floats for the position and orientation [x,
         y, z, qx, qy, qz, qw]
         """
-        return self.redisClient.get(ROBOT_STATE_EE_POSE_KEY)
+        return self._get_state('ee_pose')
 
     @property
     def ee_v(self):
@@ -130,7 +208,7 @@ class RealSawyerInterface(RealRobotInterface):
         :return: a list of floats for the linear velocity m/s [vx, vy,
         vz]
         """
-        return self.redisClient.get(ROBOT_STATE_EE_V_KEY)
+        return self._get_state('ee_v')
 
     @property
     def ee_pose_euler(self):
@@ -144,7 +222,7 @@ class RealSawyerInterface(RealRobotInterface):
         :return: a list of floats for the twist velocity [vx, vy, vz,
         wx, wy, wz]
         """
-        return self.redisClient.get(ROBOT_STATE_EE_OMEGA_KEY)
+        return self._get_state('ee_w')
 
     @property
     def ee_twist(self):
@@ -188,7 +266,7 @@ class RealSawyerInterface(RealRobotInterface):
         indices from small to large.
         Typically the order goes from base to end effector.
         """
-        return self.redisClient.get(ROBOT_STATE_Q_KEY)
+        return self._get_state('q')
 
     @q.setter
     def q(self, qd):
@@ -203,13 +281,7 @@ class RealSawyerInterface(RealRobotInterface):
         indices from small to large.
         Typically the order goes from base to end effector.
         """
-        dq_dict = self.redisClient.get_dict(ROBOT_STATE_DQ_KEY)
-        dq = []
-        if isinstance(dq_dict, dict):
-            for limb_name in self.config['sawyer']['limb_joint_names']:
-                dq.append(dq_dict[limb_name])
-        dq = dq_dict
-        return dq
+        return self._get_state('dq')
 
     @property
     def ddq(self):
@@ -229,29 +301,23 @@ class RealSawyerInterface(RealRobotInterface):
         small to large.
         Typically the order goes from base to end effector.
         """
-        tau_dict = self.redisClient.get_dict(ROBOT_STATE_TAU_KEY)
-        tau = []
-
-        for limb_name in self.config['sawyer']['limb_joint_names']:
-            tau.append(tau_dict[limb_name])
-
-        return tau
+        return self._get_state('tau')
 
     @property
     def jacobian(self):
-        return self.redisClient.get(ROBOT_MODEL_JACOBIAN_KEY)
+        return self._get_state('jacobian')
 
     @property
     def linear_jacobian(self):
-        return self.redisClient.get(ROBOT_MODEL_L_JACOBIAN_KEY)
+        return self._get_state('linear_jacobian')
 
     @property
     def angular_jacobian(self):
-        return self.redisClient.get(ROBOT_MODEL_A_JACOBIAN_KEY)
+        return self._get_state('angular_jacobian')
 
     @property
     def mass_matrix(self):
-        return self.redisClient.get(ROBOT_MODEL_MASS_MATRIX_KEY)
+        return self._get_state('mass_matrix')
 
     @property
     def N_q(self):
@@ -266,10 +332,7 @@ class RealSawyerInterface(RealRobotInterface):
         self.redisClient.mset({CONTROLLER_CONTROL_PARAMS_KEY: json.dumps(self.control_config),
                                CONTROLLER_CONTROL_TYPE_KEY: selected_type})
 
-        cmd_type = CHANGE_CONTROLLER
-        control_cmd = {ROBOT_CMD_TSTAMP_KEY: time.time(), ROBOT_CMD_TYPE_KEY: cmd_type}
-
-        self.redisClient.mset(control_cmd)
+        self.redisClient.send_cmd(CHANGE_CONTROLLER)
 
         logging.debug("{} Control parameters set to redis: {}".format(selected_type, self.control_config))
 
@@ -292,5 +355,8 @@ class RealSawyerInterface(RealRobotInterface):
         if (value > 1.0 or value < 0):
             raise ValueError("Invalid gripper value must be fraction between 0 and 1")
 
-        self.redisClient.set(ROBOT_SET_GRIPPER_CMD_KEY, (value * self.GRIPPER_MAX_CLOSED))
-        self.redisClient.set(ROBOT_SET_GRIPPER_CMD_TSTAMP_KEY, time.time())
\ No newline at end of file
+        if self.redisClient.cmd_transport == CMD_TRANSPORT_PUBSUB:
+            self.redisClient.send_cmd(SET_GRIPPER_VALUE, {'value': value * self.GRIPPER_MAX_CLOSED})
+        else:
+            self.redisClient.set(ROBOT_SET_GRIPPER_CMD_KEY, (value * self.GRIPPER_MAX_CLOSED))
+            self.redisClient.set(ROBOT_SET_GRIPPER_CMD_TSTAMP_KEY, time.time())
\ No newline at end of file
@@ -0,0 +1,123 @@
+"""Redis I/O helpers for the Control Interfaces.
+
+Kept free of ROS imports, so they can be tested without a robot.
+
+Must remain compatible with python 2.7 for the SawyerCtrlInterface.
+"""
+import logging
+import sys
+import threading
+import time
+import six
+from perls2.ros_interfaces.redis_keys import *
+from perls2.ros_interfaces.redis_values import *
+
+bSET_GRIPPER_VALUE = SET_GRIPPER_VALUE.encode()
+bDISCONNECT = DISCONNECT.encode()
+
+
+class LatestSlot(object):
+    """Slot holding the latest value written by a single writer thread.
+
+    put replaces the (seq, value) tuple with a single reference assignment,
+    which is atomic in CPython, so readers never block the writer and never
+    see a partially written value.
+    """
+    def __init__(self):
+        self._item = (0, None)
+
+    def put(self, value):
+        self._item = (self._item[0] + 1, value)
+
+    def get(self):
+        """Returns (seq, value), where seq increments on every put.
+        """
+        return self._item
+
+
+def drain(queue):
+    """Pop all items of a deque another thread appends to, oldest first.
+
+    deque appends and pops are atomic in CPython, so the writer never
+    blocks. Only one thread may pop.
+    """
+    items = []
+    while queue:
+        items.append(queue.popleft())
+    return items
+
+
+class IOThread(object):
+    """Daemon thread running the redis I/O loop of a Control Interface.
+
+    The running event is cleared when the loop returns or raises, so the
+    torque loop waiting on it stops instead of applying the last goal
+    forever. An exception of the loop is logged, and re-raised by join.
+    """
+    def __init__(self, io_loop, running, name=None):
+        """
+        Args:
+            io_loop (callable): I/O loop, run while running is set.
+            running (threading.Event): set while the I/O loop runs.
+            name (str): name of the thread.
+        """
+        self.running = running
+        self._io_loop = io_loop
+        self._exc_info = None
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+
+    def start(self):
+        self.running.set()
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self._io_loop()
+        except Exception:
+            self._exc_info = sys.exc_info()
+            logging.exception("Redis I/O loop failed, stopping the control loop.")
+        finally:
+            self.running.clear()
+
+    def join(self):
+        """Wait for the I/O loop to stop, re-raising its exception if any.
+        """
+        self._thread.join()
+        if self._exc_info is not None:
+            six.reraise(*self._exc_info)
+
+
+def dispatch_cmd_msgs(redis_client, dispatch, process_gripper_cmd):
+    """Dispatch all commands published on the command channel since the last call.
+
+    Used when the redis cmd_transport is pubsub. The latency between the
+    last command being sent and received is set to ROBOT_CMD_LATENCY_KEY.
+
+    Args:
+        redis_client (RobotRedisInterface): client subscribed to the commands.
+        dispatch (callable): called with the cmd_type (bytes) and goal of
+            each robot command, in the order they were sent.
+        process_gripper_cmd (callable): called with the value of each
+            gripper command.
+
+    Returns:
+        (bool, float): False if the environment disconnected, True
+            otherwise, and the latency of the last command (s), None if
+            there was none.
+    """
+    cmd_msgs = redis_client.get_cmd_msgs()
+    latency = None
+    for cmd_msg in cmd_msgs:
+        latency = time.time() - cmd_msg['tstamp']
+        cmd_type = cmd_msg['cmd_type'].encode()
+        if cmd_type == bDISCONNECT:
+            return False, latency
+        elif cmd_type == bSET_GRIPPER_VALUE:
+            process_gripper_cmd(cmd_msg['goal']['value'])
+        else:
+            dispatch(cmd_type, cmd_msg['goal'])
+
+    if cmd_msgs:
+        redis_client.set(ROBOT_CMD_LATENCY_KEY, latency)
+    return True, latency
@@ -0,0 +1,435 @@
+"""Binary encoding of camera frames for the Kinect redis keys.
+
+Frames keep their native dtype, so 16 bit depth and IR images are not
+truncated to 8 bits. The payload may be compressed losslessly with PNG or
+zlib, or lossily with JPEG for 8 bit color images.
+
+Header layout (little-endian):
+    magic (3s): b'\\x93F2'
+    version (B): codec version, currently 1.
+    dtype (c): type code of the frame, see DTYPE_CODES.
+    compression (B): compression of the payload, see COMPRESSION_IDS.
+    ndim (B): number of dimensions of the frame.
+    shape (ndim x I): size of each dimension.
+
+Values without the magic prefix are in the legacy format of
+convert_frame_to_encoded_bytes: a big-endian (height, width) header followed
+by uint8 pixels.
+
+A frameset is the rgb, depth and ir frames of one capture and their shared
+timestamp, written with a single MSET and read with a single MGET.
+
+Synchronized framesets also have a sequence number, and are written to the
+slot seq % ring_size of a ring buffer of keys, so readers can get recent
+framesets by seq. The seq is published on KINECT2_FRAMESET_CHANNEL_KEY
+after each write, so readers can wait for new framesets without polling.
+
+Must remain compatible with python 2.7 for the KinectROSInterface.
+"""
+from __future__ import division
+import struct
+import zlib
+import numpy as np
+import cv2
+
+from perls2.ros_interfaces.redis_keys import *
+
+FRAME_MAGIC = b'\x93F2'
+FRAME_VERSION = 1
+
+# Type codes of the frame pixels. All payloads are little-endian.
+DTYPE_CODES = {
+    b'B': np.dtype('|u1'),
+    b'H': np.dtype('<u2'),
+    b'f': np.dtype('<f4'),
+}
+_DTYPE_TO_CODE = dict((dtype, code) for code, dtype in DTYPE_CODES.items())
+
+# Wire ids of the compressions. Never reuse an id.
+COMPRESSION_IDS = {
+    None: 0,
+    'zlib': 1,
+    'png': 2,
+    'jpeg': 3,
+}
+_ID_TO_COMPRESSION = dict((id_, name) for name, id_ in COMPRESSION_IDS.items())
+
+# Number of framesets kept in the ring buffer.
+DEFAULT_RING_SIZE = 4
+# Number of attempts to read the latest frameset before it is overwritten.
+_MAX_LATEST_READS = 3
+
+_HEADER_FMT = '<3sBcBB'
+_HEADER_SIZE = struct.calcsize(_HEADER_FMT)
+
+# Redis keys of each modality of a frameset.
+FRAMESET_KEYS = {
+    'rgb': KINECT2_RGB_KEY,
+    'depth': KINECT2_DEPTH_KEY,
+    'ir': KINECT2_IR_KEY,
+}
+
+
+def is_encoded_frame(value):
+    """Check if a redis value was written with encode_frame.
+    """
+    return value is not None and value[:len(FRAME_MAGIC)] == FRAME_MAGIC
+
+
+def encode_frame(frame, compression=None, jpeg_quality=90, zlib_level=1):
+    """Encode a frame as header + payload bytes.
+
+    Args:
+        frame (ndarray): (h, w) or (h, w, c) image of a dtype in DTYPE_CODES.
+        compression (str): None, 'zlib', 'png' (lossless, uint8 or uint16)
+            or 'jpeg' (lossy, uint8 with 1 or 3 channels).
+        jpeg_quality (int): quality of jpeg compression, 0 - 100.
+        zlib_level (int): level of zlib compression, 1 (fastest) - 9.
+
+    Returns:
+        bytes: encoded frame, ready to be set to redis.
+    """
+    frame, dtype = _check_frame(frame, compression)
+    header = _frame_header(frame, dtype, compression)
+    if compression is None:
+        return header + np.ascontiguousarray(frame, dtype=dtype).tobytes()
+    payload = _compress(frame, compression, jpeg_quality, zlib_level)
+    return header + np.frombuffer(payload, dtype=np.uint8).tobytes()
+
+
+def _check_frame(frame, compression):
+    """Check a frame can be encoded, returning it as an ndarray and the
+    little-endian dtype of its payload.
+    """
+    frame = np.asarray(frame)
+    dtype = frame.dtype.newbyteorder('<') if frame.dtype.itemsize > 1 else frame.dtype
+    if dtype not in _DTYPE_TO_CODE:
+        raise ValueError("Unsupported dtype for frame codec: {}".format(frame.dtype))
+    if compression not in COMPRESSION_IDS:
+        raise ValueError("Unknown frame compression {}".format(compression))
+    if compression == 'jpeg' and dtype != np.uint8:
+        raise ValueError("jpeg compression requires uint8 frames.")
+    if compression == 'png' and dtype not in (np.uint8, np.uint16):
+        raise ValueError("png compression requires uint8 or uint16 frames.")
+    return frame, dtype
+
+
+def _frame_header(frame, dtype, compression):
+    return struct.pack(_HEADER_FMT,
+                       FRAME_MAGIC,
+                       FRAME_VERSION,
+                       _DTYPE_TO_CODE[dtype],
+                       COMPRESSION_IDS[compression],
+                       frame.ndim) + struct.pack('<{}I'.format(frame.ndim), *frame.shape)
+
+
+def _compress(frame, compression, jpeg_quality, zlib_level):
+    """Compressed payload of a frame, as a bytes-like object.
+    """
+    if compression == 'zlib':
+        return zlib.compress(np.ascontiguousarray(frame).tobytes(), zlib_level)
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality] if compression == 'jpeg' else []
+    ok, payload = cv2.imencode('.' + ('jpg' if compression == 'jpeg' else 'png'),
+                               frame, params)
+    if not ok:
+        raise ValueError("Failed to {} encode frame of shape {}".format(
+            compression, frame.shape))
+    return payload
+
+
+class FrameEncoder(object):
+    """Encodes the frames of a stream into a reused buffer.
+
+    The header and payload are written into one preallocated bytearray,
+    grown as needed, and copied out once as bytes, instead of concatenating
+    new bytes for every frame. Bytes are returned as redis-py (3.3.8) does
+    not accept bytearrays or memoryviews.
+
+    Attributes:
+        compression (str): compression of the frames, see encode_frame.
+    """
+
+    def __init__(self, compression=None, jpeg_quality=90, zlib_level=1):
+        if compression not in COMPRESSION_IDS:
+            raise ValueError("Unknown frame compression {}".format(compression))
+        self.compression = compression
+        self.jpeg_quality = jpeg_quality
+        self.zlib_level = zlib_level
+        self._buffer = bytearray(0)
+
+    def encode(self, frame):
+        """Encode a frame, as encode_frame.
+
+        Returns:
+            bytes: encoded frame.
+        """
+        frame, dtype = _check_frame(frame, self.compression)
+        header = _frame_header(frame, dtype, self.compression)
+        if self.compression is None:
+            payload = frame
+        else:
+            payload = np.frombuffer(_compress(frame, self.compression, self.jpeg_quality,
+                                              self.zlib_level), dtype=np.uint8)
+            dtype = payload.dtype
+        header_size = len(header)
+        size = header_size + payload.nbytes
+        if len(self._buffer) < size:
+            self._buffer = bytearray(size)
+
+        view = memoryview(self._buffer)
+        view[:header_size] = header
+        np.copyto(np.ndarray(payload.shape, dtype, buffer=self._buffer, offset=header_size),
+                  payload)
+        return view[:size].tobytes()
+
+
+# Dtype and number of channels of the ROS image encodings copied directly.
+IMAGE_MSG_ENCODINGS = {
+    'bgr8': (np.dtype(np.uint8), 3),
+    '16UC1': (np.dtype('<u2'), 1),
+}
+
+
+class FrameBufferPool(object):
+    """Preallocated frame buffers of a stream, used round robin.
+
+    A buffer is overwritten num_buffers frames after it was returned, so
+    num_buffers must exceed the number of frames of the stream held at once,
+    e.g. in the queue of an ApproximateTimeSynchronizer.
+
+    Attributes:
+        num_buffers (int): number of buffers in the pool.
+    """
+
+    def __init__(self, num_buffers):
+        if num_buffers < 1:
+            raise ValueError("num_buffers must be at least 1.")
+        self.num_buffers = num_buffers
+        self._buffers = []
+        self._index = 0
+
+    def next(self, shape, dtype):
+        """The next buffer of the pool, reallocated if shape or dtype changed.
+        """
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+        if not self._buffers or self._buffers[0].shape != shape \
+                or self._buffers[0].dtype != dtype:
+            self._buffers = [np.empty(shape, dtype) for _ in range(self.num_buffers)]
+            self._index = 0
+        buffer = self._buffers[self._index]
+        self._index = (self._index + 1) % self.num_buffers
+        return buffer
+
+
+def copy_image_msg(msg, encoding, pool):
+    """Copy the data of a sensor_msgs/Image into a buffer of a pool.
+
+    Args:
+        msg (sensor_msgs.msg.Image): image message.
+        encoding (str): expected encoding, one of IMAGE_MSG_ENCODINGS.
+        pool (FrameBufferPool): buffers of the stream.
+
+    Returns:
+        ndarray: the frame, or None if the message has another encoding or
+            layout and must be converted with cv_bridge instead.
+    """
+    dtype, channels = IMAGE_MSG_ENCODINGS[encoding]
+    if msg.encoding != encoding or msg.is_bigendian \
+            or msg.step != msg.width * channels * dtype.itemsize:
+        return None
+    shape = (msg.height, msg.width, channels) if channels > 1 else (msg.height, msg.width)
+    buffer = pool.next(shape, dtype)
+    np.copyto(buffer, np.frombuffer(msg.data, dtype=dtype).reshape(shape))
+    return buffer
+
+
+def decode_frame(value, legacy=True):
+    """Decode a redis value into a frame.
+
+    Uncompressed frames are wrapped with np.frombuffer without copying, so
+    the returned array is read-only.
+
+    Args:
+        value (bytes): raw value from redis.
+        legacy (bool): decode values without the codec header in the legacy
+            uint8 format.
+
+    Returns:
+        ndarray: decoded frame, or None if value is None.
+    """
+    if value is None:
+        return None
+    if not is_encoded_frame(value):
+        if legacy:
+            return decode_legacy_frame(value)
+        raise ValueError("Redis value is not a binary encoded frame.")
+
+    _, version, code, compression_id, ndim = struct.unpack_from(_HEADER_FMT, value, 0)
+    if version != FRAME_VERSION:
+        raise ValueError("Unsupported frame codec version {}, expected {}".format(
+            version, FRAME_VERSION))
+    if code not in DTYPE_CODES:
+        raise ValueError("Unknown frame codec dtype code {}".format(code))
+    if compression_id not in _ID_TO_COMPRESSION:
+        raise ValueError("Unknown frame compression id {}".format(compression_id))
+    shape = struct.unpack_from('<{}I'.format(ndim), value, _HEADER_SIZE)
+    offset = _HEADER_SIZE + 4 * ndim
+    compression = _ID_TO_COMPRESSION[compression_id]
+
+    if compression is None:
+        return np.frombuffer(value, dtype=DTYPE_CODES[code], offset=offset).reshape(shape)
+    if compression == 'zlib':
+        payload = zlib.decompress(memoryview(value)[offset:])
+        return np.frombuffer(payload, dtype=DTYPE_CODES[code]).reshape(shape)
+    frame = cv2.imdecode(np.frombuffer(value, dtype=np.uint8, offset=offset),
+                         cv2.IMREAD_UNCHANGED)
+    if frame is None:
+        raise ValueError("Failed to {} decode frame".format(compression))
+    return frame.reshape(shape)
+
+
+def decode_legacy_frame(value):
+    """Decode a frame from the legacy (height, width) + uint8 format.
+
+    Returns:
+        ndarray: (h, w, c) uint8 frame.
+    """
+    height, width = struct.unpack('>II', value[:8])
+    frame = np.frombuffer(value, dtype=np.uint8, offset=8)
+    return frame.reshape(height, width, -1)
+
+
+def set_frameset(redis_client, frames, timestamp, compression=None, **kwargs):
+    """Write the frames of a capture and their timestamp with one MSET.
+
+    Args:
+        redis_client (redis.Redis): client of the redis server.
+        frames (dict): frames keyed by modality, see FRAMESET_KEYS.
+        timestamp (float): capture timestamp (ms), shared by all frames.
+        compression (dict): compression of each modality, None for raw.
+        kwargs: compression parameters for encode_frame.
+    """
+    compression = compression or {}
+    mapping = {KINECT2_RGB_TSTAMP_KEY: str(timestamp)}
+    for modality, frame in frames.items():
+        mapping[FRAMESET_KEYS[modality]] = encode_frame(
+            frame, compression.get(modality), **kwargs)
+    redis_client.mset(mapping)
+
+
+def get_frameset(redis_client, modalities=('rgb', 'depth', 'ir')):
+    """Read the frames of a capture and their timestamp with one MGET.
+
+    Args:
+        redis_client (redis.Redis): client of the redis server.
+        modalities (list): modalities to read, see FRAMESET_KEYS.
+
+    Returns:
+        dict of frames keyed by modality, with the timestamp (bytes) of the
+            capture as 'image_stamp'.
+    """
+    values = redis_client.mget([KINECT2_RGB_TSTAMP_KEY] +
+                               [FRAMESET_KEYS[modality] for modality in modalities])
+    frameset = {'image_stamp': values[0]}
+    for modality, value in zip(modalities, values[1:]):
+        frameset[modality] = decode_frame(value)
+    return frameset
+
+
+def _ring_key(slot, name):
+    return '{}{}::{}'.format(KINECT2_RING_KEY, slot, name)
+
+
+def set_synced_frameset(redis_client, frames, timestamp, seq,
+                        ring_size=DEFAULT_RING_SIZE, compression=None, encoders=None,
+                        **kwargs):
+    """Write a synchronized frameset to its ring buffer slot and publish it.
+
+    The frames, timestamp and seq are written with one MSET, pipelined with
+    the PUBLISH of the seq. Frames of the modalities not published are
+    deleted from the slot, so they are not read with this seq.
+
+    Args:
+        redis_client (redis.Redis): client of the redis server.
+        frames (dict): frames keyed by modality, see FRAMESET_KEYS.
+        timestamp (float): capture timestamp (ms), shared by all frames.
+        seq (int): sequence number of the frameset, increasing from 1.
+        ring_size (int): number of slots of the ring buffer.
+        compression (dict): compression of each modality, None for raw.
+        encoders (dict): FrameEncoders of the modalities, used instead of
+            encode_frame and compression to reuse their buffers.
+        kwargs: compression parameters for encode_frame.
+    """
+    compression = compression or {}
+    encoders = encoders or {}
+    slot = seq % ring_size
+    mapping = {_ring_key(slot, 'seq'): str(seq),
+               _ring_key(slot, 'timestamp'): str(timestamp),
+               KINECT2_SEQ_KEY: str(seq),
+               KINECT2_RING_SIZE_KEY: str(ring_size)}
+    for modality, frame in frames.items():
+        if modality in encoders:
+            mapping[_ring_key(slot, modality)] = encoders[modality].encode(frame)
+        else:
+            mapping[_ring_key(slot, modality)] = encode_frame(
+                frame, compression.get(modality), **kwargs)
+    stale_keys = [_ring_key(slot, modality) for modality in FRAMESET_KEYS
+                  if modality not in frames]
+    pipe = redis_client.pipeline(transaction=False)
+    if stale_keys:
+        pipe.delete(*stale_keys)
+    pipe.mset(mapping)
+    pipe.publish(KINECT2_FRAMESET_CHANNEL_KEY, str(seq))
+    pipe.execute()
+
+
+def get_latest_seq(redis_client):
+    """Sequence number of the latest synchronized frameset, 0 if none.
+    """
+    seq = redis_client.get(KINECT2_SEQ_KEY)
+    return 0 if seq is None else int(seq)
+
+
+def get_synced_frameset(redis_client, modalities=('rgb', 'depth', 'ir'), seq=None):
+    """Read a synchronized frameset from the ring buffer.
+
+    Args:
+        redis_client (redis.Redis): client of the redis server.
+        modalities (list): modalities to read, see FRAMESET_KEYS.
+        seq (int): sequence number of the frameset. Defaults to the latest.
+
+    Returns:
+        dict of frames keyed by modality, with the seq and the timestamp
+            (bytes) of the capture as 'image_stamp', or None if there is no
+            synchronized frameset. Modalities not published in the
+            frameset are None.
+
+    Raises:
+        ValueError: if the frameset was overwritten in the ring buffer.
+    """
+    latest = seq is None
+    for _ in range(_MAX_LATEST_READS):
+        latest_seq, ring_size = redis_client.mget([KINECT2_SEQ_KEY, KINECT2_RING_SIZE_KEY])
+        if latest_seq is None:
+            return None
+        if latest:
+            seq = int(latest_seq)
+        elif seq > int(latest_seq):
+            raise ValueError("Frameset {} has not been captured, latest is {}".format(
+                seq, int(latest_seq)))
+        slot = seq % int(ring_size)
+        values = redis_client.mget([_ring_key(slot, 'seq'), _ring_key(slot, 'timestamp')] +
+                                   [_ring_key(slot, modality) for modality in modalities])
+        if values[0] is not None and int(values[0]) == seq:
+            break
+        # The latest frameset may be overwritten by a fast writer while
+        # reading it, in which case the new latest is read.
+        if not latest:
+            raise ValueError("Frameset {} was overwritten in the ring buffer.".format(seq))
+    else:
+        raise ValueError("Frameset ring buffer is overwritten faster than it is read.")
+    frameset = {'seq': seq, 'image_stamp': values[1]}
+    for modality, value in zip(modalities, values[2:]):
+        frameset[modality] = decode_frame(value)
+    return frameset
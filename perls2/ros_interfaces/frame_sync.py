@@ -0,0 +1,129 @@
+"""Approximate time synchronization of camera streams.
+
+Each stream (e.g. rgb, depth and ir) keeps a short queue of its most recent
+(timestamp, frame) messages. When a message arrives, the newest message of
+the pivot stream is matched with the message closest in time of every other
+stream. If all of them are within slop of the pivot, they are emitted as a
+frameset with the next sequence number, and older messages are dropped.
+
+Must remain compatible with python 2.7 for the KinectROSInterface.
+"""
+import time
+import threading
+from collections import deque
+
+
+class ApproximateTimeSynchronizer(object):
+    """Matches messages of several streams with close timestamps.
+
+    Attributes:
+        streams (list): names of the streams.
+        pivot (str): stream whose timestamp is the timestamp of a frameset.
+        slop (float): max timestamp difference to the pivot message, in the
+            units of the timestamps.
+        seq (int): sequence number of the last frameset, start_seq before
+            the first.
+    """
+
+    def __init__(self, streams, slop, pivot=None, queue_size=5, start_seq=0):
+        """Initialize.
+
+        Args:
+            streams (list): names of the streams.
+            slop (float): max timestamp difference to the pivot message.
+            pivot (str): stream whose timestamp is the frameset timestamp.
+                Defaults to the first stream.
+            queue_size (int): number of recent messages kept per stream.
+            start_seq (int): framesets are numbered from start_seq + 1,
+                e.g. to continue the sequence of a previous run.
+        """
+        if pivot is None:
+            pivot = streams[0]
+        if pivot not in streams:
+            raise ValueError("pivot {} is not one of the streams {}".format(pivot, streams))
+        self.streams = list(streams)
+        self.pivot = pivot
+        self.slop = slop
+        self.seq = start_seq
+        self._queues = dict((stream, deque(maxlen=queue_size)) for stream in streams)
+        self._last_timestamp = None
+        self._frameset = None
+        self._cond = threading.Condition()
+
+    def add(self, stream, timestamp, frame):
+        """Add a message, emitting a frameset if it completes one.
+
+        Called from the subscriber callbacks, possibly on different threads.
+
+        Args:
+            stream (str): name of the stream.
+            timestamp (float): timestamp of the message.
+            frame: frame of the message.
+
+        Returns:
+            (dict): the new frameset, or None.
+        """
+        with self._cond:
+            self._queues[stream].append((timestamp, frame))
+            frameset = self._match()
+            if frameset is not None:
+                self._frameset = frameset
+                self._cond.notify_all()
+            return frameset
+
+    def _match(self):
+        pivot_queue = self._queues[self.pivot]
+        if not pivot_queue:
+            return None
+        pivot_timestamp, pivot_frame = pivot_queue[-1]
+        if self._last_timestamp is not None and pivot_timestamp <= self._last_timestamp:
+            return None
+
+        frames = {self.pivot: pivot_frame}
+        matched_timestamps = {self.pivot: pivot_timestamp}
+        for stream in self.streams:
+            if stream == self.pivot:
+                continue
+            if not self._queues[stream]:
+                return None
+            timestamp, frame = min(self._queues[stream],
+                                   key=lambda message: abs(message[0] - pivot_timestamp))
+            if abs(timestamp - pivot_timestamp) > self.slop:
+                return None
+            frames[stream] = frame
+            matched_timestamps[stream] = timestamp
+
+        # Drop the matched messages and older ones, so they are not reused.
+        for stream, timestamp in matched_timestamps.items():
+            queue = self._queues[stream]
+            while queue and queue[0][0] <= timestamp:
+                queue.popleft()
+        self._last_timestamp = pivot_timestamp
+        self.seq += 1
+        return {'seq': self.seq, 'timestamp': pivot_timestamp, 'frames': frames}
+
+    def latest(self):
+        """The last frameset emitted, or None.
+        """
+        with self._cond:
+            return self._frameset
+
+    def wait_for_frameset(self, after_seq=0, timeout=None):
+        """Wait for a frameset with a sequence number after after_seq.
+
+        Args:
+            after_seq (int): sequence number of the last frameset seen.
+            timeout (float): max time to wait (s), or None to wait forever.
+
+        Returns:
+            (dict): the latest frameset, with keys seq, timestamp and frames,
+                or None on timeout.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._frameset is None or self._frameset['seq'] <= after_seq:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self._frameset
@@ -0,0 +1,163 @@
+"""Binary encoding of robot commands and their controller goals.
+
+Each command type has a fixed schema of float64 goal fields, registered in
+GOAL_SCHEMAS by its redis_values command name. Commands are packed as a small
+header followed by the present fields in schema order, so the Control
+Interface unpacks goals with np.frombuffer instead of parsing json. Goals
+that do not match their schema raise a ValueError when encoded, before they
+are sent.
+
+Header layout (little-endian):
+    magic (3s): b'\\x93G2'
+    version (B): codec version, currently 1.
+    cmd id (B): id of the command type, see CMD_IDS.
+    fields (B): bitmask of the schema fields present in the payload.
+    tstamp (d): time the command was sent.
+
+Must remain compatible with python 2.7 for the SawyerCtrlInterface.
+"""
+from __future__ import division
+import json
+import struct
+import numpy as np
+from perls2.ros_interfaces.redis_values import *
+
+GOAL_MAGIC = b'\x93G2'
+GOAL_VERSION = 1
+
+# Goal fields for each command type as (name, size, optional).
+# Fields of size 0 are scalars.
+GOAL_SCHEMAS = {
+    SET_EE_POSE: [('set_pos', 3, False),
+                  ('set_ori', 4, False)],
+    MOVE_EE_DELTA: [('delta', 6, False),
+                    ('set_pos', 3, True),
+                    ('set_ori', 4, True)],
+    SET_JOINT_DELTA: [('delta', 7, False)],
+    SET_JOINT_POSITIONS: [('set_qpos', 7, False)],
+    SET_JOINT_VELOCITIES: [('velocities', 7, False)],
+    SET_JOINT_TORQUES: [('torques', 7, False)],
+    SET_GRIPPER_VALUE: [('value', 0, False)],
+    RESET: [],
+    CHANGE_CONTROLLER: [],
+    IDLE: [],
+    DISCONNECT: [],
+}
+
+# Wire ids of the command types. Never reuse an id.
+CMD_IDS = {
+    RESET: 1,
+    CHANGE_CONTROLLER: 2,
+    MOVE_EE_DELTA: 3,
+    SET_EE_POSE: 4,
+    SET_JOINT_DELTA: 5,
+    SET_JOINT_POSITIONS: 6,
+    SET_JOINT_VELOCITIES: 7,
+    SET_JOINT_TORQUES: 8,
+    IDLE: 9,
+    SET_GRIPPER_VALUE: 10,
+    DISCONNECT: 11,
+}
+_ID_TO_CMD = dict((cmd_id, cmd_type) for cmd_type, cmd_id in CMD_IDS.items())
+
+_HEADER_FMT = '<3sBBBd'
+_HEADER_SIZE = struct.calcsize(_HEADER_FMT)
+
+
+def is_encoded_cmd_msg(value):
+    """Check if a redis value was written with encode_cmd_msg.
+
+    Args:
+        value (bytes): raw value from redis.
+    """
+    return value is not None and value[:len(GOAL_MAGIC)] == GOAL_MAGIC
+
+
+def encode_cmd_msg(cmd_type, goal=None, tstamp=0.0):
+    """Encode a command and its goal with the schema of the command type.
+
+    Args:
+        cmd_type (str): command name from redis_values. Must be in GOAL_SCHEMAS.
+        goal (dict): goal fields of the command. Fields set to None are
+            treated as absent.
+        tstamp (float): time the command was sent.
+
+    Returns:
+        bytes: encoded command, ready to be set or published to redis.
+    """
+    if cmd_type not in GOAL_SCHEMAS:
+        raise ValueError("No goal schema for command {}".format(cmd_type))
+    schema = GOAL_SCHEMAS[cmd_type]
+    goal = dict((name, value) for name, value in (goal or {}).items() if value is not None)
+
+    unknown = set(goal.keys()) - set(name for name, _, _ in schema)
+    if unknown:
+        raise ValueError("Invalid goal fields {} for command {}".format(sorted(unknown), cmd_type))
+
+    fields = 0
+    payload = []
+    for bit, (name, size, optional) in enumerate(schema):
+        if name not in goal:
+            if not optional:
+                raise ValueError("Missing goal field {} for command {}".format(name, cmd_type))
+            continue
+        value = np.asarray(goal[name], dtype='<f8').ravel()
+        if value.size != max(size, 1):
+            raise ValueError("Goal field {} for command {} should have size {}, got {}".format(
+                name, cmd_type, max(size, 1), value.size))
+        fields |= 1 << bit
+        payload.append(value)
+
+    header = struct.pack(_HEADER_FMT, GOAL_MAGIC, GOAL_VERSION, CMD_IDS[cmd_type], fields, tstamp)
+    if payload:
+        return header + np.concatenate(payload).tobytes()
+    return header
+
+
+def decode_cmd_msg(value, legacy=True):
+    """Decode a command encoded with encode_cmd_msg.
+
+    Args:
+        value (bytes): raw value from redis.
+        legacy (bool): parse values without the codec header as a json
+            command message with keys cmd_type, tstamp and goal.
+
+    Returns:
+        dict: command with keys cmd_type (str), tstamp (float) and goal
+            (dict of ndarrays and floats, or None if the command has no goal
+            fields). Optional fields that were not sent are None.
+    """
+    if not is_encoded_cmd_msg(value):
+        if legacy:
+            if isinstance(value, bytes):
+                value = value.decode()
+            return json.loads(value)
+        raise ValueError("Redis value is not an encoded command.")
+
+    _, version, cmd_id, fields, tstamp = struct.unpack_from(_HEADER_FMT, value, 0)
+    if version != GOAL_VERSION:
+        raise ValueError(
+            "Unsupported goal codec version {}, expected {}".format(version, GOAL_VERSION))
+    if cmd_id not in _ID_TO_CMD:
+        raise ValueError("Unknown command id {}".format(cmd_id))
+    cmd_type = _ID_TO_CMD[cmd_id]
+    schema = GOAL_SCHEMAS[cmd_type]
+
+    payload = np.frombuffer(value, dtype='<f8', offset=_HEADER_SIZE)
+    goal = None
+    if schema:
+        goal = {}
+        offset = 0
+        for bit, (name, size, _) in enumerate(schema):
+            if not fields & (1 << bit):
+                goal[name] = None
+            elif size == 0:
+                goal[name] = float(payload[offset])
+                offset += 1
+            else:
+                goal[name] = payload[offset:offset + size].copy()
+                offset += size
+        if offset != payload.size:
+            raise ValueError("Invalid payload size for command {}".format(cmd_type))
+
+    return {'cmd_type': cmd_type, 'tstamp': tstamp, 'goal': goal}
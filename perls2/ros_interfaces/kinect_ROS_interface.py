@@ -12,12 +12,21 @@ import logging
 logging.basicConfig(level=logging.DEBUG)
 import redis
 import time
+import json
 import struct
 from perls2.ros_interfaces.redis_keys import *
+from perls2.ros_interfaces.frame_codec import (set_frameset, set_synced_frameset,
+                                               get_synced_frameset, get_latest_seq,
+                                               FrameEncoder,
+                                               FrameBufferPool, copy_image_msg)
+from perls2.ros_interfaces.frame_sync import ApproximateTimeSynchronizer
+from perls2.ros_interfaces.stream_config import StreamConfig
 
 
 def convert_frame_to_encoded_bytes(frame):
     """Convert rgb, depth or ir frame to bytes array with encoded dim
+
+    Legacy uint8 format, truncating 16 bit frames. See frame_codec.encode_frame.
     """
     height = np.shape(frame)[0]
     width = np.shape(frame)[1]
@@ -60,6 +69,10 @@ class KinectROSInterface():
             rostopic for color stream
         _KINECT_IR_TOPIC: str
             rostopic for ir stream
+        sync (ApproximateTimeSynchronizer): matches the rgb, depth and ir
+            frames of a capture, and numbers the framesets.
+        stream_config (StreamConfig): modalities published and their region
+            of interest and output size.
 
 
     Notes:
@@ -81,13 +94,43 @@ class KinectROSInterface():
     HD_IMG_SIZE = (1080, 1920)
     QHD_IMG_SIZE = (540, 960)
 
-    def __init__(self, res_mode="sd"):
-        """ Constructor """
+    SYNC_QUEUE_SIZE = 5
+    # Buffers beyond the sync queue: the last frameset, the one being
+    # captured and the one being received.
+    NUM_SPARE_BUFFERS = 3
+
+    def __init__(self, res_mode="sd", sync_slop_ms=15.0, ring_size=4):
+        """ Constructor
+
+        Args:
+            res_mode (str): resolution of the rgb and depth streams.
+            sync_slop_ms (float): max difference of the rgb, depth and ir
+                timestamps of a frameset (ms).
+            ring_size (int): number of framesets kept in the redis ring
+                buffer.
+        """
         self._depth = None
         self._ir = None
         self._rgb = None
         self._model = None
 
+        # Set up redis Client
+        self.redisClient = redis.Redis()
+        self.redisClient.set('env_connected', 'False')
+
+        # Continue the seq of a previous run, so consumers waiting for a seq
+        # newer than the last one they read do not stall after a restart.
+        self._published_seq = get_latest_seq(self.redisClient)
+        self.sync = ApproximateTimeSynchronizer(['rgb', 'depth', 'ir'], sync_slop_ms,
+                                                queue_size=self.SYNC_QUEUE_SIZE,
+                                                start_seq=self._published_seq)
+        self._bridge = CvBridge()
+        self._buffer_pools = dict(
+            (stream, FrameBufferPool(self.SYNC_QUEUE_SIZE + self.NUM_SPARE_BUFFERS))
+            for stream in ['rgb', 'depth', 'ir'])
+        self._inverted_rgb = None
+        self.ring_size = ring_size
+
         assert(res_mode in ['hd', 'sd', 'qhd'])
         self._KINECT_DEPTH_TOPIC = "/kinect2/%s/image_depth_rect" % res_mode
         self._KINECT_IR_TOPIC = "/kinect2/sd/image_ir_rect"
@@ -120,11 +163,11 @@ class KinectROSInterface():
             self._ir_callback
         )
 
-        # Set up redis Client
-        self.redisClient = redis.Redis()
-        self.redisClient.set('env_connected', 'False')
-
         self.invert = False
+        # Compression of each modality, see frame_codec.encode_frame.
+        self.set_compression(None)
+        self.stream_config = StreamConfig()
+        self._stream_config_json = None
 
     @property
     def rgb_frame(self):
@@ -147,10 +190,7 @@ class KinectROSInterface():
 
         # Just for testing out the redis part. TODO switch this out
 
-        rgb_encoded = self.redisClient.get(KINECT2_RGB_KEY)
-        h, w = struct.unpack('>II', rgb_encoded[:8])
-        image_np = np.frombuffer(
-            rgb_encoded, dtype=np.uint8, offset=8).reshape(h, w, 3)
+        image_np = get_synced_frameset(self.redisClient, ('rgb',))['rgb']
         # depth_frame = self.redisClient.get('camera:depth_frame')
         # ir_frame = self.redisClient.get('camera::ir_frame')
         rgb_frame = image_np
@@ -160,34 +200,80 @@ class KinectROSInterface():
         cv2.waitKey(waitkey)
         cv2.destroyAllWindows()
 
-    def capture_frames(self):
-        """ Capture the newest frame """
-        self.wait_to_receive()
+    def set_compression(self, compression):
+        """ Set the compression of each modality.
 
-        if self.invert:
-            rgb_frame = cv2.cvtColor(self.rgb_frame, cv2.COLOR_RGB2BGR)
-        else:
-            rgb_frame = self.rgb_frame
-        encoded_rgb = convert_frame_to_encoded_bytes(rgb_frame)
-        encoded_depth = convert_frame_to_encoded_bytes(self.depth_frame)
-        encoded_ir = convert_frame_to_encoded_bytes(self.ir_frame)
-        # set the key in redis
-        self.redisClient.set(KINECT2_RGB_KEY, encoded_rgb)
-        self.redisClient.set(
-            KINECT2_RGB_TSTAMP_KEY, str(self._rgb_timestamp_ms))
-        self.redisClient.set(KINECT2_DEPTH_KEY, encoded_depth)
-        self.redisClient.set(KINECT2_IR_KEY, encoded_ir)
-
-        return (self.rgb_frame, self.depth_frame, self.ir_frame)
+        Args:
+            compression (dict or str): compression keyed by modality, or its
+                json encoding as set to KINECT2_COMPRESSION_KEY.
+        """
+        if compression is not None and not isinstance(compression, dict):
+            if isinstance(compression, bytes):
+                compression = compression.decode()
+            compression = json.loads(compression)
+        self.compression = dict(compression or {})
+        self._encoders = dict((modality, FrameEncoder(self.compression.get(modality)))
+                              for modality in ['rgb', 'depth', 'ir'])
+
+    def set_stream_config(self, stream_config):
+        """ Set the modalities, region of interest and size of the streams.
+
+        Args:
+            stream_config (StreamConfig or str): the config, or its json
+                encoding as set to KINECT2_STREAM_CONFIG_KEY. Only parsed if
+                it changed.
+        """
+        if isinstance(stream_config, StreamConfig):
+            self.stream_config = stream_config
+            self._stream_config_json = None
+        elif stream_config != self._stream_config_json:
+            self.stream_config = StreamConfig.from_json(stream_config)
+            self._stream_config_json = stream_config
+            rospy.loginfo("Stream config {}".format(self.stream_config.to_json()))
+
+    def capture_frames(self, timeout=1.0):
+        """ Capture the newest synchronized frameset
+
+        Waits for a frameset newer than the last one captured. Frames keep
+        their native dtype, 16 bit for depth and ir, and are written to the
+        redis ring buffer in one MSET with the rgb timestamp and the seq of
+        the frameset. Each modality is encoded into a reused buffer.
+
+        Only the modalities of the stream config are published, cropped to
+        their region of interest and resized before encoding.
+
+        Args:
+            timeout (float): max time to wait for a new frameset (s).
+
+        Returns:
+            tuple of full rgb, depth and ir frames, or None on timeout.
+        """
+        frameset = self.sync.wait_for_frameset(self._published_seq, timeout)
+        if frameset is None:
+            rospy.logwarn("No synchronized frameset received in {} s".format(timeout))
+            return None
+        frames = frameset['frames']
+        stream_frames = self.stream_config.apply(frames)
+        if self.invert and 'rgb' in stream_frames:
+            self._inverted_rgb = cv2.cvtColor(stream_frames['rgb'], cv2.COLOR_RGB2BGR,
+                                              dst=self._inverted_rgb)
+            stream_frames['rgb'] = self._inverted_rgb
+        set_synced_frameset(self.redisClient,
+                            stream_frames,
+                            frameset['timestamp'],
+                            frameset['seq'],
+                            self.ring_size,
+                            encoders=self._encoders)
+        self._published_seq = frameset['seq']
+
+        return (frames['rgb'], frames['depth'], frames['ir'])
 
     def capture_rgb(self):
         """ Capture the newest rgb frame """
         self.wait_to_receive_rgb()
         rospy.logdebug("capture_rgb: rgb received")
-        encoded_rgb = convert_frame_to_encoded_bytes(self.rgb_frame)
-        self.redisClient.set(KINECT2_RGB_KEY, encoded_rgb)
-        self.redisClient.set(
-            KINECT2_RGB_TSTAMP_KEY, str(self._rgb_timestamp_ms))
+        set_frameset(self.redisClient, {'rgb': self.rgb_frame},
+                     self._rgb_timestamp_ms, self.compression)
 
     def wait_to_receive(self):
         """ Wait to receive the newest frame """
@@ -205,16 +291,32 @@ class KinectROSInterface():
         self._rgb_receiver.unregister()
         self._ir_receiver.unregister()
 
+    @staticmethod
+    def _stamp_ms(msg):
+        return (msg.header.stamp.secs * 1000.0) + (msg.header.stamp.nsecs / 1000000.0)
+
+    def _msg_to_frame(self, stream, msg, encoding):
+        """ Copy an image message into the next buffer of its stream
+
+        Falls back to cv_bridge for other encodings or layouts.
+        """
+        frame = copy_image_msg(msg, encoding, self._buffer_pools[stream])
+        if frame is None:
+            frame = self._bridge.imgmsg_to_cv2(msg, encoding)
+        return frame
+
     def _depth_callback(self, depth):
-        self._depth = CvBridge().imgmsg_to_cv2(depth, '16UC1')
+        self._depth = self._msg_to_frame('depth', depth, '16UC1')
+        self.sync.add('depth', self._stamp_ms(depth), self._depth)
 
     def _rgb_callback(self, rgb):
-        self._rgb = CvBridge().imgmsg_to_cv2(rgb, 'bgr8')
-        self._rgb_timestamp_ms = np.asarray((rgb.header.stamp.secs * 1000) +
-                                            (rgb.header.stamp.nsecs / 1000000))
+        self._rgb = self._msg_to_frame('rgb', rgb, 'bgr8')
+        self._rgb_timestamp_ms = np.asarray(self._stamp_ms(rgb))
+        self.sync.add('rgb', self._stamp_ms(rgb), self._rgb)
 
     def _ir_callback(self, ir):
-        self._ir = CvBridge().imgmsg_to_cv2(ir, '16UC1')
+        self._ir = self._msg_to_frame('ir', ir, '16UC1')
+        self.sync.add('ir', self._stamp_ms(ir), self._ir)
 
     @property
     def camera_model(self):
@@ -229,7 +331,7 @@ class KinectROSInterface():
             callback: function to call on click. Should accept OpenCV args.
         """
         def show_image(img_data):
-            cv_image = CvBridge().imgmsg_to_cv2(img_data, 'bgr8')
+            cv_image = self._bridge.imgmsg_to_cv2(img_data, 'bgr8')
 
             color = cv_image
 
@@ -277,14 +379,16 @@ if __name__ == '__main__':
         camera.invert = True
     else:
         camera.invert = False
+    camera.set_compression(camera.redisClient.get(KINECT2_COMPRESSION_KEY))
     while (camera.redisClient.get(KINECT2_INTERFACE_CONN_KEY) == b'True'):
-        if (camera.redisClient.get(KINECT2_STREAM_ENABLED) == b'True'):
-            start = time.time()
+        if (camera.redisClient.get(KINECT2_STREAM_ENABLED_KEY) == b'True'):
+            camera.set_stream_config(camera.redisClient.get(KINECT2_STREAM_CONFIG_KEY))
+            # Blocks until the next synchronized frameset, at the camera rate.
             camera.capture_frames()
             if display_image:
                 camera.display()
-            while ((time.time() - start) < 0.033):
-                pass
+        else:
+            time.sleep(0.01)
     if (camera.redisClient.get(KINECT2_INTERFACE_CONN_KEY) == b'False'):
         rospy.loginfo('Camera interface disconnected')
 
@@ -0,0 +1,141 @@
+"""Binary encoding of numpy arrays for robot state and model redis keys.
+
+Arrays are packed as a small header followed by the raw little-endian
+payload, so the receiver can wrap the value with np.frombuffer instead of
+parsing text. This avoids the precision loss of str(ndarray) and is much
+cheaper to encode / decode in the control loop.
+
+Header layout (little-endian):
+    magic (3s): b'\\x93P2'
+    version (B): codec version, currently 1.
+    dtype (c): type code of the payload, see DTYPE_CODES.
+    ndim (B): number of dimensions of the array.
+    shape (ndim x I): size of each dimension.
+
+Values without the magic prefix are in the legacy string format written by
+str(list), str(ndarray) or json.dumps of a dict keyed by joint name, and may
+still be parsed as text.
+
+Must remain compatible with python 2.7 for the SawyerCtrlInterface.
+"""
+from __future__ import division
+import json
+import struct
+import numpy as np
+
+CODEC_MAGIC = b'\x93P2'
+CODEC_VERSION = 1
+
+# Type codes for the array payload. All payloads are little-endian.
+DTYPE_CODES = {
+    b'd': np.dtype('<f8'),
+    b'f': np.dtype('<f4'),
+    b'i': np.dtype('<i4'),
+    b'q': np.dtype('<i8'),
+}
+_DTYPE_TO_CODE = dict((dtype, code) for code, dtype in DTYPE_CODES.items())
+
+_HEADER_FMT = '<3sBcB'
+_HEADER_SIZE = struct.calcsize(_HEADER_FMT)
+
+
+def is_encoded_ndarray(value):
+    """Check if a redis value was written with encode_ndarray.
+
+    Args:
+        value (bytes): raw value from redis.
+    """
+    return value is not None and value[:len(CODEC_MAGIC)] == CODEC_MAGIC
+
+
+def encode_ndarray(array, dtype=np.float64):
+    """Encode an array-like as header + raw little-endian bytes.
+
+    Args:
+        array (list or ndarray): values to encode.
+        dtype (np.dtype): type of the payload. Must be in DTYPE_CODES.
+
+    Returns:
+        bytes: encoded array, ready to be set to redis.
+    """
+    dtype = np.dtype(dtype).newbyteorder('<')
+    if dtype not in _DTYPE_TO_CODE:
+        raise ValueError("Unsupported dtype for redis codec: {}".format(dtype))
+    array = np.ascontiguousarray(array, dtype=dtype)
+    header = struct.pack(_HEADER_FMT,
+                         CODEC_MAGIC,
+                         CODEC_VERSION,
+                         _DTYPE_TO_CODE[dtype],
+                         array.ndim)
+    shape = struct.pack('<{}I'.format(array.ndim), *array.shape)
+    return header + shape + array.tobytes()
+
+
+def decode_ndarray(value, legacy=True, joint_names=None):
+    """Decode a redis value into a numpy array.
+
+    Binary values are wrapped with np.frombuffer without copying, so the
+    returned array is read-only.
+
+    Args:
+        value (bytes): raw value from redis.
+        legacy (bool): parse values without the codec header as text in
+            the legacy str(list) / str(ndarray) / json dict format.
+        joint_names (list): order of the values of legacy json dicts, see
+            decode_legacy_ndarray.
+
+    Returns:
+        ndarray: decoded array, or None if value is None.
+    """
+    if value is None:
+        return None
+    if not is_encoded_ndarray(value):
+        if legacy:
+            return decode_legacy_ndarray(value, joint_names)
+        raise ValueError("Redis value is not a binary encoded array.")
+
+    _, version, code, ndim = struct.unpack_from(_HEADER_FMT, value, 0)
+    if version != CODEC_VERSION:
+        raise ValueError(
+            "Unsupported redis codec version {}, expected {}".format(
+                version, CODEC_VERSION))
+    if code not in DTYPE_CODES:
+        raise ValueError("Unknown redis codec dtype code {}".format(code))
+    shape = struct.unpack_from('<{}I'.format(ndim), value, _HEADER_SIZE)
+    offset = _HEADER_SIZE + 4 * ndim
+
+    return np.frombuffer(
+        value, dtype=DTYPE_CODES[code], offset=offset).reshape(shape)
+
+
+def decode_legacy_ndarray(value, joint_names=None):
+    """Parse an array from the legacy string format.
+
+    Handles str(list) ('[0.1, 0.2]') as well as str(ndarray), including
+    2D matrices ('[[0.1 0.2]\\n [0.3 0.4]]'), and json dicts keyed by joint
+    name ('{"right_j0": 0.1, "right_j1": 0.2}'), as the joint velocities
+    and efforts of the legacy ros redis interface.
+
+    Args:
+        value (bytes or str): raw value from redis.
+        joint_names (list): order of the values of a json dict. Defaults to
+            the sorted keys of the dict.
+
+    Returns:
+        ndarray: float64 array, 2D if the string was a nested list.
+    """
+    if isinstance(value, bytes):
+        value = value.decode()
+    text = value.strip()
+    if text.startswith('{'):
+        values = json.loads(text)
+        if joint_names is None:
+            joint_names = sorted(values)
+        return np.array([values[name] for name in joint_names], dtype=np.float64)
+    num_rows = text.count('[') - 1 if text.startswith('[[') else 0
+    for char in '[],':
+        text = text.replace(char, ' ')
+    array = np.array(text.split(), dtype=np.float64)
+    if num_rows > 0:
+        array = array.reshape(num_rows, -1)
+    return array
@@ -4,10 +4,32 @@ import redis
 # Importing hiredis speeds up redis.
 import hiredis
 import socket
+import threading
 import numpy as np
 import json
+import time
 from perls2.ros_interfaces.redis_keys import *
 from perls2.ros_interfaces.redis_values import *
+from perls2.ros_interfaces.redis_codec import encode_ndarray, decode_ndarray
+from perls2.ros_interfaces.goal_codec import encode_cmd_msg, decode_cmd_msg, is_encoded_cmd_msg
+# Retry with backoff on reconnection requires redis-py >= 4.1. Older versions
+# (e.g. for python 2.7) retry a failed command once on a new connection.
+try:
+    from redis.retry import Retry
+    from redis.backoff import ExponentialBackoff
+except ImportError:
+    Retry = None
+
+# Connection pools shared by all redis interfaces in the process.
+_CONNECTION_POOLS = {}
+# Hostnames resolved to IP addresses.
+_RESOLVED_HOSTS = {}
+_POOLS_LOCK = threading.Lock()
+
+# Idle time, probe interval and probe count for TCP keepalive (s).
+KEEPALIVE_IDLE = 10
+KEEPALIVE_INTERVAL = 5
+KEEPALIVE_COUNT = 3
 
 
 def bstr_to_ndarray(array_bstr):
@@ -38,35 +60,146 @@ def convert_encoded_timestamp_to_np(encoded_frame, dim):
     return (frame_np, timestamp)
 
 
+def resolve_host(host):
+    """Resolve a hostname to an IP address, once per process.
+
+    IP address rather than hostname is used to connect to redis. This is an
+    idiosyncracy of our setup. localhost is not resolved.
+
+    Args:
+        host (str): hostname or IP address of the redis server.
+
+    Returns:
+        (str): IP address of the host.
+    """
+    if 'localhost' in host:
+        return host
+    with _POOLS_LOCK:
+        if host not in _RESOLVED_HOSTS:
+            _RESOLVED_HOSTS[host] = socket.gethostbyname(host)
+        return _RESOLVED_HOSTS[host]
+
+
+def _keepalive_options():
+    """TCP keepalive options supported on this platform.
+    """
+    options = {}
+    for name, value in [('TCP_KEEPIDLE', KEEPALIVE_IDLE),
+                        ('TCP_KEEPINTVL', KEEPALIVE_INTERVAL),
+                        ('TCP_KEEPCNT', KEEPALIVE_COUNT)]:
+        if hasattr(socket, name):
+            options[getattr(socket, name)] = value
+    return options
+
+
+def get_connection_pool(host='localhost', port=6379, password=None, unix_socket_path=None,
+                        socket_keepalive=True, reconnect_retries=3, health_check_interval=30):
+    """Get the connection pool shared by all redis clients for a server.
+
+    Pools are created on first use and shared for the rest of the process,
+    so interfaces connecting to the same server with the same options reuse
+    sockets instead of each opening their own. redis-py sets TCP_NODELAY on
+    all tcp connections.
+
+    Args:
+        host (str): hostname or IP address of the redis server.
+        port (int): port of the redis server.
+        password (str): path to a file containing the redis password.
+        unix_socket_path (str): path of the unix domain socket of a local
+            redis server. If set, host and port are ignored.
+        socket_keepalive (bool): enable TCP keepalive to detect dead
+            connections.
+        reconnect_retries (int): number of times to reconnect and retry a
+            command on connection errors, with exponential backoff.
+        health_check_interval (int): check connections idle for longer than
+            this with a PING before using them (s). 0 disables.
+
+    Returns:
+        redis.ConnectionPool
+    """
+    # Clients requesting different connection options get their own pool.
+    pool_key = (unix_socket_path,) if unix_socket_path is not None else (host, port)
+    pool_key += (password, bool(socket_keepalive), reconnect_retries, health_check_interval)
+    with _POOLS_LOCK:
+        if pool_key in _CONNECTION_POOLS:
+            return _CONNECTION_POOLS[pool_key]
+
+    pool_kwargs = {'health_check_interval': health_check_interval}
+    if password is not None:
+        with open(password, 'r') as pw_file:
+            pool_kwargs['password'] = pw_file.read()
+    if Retry is not None and reconnect_retries > 0:
+        pool_kwargs['retry'] = Retry(ExponentialBackoff(cap=1.0, base=0.01), reconnect_retries)
+        pool_kwargs['retry_on_error'] = [redis.exceptions.ConnectionError,
+                                         redis.exceptions.TimeoutError]
+
+    if unix_socket_path is not None:
+        pool = redis.ConnectionPool(connection_class=redis.UnixDomainSocketConnection,
+                                    path=unix_socket_path,
+                                    **pool_kwargs)
+    else:
+        if socket_keepalive:
+            pool_kwargs['socket_keepalive'] = True
+            pool_kwargs['socket_keepalive_options'] = _keepalive_options()
+        pool = redis.ConnectionPool(host=resolve_host(host), port=port, **pool_kwargs)
+
+    with _POOLS_LOCK:
+        return _CONNECTION_POOLS.setdefault(pool_key, pool)
+
+
+def make_robot_redis_interface(transport='redis', **kwargs):
+    """Factory for creating the robot redis interface from the redis config.
+
+    Args:
+        transport (str): 'redis' to exchange states and commands through
+            the redis server, or 'shm' to exchange them through shared
+            memory when the env and Control Interface are on the same machine.
+        kwargs (dict): remaining redis config, passed to the interface.
+
+    Returns:
+        RobotRedisInterface
+    """
+    if transport == 'redis':
+        return RobotRedisInterface(**kwargs)
+    elif transport == 'shm':
+        from perls2.ros_interfaces.shm_interface import SharedMemoryRobotInterface
+        return SharedMemoryRobotInterface(**kwargs)
+    else:
+        raise ValueError("Invalid redis transport {}. Choose 'redis' or 'shm'".format(transport))
+
+
 class RedisInterface(object):
     """
     Redis interfaces allow for unified access to redis-servers by maintaining consistent keys.
     Both control interfaces and robot interfaces use redis to communicate and key mismatch can
     be a source of many bugs.
 
+    Interfaces connecting to the same server share a connection pool, see
+    get_connection_pool.
+
     Attributes:
         host (str): name of redis host where server is located
         port (int): identifying port for where server is being hosted. Usually 6379
         pw (str): password to connect to secured server (Necessary for tcp connections.)
+        unix_socket_path (str): unix domain socket of a local redis server, used
+            instead of host and port if set.
         """
-    def __init__(self, host, port, password=None):
-        # IP address rather than hostname is used to connect to redis. This is an idiosyncracy of our setup.
-        # It is more convenient however, to store the hostname in the config file. So we look it up via sockets.
-        self.host = host
+    def __init__(self, host, port, password=None, unix_socket_path=None, socket_keepalive=True,
+                 reconnect_retries=3, health_check_interval=30):
+        # It is more convenient to store the hostname in the config file, so it is resolved once per process.
+        self.host = resolve_host(host)
         self.port = port
-        if 'localhost' not in host:
-            self.host = socket.gethostbyname(host)
-
-        setup_kwargs = {'host': self.host,
-                        'port': self.port}
-
-        if password is not None:
-            with open(password, 'r') as pw_file:
-                pw = pw_file.read()
-                setup_kwargs['password'] = pw
+        self.unix_socket_path = unix_socket_path
 
         # Connect to redis server.
-        self._client = redis.Redis(**setup_kwargs)
+        self._client = redis.Redis(connection_pool=get_connection_pool(
+            host=host,
+            port=port,
+            password=password,
+            unix_socket_path=unix_socket_path,
+            socket_keepalive=socket_keepalive,
+            reconnect_retries=reconnect_retries,
+            health_check_interval=health_check_interval))
 
 
 class RobotRedisInterface(RedisInterface):
@@ -81,11 +214,121 @@ class RobotRedisInterface(RedisInterface):
             set_joint_positions
             move_ee_delta
             reset
-
+        use_binary_codec (bool): encode robot states and models with the
+            binary redis codec, and commands with the goal codec. If False,
+            they are written as strings and json.
+        legacy_compat (bool): also decode states, models and commands written
+            in the legacy string and json formats.
+        cmd_transport (str): how robot commands are sent. Choose from:
+            keys: set command type, timestamp and goal keys, which the
+                Control Interface polls.
+            pubsub: publish each command as a single message on
+                ROBOT_CMD_CHANNEL_KEY.
+        state_history_len (int): approximate number of control ticks kept in
+            the ROBOT_STATE_HISTORY_KEY stream. 0 disables the history.
+
+    Remaining kwargs are connection options passed to RedisInterface.
     """
 
-    def __init__(self, host, port, password=None):
-        RedisInterface.__init__(self, host, port, password)
+    def __init__(self, host, port, password=None, use_binary_codec=True, legacy_compat=True,
+                 cmd_transport=CMD_TRANSPORT_KEYS, state_history_len=0, **kwargs):
+        RedisInterface.__init__(self, host, port, password, **kwargs)
+        self.state_history_len = state_history_len
+        self.use_binary_codec = use_binary_codec
+        self.legacy_compat = legacy_compat
+        if cmd_transport not in [CMD_TRANSPORT_KEYS, CMD_TRANSPORT_PUBSUB]:
+            raise ValueError("Invalid cmd_transport {}".format(cmd_transport))
+        self.cmd_transport = cmd_transport
+        self._cmd_pubsub = None
+
+    def encode_cmd_msg(self, cmd_type, goal=None, tstamp=0.0):
+        """Encode a robot command with the goal schema of its type.
+
+            Raises a ValueError if the goal does not match the schema. If the
+            binary codec is disabled, the command is encoded as json.
+
+            Args:
+                cmd_type (str): string identifier for the command.
+                goal (dict): controller goal for the command, if any.
+                tstamp (float): time the command was sent.
+
+            Returns:
+                (bytes or str): encoded command message.
+        """
+        if self.use_binary_codec:
+            return encode_cmd_msg(cmd_type, goal, tstamp)
+        return json.dumps({'cmd_type': cmd_type, 'tstamp': tstamp, 'goal': goal})
+
+    def decode_cmd_msg(self, value):
+        """Decode a robot command message, as binary or legacy json.
+
+            Returns:
+                (dict): command with keys cmd_type, tstamp and goal.
+        """
+        return decode_cmd_msg(value, legacy=self.legacy_compat or not self.use_binary_codec)
+
+    def send_cmd(self, cmd_type, goal=None):
+        """Send a robot command to the Control Interface.
+
+            Args:
+                cmd_type (str): string identifier for the command.
+                goal (dict): controller goal for the command, if any.
+        """
+        tstamp = time.time()
+        if self.cmd_transport == CMD_TRANSPORT_PUBSUB:
+            self._client.publish(ROBOT_CMD_CHANNEL_KEY, self.encode_cmd_msg(cmd_type, goal, tstamp))
+        else:
+            control_cmd = {ROBOT_CMD_TSTAMP_KEY: tstamp,
+                           ROBOT_CMD_TYPE_KEY: cmd_type}
+            if goal is not None:
+                if self.use_binary_codec:
+                    control_cmd[CONTROLLER_GOAL_KEY] = encode_cmd_msg(cmd_type, goal, tstamp)
+                else:
+                    control_cmd[CONTROLLER_GOAL_KEY] = json.dumps(goal)
+            self._client.mset(control_cmd)
+
+    def subscribe_cmds(self):
+        """Subscribe to the robot command channel.
+
+        Commands published before subscribing are not received.
+        """
+        self._cmd_pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._cmd_pubsub.subscribe(ROBOT_CMD_CHANNEL_KEY)
+
+    def get_cmd_msgs(self):
+        """Get all commands published since the last call without blocking.
+
+            Returns:
+                (list): command dicts with keys cmd_type, tstamp and goal,
+                    in the order they were sent.
+        """
+        cmd_msgs = []
+        while True:
+            msg = self._cmd_pubsub.get_message()
+            if msg is None:
+                break
+            cmd_msgs.append(self.decode_cmd_msg(msg['data']))
+        return cmd_msgs
+
+    @property
+    def publish_every_tick(self):
+        """Whether the Control Interface should set its state every control tick.
+        """
+        return self.state_history_len > 0
+
+    def encode_ndarray(self, array):
+        """Encode an array for a robot state or model key.
+
+            Args:
+                array (list or ndarray): value to encode.
+
+            Returns:
+                (bytes or str): binary encoded array, or str(array) if
+                    the binary codec is disabled.
+        """
+        if self.use_binary_codec:
+            return encode_ndarray(array)
+        return str(array)
 
     def _get_key_ndarray(self, key):
         """Return value from desired key, converting bytestring to ndarray
@@ -93,7 +336,7 @@ class RobotRedisInterface(RedisInterface):
             Args:
                 key (str): string of key storing ndarray
         """
-        return bstr_to_ndarray(self._client.get(key))
+        return self._decode_value(key, self._client.get(key))
 
     def _get_key_json(self, key):
         """get json value from desired key, converting it to a dict.
@@ -140,6 +383,20 @@ class RobotRedisInterface(RedisInterface):
 
         return self._get_key_json(key)
 
+    def get_goal(self):
+        """Get the controller goal of the last command sent with the keys transport.
+
+        Returns:
+            (dict): goal fields of the command, or None if no goal was set.
+        """
+        value = self._client.get(CONTROLLER_GOAL_KEY)
+        if value is None:
+            return None
+        if is_encoded_cmd_msg(value):
+            return decode_cmd_msg(value)['goal']
+        # Legacy json goal.
+        return json.loads(self._make_valid_json_dict(value))
+
     def get(self, key):
         """Get value of redis data base given key.
 
@@ -154,12 +411,112 @@ class RobotRedisInterface(RedisInterface):
             it is a control parameter or goal, converts to dict.
         """
         if ROBOT_STATE_KEY in key or ROBOT_MODEL_KEY in key:
-            return self._get_key_ndarray(key)
+            return self._decode_value(key, self._client.get(key))
+        elif key == CONTROLLER_GOAL_KEY:
+            return self.get_goal()
         elif CONTROLLER_CONTROL_PARAMS_KEY in key or CONTROLLER_GOAL_KEY in key:
             return self._get_key_json(key)
         else:
             return self._client.get(key)
 
+    def _decode_value(self, key, value):
+        """Decode raw value of a robot state or model key.
+
+            Args:
+                key (str): redis key the value was read from.
+                value (bytes): raw value from redis.
+        """
+        if value is None:
+            return None
+        if key == ROBOT_STATE_TSTAMP_KEY:
+            return float(value)
+        return decode_ndarray(value, legacy=self.legacy_compat)
+
+    def mget(self, keys):
+        """Get values of multiple keys in a single round trip.
+
+        Args:
+            keys (list): redis keys to be queried.
+
+        Returns:
+            (list): Values of the keys, in the same order as keys.
+
+        Notes:
+            Robot states and models are decoded as in get. Other values
+            are returned as raw bytes.
+        """
+        values = self._client.mget(keys)
+        return [self._decode_value(key, value)
+                if (ROBOT_STATE_KEY in key or ROBOT_MODEL_KEY in key) else value
+                for key, value in zip(keys, values)]
+
+    def set_robot_state(self, robot_state, history_state=None):
+        """Set robot state keys in a single round trip.
+
+        If the state history is enabled, history_state is also appended to
+        the ROBOT_STATE_HISTORY_KEY stream, dropping the oldest entries.
+
+        Args:
+            robot_state (dict): robot state and model keys with encoded values.
+            history_state (dict): fields to append to the history, with
+                encoded values.
+        """
+        pipe = self._client.pipeline(transaction=False)
+        pipe.mset(robot_state)
+        if history_state is not None and self.state_history_len > 0:
+            pipe.xadd(ROBOT_STATE_HISTORY_KEY, history_state,
+                      maxlen=self.state_history_len, approximate=True)
+        pipe.execute()
+
+    def append_state_history(self, history_states):
+        """Append states to the state history stream in a single round trip.
+
+        Used by the redis I/O thread to record every control tick, while
+        only setting the latest state to the robot state keys.
+
+        Args:
+            history_states (list): dicts of fields to append, with encoded
+                values, ordered from oldest to newest.
+        """
+        if not history_states or self.state_history_len <= 0:
+            return
+        pipe = self._client.pipeline(transaction=False)
+        for history_state in history_states:
+            pipe.xadd(ROBOT_STATE_HISTORY_KEY, history_state,
+                      maxlen=self.state_history_len, approximate=True)
+        pipe.execute()
+
+    def get_state_history(self, since=None, count=None):
+        """Get robot states from the state history stream.
+
+        Args:
+            since (float): only get states added at or after this redis server
+                time (seconds). If None, get the most recent states.
+            count (int): maximum number of states to get. If None, get all.
+
+        Returns:
+            (list): decoded state dicts ordered from oldest to newest.
+                'tstamp' is a float and all other fields are ndarrays.
+        """
+        if since is None:
+            entries = self._client.xrevrange(ROBOT_STATE_HISTORY_KEY, count=count)[::-1]
+        else:
+            entries = self._client.xrange(
+                ROBOT_STATE_HISTORY_KEY, min=int(since * 1000), count=count)
+
+        states = []
+        for _, fields in entries:
+            state = {}
+            for field, value in fields.items():
+                if isinstance(field, bytes):
+                    field = field.decode()
+                if field == 'tstamp':
+                    state[field] = float(value)
+                else:
+                    state[field] = decode_ndarray(value, legacy=self.legacy_compat)
+            states.append(state)
+        return states
+
     def mset(self, key_val_dict):
         """ Set multiple keys to redis at same time.
             All values for keys must be strings.
@@ -10,6 +10,17 @@ ROBOT_CMD_TSTAMP_KEY = ROBOT_KEY + "cmd_tstamp"
 ROBOT_LAST_CMD_TSTAMP = ROBOT_KEY + "last_cmd_tstamp"
 ROBOT_SET_GRIPPER_CMD_KEY = ROBOT_KEY + "set_gripper_value"
 ROBOT_SET_GRIPPER_CMD_TSTAMP_KEY = ROBOT_KEY + "set_gripper_cmd_tstamp"
+ROBOT_CMD_CHANNEL_KEY = ROBOT_KEY + "cmd_channel"
+ROBOT_CMD_LATENCY_KEY = ROBOT_KEY + "cmd_latency"
+
+# Control loop statistics keys
+CTRL_LOOP_KEY = ROBOT_KEY + "ctrl_loop::"
+ROBOT_CTRL_LOOP_PERIOD_KEY = CTRL_LOOP_KEY + "period"
+ROBOT_CTRL_LOOP_MAX_PERIOD_KEY = CTRL_LOOP_KEY + "max_period"
+ROBOT_CTRL_LOOP_COMPUTE_TIME_KEY = CTRL_LOOP_KEY + "compute_time"
+ROBOT_CTRL_LOOP_MAX_COMPUTE_TIME_KEY = CTRL_LOOP_KEY + "max_compute_time"
+ROBOT_CTRL_LOOP_MIN_SLACK_KEY = CTRL_LOOP_KEY + "min_slack"
+ROBOT_CTRL_LOOP_MISSED_KEY = CTRL_LOOP_KEY + "missed_deadlines"
 
 # Robot State Keys
 STATE_KEY = "proprio::"
@@ -24,6 +35,10 @@ ROBOT_STATE_EE_V_KEY = ROBOT_STATE_KEY +"ee_v"
 ROBOT_STATE_EE_OMEGA_KEY = ROBOT_STATE_KEY + "ee_omega"
 ROBOT_STATE_TAU_KEY = ROBOT_STATE_KEY + "tau"
 
+# Stream of robot states from every control tick.
+# Not under ROBOT_STATE_KEY, as it is not a single ndarray.
+ROBOT_STATE_HISTORY_KEY = ROBOT_KEY + "state_history"
+
 # Robot Controller Model Keys
 MODEL_KEY = "model::"
 ROBOT_MODEL_KEY = ROBOT_KEY + MODEL_KEY
@@ -48,3 +63,9 @@ KINECT2_IR_KEY = KINECT2_KEY + 'ir_frame'
 KINECT2_INVERT_KEY = KINECT2_KEY + 'invert'
 KINECT2_STREAM_ENABLED_KEY = KINECT2_KEY + 'stream_enabled'
 KINECT2_INTERFACE_CONN_KEY = KINECT2_KEY + 'interface_connected'
+KINECT2_COMPRESSION_KEY = KINECT2_KEY + 'compression'
+KINECT2_STREAM_CONFIG_KEY = KINECT2_KEY + 'stream_config'
+KINECT2_SEQ_KEY = KINECT2_KEY + 'seq'
+KINECT2_RING_SIZE_KEY = KINECT2_KEY + 'ring_size'
+KINECT2_RING_KEY = KINECT2_KEY + 'ring::'
+KINECT2_FRAMESET_CHANNEL_KEY = KINECT2_KEY + 'frameset_channel'
@@ -17,3 +17,9 @@ SET_JOINT_POSITIONS = "set_joint_positions"
 SET_JOINT_VELOCITIES = "set_joint_velocities"
 SET_JOINT_TORQUES = "set_joint_torques"
 IDLE = "IDLE"
+SET_GRIPPER_VALUE = "set_gripper_value"
+DISCONNECT = "disconnect"
+
+# Command transports
+CMD_TRANSPORT_KEYS = "keys"
+CMD_TRANSPORT_PUBSUB = "pubsub"
@@ -3,7 +3,7 @@ from sensor_msgs.msg import JointState
 import redis
 import hiredis
 from perls2.utils.yaml_config import YamlConfig
-from perls2.ros_interfaces.redis_interface import RobotRedisInterface as RobotRedis
+from perls2.ros_interfaces.redis_interface import make_robot_redis_interface
 from perls2.ros_interfaces.redis_keys import * 
 import json
 import numpy as np        
@@ -17,21 +17,22 @@ def on_joint_states(msg):
     global redisClient
     global _limb
 
+    encode = redisClient.encode_ndarray
+    joint_names = _limb.joint_names()
+    dq = _limb.joint_velocities()
+    tau = _limb.joint_efforts()
     robot_state = {
         ROBOT_STATE_TSTAMP_KEY : str(msg.header.stamp),
-        ROBOT_STATE_EE_POS_KEY :  str(list(_limb.endpoint_pose()['position'])), 
-        ROBOT_STATE_EE_POSE_KEY: str(list(_limb.endpoint_pose()['position']) + list(_limb.endpoint_pose()['orientation'])),
-        ROBOT_STATE_EE_ORN_KEY: str(list(_limb.endpoint_pose()['orientation'])),
-        ROBOT_STATE_EE_V_KEY: str(list(_limb.endpoint_velocity()['linear'])), 
-        ROBOT_STATE_Q_KEY: str( _limb.joint_ordered_angles()),
-        ROBOT_STATE_DQ_KEY: json.dumps(_limb.joint_velocities()),
-        ROBOT_STATE_TAU_KEY: json.dumps(_limb.joint_efforts()),
-        ROBOT_MODEL_JACOBIAN_KEY: str(np.zeros((6,7))),
-        ROBOT_MODEL_L_JACOBIAN_KEY: str(np.zeros((3,6))),
-        ROBOT_MODEL_A_JACOBIAN_KEY: str(np.zeros((3,6))),
-        ROBOT_MODEL_MASS_MATRIX_KEY: str(np.zeros((7,7)))
+        ROBOT_STATE_EE_POS_KEY :  encode(list(_limb.endpoint_pose()['position'])),
+        ROBOT_STATE_EE_POSE_KEY: encode(list(_limb.endpoint_pose()['position']) + list(_limb.endpoint_pose()['orientation'])),
+        ROBOT_STATE_EE_ORN_KEY: encode(list(_limb.endpoint_pose()['orientation'])),
+        ROBOT_STATE_EE_V_KEY: encode(list(_limb.endpoint_velocity()['linear'])),
+        ROBOT_STATE_Q_KEY: encode( _limb.joint_ordered_angles()),
+        ROBOT_STATE_DQ_KEY: encode([dq[n] for n in joint_names]),
+        ROBOT_STATE_TAU_KEY: encode([tau[n] for n in joint_names]),
     }
-    redisClient.mset(robot_state)   
+    # Model keys are left to the Control Interface, which computes them.
+    redisClient.set_robot_state(robot_state)
 
 print("Initializing ros redis interface.")
 rospy.init_node("ros_redis_interface")
@@ -45,7 +46,12 @@ config = YamlConfig('cfg/sawyer_ctrl_config.yaml')
 # redisClient = redis.Redis(**redis_kwargs)
 
 # redisClient.flushall()
-redisClient = RobotRedis(**config['redis'])
+# Joint states always go to the redis keys. With the shm transport the
+# Control Interface must be the only writer of the shared memory state block.
+redis_config = dict(config['redis'])
+for shm_key in ['transport', 'shm_path', 'seqlock_timeout']:
+    redis_config.pop(shm_key, None)
+redisClient = make_robot_redis_interface(transport='redis', **redis_config)
 
 joint_state_topic = 'robot/joint_states'
 _joint_state_sub = rospy.Subscriber(
@@ -11,7 +11,12 @@ from perls2.controllers.joint_vel import JointVelController
 from perls2.controllers.interpolator.linear_interpolator import LinearInterpolator
 from perls2.controllers.interpolator.linear_ori_interpolator import LinearOriInterpolator
 from perls2.controllers.robot_model.model import Model
+from perls2.utils.math.ik import Chain
+from perls2.utils.math.ik.urdf_utils import PYBULLET_DEFAULT_INERTIAL
+import os
 import time
+import threading
+from collections import deque
 import rospy
 from intera_core_msgs.msg import JointCommand
 try:
@@ -23,29 +28,43 @@ except ImportError:
     print('intera_interface not imported, did you remember to run cd ~/ros_ws;./intera.sh?')
 import numpy as np
 import logging
-# Pybullet used for calculating mass matrix, jacobians.
+# Pybullet used for querying the joints and links of the urdf.
 import pybullet as pb
 from perls2.utils.yaml_config import YamlConfig
 import json
-from perls2.ros_interfaces.redis_interface import RobotRedisInterface as RobotRedis
+from perls2.ros_interfaces.redis_interface import make_robot_redis_interface
 from perls2.ros_interfaces.redis_keys import *
 from perls2.ros_interfaces.redis_values import *
 import perls2.controllers.utils.transform_utils as T
+from perls2.utils.loop_scheduler import LoopScheduler
+from perls2.ros_interfaces.ctrl_io import LatestSlot, IOThread, dispatch_cmd_msgs, drain
 
 LOOP_LATENCY = 0.000
 LOOP_TIME = (1.0 / 500.0) - LOOP_LATENCY
+# Number of control loop ticks between publishing loop statistics.
+LOOP_STATS_TICKS = 500
 
 # Redis reads commands as bytes strings
 # compatible with python 2.7
-bSET_EE_POSE = bytes(SET_EE_POSE)
-bMOVE_EE_DELTA = bytes(MOVE_EE_DELTA)
-bSET_JOINT_DELTA = bytes(SET_JOINT_DELTA)
-bSET_JOINT_POSITIONS = bytes(SET_JOINT_POSITIONS)
-bSET_JOINT_VELOCITIES = bytes(SET_JOINT_VELOCITIES)
-bSET_JOINT_TORQUES = bytes(SET_JOINT_TORQUES)
-bIDLE = bytes(IDLE)
-bCHANGE_CONTROLLER = bytes(CHANGE_CONTROLLER)
-bRESET = bytes(RESET)
+bSET_EE_POSE = SET_EE_POSE.encode()
+bMOVE_EE_DELTA = MOVE_EE_DELTA.encode()
+bSET_JOINT_DELTA = SET_JOINT_DELTA.encode()
+bSET_JOINT_POSITIONS = SET_JOINT_POSITIONS.encode()
+bSET_JOINT_VELOCITIES = SET_JOINT_VELOCITIES.encode()
+bSET_JOINT_TORQUES = SET_JOINT_TORQUES.encode()
+bIDLE = IDLE.encode()
+bCHANGE_CONTROLLER = CHANGE_CONTROLLER.encode()
+bRESET = RESET.encode()
+bSET_GRIPPER_VALUE = SET_GRIPPER_VALUE.encode()
+bDISCONNECT = DISCONNECT.encode()
+
+# Commands that carry a controller goal.
+bGOAL_CMDS = [bSET_EE_POSE,
+              bMOVE_EE_DELTA,
+              bSET_JOINT_DELTA,
+              bSET_JOINT_POSITIONS,
+              bSET_JOINT_TORQUES,
+              bSET_JOINT_VELOCITIES]
 
 
 class SawyerCtrlInterface(RobotInterface):
@@ -86,8 +105,11 @@ class SawyerCtrlInterface(RobotInterface):
         # Connect to redis client
         # use default port 6379 at local host.
         self.config = YamlConfig(config)
-        self.redisClient = RobotRedis(**self.config['redis'])
+        self.redisClient = make_robot_redis_interface(**self.config['redis'])
         self.redisClient.flushall()
+        if self.redisClient.cmd_transport == CMD_TRANSPORT_PUBSUB:
+            self.redisClient.subscribe_cmds()
+        self.last_cmd_latency = None
 
         # Timing
         self.startTime = time.time()
@@ -141,12 +163,15 @@ class SawyerCtrlInterface(RobotInterface):
 
         self.blocking = False
 
-        # set up internal pybullet simulation for jacobian and mass matrix calcs.
+        # set up internal pybullet simulation for joint and link info.
         self._clid = pb.connect(pb.DIRECT)
         pb.resetSimulation(physicsClientId=self._clid)
 
         # TODO: make this not hard coded
         sawyer_urdf_path = self.config['sawyer']['arm']['path']
+        if not os.path.isabs(sawyer_urdf_path) and not os.path.exists(sawyer_urdf_path):
+            sawyer_urdf_path = os.path.join(
+                self.config.get('data_dir', 'data'), sawyer_urdf_path)
 
         self._pb_sawyer = pb.loadURDF(
             fileName=sawyer_urdf_path,
@@ -169,6 +194,22 @@ class SawyerCtrlInterface(RobotInterface):
             rospy.logerr('IKService from Intera timed out')
             self._ik_service = False
         self._joint_names = self.config['sawyer']['limb_joint_names']
+
+        # Kinematic chain from the urdf base to the end effector, for
+        # jacobian and mass matrix calcs without resetting the pybullet sim.
+        # Links without inertials get the pybullet defaults, so the mass
+        # matrix is the one pb.calculateMassMatrix gave.
+        base_link_name = pb.getBodyInfo(
+            self._pb_sawyer, physicsClientId=self._clid)[0].decode('utf-8')
+        self._chain = Chain.from_urdf_file(
+            sawyer_urdf_path,
+            base_elements=[base_link_name],
+            tip_link=self.ee_name,
+            use_symbolic_matrix=False,
+            default_inertial=PYBULLET_DEFAULT_INERTIAL)
+        self._chain.active_links = np.array(
+            [link.name in self._joint_names for link in self._chain.links])
+
         self.free_joint_dict = self.get_free_joint_dict()
         self.joint_dict = self.get_joint_dict()
         self._link_id_dict = self.get_link_dict()
@@ -187,11 +228,6 @@ class SawyerCtrlInterface(RobotInterface):
         self.redisClient.set(CONTROLLER_CONTROL_TYPE_KEY, self.default_control_type)
         self.redisClient.set(CONTROLLER_CONTROL_PARAMS_KEY, json.dumps(self.default_params))
 
-        self.pb_ee_pos_log = []
-        self.pb_ee_ori_log = []
-        self.pb_ee_v_log = []
-        self.pb_ee_w_log = []
-
         # Set initial redis keys
         self._linear_jacobian = None
         self._angular_jacobian = None
@@ -224,6 +260,20 @@ class SawyerCtrlInterface(RobotInterface):
         self.loop_times = []
         self.cmd_end_time = []
 
+        self.loop_scheduler = LoopScheduler(LOOP_TIME)
+
+        # Redis I/O thread, decoupled from the torque loop.
+        io_thread_cfg = self.config.get('io_thread', {})
+        self.use_io_thread = io_thread_cfg.get('enabled', False)
+        self.io_rate = io_thread_cfg.get('rate', 100)
+        self._cmd_queue = deque()
+        self._state_slot = LatestSlot()
+        self._loop_stats_slot = LatestSlot()
+        # States of every tick, for the state history. Bounded by the
+        # history length, so the oldest are dropped if the I/O thread stalls.
+        self._history_queue = deque(maxlen=max(self.redisClient.state_history_len, 1))
+        self._io_running = threading.Event()
+
 
     def make_controller_from_redis(self, control_type, controller_dict):
         print("Making controller {} with params: {}".format(control_type, controller_dict))
@@ -292,7 +342,11 @@ class SawyerCtrlInterface(RobotInterface):
         return self.redisClient.get(CONTROLLER_CONTROL_PARAMS_KEY)
 
     def get_control_type(self):
-        return self.redisClient.get(CONTROLLER_CONTROL_TYPE_KEY)
+        control_type = self.redisClient.get(CONTROLLER_CONTROL_TYPE_KEY)
+        # redis-py returns bytes on python 3.
+        if isinstance(control_type, bytes):
+            control_type = control_type.decode('utf-8')
+        return control_type
 
     def reset_to_neutral(self):
         """Blocking call for resetting the arm to neutral position
@@ -374,6 +428,14 @@ class SawyerCtrlInterface(RobotInterface):
         """
         return list(self._limb.endpoint_velocity()['angular'])
 
+    @property
+    def ee_w(self):
+        """
+        Get the current angular velocity of end effector in the eef frame.
+        :return: a list of floats for the angular velocity [wx, wy, wz]
+        """
+        return self.ee_omega
+
     def get_ee_omega_world(self):
         """
         Returns ee_v in world frame, after applying transformations from eef ori.
@@ -557,37 +619,27 @@ class SawyerCtrlInterface(RobotInterface):
 
         return joint_velocities
 
-    def _calc_jacobian(self, q=None, dq=None, localPos=None):
+    def _chain_positions(self, q):
+        """Full joint positions of the kinematic chain for limb joint positions q.
+        """
+        return self._chain.active_to_full(
+            q[:7], np.zeros(len(self._chain.links)))
+
+    def _calc_jacobian(self, q=None):
+        """Compute the jacobian of the end effector link origin from the urdf.
+
+        This is the point pb.calculateJacobian used with a zero local
+        position: pybullet takes it in the link frame, not at the center of
+        mass of the link.
+        """
         if q is None:
             q = self.q
-        if dq is None:
-            dq = self.dq
-        if localPos is None:
-            localPos = [0, 0, 0]
-
-        # append zeros to q to fit pybullet
-        q = self._pad_zeros_to_joint_values(q)
-        dq = self._pad_zeros_to_joint_values(dq)
-
-        linear_jacobian, angular_jacobian = pb.calculateJacobian(
-            bodyUniqueId=self._pb_sawyer,
-            linkIndex=self._link_id_dict[self.ee_name],
-            localPosition=localPos,
-            objPositions=q,
-            objVelocities=dq,
-            objAccelerations=[0] * self.num_free_joints,
-            physicsClientId=self._clid)
 
-        # Save full linear jacoban as 3 x 10
-        self._linear_jacobian = np.reshape(
-            linear_jacobian, (3, self.num_free_joints))
-        # save full angular jacobian as 3x10
-        self._angular_jacobian = np.reshape(
-            angular_jacobian, (3, self.num_free_joints))
-        # Save full jacobian as 6x10
-        self._jacobian = np.vstack(
-            (self._linear_jacobian, self._angular_jacobian))
-        return linear_jacobian, angular_jacobian
+        self._jacobian = self._chain.dynamics.jacobian(self._chain_positions(q))
+        # Linear and angular jacobians as 3x7
+        self._linear_jacobian = self._jacobian[:3]
+        self._angular_jacobian = self._jacobian[3:]
+        return self._linear_jacobian, self._angular_jacobian
 
     @property
     def J(self, q=None):
@@ -595,6 +647,12 @@ class SawyerCtrlInterface(RobotInterface):
         """
         return self._jacobian[:, :7]
 
+    @property
+    def jacobian(self):
+        """ Full jacobian as a 6x7 matrix, same as J.
+        """
+        return self.J
+
     @property
     def linear_jacobian(self):
         """The linear jacobian x_dot = J_t*q_dot using pb as a 3x7 matrix
@@ -612,14 +670,11 @@ class SawyerCtrlInterface(RobotInterface):
         return self._mass_matrix
 
     def _calc_mass_matrix(self, q=None):
+        """Compute the joint space mass matrix from the urdf inertials.
+        """
         if q is None:
             q = self.q
-        mass_matrix = pb.calculateMassMatrix(
-            self._pb_sawyer,
-            q,
-            physicsClientId=self._clid)
-
-        self._mass_matrix = np.array(mass_matrix)[:7, :7]
+        self._mass_matrix = self._chain.dynamics.mass_matrix(self._chain_positions(q))
 
     @property
     def torque_compensation(self):
@@ -642,11 +697,12 @@ class SawyerCtrlInterface(RobotInterface):
         return assembly_names, camera_info
 
     # Controllers#######################################################
-    def step(self, start):
+    def step(self, start=None):
         """Update the robot state and model, set torques from controller
 
         Note this is different from other robot interfaces, as the Sawyer
         low-level controller takes gravity compensation into account.
+        Loop timing is handled by the loop_scheduler in run.
         """
         self.update_model()
 
@@ -659,9 +715,6 @@ class SawyerCtrlInterface(RobotInterface):
             
             self.set_torques(torques)
 
-            while (time.time() - start < LOOP_TIME):
-                pass
-
         else:
             pass
 
@@ -806,24 +859,9 @@ class SawyerCtrlInterface(RobotInterface):
         return joint_name
 
     def update_model(self):
-        self._calc_jacobian()
-        self._calc_mass_matrix()
-
-        # Reset pybullet model to joint State to get ee_pose and orientation.
-        for joint_ind, joint_name in enumerate(self._joint_names):
-            pb.resetJointState(
-                bodyUniqueId=self._pb_sawyer,
-                jointIndex=self.joint_dict[joint_name],
-                targetValue=self.q[joint_ind],
-                targetVelocity=self.dq[joint_ind],
-                physicsClientId=self._clid)
-
-        pb_ee_pos, pb_ee_ori, _, _, _, _, pb_ee_v, pb_ee_w = pb.getLinkState(
-            self._pb_sawyer,
-            self._link_id_dict[self.ee_name],
-            computeLinkVelocity=1,
-            computeForwardKinematics=1,
-            physicsClientId=self._clid)
+        q = np.asarray(self.q)
+        self._calc_jacobian(q)
+        self._calc_mass_matrix(q)
 
         # Get ee orientation as a matrix
         ee_ori_mat = T.quat2mat(self.ee_orientation)
@@ -846,27 +884,85 @@ class SawyerCtrlInterface(RobotInterface):
                                 J_ori=self.angular_jacobian,
                                 mass_matrix=self.mass_matrix)
 
-    def update_redis(self):
+    def get_robot_state(self):
+        """ Collect the robot state and model to publish to redis.
+
+        Returns:
+            (dict): state and model values keyed by property name.
+        """
+        return {'tstamp': time.time(),
+                'ee_position': self.ee_position,
+                'ee_pose': self.ee_pose,
+                'ee_orientation': self.ee_orientation,
+                'ee_v': self.ee_v,
+                'q': self.q,
+                'dq': self.dq,
+                'tau': self.tau,
+                'jacobian': self.J,
+                'linear_jacobian': self.linear_jacobian,
+                'angular_jacobian': self.angular_jacobian,
+                'mass_matrix': self.mass_matrix}
+
+    def get_history_state(self, state):
+        """ Encode the fields of a robot state kept in the state history.
+
+        Args:
+            state (dict): robot state from get_robot_state.
+
+        Returns:
+            (dict): history fields with encoded values.
+        """
+        encode = self.redisClient.encode_ndarray
+        return {'tstamp': str(state['tstamp']),
+                'q': encode(state['q']),
+                'dq': encode(state['dq']),
+                'tau': encode(state['tau']),
+                'ee_pose': encode(state['ee_pose']),
+                'ee_v': encode(state['ee_v'])}
+
+    def update_redis(self, state=None, history=True):
         """ update db parameters for the robot on a regular loop
 
+        If the redis state_history_len is set, the state is also appended
+        to the state history stream.
+
+        Args:
+            state (dict): robot state from get_robot_state. If None, the
+                current state is used.
+            history (bool): append the state to the state history. False
+                when the I/O thread appends the states of every tick itself.
         """
+        if state is None:
+            state = self.get_robot_state()
         # Set initial redis keys
+        encode = self.redisClient.encode_ndarray
         robot_state = {
-            ROBOT_STATE_TSTAMP_KEY: str(time.time()),
-            ROBOT_STATE_EE_POS_KEY: str(self.ee_position),
-            ROBOT_STATE_EE_POSE_KEY: str(self.ee_pose),
-            ROBOT_STATE_EE_ORN_KEY: str(self.ee_orientation),
-            ROBOT_STATE_EE_V_KEY: str(self.ee_v),
-            ROBOT_STATE_Q_KEY: str(self.q),
-            ROBOT_STATE_DQ_KEY: str(self.dq),
-            ROBOT_STATE_TAU_KEY: str(self.tau),
-            ROBOT_MODEL_JACOBIAN_KEY: str(self.J),
-            ROBOT_MODEL_L_JACOBIAN_KEY: str(self.linear_jacobian),
-            ROBOT_MODEL_A_JACOBIAN_KEY: str(self.angular_jacobian),
-            ROBOT_MODEL_MASS_MATRIX_KEY: str(self.mass_matrix)
+            ROBOT_STATE_TSTAMP_KEY: str(state['tstamp']),
+            ROBOT_STATE_EE_POS_KEY: encode(state['ee_position']),
+            ROBOT_STATE_EE_POSE_KEY: encode(state['ee_pose']),
+            ROBOT_STATE_EE_ORN_KEY: encode(state['ee_orientation']),
+            ROBOT_STATE_EE_V_KEY: encode(state['ee_v']),
+            ROBOT_STATE_Q_KEY: encode(state['q']),
+            ROBOT_STATE_DQ_KEY: encode(state['dq']),
+            ROBOT_STATE_TAU_KEY: encode(state['tau']),
+            ROBOT_MODEL_JACOBIAN_KEY: encode(state['jacobian']),
+            ROBOT_MODEL_L_JACOBIAN_KEY: encode(state['linear_jacobian']),
+            ROBOT_MODEL_A_JACOBIAN_KEY: encode(state['angular_jacobian']),
+            ROBOT_MODEL_MASS_MATRIX_KEY: encode(state['mass_matrix'])
         }
 
-        self.redisClient.mset(robot_state)
+        history_state = None
+        if history and self.redisClient.state_history_len > 0:
+            history_state = {
+                'tstamp': robot_state[ROBOT_STATE_TSTAMP_KEY],
+                'q': robot_state[ROBOT_STATE_Q_KEY],
+                'dq': robot_state[ROBOT_STATE_DQ_KEY],
+                'tau': robot_state[ROBOT_STATE_TAU_KEY],
+                'ee_pose': robot_state[ROBOT_STATE_EE_POSE_KEY],
+                'ee_v': robot_state[ROBOT_STATE_EE_V_KEY]
+            }
+
+        self.redisClient.set_robot_state(robot_state, history_state)
 
     def get_free_joint_idx_dict(self):
         """ Create a dictionary linking the "free" (not fixed)
@@ -974,24 +1070,30 @@ class SawyerCtrlInterface(RobotInterface):
     def get_cmd_tstamp(self):
         return self.redisClient.get(ROBOT_CMD_TSTAMP_KEY)
 
-    def process_cmd(self, cmd_type):
+    def process_cmd(self, cmd_type, goal=None):
         """ process command from redis
-        
+
         Args:
             cmd_type (str): byte-array string from redis cmd key
+            goal (dict): controller goal sent with the command. If None,
+                the goal is read from redis for commands that need one.
+                For CHANGE_CONTROLLER, the control_type and params.
         """
+        if goal is None and cmd_type in bGOAL_CMDS:
+            goal = self.controller_goal
+
         if (cmd_type == bSET_EE_POSE):
-            self.set_ee_pose(**self.controller_goal)
+            self.set_ee_pose(**goal)
         elif (cmd_type == bMOVE_EE_DELTA):
-            self.move_ee_delta(**self.controller_goal)
+            self.move_ee_delta(**goal)
         elif(cmd_type == bSET_JOINT_DELTA):
-            self.set_joint_delta(**self.controller_goal)
+            self.set_joint_delta(**goal)
         elif (cmd_type == bSET_JOINT_POSITIONS):
-            self.set_joint_positions(**self.controller_goal)
+            self.set_joint_positions(**goal)
         elif (cmd_type == bSET_JOINT_TORQUES):
-            self.set_joint_torques(**self.controller_goal)
+            self.set_joint_torques(**goal)
         elif (cmd_type == bSET_JOINT_VELOCITIES):
-            self.set_joint_velocities(**self.controller_goal)
+            self.set_joint_velocities(**goal)
         elif(cmd_type == bRESET):
             self.redisClient.set(ROBOT_RESET_COMPL_KEY, 'False')
             self.reset_to_neutral()
@@ -1001,9 +1103,12 @@ class SawyerCtrlInterface(RobotInterface):
             return
         elif (cmd_type == bCHANGE_CONTROLLER):
             rospy.loginfo("CHANGE CONTROLLER COMMAND RECEIVED")
+            if goal is None:
+                goal = {'control_type': self.get_control_type(),
+                        'params': self.get_controller_params()}
             self.controller = self.make_controller_from_redis(
-                self.get_control_type(),
-                self.get_controller_params())
+                goal['control_type'],
+                goal['params'])
         else:
             rospy.logwarn("Unknown command: {}".format(cmd_type))
     
@@ -1015,18 +1120,44 @@ class SawyerCtrlInterface(RobotInterface):
         else:
             return False
 
-    def process_gripper_cmd(self):
+    def process_gripper_cmd(self, des_gripper_state=None):
         """Process the new gripper command by setting gripper state.
 
         Only send gripper command if current gripper open fraction is not
         equal to desired gripper open fraction.
-        """
-        if self.prev_gripper_state != self.des_gripper_state:
-            self.set_gripper_to_value(self.des_gripper_state)
-            self.prev_gripper_state = self.des_gripper_state
+
+        Args:
+            des_gripper_state (float): desired gripper open fraction. If None,
+                read from redis.
+        """
+        if des_gripper_state is None:
+            des_gripper_state = self.des_gripper_state
+        if self.prev_gripper_state != des_gripper_state:
+            self.set_gripper_to_value(des_gripper_state)
+            self.prev_gripper_state = des_gripper_state
         else:
             pass
 
+    def process_cmd_msgs(self, dispatch=None):
+        """Process all commands published on the command channel since last tick.
+
+        Used when the redis cmd_transport is pubsub. The latency between the
+        command being sent and received is set to ROBOT_CMD_LATENCY_KEY.
+
+        Args:
+            dispatch (callable): called with the cmd_type and goal of each
+                robot command. Defaults to process_cmd.
+
+        Returns:
+            (bool): False if the environment disconnected, True otherwise.
+        """
+        connected, latency = dispatch_cmd_msgs(self.redisClient,
+                                               dispatch or self.process_cmd,
+                                               self.process_gripper_cmd)
+        if latency is not None:
+            self.last_cmd_latency = latency
+        return connected
+
 
     def check_for_new_cmd(self):
         cmd_tstamp = self.get_cmd_tstamp()
@@ -1037,20 +1168,165 @@ class SawyerCtrlInterface(RobotInterface):
             return False
 
     def run(self):
+        if self.use_io_thread:
+            self.run_threaded()
+            return
+
         if (self.env_connected == b'True'):
             self.controller = self.make_controller_from_redis(self.get_control_type(), self.get_controller_params())
 
+        self.loop_scheduler.start()
+
         while True:
             start = time.time()
             self.log_start_times.append(start)
-            if (self.env_connected == b'True'):
+            if self.redisClient.cmd_transport == CMD_TRANSPORT_PUBSUB:
+                if not self.process_cmd_msgs():
+                    break
+            elif (self.env_connected == b'True'):
                 if self.check_for_new_cmd():
                     self.process_cmd(self.cmd_type)
                 if self.check_for_new_gripper_cmd():
                     self.process_gripper_cmd()
-                self.step(start)
             else:
                 break
+            self.step(start)
+            if self.redisClient.publish_every_tick:
+                self.update_redis()
+            self.loop_scheduler.wait()
+            if self.loop_scheduler.ticks >= LOOP_STATS_TICKS:
+                self.update_loop_stats()
+
+    def run_threaded(self):
+        """ Run the torque loop in this thread and redis I/O on another.
+
+        The torque loop never touches the network: the I/O thread queues
+        incoming commands, and publishes the latest robot state and loop
+        statistics the torque loop puts in their slots at io_rate. If the
+        state history is enabled, the torque loop also queues the state of
+        every tick, which the I/O thread appends to the history in one
+        batch. Run the
+        process with real-time priority (e.g. chrt) to prioritize the
+        torque loop over the I/O thread.
+
+        The torque loop stops when the environment disconnects or the I/O
+        loop raises, in which case the exception is re-raised here.
+        """
+        if (self.env_connected == b'True'):
+            self.controller = self.make_controller_from_redis(self.get_control_type(), self.get_controller_params())
+
+        self._cmd_queue.clear()
+        self._history_queue.clear()
+        record_history = self.redisClient.state_history_len > 0
+        io_thread = IOThread(self._io_loop, self._io_running, name='sawyer_redis_io')
+        io_thread.start()
+
+        self.loop_scheduler.start()
+        try:
+            while self._io_running.is_set():
+                while self._cmd_queue:
+                    cmd_type, goal = self._cmd_queue.popleft()
+                    self.process_cmd(cmd_type, goal)
+                self.step()
+                state = self.get_robot_state()
+                self._state_slot.put(state)
+                if record_history:
+                    self._history_queue.append(state)
+                self.loop_scheduler.wait()
+                if self.loop_scheduler.ticks >= LOOP_STATS_TICKS:
+                    self._loop_stats_slot.put(self.loop_scheduler.stats())
+                    self.loop_scheduler.reset_stats()
+        finally:
+            self._io_running.clear()
+
+        # Re-raises the exception that stopped the I/O loop, if any.
+        io_thread.join()
+        # States of the last ticks, queued after the I/O loop stopped.
+        self._append_state_history()
+
+    def _io_loop(self):
+        """ Ingest commands and publish robot states at io_rate.
+
+        Clears _io_running when the environment disconnects.
+        """
+        io_scheduler = LoopScheduler(1.0 / self.io_rate)
+        last_state_seq = 0
+        last_stats_seq = 0
+        while self._io_running.is_set():
+            if not self._ingest_cmds():
+                self._io_running.clear()
+                break
+
+            self._append_state_history()
+
+            state_seq, state = self._state_slot.get()
+            if state_seq != last_state_seq:
+                self.update_redis(state, history=False)
+                last_state_seq = state_seq
+
+            stats_seq, stats = self._loop_stats_slot.get()
+            if stats_seq != last_stats_seq:
+                self.update_loop_stats(stats)
+                last_stats_seq = stats_seq
+
+            io_scheduler.wait()
+
+    def _append_state_history(self):
+        """ Append the states queued by the torque loop to the state history.
+        """
+        history = drain(self._history_queue)
+        if history:
+            self.redisClient.append_state_history(
+                [self.get_history_state(state) for state in history])
+
+    def _ingest_cmds(self):
+        """ Read new commands from redis and queue them for the torque loop.
+
+        Gripper commands are executed directly, as they do not affect the
+        torque loop.
+
+        Returns:
+            (bool): False if the environment disconnected, True otherwise.
+        """
+        if self.redisClient.cmd_transport == CMD_TRANSPORT_PUBSUB:
+            return self.process_cmd_msgs(self._queue_cmd)
+        else:
+            if (self.env_connected != b'True'):
+                return False
+            if self.check_for_new_cmd():
+                self._queue_cmd(self.cmd_type)
+            if self.check_for_new_gripper_cmd():
+                self.process_gripper_cmd()
+        return True
+
+    def _queue_cmd(self, cmd_type, goal=None):
+        """ Queue command for the torque loop, reading its goal from redis if needed.
+        """
+        if goal is None:
+            if cmd_type in bGOAL_CMDS:
+                goal = self.controller_goal
+            elif cmd_type == bCHANGE_CONTROLLER:
+                goal = {'control_type': self.get_control_type(),
+                        'params': self.get_controller_params()}
+        self._cmd_queue.append((cmd_type, goal))
+
+    def update_loop_stats(self, stats=None):
+        """Set control loop statistics to redis and start a new window.
+
+        Args:
+            stats (dict): loop statistics to set. If None, taken from
+                the loop_scheduler.
+        """
+        if stats is None:
+            stats = self.loop_scheduler.stats()
+            self.loop_scheduler.reset_stats()
+        self.redisClient.mset({
+            ROBOT_CTRL_LOOP_PERIOD_KEY: stats['period'],
+            ROBOT_CTRL_LOOP_MAX_PERIOD_KEY: stats['max_period'],
+            ROBOT_CTRL_LOOP_COMPUTE_TIME_KEY: stats['compute_time'],
+            ROBOT_CTRL_LOOP_MAX_COMPUTE_TIME_KEY: stats['max_compute_time'],
+            ROBOT_CTRL_LOOP_MIN_SLACK_KEY: stats['min_slack'],
+            ROBOT_CTRL_LOOP_MISSED_KEY: stats['missed_deadlines']})
 
 ### MAIN ###
 if __name__ == "__main__":
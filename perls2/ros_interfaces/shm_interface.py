@@ -0,0 +1,283 @@
+"""Shared memory transport for an env and Control Interface on the same machine.
+
+Robot states, models and commands are exchanged through a memory mapped
+file (in /dev/shm by default) instead of the redis socket. All other keys,
+such as controller parameters and connection flags, still go through redis.
+
+Layout of the shared memory:
+    state seq (uint64): seqlock counter for the state block.
+    state block (float64): robot states and models in STATE_LAYOUT order.
+    cmd count (uint64): number of commands written.
+    cmd slots (CMD_RING_SLOTS x (seq, length)) (uint64): seqlock counter and
+        message length of each slot of the command ring.
+    cmd payloads (CMD_RING_SLOTS x CMD_MSG_MAX_LEN) (uint8): encoded command
+        messages, see goal_codec.
+
+The state block has a single writer (the Control Interface) and the command
+ring a single writer (the env), so seqlocks are enough to give readers a
+consistent copy without locking. Readers give up after SEQLOCK_TIMEOUT, in
+case a writer died in the middle of a write.
+
+Uses mmap rather than multiprocessing.shared_memory to remain compatible
+with python 2.7 for the SawyerCtrlInterface.
+"""
+from __future__ import division
+import os
+import mmap
+import time
+import logging
+import numpy as np
+from perls2.ros_interfaces.redis_interface import RobotRedisInterface
+from perls2.ros_interfaces.redis_keys import *
+from perls2.ros_interfaces.redis_values import *
+from perls2.ros_interfaces.redis_codec import encode_ndarray
+
+DEFAULT_SHM_PATH = '/dev/shm/perls2_robot'
+
+# Robot state and model keys in the state block, with their shapes.
+STATE_LAYOUT = [
+    (ROBOT_STATE_TSTAMP_KEY, ()),
+    (ROBOT_STATE_Q_KEY, (7,)),
+    (ROBOT_STATE_DQ_KEY, (7,)),
+    (ROBOT_STATE_TAU_KEY, (7,)),
+    (ROBOT_STATE_EE_POS_KEY, (3,)),
+    (ROBOT_STATE_EE_ORN_KEY, (4,)),
+    (ROBOT_STATE_EE_POSE_KEY, (7,)),
+    (ROBOT_STATE_EE_V_KEY, (3,)),
+    (ROBOT_STATE_EE_OMEGA_KEY, (3,)),
+    (ROBOT_MODEL_JACOBIAN_KEY, (6, 7)),
+    (ROBOT_MODEL_L_JACOBIAN_KEY, (3, 7)),
+    (ROBOT_MODEL_A_JACOBIAN_KEY, (3, 7)),
+    (ROBOT_MODEL_MASS_MATRIX_KEY, (7, 7)),
+]
+
+CMD_RING_SLOTS = 64
+CMD_MSG_MAX_LEN = 4096
+
+# Max time to wait for a consistent copy under a seqlock (s).
+SEQLOCK_TIMEOUT = 0.1
+
+
+class SharedMemoryRobotInterface(RobotRedisInterface):
+    """ RobotRedisInterface that exchanges states and commands through shared memory.
+
+    Commands are always sent as messages, so cmd_transport is pubsub.
+
+    Attributes:
+        shm_path (str): path of the memory mapped file shared by the env and
+            Control Interface.
+        seqlock_timeout (float): max time to wait for a write of the state
+            block or a command slot to finish (s).
+    """
+
+    def __init__(self, host, port, password=None, shm_path=DEFAULT_SHM_PATH,
+                 seqlock_timeout=SEQLOCK_TIMEOUT, **kwargs):
+        kwargs['cmd_transport'] = CMD_TRANSPORT_PUBSUB
+        RobotRedisInterface.__init__(self, host, port, password, **kwargs)
+        self.shm_path = shm_path
+        self.seqlock_timeout = seqlock_timeout
+
+        # Offsets of each state field in the state block.
+        self._fields = {}
+        num_floats = 0
+        for key, shape in STATE_LAYOUT:
+            size = int(np.prod(shape))
+            self._fields[key] = (num_floats, num_floats + size, shape)
+            num_floats += size
+
+        state_offset = 8
+        cmd_count_offset = state_offset + 8 * num_floats
+        slots_offset = cmd_count_offset + 8
+        payloads_offset = slots_offset + 16 * CMD_RING_SLOTS
+        self._size = payloads_offset + CMD_MSG_MAX_LEN * CMD_RING_SLOTS
+
+        fd = os.open(shm_path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            if os.fstat(fd).st_size < self._size:
+                os.ftruncate(fd, self._size)
+            self._mm = mmap.mmap(fd, self._size)
+        finally:
+            os.close(fd)
+
+        self._buffer = np.ndarray((self._size,), np.uint8, buffer=self._mm)
+        self._state_seq = np.ndarray((1,), np.uint64, buffer=self._mm, offset=0)
+        self._state = np.ndarray((num_floats,), np.float64, buffer=self._mm, offset=state_offset)
+        self._cmd_count = np.ndarray((1,), np.uint64, buffer=self._mm, offset=cmd_count_offset)
+        self._cmd_slots = np.ndarray(
+            (CMD_RING_SLOTS, 2), np.uint64, buffer=self._mm, offset=slots_offset)
+        self._cmd_payloads = np.ndarray(
+            (CMD_RING_SLOTS, CMD_MSG_MAX_LEN), np.uint8, buffer=self._mm, offset=payloads_offset)
+        self._cmd_read_count = int(self._cmd_count[0])
+
+    @property
+    def publish_every_tick(self):
+        """Writing states to shared memory is cheap enough for every tick.
+        """
+        return True
+
+    def encode_ndarray(self, array):
+        """States are written to shared memory as float64, without encoding.
+        """
+        return np.asarray(array, dtype=np.float64)
+
+    def _write_state(self, values):
+        """Write state fields to the state block under the seqlock.
+
+        Args:
+            values (dict): arrays keyed by redis key. Keys must be in STATE_LAYOUT.
+        """
+        self._state_seq[0] += 1
+        for key, value in values.items():
+            start, stop, _ = self._fields[key]
+            self._state[start:stop] = np.ravel(value)
+        self._state_seq[0] += 1
+
+    def _seqlock_read(self, read_seq, copy, name):
+        """Copy data under a seqlock, retrying while a write overlaps.
+
+        Args:
+            read_seq (function): returns the seqlock counter.
+            copy (function): returns a copy of the data.
+            name (str): name of the data, for the error message.
+
+        Returns:
+            the copy, from a single write.
+
+        Raises:
+            RuntimeError: if no consistent copy was made within
+                seqlock_timeout, e.g. the writer died in the middle of a write.
+        """
+        deadline = None
+        while True:
+            seq = read_seq()
+            if seq % 2 == 0:
+                data = copy()
+                if read_seq() == seq:
+                    return data
+            if deadline is None:
+                deadline = time.time() + self.seqlock_timeout
+            elif time.time() > deadline:
+                raise RuntimeError(
+                    "Timed out reading {} from shared memory {}, the writer may have "
+                    "stopped in the middle of a write.".format(name, self.shm_path))
+            # Yield to the writer.
+            time.sleep(0)
+
+    def _read_state(self, keys):
+        """Copy state fields from the state block, retrying if a write overlapped.
+
+        Args:
+            keys (list): redis keys to read. Keys must be in STATE_LAYOUT.
+
+        Returns:
+            (list): values of the keys, from the same write.
+        """
+        def copy():
+            values = []
+            for key in keys:
+                start, stop, shape = self._fields[key]
+                values.append(self._state[start:stop].reshape(shape).copy())
+            return values
+
+        values = self._seqlock_read(lambda: int(self._state_seq[0]), copy, 'robot state')
+        return [float(value) if key == ROBOT_STATE_TSTAMP_KEY else value
+                for key, value in zip(keys, values)]
+
+    def set_robot_state(self, robot_state, history_state=None):
+        """Write robot state keys to shared memory.
+
+        If the state history is enabled, history_state is appended to the
+        redis stream as in RobotRedisInterface.
+        """
+        values = dict((key, float(value) if key == ROBOT_STATE_TSTAMP_KEY else value)
+                      for key, value in robot_state.items())
+        self._write_state(values)
+        if history_state is not None:
+            self.append_state_history([history_state])
+
+    def append_state_history(self, history_states):
+        """Append states to the state history stream in a single round trip.
+
+        The history stays in redis, so the raw arrays are encoded first.
+        """
+        RobotRedisInterface.append_state_history(self, [
+            dict((field, value if field == 'tstamp' else encode_ndarray(value))
+                 for field, value in history_state.items())
+            for history_state in history_states])
+
+    def get(self, key):
+        """Get value of key, reading robot states and models from shared memory.
+        """
+        if key in self._fields:
+            return self._read_state([key])[0]
+        return RobotRedisInterface.get(self, key)
+
+    def mget(self, keys):
+        """Get values of multiple keys. State keys are read from a single write.
+        """
+        state_keys = [key for key in keys if key in self._fields]
+        other_keys = [key for key in keys if key not in self._fields]
+        values = dict(zip(state_keys, self._read_state(state_keys)))
+        if other_keys:
+            values.update(zip(other_keys, RobotRedisInterface.mget(self, other_keys)))
+        return [values[key] for key in keys]
+
+    def send_cmd(self, cmd_type, goal=None):
+        """Write a robot command to the next slot of the command ring.
+        """
+        data = self.encode_cmd_msg(cmd_type, goal, time.time())
+        if not isinstance(data, bytes):
+            data = data.encode()
+        if len(data) > CMD_MSG_MAX_LEN:
+            raise ValueError("Command message too long for shared memory slot.")
+
+        count = int(self._cmd_count[0])
+        slot = count % CMD_RING_SLOTS
+        self._cmd_slots[slot, 0] += 1
+        self._cmd_payloads[slot, :len(data)] = np.frombuffer(data, dtype=np.uint8)
+        self._cmd_slots[slot, 1] = len(data)
+        self._cmd_slots[slot, 0] += 1
+        self._cmd_count[0] = count + 1
+
+    def subscribe_cmds(self):
+        """Only receive commands written from now on.
+        """
+        self._cmd_read_count = int(self._cmd_count[0])
+
+    def get_cmd_msgs(self):
+        """Get all commands written since the last call without blocking.
+
+            Returns:
+                (list): command dicts with keys cmd_type, tstamp and goal,
+                    in the order they were sent.
+
+            Raises:
+                RuntimeError: if a command slot is left mid-write, see
+                    _seqlock_read.
+        """
+        count = int(self._cmd_count[0])
+        if count < self._cmd_read_count:
+            # Shared memory was cleared.
+            self._cmd_read_count = 0
+        if count - self._cmd_read_count > CMD_RING_SLOTS:
+            logging.warning("Dropped {} robot commands from shared memory.".format(
+                count - self._cmd_read_count - CMD_RING_SLOTS))
+            self._cmd_read_count = count - CMD_RING_SLOTS
+
+        cmd_msgs = []
+        while self._cmd_read_count < count:
+            slot = self._cmd_read_count % CMD_RING_SLOTS
+            data = self._seqlock_read(
+                lambda: int(self._cmd_slots[slot, 0]),
+                lambda: self._cmd_payloads[slot, :int(self._cmd_slots[slot, 1])].tobytes(),
+                'robot command')
+            cmd_msgs.append(self.decode_cmd_msg(data))
+            self._cmd_read_count += 1
+        return cmd_msgs
+
+    def flushall(self):
+        """Delete all redis keys and clear the shared memory.
+        """
+        RobotRedisInterface.flushall(self)
+        self._buffer[:] = 0
+        self._cmd_read_count = 0
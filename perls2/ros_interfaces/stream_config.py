@@ -0,0 +1,168 @@
+"""Server-side region of interest and resizing of the Kinect streams.
+
+The env sets a stream config to KINECT2_STREAM_CONFIG_KEY as json, e.g.
+
+    {"modalities": ["rgb", "depth"],
+     "roi": {"rgb": [480, 270, 960, 540], "depth": [128, 106, 256, 212]},
+     "size": [128, 128]}
+
+and the KinectROSInterface crops and resizes the frames before encoding
+them, and only publishes the listed modalities.
+
+    modalities (list): modalities to publish. Defaults to rgb, depth and ir.
+    roi ([x, y, width, height]): region of interest, in pixels of the
+        full frame. Defaults to the full frame.
+    size ([width, height]): output size of the frames, after cropping.
+        Defaults to the size of the roi.
+
+roi and size may be given for all modalities, or as a dict keyed by
+modality, as rgb and depth may have a different resolution than ir.
+
+Must remain compatible with python 2.7 for the KinectROSInterface.
+"""
+from __future__ import division
+import json
+import numpy as np
+import cv2
+
+MODALITIES = ('rgb', 'depth', 'ir')
+
+# Color is averaged when downsampling, depth and ir are not, so that no
+# depth is interpolated across object edges.
+INTERPOLATION = {
+    'rgb': cv2.INTER_AREA,
+    'depth': cv2.INTER_NEAREST,
+    'ir': cv2.INTER_NEAREST,
+}
+
+
+def _per_modality(value, length, name):
+    """Parse a roi or size given for all modalities or keyed by modality.
+    """
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        value = dict((modality, value) for modality in MODALITIES)
+    parsed = {}
+    for modality, item in value.items():
+        if modality not in MODALITIES:
+            raise ValueError("Unknown modality {} in stream {}".format(modality, name))
+        if item is None:
+            continue
+        item = tuple(int(x) for x in item)
+        if len(item) != length or min(item[-2:]) <= 0 or min(item) < 0:
+            raise ValueError("Invalid stream {} for {}: {}".format(name, modality, item))
+        parsed[modality] = item
+    return parsed
+
+
+class StreamConfig(object):
+    """Modalities, regions of interest and output sizes of the streams.
+
+    Attributes:
+        modalities (tuple): modalities published.
+        roi (dict): (x, y, width, height) of the modalities cropped.
+        size (dict): (width, height) of the modalities resized.
+    """
+
+    def __init__(self, modalities=None, roi=None, size=None):
+        """Initialize.
+
+        Args:
+            modalities (list): modalities to publish, defaults to all.
+            roi (list or dict): [x, y, width, height] region of interest for
+                all modalities, or keyed by modality.
+            size (list or dict): [width, height] output size for all
+                modalities, or keyed by modality.
+        """
+        if modalities is None:
+            modalities = MODALITIES
+        for modality in modalities:
+            if modality not in MODALITIES:
+                raise ValueError("Unknown stream modality {}".format(modality))
+        if not modalities:
+            raise ValueError("At least one modality must be streamed.")
+        self.modalities = tuple(modalities)
+        self.roi = _per_modality(roi, 4, 'roi')
+        self.size = _per_modality(size, 2, 'size')
+        self._out = {}
+
+    @classmethod
+    def from_json(cls, value):
+        """Stream config from its json encoding, defaults if value is None.
+        """
+        if value is None:
+            return cls()
+        if isinstance(value, bytes):
+            value = value.decode()
+        config = json.loads(value) or {}
+        return cls(config.get('modalities'), config.get('roi'), config.get('size'))
+
+    def to_json(self):
+        return json.dumps({'modalities': list(self.modalities),
+                           'roi': dict((m, list(roi)) for m, roi in self.roi.items()),
+                           'size': dict((m, list(size)) for m, size in self.size.items())})
+
+    def apply(self, frames):
+        """Crop and resize the frames of the streamed modalities.
+
+        Resized frames are written into buffers reused on the next call.
+
+        Args:
+            frames (dict): full frames keyed by modality.
+
+        Returns:
+            dict of the frames of the streamed modalities. Cropped frames
+                are views of the full frames.
+        """
+        out = {}
+        for modality in self.modalities:
+            frame = frames[modality]
+            if modality in self.roi:
+                x, y, width, height = self.roi[modality]
+                if x + width > frame.shape[1] or y + height > frame.shape[0]:
+                    raise ValueError("Stream roi {} exceeds the {} frame of shape {}".format(
+                        self.roi[modality], modality, frame.shape))
+                frame = frame[y:y + height, x:x + width]
+            if modality in self.size and self.size[modality] != frame.shape[1::-1]:
+                width, height = self.size[modality]
+                buffer = self._out.get(modality)
+                if buffer is None or buffer.shape[:2] != (height, width) \
+                        or buffer.shape[2:] != frame.shape[2:] or buffer.dtype != frame.dtype:
+                    buffer = np.empty((height, width) + frame.shape[2:], frame.dtype)
+                    self._out[modality] = buffer
+                cv2.resize(frame, (width, height), dst=buffer,
+                           interpolation=INTERPOLATION[modality])
+                frame = buffer
+            out[modality] = frame
+        return out
+
+    def intrinsics(self, K, modality='rgb', full_size=None):
+        """Intrinsics of the frames of a modality after cropping and resizing.
+
+        Args:
+            K (ndarray): 3x3 intrinsics of the full frames.
+            modality (str): modality of the frames.
+            full_size (tuple): (width, height) of the full frames, required
+                to resize frames without a roi.
+
+        Returns:
+            3x3 ndarray of intrinsics.
+        """
+        K = np.array(K, dtype=np.float64).reshape(3, 3)
+        if modality in self.roi:
+            x, y, width, height = self.roi[modality]
+            K[0, 2] -= x
+            K[1, 2] -= y
+        elif full_size is not None:
+            width, height = full_size
+        elif modality in self.size:
+            raise ValueError("Intrinsics of resized {} frames without a roi require "
+                             "the full frame size.".format(modality))
+        if modality in self.size:
+            # Pixel centers are scaled about the image corner, as by cv2.resize.
+            for row, scale in enumerate([self.size[modality][0] / width,
+                                         self.size[modality][1] / height]):
+                K[row, row] *= scale
+                K[row, 2] = (K[row, 2] + 0.5) * scale - 0.5
+        return K
@@ -0,0 +1,447 @@
+"""Renders BulletCameraInterface images in worker processes.
+
+pybullet holds the GIL while rendering and stepping, so a render thread
+cannot overlap with the physics. Instead each worker process loads a mirror
+of the world with a BulletArena in its own pybullet DIRECT client. On each
+request the body states of the world are sent to the workers, which reset
+their mirror to them and render the cameras into a memory mapped file (in
+/dev/shm by default).
+
+Each camera has two slots in the shared memory, used in turn, so the frames
+of the last request stay valid while the next one is rendered. Cameras are
+split across the workers and rendered in parallel.
+
+Only body poses and joint positions are mirrored. Changes to the world
+made outside of the arena, add_object and remove_object, such as visual
+shape colors or textures, or bodies loaded directly with pybullet, are not
+rendered. Body ids of the mirrors are mapped from the ids of the world,
+and segmentation masks are translated back to the ids of the world.
+
+Example:
+    renderer = AsyncBulletRenderer(config, physics_id, [camera])
+    renderer.request()
+    # step the physics, compute the rest of the observation ...
+    frames = renderer.frames(camera.name)
+    renderer.close()
+"""
+import os
+import mmap
+import logging
+import traceback
+import multiprocessing
+import numpy as np
+import pybullet
+
+from perls2.utils.shared_buffers import BUFFER_ALIGNMENT, aligned_size, create_shared_file
+from perls2.sensors.bullet_camera_interface import render_frames, MODALITIES
+
+NUM_SLOTS = 2
+
+
+def _layout_frames(cameras):
+    """Offsets of the frame buffers of each camera and slot.
+
+    Args:
+        cameras (list): (name, image_height, image_width) of each camera.
+
+    Returns:
+        (list, int): (name, slot, modality, offset, shape, dtype str) of each
+            buffer and the total size in bytes.
+    """
+    layout = []
+    offset = 0
+    for name, height, width in cameras:
+        specs = [('rgb', (height, width, 3), '|u1'),
+                 ('depth', (height, width), '<f4'),
+                 ('segmask', (height, width), '|u1'),
+                 ('rgba', (height, width, 4), '|u1')]
+        for slot in range(NUM_SLOTS):
+            for modality, shape, dtype in specs:
+                layout.append((name, slot, modality, offset, shape, dtype))
+                size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+                offset += aligned_size(size)
+    return layout, max(offset, BUFFER_ALIGNMENT)
+
+
+def _map_frames(mm, layout):
+    """ndarray views of the frame buffers, keyed by (name, slot).
+    """
+    buffers = {}
+    for name, slot, modality, offset, shape, dtype in layout:
+        buffers.setdefault((name, slot), {})[modality] = np.ndarray(
+            shape, dtype, buffer=mm, offset=offset)
+    return buffers
+
+
+def get_body_ids(physics_id):
+    """Unique ids of all bodies in a simulation, in load order.
+    """
+    return [pybullet.getBodyUniqueId(index, physicsClientId=physics_id)
+            for index in range(pybullet.getNumBodies(physicsClientId=physics_id))]
+
+
+def get_body_states(physics_id, num_joints=None):
+    """Base poses and joint positions of all bodies in a simulation.
+
+    Args:
+        physics_id (int): physics client.
+        num_joints (dict): optional cache of the number of joints of each
+            body, keyed by body id. Filled in for new bodies.
+
+    Returns:
+        (list): (body id, position, orientation, joint positions) of each body.
+    """
+    if num_joints is None:
+        num_joints = {}
+    states = []
+    for body_id in get_body_ids(physics_id):
+        if body_id not in num_joints:
+            num_joints[body_id] = pybullet.getNumJoints(body_id, physicsClientId=physics_id)
+        position, orientation = pybullet.getBasePositionAndOrientation(
+            body_id, physicsClientId=physics_id)
+        joint_positions = ()
+        if num_joints[body_id]:
+            joint_positions = tuple(state[0] for state in pybullet.getJointStates(
+                body_id, range(num_joints[body_id]), physicsClientId=physics_id))
+        states.append((body_id, position, orientation, joint_positions))
+    return states
+
+
+def set_body_states(physics_id, states):
+    """Reset the bodies of a simulation to states from get_body_states.
+    """
+    for body_id, position, orientation, joint_positions in states:
+        pybullet.resetBasePositionAndOrientation(
+            body_id, position, orientation, physicsClientId=physics_id)
+        for joint_index, joint_position in enumerate(joint_positions):
+            pybullet.resetJointState(
+                body_id, joint_index, joint_position, physicsClientId=physics_id)
+
+
+def _worker(conn, config):
+    """Render cameras of a mirror of the world, executing commands from the
+    AsyncBulletRenderer.
+
+    Args:
+        conn (multiprocessing.Connection): pipe to the AsyncBulletRenderer.
+        config (dict): config of the world to mirror.
+    """
+    # Imported here to avoid a circular import with bullet_world.
+    from perls2.arenas.bullet_arena import BulletArena
+    physics_id = None
+    try:
+        physics_id = pybullet.connect(pybullet.DIRECT)
+        arena = BulletArena(config, physics_id, has_camera=False)
+        conn.send(('ok', get_body_ids(physics_id)))
+
+        shm_path, layout, size = conn.recv()
+        with open(shm_path, 'r+b') as shm_file:
+            mm = mmap.mmap(shm_file.fileno(), size)
+        buffers = _map_frames(mm, layout)
+        conn.send(('ok', None))
+
+        while True:
+            cmd, data = conn.recv()
+            if cmd == 'render':
+                slot, states, cameras = data
+                set_body_states(physics_id, states)
+                for name, params in cameras:
+                    render_frames(physics_id, modalities=MODALITIES,
+                                  out=buffers[(name, slot)], **params)
+                conn.send(('ok', None))
+            elif cmd == 'add_object':
+                conn.send(('ok', arena._load_object_path(**data)))
+            elif cmd == 'remove_object':
+                arena._remove_object(data, physics_id)
+                conn.send(('ok', None))
+            elif cmd == 'close':
+                conn.send(('ok', None))
+                break
+            else:
+                raise ValueError("Invalid AsyncBulletRenderer command {}".format(cmd))
+    except (KeyboardInterrupt, EOFError):
+        pass
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+    finally:
+        if physics_id is not None:
+            pybullet.disconnect(physicsClientId=physics_id)
+        conn.close()
+
+
+class AsyncBulletRenderer(object):
+    """Renders the images of BulletCameraInterfaces in worker processes.
+
+    Attributes:
+        cameras (dict): BulletCameraInterfaces rendered, keyed by name.
+        num_workers (int): number of worker processes.
+    """
+
+    def __init__(self,
+                 config,
+                 physics_id,
+                 cameras,
+                 num_workers=None,
+                 start_method=None,
+                 shm_dir=None):
+        """Start the workers and load the mirrors of the world.
+
+        Args:
+            config (dict): config of the world, used to load the mirrors with
+                a BulletArena.
+            physics_id (int): physics client of the world.
+            cameras (list): BulletCameraInterfaces to render. Names must be
+                unique.
+            num_workers (int): number of worker processes. Defaults to one
+                per camera, up to the number of cpus.
+            start_method (str): multiprocessing start method for the workers.
+                Defaults to the platform default.
+            shm_dir (str): directory for the shared memory file. Defaults
+                to /dev/shm if it exists, otherwise the temp directory.
+        """
+        names = [camera.name for camera in cameras]
+        if not names or len(set(names)) != len(names):
+            raise ValueError("cameras must be a non-empty list with unique names.")
+        if num_workers is None:
+            num_workers = min(len(cameras), multiprocessing.cpu_count())
+        if not 1 <= num_workers <= len(cameras):
+            raise ValueError("num_workers must be between 1 and the number of cameras.")
+
+        self.cameras = dict(zip(names, cameras))
+        self.num_workers = num_workers
+        self._physics_id = physics_id
+        self._num_joints = {}
+        # Body ids of the mirrors, keyed by body id of the world.
+        self._mirror_ids = {}
+        self._segmask_lut = None
+        self._mm = None
+        self._closed = False
+        self._pending = False
+        self._frames = None
+        self._slot = 0
+
+        ctx = multiprocessing.get_context(start_method)
+        self._worker_cameras = [[names[index] for index in indices] for indices in
+                                np.array_split(np.arange(len(names)), num_workers)]
+        self._conns = []
+        self._processes = []
+        for _ in range(num_workers):
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(child_conn, config),
+                name='async_bullet_renderer_{}'.format(len(self._processes)))
+            process.daemon = True
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+
+        try:
+            self._init_mirror_ids(self._recv_all())
+            self._init_buffers(shm_dir)
+        except Exception:
+            self.close()
+            raise
+
+    def _init_mirror_ids(self, mirror_body_ids):
+        """Map the bodies loaded by the arena of the world to the mirrors.
+
+        The mirrors are loaded with a BulletArena from the same config, so
+        their bodies are loaded in the same order as in the world.
+
+        Args:
+            mirror_body_ids (list): body ids of the mirror of each worker.
+        """
+        world_body_ids = get_body_ids(self._physics_id)
+        for body_ids in mirror_body_ids:
+            if body_ids != mirror_body_ids[0]:
+                raise RuntimeError("AsyncBulletRenderer workers loaded different bodies.")
+        if len(mirror_body_ids[0]) != len(world_body_ids):
+            raise ValueError(
+                "The world has {} bodies but its arena loads {}. Create the "
+                "AsyncBulletRenderer before loading bodies outside of the arena.".format(
+                    len(world_body_ids), len(mirror_body_ids[0])))
+        self._mirror_ids = dict(zip(world_body_ids, mirror_body_ids[0]))
+        self._update_segmask_lut()
+
+    def _update_segmask_lut(self):
+        """Lookup table from mirror to world body ids in segmentation masks,
+        or None if the ids are the same.
+        """
+        self._segmask_lut = None
+        if any(world_id != mirror_id for world_id, mirror_id in self._mirror_ids.items()):
+            self._segmask_lut = np.arange(256, dtype=np.uint8)
+            for world_id, mirror_id in self._mirror_ids.items():
+                self._segmask_lut[mirror_id % 256] = world_id % 256
+
+    def _init_buffers(self, shm_dir):
+        """Create the shared memory file and map it in all processes.
+
+        The file is removed once all workers have mapped it.
+        """
+        layout, size = _layout_frames(
+            [(name, camera.image_height, camera.image_width)
+             for name, camera in self.cameras.items()])
+
+        self._mm, shm_path = create_shared_file('perls2_renderer_', size, shm_dir)
+        try:
+            self._buffers = _map_frames(self._mm, layout)
+            for conn in self._conns:
+                conn.send((shm_path, layout, size))
+            self._recv_all()
+        finally:
+            os.remove(shm_path)
+
+    def _recv_all(self):
+        """Wait for a reply from every worker.
+
+        Returns:
+            (list): reply data of each worker.
+        """
+        replies = []
+        errors = []
+        for conn, process in zip(self._conns, self._processes):
+            try:
+                status, data = conn.recv()
+            except EOFError:
+                status, data = 'error', "Worker {} exited.".format(process.name)
+            if status == 'error':
+                errors.append(data)
+            replies.append(data)
+        if errors:
+            raise RuntimeError("AsyncBulletRenderer worker failed:\n{}".format('\n'.join(errors)))
+        return replies
+
+    def request(self):
+        """Render the current state of the world without waiting.
+
+        Frames of a previous request are discarded. The camera matrices are
+        read on each request, so changes to the cameras apply to the next
+        request.
+        """
+        self.discard()
+        states = []
+        for body_id, position, orientation, joint_positions in get_body_states(
+                self._physics_id, self._num_joints):
+            # Bodies loaded outside of the arena and add_object are not mirrored.
+            if body_id in self._mirror_ids:
+                states.append((self._mirror_ids[body_id], position, orientation, joint_positions))
+        for conn, names in zip(self._conns, self._worker_cameras):
+            conn.send(('render', (self._slot, states,
+                                  [(name, self.cameras[name].render_params()) for name in names])))
+        self._pending = True
+
+    def wait(self):
+        """Wait for the frames of the last request.
+
+        Returns:
+            dict of frames for each camera, keyed by name. Frames are views
+                into the shared memory and are overwritten by the request
+                after next.
+        """
+        if self._pending:
+            self._pending = False
+            self._recv_all()
+            self._frames = dict((name, self._buffers[(name, self._slot)])
+                                for name in self.cameras)
+            if self._segmask_lut is not None:
+                for frames in self._frames.values():
+                    np.take(self._segmask_lut, frames['segmask'], out=frames['segmask'])
+            self._slot = (self._slot + 1) % NUM_SLOTS
+        return self._frames
+
+    def discard(self):
+        """Wait for and drop the frames of the last request.
+
+        Call after changing the world outside of the steps it was requested
+        for, e.g. on reset.
+        """
+        self.wait()
+        self._frames = None
+
+    def frames(self, name):
+        """Frames of a camera for the last request.
+
+        Requests the current state first if there is no request.
+
+        Args:
+            name (str): name of the camera.
+
+        Returns:
+            dict with rgb (inverted), depth, segmask and rgba images.
+        """
+        if not self._pending and self._frames is None:
+            self.request()
+        return dict(self.wait()[name])
+
+    def add_object(self, obj_id, path, name, pose, scale=1.0, is_static=False):
+        """Add an object to the mirrors, as it was added to the world.
+
+        Args:
+            obj_id (int): pybullet body id of the object in the world.
+
+        Returns:
+            (int): pybullet body id of the object in the mirrors.
+        """
+        self.discard()
+        for conn in self._conns:
+            conn.send(('add_object', {'path': path, 'name': name, 'pose': pose,
+                                      'scale': scale, 'is_static': is_static}))
+        body_ids = self._recv_all()
+        if len(set(body_ids)) != 1:
+            raise RuntimeError("AsyncBulletRenderer workers loaded {} with different ids {}".format(
+                name, body_ids))
+        self._mirror_ids[obj_id] = body_ids[0]
+        self._update_segmask_lut()
+        self._num_joints.clear()
+        return body_ids[0]
+
+    def remove_object(self, obj_id):
+        """Remove an object from the mirrors.
+
+        Args:
+            obj_id (int): pybullet body id of the object in the world.
+        """
+        self.discard()
+        mirror_id = self._mirror_ids.pop(obj_id)
+        self._update_segmask_lut()
+        for conn in self._conns:
+            conn.send(('remove_object', mirror_id))
+        self._recv_all()
+        self._num_joints.pop(obj_id, None)
+
+    def close(self):
+        """Stop the workers.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for conn, process in zip(self._conns, self._processes):
+            if not process.is_alive():
+                continue
+            try:
+                if self._pending:
+                    conn.recv()
+                conn.send(('close', None))
+                conn.recv()
+            except (EOFError, BrokenPipeError):
+                pass
+        self._pending = False
+        for process in self._processes:
+            process.join(timeout=5.0)
+            if process.is_alive():
+                logging.warning("Terminating AsyncBulletRenderer worker {}".format(process.name))
+                process.terminate()
+        for conn in self._conns:
+            conn.close()
+        self._frames = None
+        if self._mm is not None:
+            self._buffers = None
+            self._mm.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
@@ -17,6 +17,108 @@ DEPTH_WIDTH = 512
 # DEPTH_HEIGHT = 428
 # DEPTH_WIDTH = 482
 
+# Image modalities rendered by the camera.
+MODALITIES = ('rgb', 'depth', 'segmask', 'rgba')
+
+
+def make_frame_buffers(image_height, image_width, modalities=MODALITIES):
+    """Allocate an output buffer for each modality of a camera image.
+
+    Args:
+        image_height (int): Height of the image in pixels.
+        image_width (int): Width of the image in pixels.
+        modalities (list): modalities to allocate buffers for.
+
+    Returns:
+        dict of ndarrays keyed by modality.
+    """
+    specs = {'rgb': ((image_height, image_width, 3), np.uint8),
+             'depth': ((image_height, image_width), np.float32),
+             'segmask': ((image_height, image_width), np.uint8),
+             'rgba': ((image_height, image_width, 4), np.uint8)}
+    return dict((modality, np.empty(*specs[modality])) for modality in modalities)
+
+
+def render_frames(physics_id,
+                  image_height,
+                  image_width,
+                  view_matrix,
+                  projection_matrix,
+                  near,
+                  far,
+                  modalities=MODALITIES,
+                  invert_rgb=True,
+                  renderer=pybullet.ER_TINY_RENDERER,
+                  out=None):
+    """Render a camera image and post-process the requested modalities.
+
+    Post-processing is done in place, into the buffers in out if given.
+    The segmentation mask is only rendered if requested.
+
+    Args:
+        physics_id (int): physics client to render.
+        image_height (int): Height of the image in pixels.
+        image_width (int): Width of the image in pixels.
+        view_matrix (list): list of 16 floats for pybullet view_matrix.
+        projection_matrix (list): list of 16 floats for pybullet projection matrix.
+        near (float): The distance to the near plane.
+        far (float): The distance to the far plane.
+        modalities (list): modalities to return, from MODALITIES.
+        invert_rgb (bool): invert the rgb image.
+        renderer (int): pybullet renderer.
+        out (dict): optional buffers from make_frame_buffers to write the
+            modalities to.
+
+    Returns:
+        dict of images keyed by modality.
+    """
+    flags = 0 if 'segmask' in modalities else pybullet.ER_NO_SEGMENTATION_MASK
+    _, _, rgba, depth, segmask = pybullet.getCameraImage(
+        height=image_height,
+        width=image_width,
+        viewMatrix=view_matrix,
+        projectionMatrix=projection_matrix,
+        renderer=renderer,
+        flags=flags,
+        physicsClientId=physics_id)
+
+    if out is None:
+        out = make_frame_buffers(image_height, image_width, modalities)
+    frames = {}
+    if 'rgb' in modalities or 'rgba' in modalities:
+        rgba = np.reshape(np.asarray(rgba, dtype=np.uint8),
+                          (image_height, image_width, 4))
+        if 'rgba' in modalities:
+            np.copyto(out['rgba'], rgba)
+            frames['rgba'] = out['rgba']
+        if 'rgb' in modalities:
+            if invert_rgb:
+                np.invert(rgba[:, :, :3], out=out['rgb'])
+            else:
+                np.copyto(out['rgb'], rgba[:, :, :3])
+            frames['rgb'] = out['rgb']
+
+    if 'depth' in modalities:
+        # This is a fix for the depth image rendering in
+        # pybullet, by following:
+        # https://stackoverflow.com/questions/6652253/getting-the-true-z-value-from-the-depth-buffer
+        # z_e = 2 n f / (f + n - (2 z_b - 1)(f - n)) = n f / (f - z_b (f - n))
+        z_e = out['depth']
+        np.multiply(np.reshape(np.asarray(depth, dtype=np.float32),
+                               (image_height, image_width)),
+                    far - near, out=z_e)
+        np.subtract(far, z_e, out=z_e)
+        np.divide(near * far, z_e, out=z_e)
+        frames['depth'] = z_e
+
+    if 'segmask' in modalities:
+        np.copyto(out['segmask'],
+                  np.reshape(segmask, (image_height, image_width)),
+                  casting='unsafe')
+        frames['segmask'] = out['segmask']
+
+    return frames
+
 
 class BulletCameraInterface(SimCameraInterface):
     """" Interface for rendering camera images from PyBullet.
@@ -33,6 +135,10 @@ class BulletCameraInterface(SimCameraInterface):
         view_matrix (np.npdarray): View matrix
         projection_matrix (np.ndarray): projection matrix.
         name (str): string identifying name of camera.
+        renderer (int): pybullet renderer, ER_TINY_RENDERER or
+            ER_BULLET_HARDWARE_OPENGL.
+        async_renderer (AsyncBulletRenderer): renders the images of the
+            camera in a worker process if set, see async_bullet_renderer.
     """
     def __init__(self,
                  physics_id=None,
@@ -45,7 +151,9 @@ class BulletCameraInterface(SimCameraInterface):
                  cameraEyePosition=[0.6, 0., 1.0],
                  cameraTargetPosition=[0.6, 0., 0],
                  cameraUpVector=[1., 0., 1.],
-                 name='bullet_camera'):
+                 name='bullet_camera',
+                 renderer=pybullet.ER_TINY_RENDERER,
+                 reuse_buffers=False):
         """Initialize
 
         Args:
@@ -58,12 +166,26 @@ class BulletCameraInterface(SimCameraInterface):
             cameraTargetPosition (list): 3f xyz position of camera target in world frame.
             cameraUpVectory (list): 3f vector describing camera up direction.
             name (str): string identifying name of camera.
+            renderer (int): pybullet renderer.
+            reuse_buffers (bool): post-process images into two preallocated
+                sets of buffers used in turn, instead of new arrays. Images
+                returned by frames are then overwritten two calls later.
 
         """
-        super().__init__(image_height, image_width, None)
+        super().__init__(image_height, image_width, None, name=name)
+        self.renderer = renderer
+        self.async_renderer = None
+        self._buffers = None
+        self._buffer_index = 0
+        if reuse_buffers:
+            self._buffers = [make_frame_buffers(image_height, image_width)
+                             for _ in range(2)]
         self._physics_id = physics_id
         self._near = near
         self._far = far
+        self._view_matrix_array = None
+        self._projection_matrix_array = None
+        self._extrinsics = None
         self._distance = distance
         self._fov = fov
         self.cameraEyePosition = cameraEyePosition
@@ -93,6 +215,10 @@ class BulletCameraInterface(SimCameraInterface):
             projection_matrix (list): list of 16 floats for pybullet projection matrix.
         """
         self._projection_matrix = projection_matrix
+        self._projection_matrix_array = None
+        self.K = self.get_intrinsics()
+        if self.async_renderer is not None:
+            self.async_renderer.discard()
 
     def set_view_matrix(self, view_matrix):
         """ Set View matrix for the camera
@@ -100,7 +226,10 @@ class BulletCameraInterface(SimCameraInterface):
             view_matrix (list): list of 16 floats for pybullet view_matrix
         """
         self._view_matrix = view_matrix
-
+        self._view_matrix_array = None
+        self._extrinsics = None
+        if self.async_renderer is not None:
+            self.async_renderer.discard()
 
     def get_intrinsics(self):
         """ Calculate camera intrinsic matrix.
@@ -145,12 +274,8 @@ class BulletCameraInterface(SimCameraInterface):
         cam_y = (y - self.K[1, 2]) / self.K[1, 1] * depth
         point = np.asarray([cam_x, cam_y, depth])
 
-        camera_R = -self.view_matrix[:3, :3]
-
-        camera_pos = -self.view_matrix[3, :3]
-
         if is_world_frame:
-            point = camera_pos + np.dot(point, camera_R.T)
+            point = np.dot(point - self.translation, self.rotation)
 
         return point
 
@@ -161,10 +286,13 @@ class BulletCameraInterface(SimCameraInterface):
     def stop(self):
         """Stops the sensor stream.
 
+        Frames rendered asynchronously before stopping are discarded.
+
         Returns:
             True if succeed, False if fail.
         """
-        pass
+        if self.async_renderer is not None:
+            self.async_renderer.discard()
 
     def set_physics_id(self, physics_id):
         """ Set unique physics client id
@@ -173,65 +301,56 @@ class BulletCameraInterface(SimCameraInterface):
         """
         self._physics_id = physics_id
 
-    def frames(self):
+    def render_params(self):
+        """Parameters for render_frames, without the physics id.
+        """
+        return {'image_height': self._image_height,
+                'image_width': self._image_width,
+                'view_matrix': self._view_matrix,
+                'projection_matrix': self._projection_matrix,
+                'near': self._near,
+                'far': self._far,
+                'renderer': self.renderer}
+
+    def _render(self, modalities, invert_rgb=True):
+        if self.async_renderer is not None:
+            # The renderer returns the inverted rgb with all modalities.
+            frames = self.async_renderer.frames(self.name)
+            if not invert_rgb:
+                frames['rgb'] = frames['rgba'][:, :, :3]
+            return dict((modality, frames[modality]) for modality in modalities)
+
+        out = None
+        if self._buffers is not None:
+            out = self._buffers[self._buffer_index]
+            self._buffer_index = 1 - self._buffer_index
+        return render_frames(self._physics_id,
+                             modalities=modalities,
+                             invert_rgb=invert_rgb,
+                             out=out,
+                             **self.render_params())
+
+    def frames(self, rgb=True, depth=True, segmask=True, rgba=True):
         """Render the world at the current time step.
-        Args: None
+        Args:
+            rgb (bool): return the (inverted) rgb image.
+            depth (bool): return the depth image.
+            segmask (bool): return the segmentation mask. Not rendered
+                if False.
+            rgba (bool): return the rgba image.
         Returns:
-            dict with rgb, depth and segmask image.
+            dict with the requested rgb, depth, segmask and rgba images.
         """
-        _, _, rgba, depth, segmask = pybullet.getCameraImage(
-            height=self._image_height,
-            width=self._image_width,
-            viewMatrix=self._view_matrix,
-            projectionMatrix=self._projection_matrix,
-            physicsClientId=self._physics_id)
-
-        rgba = np.array(rgba).astype('uint8')
-        rgba = rgba.reshape((self._image_height, self._image_width, 4))
-        # invert
-        image = rgba[:, :, :3]
-        image = np.invert(image)
-        depth = np.array(depth).astype('float32')
-        depth = depth.reshape((self._image_height, self._image_width))
-
-        segmask = np.array(segmask).astype('uint8')
-        segmask = segmask.reshape((self._image_height, self._image_width))
-
-        # This is a fix for the depth image rendering in
-        # pybullet, by following:
-        # https://stackoverflow.com/questions/6652253/getting-the-true-z-value-from-the-depth-buffer
-        z_b = depth
-        z_n = 2.0 * z_b - 1.0
-        z_e = (2.0 * self._near * self._far /
-               (self._far + self._near - z_n * (self._far - self._near)))
-        depth = z_e
-
-        return {'rgb': image,
-                'depth': depth,
-                'segmask': segmask,
-                'rgba': rgba}
+        requested = [('rgb', rgb), ('depth', depth), ('segmask', segmask), ('rgba', rgba)]
+        return self._render([modality for modality, flag in requested if flag])
 
     def frames_rgb(self):
         """Render the world at the current time step.
             Args: None
             Returns:
-                dict with rgb, depth and segmask image.
+                dict with the rgb image, without the segmentation mask.
         """
-        _, _, rgba, depth, segmask = pybullet.getCameraImage(
-            height=self._image_height,
-            width=self._image_width,
-            viewMatrix=self._view_matrix,
-            projectionMatrix=self._projection_matrix,
-            physicsClientId=self._physics_id)
-
-        rgba = np.array(rgba).astype('uint8')
-        rgba = rgba.reshape((self._image_height, self._image_width, 4))
-        # invert
-        image = rgba[:, :, :3]
-        #image = np.invert(image)
-        return {
-                'rgb': image,
-                }
+        return self._render(['rgb'], invert_rgb=False)
 
     def place(self, new_camera_pos):
         """ Places camera in new position
@@ -244,6 +363,9 @@ class BulletCameraInterface(SimCameraInterface):
         Returns: None
         """
         self.cameraEyePosition = new_camera_pos
+        self._view_matrix_array = None
+        self._projection_matrix_array = None
+        self._extrinsics = None
 
         self._view_matrix = pybullet.computeViewMatrix(
                 cameraEyePosition=self.cameraEyePosition,
@@ -259,6 +381,8 @@ class BulletCameraInterface(SimCameraInterface):
                 physicsClientId = self._physics_id)
 
         self.K = self.get_intrinsics()
+        if self.async_renderer is not None:
+            self.async_renderer.discard()
 
     @property
     def image_height(self):
@@ -274,12 +398,52 @@ class BulletCameraInterface(SimCameraInterface):
 
     @property
     def view_matrix(self):
-        """View matrix.
+        """View matrix, as a read-only array cached until the view changes.
+
+        The pybullet matrix is column major, so this is the transpose of the
+        OpenGL view matrix.
         """
-        return np.asarray(self._view_matrix).reshape(4,4)
+        if self._view_matrix_array is None:
+            self._view_matrix_array = np.array(self._view_matrix, dtype=np.float64).reshape(4, 4)
+            self._view_matrix_array.flags.writeable = False
+        return self._view_matrix_array
 
     @property
     def projection_matrix(self):
-        """Projection matrix.
+        """Projection matrix, as a read-only array cached until the
+        projection changes.
+        """
+        if self._projection_matrix_array is None:
+            self._projection_matrix_array = np.array(
+                self._projection_matrix, dtype=np.float64).reshape(4, 4)
+            self._projection_matrix_array.flags.writeable = False
+        return self._projection_matrix_array
+
+    def _get_extrinsics(self):
+        """HZ-style rotation and translation from the view matrix, cached
+        until the view changes.
+
+        The OpenGL camera looks down its -z axis with y up, so its y and z
+        axes are flipped for the image convention of K.
+        """
+        if self._extrinsics is None:
+            view = self.view_matrix.T
+            flip = np.array([1.0, -1.0, -1.0])
+            rotation = flip[:, np.newaxis] * view[:3, :3]
+            translation = flip * view[:3, 3]
+            rotation.flags.writeable = False
+            translation.flags.writeable = False
+            self._extrinsics = (rotation, translation)
+        return self._extrinsics
+
+    @property
+    def rotation(self):
+        """HZ-style rotation R of the camera, x_camera = R * x_world + t.
+        """
+        return self._get_extrinsics()[0]
+
+    @property
+    def translation(self):
+        """HZ-style translation t of the camera, x_camera = R * x_world + t.
         """
-        return np.asarray(self._projection_matrix).reshape(4,4)
+        return self._get_extrinsics()[1]
@@ -65,6 +65,27 @@ class CameraInterface(SensorInterface):
         self.stop()
         self.start()
 
+    def deproject_image(self, depth, mask=None, is_world_frame=True):
+        """Deproject a depth image into a point cloud.
+
+        Args:
+            depth (ndarray): (h, w) depth image, in meters along the optical
+                axis.
+            mask (ndarray): optional (h, w) mask, e.g. from a segmask. Only
+                nonzero pixels are deprojected.
+            is_world_frame (bool): return points in the world frame, using the
+                rotation and translation of the camera. Otherwise points are
+                in the camera frame.
+
+        Returns:
+            (n, 3) ndarray of points, for every pixel or the pixels in the mask
+                in row major order.
+        """
+        rotation, translation = None, None
+        if is_world_frame:
+            rotation, translation = self.rotation, self.translation
+        return IU.deproject_image(depth, self.K, rotation, translation, mask)
+
     @property
     def rotation(self):
         return self._rotation
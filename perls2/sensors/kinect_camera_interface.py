@@ -8,12 +8,19 @@ from abc import ABCMeta, abstractmethod
 
 import redis
 import time
+import json
 import struct
 from perls2.ros_interfaces.redis_keys import *
+from perls2.ros_interfaces.redis_interface import get_connection_pool
+from perls2.ros_interfaces.frame_codec import get_frameset, get_synced_frameset, get_latest_seq
+from perls2.ros_interfaces.stream_config import StreamConfig
+import perls2.utils.image_utils as IU
 
 
 def convert_encoded_frame_to_np(encoded_frame, dim):
     """Convert rgb, depth or ir bytes array to numpy
+
+    Legacy uint8 format, see frame_codec.decode_frame.
     """
     h, w = struct.unpack('>II', encoded_frame[:8])
 
@@ -59,6 +66,17 @@ class KinectCameraInterface(CameraInterface):
 
     Notes:
         Images None initialy, need to call capture_images before accessing
+
+        The intrinsics K default to DEF_INTR_RGB_HD, and may be set with
+        config['sensor']['camera']['intrinsics']['K']. Points are deprojected
+        to the world frame with the HZ-style rotation and translation in
+        config['sensor']['camera']['extrinsics'], if calibrated.
+
+        The KinectROSInterface may publish only some modalities, cropped
+        and resized, as set by config['sensor']['stream'] or
+        set_stream_config, see ros_interfaces.stream_config. K is then
+        adjusted to the rgb frames streamed, and depth_K, used to deproject
+        depth images, to the depth frames streamed.
     """
     DEF_INTR_RGB_HD = np.array([
         [1.0450585754139581e+03, 0., 9.2509741958808945e+02],
@@ -84,15 +102,20 @@ class KinectCameraInterface(CameraInterface):
         """ Set the redis parameters for the ROS interface
         Note: Stream is initialized as disabled
         """
-        # Connect to redis
-        self.redisClient = redis.Redis()
+        # Connect to redis, sharing the connection pool for the local server.
+        self.redisClient = redis.Redis(connection_pool=get_connection_pool())
 
         # Set the res mode
         self.redisClient.set(KINECT2_RES_MODE_KEY, res_mode)
+        self.res_mode = res_mode
         self.config = config
         if 'invert' in self.config['sensor'].keys():
             self.redisClient.set(
                 KINECT2_INVERT_KEY, str(self.config['sensor']['invert']))
+        # Compression of each modality, e.g. {'rgb': 'jpeg', 'depth': 'png'}
+        # see frame_codec.encode_frame.
+        self.redisClient.set(
+            KINECT2_COMPRESSION_KEY, json.dumps(self.config['sensor'].get('compression') or {}))
 
         # Notify ROS Interface that camera interface is connected
         self.redisClient.set(KINECT2_INTERFACE_CONN_KEY, 'True')
@@ -101,8 +124,90 @@ class KinectCameraInterface(CameraInterface):
 
         self._prev_rgb_timestamp = 0
         self._prev_rgb = []
+        # Sequence number of the last synchronized frameset returned.
+        self._last_seq = 0
+        self._frameset_pubsub = None
+        self._load_calibration()
+        stream_cfg = self.config['sensor'].get('stream') or {}
+        self.set_stream_config(stream_cfg.get('modalities'),
+                               stream_cfg.get('roi'),
+                               stream_cfg.get('size'))
         self.start()
 
+    def _load_calibration(self):
+        """Load the intrinsics and extrinsics from the camera config.
+        """
+        camera_cfg = self.config['sensor'].get('camera') or {}
+        intrinsics_cfg = camera_cfg.get('intrinsics') or {}
+        extrinsics_cfg = camera_cfg.get('extrinsics') or {}
+        self._full_K = np.array(intrinsics_cfg.get('K', KinectCameraInterface.DEF_INTR_RGB_HD),
+                                dtype=np.float64).reshape(3, 3)
+        self._K = self._full_K
+        self._depth_K = self._full_K
+        self._rotation = None
+        self._translation = None
+        if 'rotation' in extrinsics_cfg and 'translation' in extrinsics_cfg:
+            self._rotation = np.array(extrinsics_cfg['rotation'], dtype=np.float64).reshape(3, 3)
+            self._translation = np.array(extrinsics_cfg['translation'], dtype=np.float64).reshape(3)
+
+    def set_stream_config(self, modalities=None, roi=None, size=None):
+        """Set the modalities streamed and their region of interest and size.
+
+        Frames are cropped and resized by the KinectROSInterface before they
+        are sent, see ros_interfaces.stream_config. Framesets captured
+        before the change may still be returned by the next call to frames.
+
+        Args:
+            modalities (list): modalities to stream, defaults to rgb, depth
+                and ir.
+            roi (list or dict): [x, y, width, height] region of interest in
+                pixels of the full frames, or a dict of them keyed by
+                modality. Defaults to the full frames.
+            size (list or dict): [width, height] output size, or a dict of
+                them keyed by modality. Defaults to the size of the roi.
+        """
+        self._stream_config = StreamConfig(modalities, roi, size)
+        full_height, full_width = {'sd': self.SD_IMG_SIZE,
+                                   'hd': self.HD_IMG_SIZE,
+                                   'qhd': self.QHD_IMG_SIZE}[self.res_mode]
+        self._K = self._stream_config.intrinsics(self._full_K, 'rgb',
+                                                 (full_width, full_height))
+        self._depth_K = self._stream_config.intrinsics(self._full_K, 'depth',
+                                                       (full_width, full_height))
+        self.redisClient.set(KINECT2_STREAM_CONFIG_KEY, self._stream_config.to_json())
+
+    @property
+    def modalities(self):
+        """Modalities streamed, returned by frames."""
+        return self._stream_config.modalities
+
+    @property
+    def depth_K(self):
+        """Intrinsics of the depth frames streamed."""
+        return self._depth_K
+
+    def deproject_image(self, depth, mask=None, is_world_frame=True):
+        """Deproject a depth image into a point cloud, with depth_K.
+
+        Args:
+            depth (ndarray): (h, w) or (h, w, 1) depth image in meters, e.g.
+                the depth frame scaled to meters.
+            mask (ndarray): optional (h, w) mask, only nonzero pixels are
+                deprojected.
+            is_world_frame (bool): return points in the world frame. Requires
+                the extrinsics to be calibrated in the config.
+
+        Returns:
+            (n, 3) ndarray of points.
+        """
+        if is_world_frame and self._rotation is None:
+            raise ValueError("Kinect extrinsics are not calibrated, set rotation and "
+                             "translation in config['sensor']['camera']['extrinsics'].")
+        rotation, translation = None, None
+        if is_world_frame:
+            rotation, translation = self.rotation, self.translation
+        return IU.deproject_image(depth, self.depth_K, rotation, translation, mask)
+
     def start(self):
         """Starts the sensor stream.
         """
@@ -142,34 +247,62 @@ class KinectCameraInterface(CameraInterface):
         Params:
             None
         Returns:
-            tuple of RGB, depth and IR frames as numpy arrays
+            dict of RGB (uint8), depth and IR (uint16) frames as numpy
+                arrays, the image_stamp of the capture and its seq. Only
+                the modalities streamed are returned.
 
-        Images are retrieved from redis as encoded bytes array.
-        They are converted to numpy arrays and returned.
+        Images are retrieved from redis as encoded bytes arrays of the
+        latest synchronized frameset, so all frames are from the same
+        capture. They are decoded to numpy arrays and returned. The seq
+        is 0 for frames written without synchronization.
 
         """
+        return self._get_frameset(self.modalities)
 
-        encoded_rgb = self.redisClient.get(KINECT2_RGB_KEY)
+    def _get_frameset(self, modalities, seq=None):
+        frameset = get_synced_frameset(self.redisClient, modalities, seq)
+        if frameset is None:
+            frameset = get_frameset(self.redisClient, modalities)
+            frameset['seq'] = 0
+        self._last_seq = max(self._last_seq, frameset['seq'])
+        return frameset
 
-        rgb_timestamp = self.redisClient.get(KINECT2_RGB_TSTAMP_KEY)
-
-        rgb_np = convert_encoded_frame_to_np(
-            encoded_rgb, KinectCameraInterface.RGB_DIM)
+    @property
+    def last_seq(self):
+        """Sequence number of the last frameset returned."""
+        return self._last_seq
 
-        encoded_depth = self.redisClient.get(KINECT2_DEPTH_KEY)
-        depth_np = convert_encoded_frame_to_np(
-            encoded_depth, KinectCameraInterface.DEPTH_DIM)
+    def wait_for_new_frames(self, after_seq=None, timeout=None):
+        """Wait for a synchronized frameset newer than after_seq.
 
-        encoded_ir = self.redisClient.get(KINECT2_IR_KEY)
-        ir_np = convert_encoded_frame_to_np(
-            encoded_ir, KinectCameraInterface.IR_DIM)
+        Blocks on the frameset channel of the KinectROSInterface instead of
+        polling redis.
 
-        image_dict = {'rgb': rgb_np,
-                      'image_stamp': rgb_timestamp,
-                      'depth': depth_np,
-                      'ir': ir_np}
+        Args:
+            after_seq (int): sequence number of the last frameset processed.
+                Defaults to the last frameset returned by this interface.
+            timeout (float): max time to wait (s), or None to wait forever.
 
-        return image_dict
+        Returns:
+            dict of frames as returned by frames, for the latest frameset,
+                or None on timeout.
+        """
+        if after_seq is None:
+            after_seq = self._last_seq
+        if self._frameset_pubsub is None:
+            self._frameset_pubsub = self.redisClient.pubsub(ignore_subscribe_messages=True)
+            self._frameset_pubsub.subscribe(KINECT2_FRAMESET_CHANNEL_KEY)
+
+        deadline = None if timeout is None else time.time() + timeout
+        # Check after subscribing, so no frameset is missed in between.
+        while get_latest_seq(self.redisClient) <= after_seq:
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                return None
+            # get_message polls without blocking for a timeout of None.
+            self._frameset_pubsub.get_message(
+                timeout=remaining if remaining is not None else 1.0)
+        return self._get_frameset(self.modalities)
 
     def frames_rgb(self):
         """Get frames from redis db.
@@ -179,17 +312,16 @@ class KinectCameraInterface(CameraInterface):
         Returns:
             image_dict (dict): dict with key 'rgb' assigned to np.ndarray
         """
-        encoded_rgb = self.redisClient.get('camera::rgb_frame')
-
-        rgb_timestamp = self.redisClient.get('camera:rgb_timestamp')
-        rgb_np = convert_encoded_frame_to_np(
-            encoded_rgb, KinectCameraInterface.RGB_DIM)
-        image_dict = {}
-        image_dict['rgb'] = rgb_np
-        return image_dict
+        if 'rgb' not in self.modalities:
+            raise ValueError("rgb is not streamed, modalities are {}".format(self.modalities))
+        return {'rgb': self._get_frameset(('rgb',))['rgb']}
+
     def disconnect(self):
         """ Set redis key to disconnect interface"""
         self.redisClient.set(KINECT2_INTERFACE_CONN_KEY, 'False')
+        if self._frameset_pubsub is not None:
+            self._frameset_pubsub.close()
+            self._frameset_pubsub = None
 
 
 if __name__ == '__main__':
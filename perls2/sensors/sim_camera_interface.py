@@ -37,7 +37,7 @@ class SimCameraInterface(CameraInterface):
                  intrinsics,
                  extrinsics=None,
                  distortion=np.zeros([5]),
-                 name='camera')
+                 name=name)
 
     def start(self):
         """Starts the sensor stream.
@@ -0,0 +1,347 @@
+""" Recorder saving episodes to disk from a background thread.
+
+Each step of an episode is a dict of observations, actions, robot states,
+frames etc. Nested dicts are flattened with '/' separated keys, and every
+key must have the same shape and dtype on every step of an episode.
+
+Steps are stacked into chunks of chunk_size steps and each chunk is saved
+as a compressed .npz file, so an episode directory looks like:
+
+    output/episode_0000/
+        meta.json
+        chunk_00000.npz
+        chunk_00001.npz
+        frames.rgb.mp4   (optional, for video_keys)
+
+Writing happens on a background thread fed by a bounded queue, so the env
+loop only pays for copying the step. If the writer falls behind by
+queue_size steps, record blocks until it catches up.
+
+Example:
+    recorder = EpisodeRecorder('output', video_keys=['frames/rgb'])
+    recorder.start_episode()
+    for step in range(100):
+        observation, reward, done, info = env.step(action)
+        recorder.record({'action': action, 'reward': reward,
+                         'frames': env.camera_interface.frames(depth=False)})
+    recorder.end_episode()
+    recorder.close()
+
+    episode = load_episode('output/episode_0000')
+"""
+import os
+import glob
+import json
+import logging
+import threading
+import numpy as np
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+META_FILENAME = 'meta.json'
+CHUNK_FORMAT = 'chunk_{:05d}.npz'
+
+# Separator of nested dict keys, and its replacement in npz array names.
+KEY_SEPARATOR = '/'
+NPZ_SEPARATOR = '.'
+
+
+def flatten_step(step, prefix=''):
+    """Flatten a nested dict of step values.
+
+    Args:
+        step (dict): values of a step, arrays, numbers or nested dicts.
+        prefix (str): prefix of the keys.
+
+    Returns:
+        dict of ndarrays keyed by '/' separated keys.
+    """
+    flat = {}
+    for key, value in step.items():
+        key = prefix + str(key)
+        if isinstance(value, dict):
+            flat.update(flatten_step(value, key + KEY_SEPARATOR))
+        else:
+            value = np.asarray(value)
+            if value.dtype == object:
+                raise ValueError("Step value {} is not numeric.".format(key))
+            flat[key] = value
+    return flat
+
+
+def load_episode(episode_dir, keys=None):
+    """Load a recorded episode.
+
+    Args:
+        episode_dir (str): directory of the episode.
+        keys (list): flattened keys to load. Defaults to all keys.
+
+    Returns:
+        dict of (num_steps, ...) ndarrays keyed by flattened key.
+    """
+    with open(os.path.join(episode_dir, META_FILENAME)) as meta_file:
+        meta = json.load(meta_file)
+    if keys is None:
+        keys = list(meta['keys'])
+    chunks = dict((key, []) for key in keys)
+    for chunk_index in range(meta['num_chunks']):
+        with np.load(os.path.join(episode_dir, CHUNK_FORMAT.format(chunk_index))) as chunk:
+            for key in keys:
+                chunks[key].append(chunk[key.replace(KEY_SEPARATOR, NPZ_SEPARATOR)])
+    episode = {}
+    for key in keys:
+        spec = meta['keys'][key]
+        if chunks[key]:
+            episode[key] = np.concatenate(chunks[key])
+        else:
+            episode[key] = np.empty([0] + spec['shape'], dtype=spec['dtype'])
+    return episode
+
+
+class EpisodeRecorder(object):
+    """Records episodes into chunked, compressed files on a writer thread.
+
+    Attributes:
+        output_dir (str): directory episodes are saved in.
+        chunk_size (int): number of steps per chunk file.
+        compress (bool): compress the chunk files.
+        video_keys (list): flattened keys of uint8 rgb frames to also encode
+            as mp4 videos.
+        video_fps (float): frame rate of the videos.
+        episode_dir (str): directory of the current episode, None between
+            episodes.
+    """
+
+    def __init__(self,
+                 output_dir='output',
+                 chunk_size=100,
+                 queue_size=64,
+                 compress=True,
+                 video_keys=None,
+                 video_fps=10):
+        """Start the writer thread.
+
+        Args:
+            output_dir (str): directory to save episodes in. Created if it
+                does not exist.
+            chunk_size (int): number of steps per chunk file.
+            queue_size (int): max number of steps waiting to be written.
+            compress (bool): compress the chunk files with zlib.
+            video_keys (list): flattened keys of (h, w, 3) uint8 rgb frames
+                to encode as mp4 videos with opencv.
+            video_fps (float): frame rate of the videos.
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1.")
+        self.output_dir = output_dir
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.video_keys = list(video_keys or [])
+        self.video_fps = video_fps
+        self.episode_dir = None
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._specs = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._write_loop, name='EpisodeRecorder')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _next_episode_num(self):
+        episode_dirs = glob.glob(os.path.join(self.output_dir, 'episode_*'))
+        nums = [int(name.rsplit('_', 1)[-1]) for name in episode_dirs
+                if name.rsplit('_', 1)[-1].isdigit()]
+        return max(nums) + 1 if nums else 0
+
+    def _check_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("EpisodeRecorder writer failed: {}".format(error))
+
+    def _put(self, item):
+        if self._closed:
+            raise ValueError("EpisodeRecorder is closed.")
+        self._check_error()
+        self._queue.put(item)
+
+    def start_episode(self, ep_num=None):
+        """Start recording a new episode, ending the current one.
+
+        Args:
+            ep_num (int): episode number. Defaults to one more than the last
+                episode in output_dir.
+
+        Returns:
+            (str): directory of the episode.
+        """
+        if self.episode_dir is not None:
+            self.end_episode()
+        if ep_num is None:
+            ep_num = self._next_episode_num()
+        self.episode_dir = os.path.join(self.output_dir, 'episode_{:04d}'.format(ep_num))
+        if not os.path.isdir(self.episode_dir):
+            os.makedirs(self.episode_dir)
+        self._specs = None
+        self._put(('start', self.episode_dir))
+        return self.episode_dir
+
+    def record(self, step):
+        """Record a step of the current episode.
+
+        The step is copied, so buffers reused by the caller, e.g. camera
+        frames, may be overwritten once record returns.
+
+        Args:
+            step (dict): values of the step, arrays, numbers or nested dicts.
+        """
+        if self.episode_dir is None:
+            raise ValueError("record called before start_episode.")
+        flat = flatten_step(step)
+        specs = dict((key, (value.shape, value.dtype.str)) for key, value in flat.items())
+        if self._specs is None:
+            self._specs = specs
+        elif specs != self._specs:
+            raise ValueError("Step keys, shapes or dtypes changed during the episode.")
+        self._put(('step', dict((key, value.copy()) for key, value in flat.items())))
+
+    def end_episode(self):
+        """End the current episode and wait for it to be written.
+
+        Returns:
+            (str): directory of the episode, None if no episode was recorded.
+        """
+        episode_dir = self.episode_dir
+        if episode_dir is None:
+            return None
+        self.episode_dir = None
+        self._put(('end', None))
+        self._queue.join()
+        self._check_error()
+        return episode_dir
+
+    def close(self):
+        """End the current episode and stop the writer thread.
+        """
+        if self._closed:
+            return
+        try:
+            self.end_episode()
+        finally:
+            self._closed = True
+            self._queue.put(('close', None))
+            self._thread.join()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def _write_loop(self):
+        """Write chunks and videos from the queue.
+
+        After an error, the rest of the episode is dropped and the error is
+        raised by the next call to the recorder.
+        """
+        writer = None
+        while True:
+            cmd, data = self._queue.get()
+            try:
+                if cmd == 'close':
+                    break
+                if cmd == 'start':
+                    writer = _EpisodeWriter(data, self.chunk_size, self.compress,
+                                            self.video_keys, self.video_fps)
+                elif writer is not None:
+                    if cmd == 'step':
+                        writer.add(data)
+                    elif cmd == 'end':
+                        writer.close()
+                        writer = None
+            except Exception as error:
+                logging.error("EpisodeRecorder failed to write: {}".format(error))
+                self._error = error
+                if writer is not None:
+                    writer.release()
+                writer = None
+            finally:
+                self._queue.task_done()
+        if writer is not None:
+            writer.close()
+
+
+class _EpisodeWriter(object):
+    """Writes the chunks, videos and metadata of one episode.
+    """
+
+    def __init__(self, episode_dir, chunk_size, compress, video_keys, video_fps):
+        self.episode_dir = episode_dir
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.video_keys = video_keys
+        self.video_fps = video_fps
+        self.num_steps = 0
+        self.num_chunks = 0
+        self.specs = None
+        self._buffers = None
+        self._videos = {}
+
+    def add(self, step):
+        if self._buffers is None:
+            self.specs = dict((key, {'shape': list(value.shape), 'dtype': value.dtype.str})
+                              for key, value in step.items())
+            self._buffers = dict((key, np.empty((self.chunk_size,) + value.shape, value.dtype))
+                                 for key, value in step.items())
+        index = self.num_steps % self.chunk_size
+        for key, value in step.items():
+            self._buffers[key][index] = value
+        for key in self.video_keys:
+            self._write_video_frame(key, step[key])
+        self.num_steps += 1
+        if index == self.chunk_size - 1:
+            self._write_chunk(self.chunk_size)
+
+    def _write_chunk(self, num_steps):
+        arrays = dict((key.replace(KEY_SEPARATOR, NPZ_SEPARATOR), buffer[:num_steps])
+                      for key, buffer in self._buffers.items())
+        path = os.path.join(self.episode_dir, CHUNK_FORMAT.format(self.num_chunks))
+        if self.compress:
+            np.savez_compressed(path, **arrays)
+        else:
+            np.savez(path, **arrays)
+        self.num_chunks += 1
+
+    def _write_video_frame(self, key, frame):
+        # Imported here so recording without video does not need opencv.
+        import cv2
+        if key not in self._videos:
+            height, width = frame.shape[:2]
+            path = os.path.join(self.episode_dir,
+                                key.replace(KEY_SEPARATOR, NPZ_SEPARATOR) + '.mp4')
+            self._videos[key] = cv2.VideoWriter(
+                path, cv2.VideoWriter_fourcc(*'mp4v'), self.video_fps, (width, height))
+        self._videos[key].write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+
+    def release(self):
+        for video in self._videos.values():
+            video.release()
+        self._videos = {}
+
+    def close(self):
+        remainder = self.num_steps % self.chunk_size
+        if remainder:
+            self._write_chunk(remainder)
+        self.release()
+        meta = {'num_steps': self.num_steps,
+                'num_chunks': self.num_chunks,
+                'chunk_size': self.chunk_size,
+                'keys': self.specs or {},
+                'video_keys': self.video_keys,
+                'video_fps': self.video_fps}
+        with open(os.path.join(self.episode_dir, META_FILENAME), 'w') as meta_file:
+            json.dump(meta, meta_file, indent=2)
@@ -1,9 +1,34 @@
 """ Library of helper functions for saving experiences
+
+For recording whole episodes without stalling the env loop, see
+perls2.utils.episode_recorder.EpisodeRecorder.
 """
 import datetime
 import cv2
 import os
 import logging
+import subprocess
+
+# Episode frame directories already created, keyed by (folder_path, ep_num).
+_frame_dirs = {}
+
+
+def _date_ep_string(ep_num):
+    currentDT = datetime.datetime.now()
+    return (str(currentDT.year) + str(currentDT.month) +
+            str(currentDT.day) + '_Episode_' + str(ep_num))
+
+
+def _frame_dir(folder_path, ep_num):
+    """ Directory for the frames of an episode, created on first use.
+    """
+    key = (folder_path, ep_num)
+    if key not in _frame_dirs:
+        frame_dir = folder_path + _date_ep_string(ep_num)
+        if not os.path.exists(frame_dir):
+            os.mkdir(frame_dir)
+        _frame_dirs[key] = frame_dir
+    return _frame_dirs[key]
 
 
 def save_image(frame,  ep_num, step, folder_path='output', invert=False):
@@ -26,24 +51,14 @@ def save_image(frame,  ep_num, step, folder_path='output', invert=False):
 
     """
     #logging.debug('saving image')
-    # directory strings common to all images
-    currentDT = datetime.datetime.now()
-    date_ep_string = (str(currentDT.year) + str(currentDT.month) +
-                      str(currentDT.day) + '_Episode_' + str(ep_num))
     step_string = '/step' + str(step) + '.jpg'
 
     # Convert to bgr for opencv
     if invert:
         frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
 
-    # frame directory
-    frame_dir = folder_path + date_ep_string
-
-    # Check if directory exists for this episode. If not
-    # make one.
-    if not os.path.exists(frame_dir):
-        os.mkdir(frame_dir)
-    frame_filepath = frame_dir + step_string
+    # frame directory, made once per episode.
+    frame_filepath = _frame_dir(folder_path, ep_num) + step_string
 
     # Save the image to file
     cv2.imwrite(frame_filepath, frame)
@@ -59,28 +74,21 @@ def convert_jpgs_to_vid(folder_path, ep_num):
         Returns: None
 
     """
-    # Construct date and time string for naming
-    # TODO: make this read the files/folderpath
-    currentDT = datetime.datetime.now()
-    date_ep_string = (str(currentDT.year) + str(currentDT.month) +
-                      str(currentDT.day) + '_Episode_' + str(ep_num))
-
-    # Convert frame images to movie
-    frame_dir = (folder_path + str(currentDT.year) + str(currentDT.month) +
-                 str(currentDT.day) + '_Episode_' + str(ep_num))
-    os.chdir(frame_dir)
+    # Use the directory the frames were saved in, even if the date changed
+    # since, and forget it once the video is written.
+    frame_dir = _frame_dir(folder_path, ep_num)
+    date_ep_string = frame_dir[len(folder_path):]
 
     # Save mp4
-    frame_output = (str(currentDT.year) + str(currentDT.month) +
-                    str(currentDT.day) + '_Episode_' + str(ep_num) + '.mp4')
-    cmd_string = ("ffmpeg -r 10  -i step%d.jpg -vcodec libx264 -crf 25  -pix_fmt yuv444p "
-                  + frame_output)
-    os.system(cmd_string)
+    frame_output = date_ep_string + '.mp4'
+    subprocess.call(['ffmpeg', '-r', '10', '-i', 'step%d.jpg', '-vcodec', 'libx264',
+                     '-crf', '25', '-pix_fmt', 'yuv444p', frame_output],
+                    cwd=frame_dir)
 
     # Save gif (converted from mp4)
-    frame_gif_output = (str(currentDT.year) + str(currentDT.month) +
-                        str(currentDT.day) + '_Episode_' + str(ep_num) + '.gif')
-    cmd_string = ("ffmpeg  -t 10 -i " + frame_output
-                  + " -filter_complex \"[0:v] fps=12,scale=480:-1,split [a][b];[a] palettegen [p];[b][p] paletteuse\" "
-                  + frame_gif_output)
-    os.system(cmd_string)
+    frame_gif_output = date_ep_string + '.gif'
+    subprocess.call(['ffmpeg', '-t', '10', '-i', frame_output, '-filter_complex',
+                     '[0:v] fps=12,scale=480:-1,split [a][b];[a] palettegen [p];[b][p] paletteuse',
+                     frame_gif_output],
+                    cwd=frame_dir)
+    _frame_dirs.pop((folder_path, ep_num), None)
@@ -94,3 +94,57 @@ def extrinsic_to_view_matrix(rotation, translation, distance):
                 cameraTargetPosition=focus,
                 cameraUpVector=up_vector)
 
+
+def deproject_image(depth, K, rotation=None, translation=None, mask=None):
+    """Deproject a depth image into a point cloud.
+
+    Pixels (u, v) are the column and row of the image, with depth along the
+    optical axis, deprojected as x = (u - u0) / fu * depth and
+    y = (v - v0) / fv * depth.
+
+    Parameters
+    ----------
+    depth :
+        (h, w) depth image.
+    K :
+        The camera intrinsics matrix.
+    rotation :
+        HZ-style rotation matrix R, with x_camera = R * x_world + t.
+        Points are returned in the camera frame if None.
+    translation :
+        HZ-style translation t.
+    mask :
+        Optional (h, w) mask, only nonzero pixels are deprojected.
+
+    Returns
+    -------
+    points
+        (h * w, 3) points, or (n, 3) points for the n pixels in the mask,
+        in row major order.
+    """
+    depth = np.asarray(depth)
+    if depth.ndim == 3 and depth.shape[2] == 1:
+        depth = depth[:, :, 0]
+    if depth.ndim != 2:
+        raise ValueError("depth must be a (h, w) image, got shape {}".format(depth.shape))
+    height, width = depth.shape
+    if mask is None:
+        v, u = np.divmod(np.arange(height * width), width)
+        z = depth.reshape(-1).astype(np.float64)
+    else:
+        mask = np.asarray(mask)
+        if mask.shape != depth.shape:
+            raise ValueError("mask must have the shape of depth {}".format(depth.shape))
+        v, u = np.nonzero(mask)
+        z = depth[v, u].astype(np.float64)
+
+    points = np.empty((z.shape[0], 3))
+    points[:, 0] = (u - K[0, 2]) * (z / K[0, 0])
+    points[:, 1] = (v - K[1, 2]) * (z / K[1, 1])
+    points[:, 2] = z
+    if rotation is not None:
+        # x_world = R^T (x_camera - t), as row vectors.
+        if translation is not None:
+            points -= translation
+        points = np.dot(points, rotation)
+    return points
@@ -0,0 +1,118 @@
+"""Fixed rate loop scheduling with absolute deadlines.
+
+Compatible with python 2.7 for the SawyerCtrlInterface.
+"""
+from __future__ import division
+import time
+
+# time.monotonic is not available in python 2.7.
+_clock = getattr(time, 'monotonic', time.time)
+
+SKIP_MISSED = 'skip'
+CATCH_UP = 'catch_up'
+
+
+class LoopScheduler(object):
+    """Run a loop at a fixed period using absolute deadlines.
+
+    Each tick waits until the next deadline by sleeping for most of the
+    remaining time and spinning only for a short tail, so the loop does not
+    burn a full core. Deadlines are on a fixed grid, so small overruns do
+    not accumulate drift.
+
+    Attributes:
+        period (float): desired loop period (s).
+        spin_time (float): time before the deadline to stop sleeping and
+            spin instead (s). Should be larger than the OS sleep jitter.
+        overrun_policy (str): what to do when a deadline is missed. Choose from:
+            'skip': drop missed ticks and schedule from the current time.
+            'catch_up': run missed ticks immediately, up to max_catch_up
+                ticks, then skip the rest.
+        max_catch_up (int): maximum number of missed ticks to run back to back.
+        ticks (int): number of ticks since start.
+        missed_deadlines (int): number of ticks that overran their deadline.
+        last_period (float): measured period of the last tick (s).
+        last_compute_time (float): time spent in the last tick before wait (s).
+        last_slack (float): time left before the deadline when the last tick
+            finished (s). Negative if the deadline was missed.
+    """
+    def __init__(self, period, spin_time=0.0005, overrun_policy=SKIP_MISSED, max_catch_up=5):
+        if overrun_policy not in [SKIP_MISSED, CATCH_UP]:
+            raise ValueError("Invalid overrun_policy {}".format(overrun_policy))
+        self.period = period
+        self.spin_time = spin_time
+        self.overrun_policy = overrun_policy
+        self.max_catch_up = max_catch_up
+        self.start()
+
+    def start(self):
+        """Reset statistics and schedule the first deadline one period from now.
+        """
+        now = _clock()
+        self._tick_start = now
+        self._deadline = now + self.period
+        self.last_period = 0.0
+        self.last_compute_time = 0.0
+        self.last_slack = 0.0
+        self.reset_stats()
+
+    def wait(self):
+        """Block until the deadline of the current tick.
+
+        Call once at the end of each loop iteration.
+        """
+        now = _clock()
+        self.last_compute_time = now - self._tick_start
+        self.last_slack = self._deadline - now
+
+        if self.last_slack < 0:
+            self.missed_deadlines += 1
+            missed_ticks = int(-self.last_slack // self.period) + 1
+            if self.overrun_policy == SKIP_MISSED or missed_ticks > self.max_catch_up:
+                self._deadline = now
+        else:
+            sleep_time = self.last_slack - self.spin_time
+            if sleep_time > 0:
+                time.sleep(sleep_time)
+            while _clock() < self._deadline:
+                pass
+
+        now = _clock()
+        self.last_period = now - self._tick_start
+        self._tick_start = now
+        self._deadline += self.period
+        self._update_stats()
+
+    def _update_stats(self):
+        self.ticks += 1
+        self._sum_period += self.last_period
+        self._sum_compute_time += self.last_compute_time
+        self.max_period = max(self.max_period, self.last_period)
+        self.max_compute_time = max(self.max_compute_time, self.last_compute_time)
+        self.min_slack = min(self.min_slack, self.last_slack)
+
+    def stats(self):
+        """Loop statistics since start or the last reset_stats.
+
+        Returns:
+            (dict): mean and max period, mean and max compute time, min slack
+                and number of missed deadlines.
+        """
+        ticks = max(self.ticks, 1)
+        return {'period': self._sum_period / ticks,
+                'max_period': self.max_period,
+                'compute_time': self._sum_compute_time / ticks,
+                'max_compute_time': self.max_compute_time,
+                'min_slack': self.min_slack,
+                'missed_deadlines': self.missed_deadlines}
+
+    def reset_stats(self):
+        """Reset statistics without changing the deadline schedule.
+        """
+        self.ticks = 0
+        self.missed_deadlines = 0
+        self.max_period = 0.0
+        self.max_compute_time = 0.0
+        self.min_slack = self.period
+        self._sum_period = 0.0
+        self._sum_compute_time = 0.0
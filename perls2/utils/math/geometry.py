@@ -3,8 +3,17 @@ Common geometry utility functions
 """
 
 import numpy as np
-from perls.utils.numpy_utils import assert_shape
-from perls.math.transformations import rotation_matrix3 as rotation_matrix
+from perls2.utils.math.transformations import rotation_matrix3 as rotation_matrix
+
+
+def assert_shape(array, shape):
+    """Assert that array has the given shape. None matches any size.
+    """
+    assert len(array.shape) == len(shape), \
+        "Expected {} dimensions, got shape {}".format(len(shape), array.shape)
+    for size, expected_size in zip(array.shape, shape):
+        assert expected_size is None or size == expected_size, \
+            "Expected shape {}, got {}".format(shape, array.shape)
 
 
 class Point2D(object):
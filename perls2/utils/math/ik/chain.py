@@ -9,6 +9,8 @@ import numpy as np
 
 from . import urdf_utils
 from . import inverse_kinematics
+from .kinematics import ChainKinematics
+from .dynamics import ChainDynamics
 
 
 class Chain(object):
@@ -42,10 +44,31 @@ class Chain(object):
         else:
             self.active_links = np.array([True] * len(links))
 
+        self._kinematics = None
+        self._dynamics = None
+
+    @property
+    def kinematics(self):
+        """Compiled kinematics of the chain, built on first use.
+        """
+        if self._kinematics is None:
+            self._kinematics = ChainKinematics(self)
+        return self._kinematics
+
+    @property
+    def dynamics(self):
+        """Compiled rigid body dynamics of the chain, built on first use.
+
+        Uses the inertial parameters of the links, see URDFLink.
+        """
+        if self._dynamics is None:
+            self._dynamics = ChainDynamics(self)
+        return self._dynamics
+
     def active_to_full(self, active_joints, initial_positions):
         """Active to full.
         """
-        full_joints = np.array(initial_positions, copy=True, dtype=np.float)
+        full_joints = np.array(initial_positions, copy=True, dtype=float)
         np.place(full_joints, self.active_links, active_joints)
 
         return full_joints
@@ -61,25 +84,45 @@ class Chain(object):
         Note : Inactive positions must be in the list.
 
         Args:
-            positions: The list of the positions of each joint.
+            positions: The list of the positions of each joint, or an
+                array of shape (m, number of links) for a batch.
 
         Returns:
-            The transformation matrix
+            The transformation matrix, or an array of shape (m, 4, 4) for
+            a batch.
         """
-        frame_matrix = np.eye(4)
-
-        if len(self.links) != len(positions):
+        if np.shape(positions)[-1] != len(self.links):
             raise ValueError('positions vector length %d != number of links %d'
-                             % (len(positions), len(self.links)))
+                             % (np.shape(positions)[-1], len(self.links)))
+
+        return self.kinematics.forward_kinematics(positions)
+
+    def jacobian(self, positions):
+        """Returns the geometric jacobian of the end of the chain.
+
+        Note : Inactive positions must be in the list.
+
+        Args:
+            positions: The list of the positions of each joint, or an
+                array of shape (m, number of links) for a batch.
+
+        Returns:
+            The jacobian in the base frame, linear rows first, with a
+            column per active link.
+        """
+        return self.kinematics.jacobian(positions)
 
-        for index, (link, joint_angle) in enumerate(zip(self.links, positions)):
-            # Compute iteratively the position
-            # NB : Use asarray to avoid old sympy problems
-            frame_matrix = np.dot(
-                    frame_matrix, 
-                    np.asarray(link.get_transformation_matrix(joint_angle)))
+    def jacobian_dot(self, positions, velocities):
+        """Returns the time derivative of the geometric jacobian.
 
-        return frame_matrix
+        Args:
+            positions: The list of the positions of each joint.
+            velocities: The list of the velocities of each joint.
+
+        Returns:
+            The jacobian derivative, shaped as the jacobian.
+        """
+        return self.kinematics.jacobian_dot(positions, velocities)
 
     def inverse_kinematics(self, target, initial_positions=None, **kwargs):
         """Computes the inverse kinematic on the specified target
@@ -107,7 +150,9 @@ class Chain(object):
 
     @classmethod
     def from_urdf_file(cls, urdf_file, base_elements=['base_link'],
-                       last_link_offset=None, active_links=None):
+                       last_link_offset=None, active_links=None,
+                       use_symbolic_matrix=True, tip_link=None,
+                       default_inertial=None):
         """Creates a chain from an URDF file.
 
         Args:
@@ -115,10 +160,19 @@ class Chain(object):
             base_elements: List of the links beginning the chain
             last_link_offset: Optional : The translation vector of the tip.
             list active_links: The active links
+            use_symbolic_matrix: Store the link transformation matrices as
+                Sympy symbolic matrices. Not needed for the compiled
+                kinematics.
+            tip_link: Optional : The link ending the chain.
+            default_inertial: Optional : (mass, inertia diagonal) of links
+                without inertial parameters. Defaults to no mass.
         """
         links = urdf_utils.get_urdf_parameters(
                 urdf_file, base_elements=base_elements,
-                last_link_offset=last_link_offset)
+                last_link_offset=last_link_offset,
+                use_symbolic_matrix=use_symbolic_matrix,
+                tip_link=tip_link,
+                default_inertial=default_inertial)
 
         # Add an origin link at the beginning
         return cls(links, active_links=active_links)
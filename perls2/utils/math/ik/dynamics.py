@@ -0,0 +1,295 @@
+"""This module implements compiled rigid body dynamics for a Chain.
+
+The mass matrix is computed with the composite rigid body algorithm (CRBA)
+and joint torques with the recursive Newton-Euler algorithm (RNEA), both in
+the base frame of the chain using the link frames of ChainKinematics.
+
+Each link of the chain is the body moved by its joint, with the inertial
+parameters of URDFLink. The base of the chain is fixed.
+"""
+
+import numba
+import numpy as np
+
+from .kinematics import ChainKinematics
+from .kinematics import JOINT_FIXED, JOINT_REVOLUTE, JOINT_PRISMATIC
+from .kinematics import link_frames
+
+GRAVITY = (0.0, 0.0, -9.81)
+
+
+@numba.jit(nopython=True, cache=True)
+def _world_inertials(frame, center_of_mass, inertia):
+    """Center of mass and inertia about it of a link, in the base frame.
+    """
+    rotation = frame[:3, :3].copy()
+    world_center = np.dot(rotation, center_of_mass) + frame[:3, 3]
+    world_inertia = np.dot(rotation, np.dot(inertia, rotation.T))
+    return world_center, world_inertia
+
+
+@numba.jit(nopython=True, cache=True)
+def _motion_subspace(frame, axis, joint_type):
+    """Spatial motion vector (angular, linear) of a unit joint velocity,
+    about the origin of the base frame.
+    """
+    s = np.zeros(6)
+    if joint_type == JOINT_FIXED:
+        return s
+    z = np.dot(frame[:3, :3].copy(), axis)
+    if joint_type == JOINT_REVOLUTE:
+        p = frame[:3, 3]
+        s[0:3] = z
+        s[3] = p[1] * z[2] - p[2] * z[1]
+        s[4] = p[2] * z[0] - p[0] * z[2]
+        s[5] = p[0] * z[1] - p[1] * z[0]
+    else:
+        s[3:6] = z
+    return s
+
+
+@numba.jit(nopython=True, cache=True)
+def mass_matrix(frames, axes, joint_types, active, masses, centers, inertias):
+    """Joint space mass matrix for a batch of link frames, using the CRBA.
+
+    Args:
+        frames: (m, n, 4, 4) link frames from link_frames.
+        axes: (n, 3) unit joint axes, in the joint frame.
+        joint_types: (n,) joint type ids.
+        active: indices of the links with a row and column.
+        masses: (n,) link masses.
+        centers: (n, 3) link centers of mass, in the link frame.
+        inertias: (n, 3, 3) link inertias about the center of mass, in the
+            link frame.
+
+    Returns:
+        (m, len(active), len(active)) mass matrices.
+    """
+    num_configs, num_links = frames.shape[0], frames.shape[1]
+    num_active = active.shape[0]
+    M = np.zeros((num_configs, num_active, num_active))
+    composite = np.zeros((num_links, 6, 6))
+    spatial_inertia = np.zeros((6, 6))
+    S = np.zeros((num_active, 6))
+    for k in range(num_configs):
+        # Spatial inertias of the composite bodies from each link to the
+        # end of the chain, about the origin of the base frame.
+        for i in range(num_links - 1, -1, -1):
+            c, I = _world_inertials(frames[k, i], centers[i], inertias[i])
+            m = masses[i]
+            cc = c[0] * c[0] + c[1] * c[1] + c[2] * c[2]
+            spatial_inertia[:] = 0.0
+            for a in range(3):
+                for b in range(3):
+                    spatial_inertia[a, b] = I[a, b] - m * c[a] * c[b]
+                spatial_inertia[a, a] += m * cc
+                spatial_inertia[3 + a, 3 + a] = m
+            # m [c]x and its transpose.
+            spatial_inertia[0, 4] = -m * c[2]
+            spatial_inertia[0, 5] = m * c[1]
+            spatial_inertia[1, 3] = m * c[2]
+            spatial_inertia[1, 5] = -m * c[0]
+            spatial_inertia[2, 3] = -m * c[1]
+            spatial_inertia[2, 4] = m * c[0]
+            for a in range(3):
+                for b in range(3):
+                    spatial_inertia[3 + b, a] = spatial_inertia[a, 3 + b]
+            composite[i] = spatial_inertia
+            if i < num_links - 1:
+                composite[i] += composite[i + 1]
+
+        for col in range(num_active):
+            i = active[col]
+            S[col] = _motion_subspace(frames[k, i], axes[i], joint_types[i])
+
+        for row in range(num_active):
+            for col in range(row, num_active):
+                i = max(active[row], active[col])
+                value = np.dot(S[row], np.dot(composite[i], S[col]))
+                M[k, row, col] = value
+                M[k, col, row] = value
+    return M
+
+
+@numba.jit(nopython=True, cache=True)
+def inverse_dynamics(frames, axes, joint_types, active, masses, centers,
+                     inertias, velocities, accelerations, gravity):
+    """Joint torques for a batch of joint motions, using the RNEA.
+
+    Args:
+        frames: (m, n, 4, 4) link frames from link_frames.
+        axes: (n, 3) unit joint axes, in the joint frame.
+        joint_types: (n,) joint type ids.
+        active: indices of the links to return torques for.
+        masses: (n,) link masses.
+        centers: (n, 3) link centers of mass, in the link frame.
+        inertias: (n, 3, 3) link inertias about the center of mass, in the
+            link frame.
+        velocities: (m, n) joint velocities.
+        accelerations: (m, n) joint accelerations.
+        gravity: (3,) gravity acceleration in the base frame.
+
+    Returns:
+        (m, len(active)) joint torques, or forces for prismatic joints.
+    """
+    num_configs, num_links = frames.shape[0], frames.shape[1]
+    tau = np.zeros((num_configs, active.shape[0]))
+    origins = np.zeros((num_links, 3))
+    z = np.zeros((num_links, 3))
+    centers_w = np.zeros((num_links, 3))
+    forces = np.zeros((num_links, 3))
+    moments = np.zeros((num_links, 3))
+    for k in range(num_configs):
+        # Forward pass: velocities and accelerations of each link. Gravity
+        # is an upwards acceleration of the base.
+        w = np.zeros(3)
+        dw = np.zeros(3)
+        a = -gravity
+        p_prev = np.zeros(3)
+        for i in range(num_links):
+            frame = frames[k, i]
+            p = frame[:3, 3].copy()
+            r = p - p_prev
+            a = a + np.cross(dw, r) + np.cross(w, np.cross(w, r))
+            joint_type = joint_types[i]
+            if joint_type != JOINT_FIXED:
+                z[i] = np.dot(frame[:3, :3].copy(), axes[i])
+                qd = velocities[k, i]
+                qdd = accelerations[k, i]
+                if joint_type == JOINT_REVOLUTE:
+                    dw = dw + z[i] * qdd + np.cross(w, z[i] * qd)
+                    w = w + z[i] * qd
+                else:
+                    a = a + z[i] * qdd + 2.0 * np.cross(w, z[i] * qd)
+            else:
+                z[i] = 0.0
+
+            c, I = _world_inertials(frame, centers[i], inertias[i])
+            d = c - p
+            a_c = a + np.cross(dw, d) + np.cross(w, np.cross(w, d))
+            forces[i] = masses[i] * a_c
+            moments[i] = np.dot(I, dw) + np.cross(w, np.dot(I, w))
+            origins[i] = p
+            centers_w[i] = c
+            p_prev = p
+
+        # Backward pass: forces and moments about each joint origin.
+        f = np.zeros(3)
+        n = np.zeros(3)
+        for i in range(num_links - 1, -1, -1):
+            if i < num_links - 1:
+                n = n + np.cross(origins[i + 1] - origins[i], f)
+            n = n + moments[i] + np.cross(centers_w[i] - origins[i], forces[i])
+            f = f + forces[i]
+            forces[i] = f
+            moments[i] = n
+
+        for col in range(active.shape[0]):
+            i = active[col]
+            if joint_types[i] == JOINT_REVOLUTE:
+                tau[k, col] = np.dot(z[i], moments[i])
+            elif joint_types[i] == JOINT_PRISMATIC:
+                tau[k, col] = np.dot(z[i], forces[i])
+    return tau
+
+
+class ChainDynamics(ChainKinematics):
+    """Compiled rigid body dynamics of a Chain.
+
+    Joint positions, velocities and accelerations are full vectors, with
+    an entry for every link of the chain. Methods accept a single
+    configuration of shape (n,) or a batch of shape (m, n), and rows and
+    columns of the results are the active links of the chain.
+
+    Attributes:
+        masses: (n,) link masses.
+        centers: (n, 3) link centers of mass, in the link frame.
+        inertias: (n, 3, 3) link inertias about the center of mass, in the
+            link frame.
+        gravity: (3,) gravity acceleration in the base frame.
+    """
+
+    def __init__(self, chain, gravity=GRAVITY):
+        """Initialize.
+
+        Args:
+            chain: The Chain to compute the dynamics of. Links without
+                inertial parameters, such as an OriginLink, have no mass.
+            gravity: Gravity acceleration in the base frame of the chain.
+        """
+        ChainKinematics.__init__(self, chain)
+        self.masses = np.zeros(self.num_links)
+        self.centers = np.zeros((self.num_links, 3))
+        self.inertias = np.zeros((self.num_links, 3, 3))
+        for index, link in enumerate(chain.links):
+            self.masses[index] = getattr(link, 'mass', 0.0)
+            self.centers[index] = getattr(link, 'center_of_mass', np.zeros(3))
+            self.inertias[index] = getattr(link, 'inertia', np.zeros((3, 3)))
+        self.gravity = np.array(gravity, dtype=np.float64)
+
+    def mass_matrix(self, positions):
+        """Returns the joint space mass matrix.
+
+        Args:
+            positions: (n,) or (m, n) joint positions.
+
+        Returns:
+            (a, a) or (m, a, a) mass matrices.
+        """
+        batch = self._as_batch(positions, 'positions')
+        frames = link_frames(
+            self.origins, self.axes, self.joint_types, batch)
+        M = mass_matrix(frames, self.axes, self.joint_types, self.active,
+                        self.masses, self.centers, self.inertias)
+        return M.reshape(np.shape(positions)[:-1] + M.shape[1:])
+
+    def inverse_dynamics(self, positions, velocities, accelerations,
+                         gravity=None):
+        """Returns the joint torques producing the given joint motion.
+
+        Args:
+            positions: (n,) or (m, n) joint positions.
+            velocities: joint velocities, shaped as positions.
+            accelerations: joint accelerations, shaped as positions.
+            gravity: Optional : gravity acceleration in the base frame.
+                Defaults to the gravity of the chain.
+
+        Returns:
+            (a,) or (m, a) joint torques.
+        """
+        batch = self._as_batch(positions, 'positions')
+        velocity_batch = self._as_batch(velocities, 'velocities')
+        acceleration_batch = self._as_batch(accelerations, 'accelerations')
+        if (velocity_batch.shape != batch.shape or
+                acceleration_batch.shape != batch.shape):
+            raise ValueError('velocities and accelerations should be shaped '
+                             'as positions %s' % (np.shape(positions),))
+        if gravity is None:
+            gravity = self.gravity
+        frames = link_frames(
+            self.origins, self.axes, self.joint_types, batch)
+        tau = inverse_dynamics(
+            frames, self.axes, self.joint_types, self.active, self.masses,
+            self.centers, self.inertias, velocity_batch, acceleration_batch,
+            np.asarray(gravity, dtype=np.float64))
+        return tau.reshape(np.shape(positions)[:-1] + tau.shape[1:])
+
+    def gravity_torques(self, positions):
+        """Returns the joint torques compensating gravity.
+
+        Args:
+            positions: (n,) or (m, n) joint positions.
+        """
+        zeros = np.zeros(np.shape(positions))
+        return self.inverse_dynamics(positions, zeros, zeros)
+
+    def coriolis_gravity_torques(self, positions, velocities):
+        """Returns the joint torques compensating gravity, coriolis and
+        centrifugal forces, N(q, dq) in M(q) ddq + N(q, dq) = tau.
+
+        Args:
+            positions: (n,) or (m, n) joint positions.
+            velocities: joint velocities, shaped as positions.
+        """
+        return self.inverse_dynamics(
+            positions, velocities, np.zeros(np.shape(positions)))
@@ -8,9 +8,14 @@ from __future__ import division
 from __future__ import print_function
 
 
+from collections import OrderedDict
+
+import numpy as np
+
 from .chain import Chain
+from .inverse_kinematics import inverse_kinematic_dls
 
-from perls.math import Pose
+from perls2.utils.math import Pose
 
 
 class IKSovler(object):
@@ -50,3 +55,177 @@ class ScipyIKSovler(IKSovler):
         pose = Pose(matrix4[:3, 3], matrix4[:3, :3])
 
         return pose
+
+
+class DLSIKSovler(IKSovler):
+    """IK solver with damped least squares on the compiled chain jacobian.
+
+    Targets are solved from the previous solution unless initial positions
+    are given, and solutions are kept in an LRU cache keyed on the target
+    quantized to the cache resolution. The cache is only looked up without
+    initial positions, as a cached solution may be far from them.
+    """
+
+    def __init__(self,
+                 path,
+                 active_links=None,
+                 base_elements=['base_link'],
+                 tip_link=None,
+                 max_iter=100,
+                 tolerance=1e-6,
+                 damping=0.1,
+                 orientation_weight=1.0,
+                 num_restarts=3,
+                 cache_size=1024,
+                 position_resolution=1e-4,
+                 orientation_resolution=1e-4):
+        """Initialize.
+
+        Args:
+            path: The path of the URDF file.
+            active_links: A list of boolean indicating that whether or
+                not the corresponding link is active.
+            base_elements: List of the links beginning the chain.
+            tip_link: Optional : The link ending the chain.
+            max_iter: Maximum number of iterations for each target.
+            tolerance: Norm of the pose error below which a target is solved.
+            damping: Initial damping of the least squares steps.
+            orientation_weight: Weight of the orientation error in the pose
+                error, in m/rad.
+            num_restarts: Number of times unsolved targets are retried from
+                random joint positions within the joint limits.
+            cache_size: Number of solutions to cache. 0 disables the cache.
+            position_resolution: Resolution of the target positions in the
+                cache keys, in m.
+            orientation_resolution: Resolution of the target rotation
+                matrices in the cache keys.
+        """
+        self._chain = Chain.from_urdf_file(
+            path, base_elements=base_elements, active_links=active_links,
+            use_symbolic_matrix=False, tip_link=tip_link)
+        self.max_iter = max_iter
+        self.tolerance = tolerance
+        self.damping = damping
+        self.orientation_weight = orientation_weight
+        self.num_restarts = num_restarts
+        self.cache_size = cache_size
+        self.position_resolution = position_resolution
+        self.orientation_resolution = orientation_resolution
+        self._cache = OrderedDict()
+        self._last_solution = np.zeros(len(self._chain.links))
+        self._random_state = np.random.RandomState(0)
+
+        # Sampling range of the restarts, with unbounded joints in [-pi, pi].
+        bounds = [link.bounds for link in self._chain.links]
+        self._lower = np.array([-np.pi if low is None else low for low, _ in bounds])
+        self._upper = np.array([np.pi if high is None else high for _, high in bounds])
+
+    def _cache_key(self, matrix4):
+        return (np.round(matrix4[:3, 3] / self.position_resolution).astype(np.int64).tobytes() +
+                np.round(matrix4[:3, :3] / self.orientation_resolution).astype(np.int64).tobytes())
+
+    def clear_cache(self):
+        """Remove all cached solutions.
+        """
+        self._cache.clear()
+
+    def inverse_kinematics(self, target, ee_link=-1, initial_positions=None):
+        """Compute the IK results.
+
+        Args:
+            target: The Pose or 4x4 transformation matrix of the target.
+            ee_link: Index of the end effector link, must be the last link.
+            initial_positions: Optional : The initial position of each joint
+                of the chain. Defaults to the previous solution, or the
+                cached solution of the target.
+
+        Returns:
+            The list of the positions of each joint of the chain.
+        """
+        assert ee_link == -1 or ee_link == len(self._chain.links) - 1
+
+        positions, _ = self.inverse_kinematics_batch(
+            [target], initial_positions=initial_positions)
+
+        return positions[0].tolist()
+
+    def inverse_kinematics_batch(self, targets, initial_positions=None):
+        """Compute the IK results of many targets in one call.
+
+        Args:
+            targets: List of Poses or 4x4 transformation matrices, or an
+                array of shape (m, 4, 4).
+            initial_positions: Optional : The initial positions of the
+                joints of the chain, for all targets (n,) or each target
+                (m, n). Defaults to the previous solution, or the cached
+                solution of each target.
+
+        Returns:
+            The (m, n) joint positions of the chain and a (m,) boolean
+            array of whether each target was solved within tolerance.
+        """
+        targets = np.array([getattr(target, 'matrix4', target)
+                            for target in targets], dtype=np.float64)
+        num_targets = targets.shape[0]
+        num_links = len(self._chain.links)
+        # Solutions from explicit initial positions are cached, but a cached
+        # solution is not returned for them.
+        use_cached = initial_positions is None
+        if initial_positions is None:
+            initial_positions = self._last_solution
+        initial_positions = np.broadcast_to(
+            np.asarray(initial_positions, dtype=np.float64),
+            (num_targets, num_links))
+
+        positions = np.empty((num_targets, num_links))
+        solved = np.ones(num_targets, dtype=bool)
+        keys = [None] * num_targets
+        misses = []
+        for index in range(num_targets):
+            if self.cache_size > 0:
+                keys[index] = self._cache_key(targets[index])
+                if use_cached and keys[index] in self._cache:
+                    self._cache[keys[index]] = self._cache.pop(keys[index])
+                    positions[index] = self._cache[keys[index]]
+                    continue
+            misses.append(index)
+
+        if misses:
+            unsolved = misses
+            starts = initial_positions[misses]
+            for restart in range(self.num_restarts + 1):
+                positions[unsolved], errors = inverse_kinematic_dls(
+                    self._chain, targets[unsolved], starts,
+                    max_iter=self.max_iter, tolerance=self.tolerance,
+                    damping=self.damping,
+                    orientation_weight=self.orientation_weight)
+                solved[unsolved] = errors < self.tolerance
+                unsolved = [index for index in unsolved if not solved[index]]
+                if not unsolved:
+                    break
+                # Restart from random positions of the active joints.
+                starts = np.where(
+                    self._chain.active_links,
+                    self._random_state.uniform(
+                        self._lower, self._upper, size=(len(unsolved), num_links)),
+                    initial_positions[unsolved])
+
+            for index in misses:
+                if keys[index] is None or not solved[index]:
+                    continue
+                self._cache[keys[index]] = positions[index].copy()
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        if solved.any():
+            self._last_solution = positions[np.flatnonzero(solved)[-1]].copy()
+
+        return positions, solved
+
+    def forward_kinematics(self, positions):
+        """Compute the forward kinematics.
+        """
+        matrix4 = self._chain.forward_kinematics(positions)
+        pose = Pose(matrix4[:3, 3], matrix4[:3, :3])
+
+        return pose
@@ -1,12 +1,16 @@
-"""Solving the IK with scipy.
+"""Solving the IK with scipy, or with damped least squares on the compiled
+jacobian of the chain.
 """
 
 import math
 import warnings
 
+import numba
 import scipy.optimize
 import numpy as np
 
+from .kinematics import jacobian, link_frames
+
 
 EPS = 1e-14
 
@@ -75,3 +79,147 @@ def inverse_kinematic_optimization(chain,
             options=options)
 
     return chain.active_to_full(result.x, initial_positions)
+
+
+@numba.jit(nopython=True, cache=True)
+def _pose_error(target, frame, orientation_weight):
+    """Position error and weighted rotation vector error of a frame.
+    """
+    error = np.empty(6)
+    for r in range(3):
+        error[r] = target[r, 3] - frame[r, 3]
+    # Rotation from the frame to the target, as a rotation vector.
+    R = np.dot(target[:3, :3].copy(), frame[:3, :3].T.copy())
+    v = np.array([R[2, 1] - R[1, 2], R[0, 2] - R[2, 0], R[1, 0] - R[0, 1]])
+    sin_angle = 0.5 * np.sqrt(np.dot(v, v))
+    cos_angle = 0.5 * (R[0, 0] + R[1, 1] + R[2, 2] - 1.0)
+    angle = math.atan2(sin_angle, cos_angle)
+    if sin_angle < 1e-6 and cos_angle < 0.0:
+        # Near pi, v vanishes with the sine of the angle. The axis is taken
+        # from the symmetric part of R = cos I + sin [a]x + (1 - cos) a a^T,
+        # starting from its largest diagonal entry.
+        i = 0
+        for j in range(1, 3):
+            if R[j, j] > R[i, i]:
+                i = j
+        axis = np.empty(3)
+        axis[i] = math.sqrt(max((R[i, i] - cos_angle) / (1.0 - cos_angle), 0.0))
+        for j in range(3):
+            if j != i:
+                axis[j] = (R[i, j] + R[j, i]) / (2.0 * (1.0 - cos_angle) * axis[i])
+        if np.dot(axis, v) < 0.0:
+            axis = -axis
+        error[3:6] = orientation_weight * angle * axis
+        return error
+    scale = 0.5
+    if sin_angle > 1e-8:
+        scale = 0.5 * angle / sin_angle
+    error[3:6] = orientation_weight * scale * v
+    return error
+
+
+@numba.jit(nopython=True, cache=True)
+def damped_least_squares(origins, axes, joint_types, active, lower, upper,
+                         targets, initial_positions, max_iter, tolerance,
+                         damping, orientation_weight):
+    """Solve the IK of a batch of targets with damped least squares.
+
+    The damping is adapted as in Levenberg-Marquardt: steps that reduce the
+    error are accepted and decrease the damping, other steps are rejected
+    and increase it. Joint positions are clipped to their limits.
+
+    Args:
+        origins, axes, joint_types, active: The chain, see ChainKinematics.
+        lower: (a,) lower limits of the active joints.
+        upper: (a,) upper limits of the active joints.
+        targets: (m, 4, 4) target frames of the end of the chain.
+        initial_positions: (m, n) full joint positions to start from.
+        max_iter: Maximum number of iterations for each target.
+        tolerance: Error norm below which a target is solved.
+        damping: Initial damping.
+        orientation_weight: Weight of the orientation error, in m/rad.
+
+    Returns:
+        (m, n) full joint positions and (m,) error norms.
+    """
+    num_targets, num_links = initial_positions.shape
+    num_active = active.shape[0]
+    positions = initial_positions.copy()
+    errors = np.empty(num_targets)
+    eye = np.eye(6)
+    for k in range(num_targets):
+        q = positions[k:k + 1].copy()
+        frames = link_frames(origins, axes, joint_types, q)
+        error = _pose_error(targets[k], frames[0, num_links - 1],
+                            orientation_weight)
+        error_norm = np.sqrt(np.dot(error, error))
+        lam = damping
+        for _ in range(max_iter):
+            if error_norm < tolerance or lam > 1e6:
+                break
+            J = jacobian(frames, axes, joint_types, active)[0]
+            J[3:6] *= orientation_weight
+            A = np.dot(J, J.T) + lam * lam * eye
+            dq = np.dot(J.T, np.linalg.solve(A, error))
+
+            q_new = q.copy()
+            for col in range(num_active):
+                i = active[col]
+                q_new[0, i] = min(max(q[0, i] + dq[col], lower[col]),
+                                  upper[col])
+            frames_new = link_frames(origins, axes, joint_types, q_new)
+            error_new = _pose_error(targets[k], frames_new[0, num_links - 1],
+                                    orientation_weight)
+            error_new_norm = np.sqrt(np.dot(error_new, error_new))
+            if error_new_norm < error_norm:
+                q = q_new
+                frames = frames_new
+                error = error_new
+                error_norm = error_new_norm
+                lam = max(0.5 * lam, 1e-6)
+            else:
+                lam *= 2.0
+        positions[k] = q[0]
+        errors[k] = error_norm
+    return positions, errors
+
+
+def inverse_kinematic_dls(chain,
+                          targets,
+                          initial_positions,
+                          max_iter=100,
+                          tolerance=1e-6,
+                          damping=0.1,
+                          orientation_weight=1.0):
+    """Computes the inverse kinematic of targets with damped least squares.
+
+    Args:
+        chain: The chain used for the Inverse kinematics.
+        targets: The desired targets, as a (m, 4, 4) array.
+        initial_positions: The initial poses of your chain, as a (n,) or
+            (m, n) array.
+        max_iter: Maximum number of iterations for each target.
+        tolerance: Norm of the pose error below which a target is solved.
+        damping: Initial damping of the least squares steps.
+        orientation_weight: Weight of the orientation error in the pose
+            error, in m/rad.
+
+    Returns:
+        The (m, n) joint positions and (m,) pose error norms.
+    """
+    targets = np.asarray(targets, dtype=np.float64).reshape(-1, 4, 4)
+    initial_positions = np.broadcast_to(
+        np.asarray(initial_positions, dtype=np.float64),
+        (targets.shape[0], len(chain.links)))
+
+    # Compute bounds
+    bounds = chain.active_from_full([link.bounds for link in chain.links])
+    lower = np.array([-np.inf if low is None else low for low, _ in bounds])
+    upper = np.array([np.inf if high is None else high for _, high in bounds])
+
+    kinematics = chain.kinematics
+    return damped_least_squares(
+        kinematics.origins, kinematics.axes, kinematics.joint_types,
+        kinematics.active, lower, upper, np.ascontiguousarray(targets),
+        np.ascontiguousarray(initial_positions), max_iter, tolerance,
+        damping, orientation_weight)
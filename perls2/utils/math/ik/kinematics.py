@@ -0,0 +1,327 @@
+"""This module implements compiled kinematics for a Chain.
+
+The chain is flattened into arrays of fixed joint origins, joint axes and
+joint types, so forward kinematics, the geometric jacobian and its time
+derivative are computed by numba kernels over many configurations at once.
+
+The frame of link i is Frame_{i-1} * Origin_i * Motion_i(q_i), where
+Origin_i is the fixed transform of the joint origin and Motion_i is the
+rotation (revolute) or translation (prismatic) along the joint axis.
+
+Jacobians are expressed in the base frame of the chain, for the origin of
+the last frame of the chain, with linear rows first.
+"""
+
+import numba
+import numpy as np
+
+import perls2.utils.math.geometry as geometry
+
+JOINT_FIXED = 0
+JOINT_REVOLUTE = 1
+JOINT_PRISMATIC = 2
+
+JOINT_TYPES = {
+    'fixed': JOINT_FIXED,
+    'revolute': JOINT_REVOLUTE,
+    'continuous': JOINT_REVOLUTE,
+    'prismatic': JOINT_PRISMATIC,
+}
+
+
+@numba.jit(nopython=True, cache=True)
+def link_frames(origins, axes, joint_types, positions):
+    """Compute the frame of every link for a batch of configurations.
+
+    Args:
+        origins: (n, 4, 4) fixed transforms of the joint origins.
+        axes: (n, 3) unit joint axes, in the joint frame.
+        joint_types: (n,) joint type ids.
+        positions: (m, n) joint positions.
+
+    Returns:
+        (m, n, 4, 4) link frames in the base frame.
+    """
+    num_configs, num_links = positions.shape
+    frames = np.empty((num_configs, num_links, 4, 4))
+    motion = np.eye(4)
+    for k in range(num_configs):
+        frame = np.eye(4)
+        for i in range(num_links):
+            frame = np.dot(frame, origins[i])
+            joint_type = joint_types[i]
+            if joint_type != JOINT_FIXED:
+                q = positions[k, i]
+                x, y, z = axes[i, 0], axes[i, 1], axes[i, 2]
+                motion[:] = 0.0
+                motion[3, 3] = 1.0
+                if joint_type == JOINT_REVOLUTE:
+                    c = np.cos(q)
+                    s = np.sin(q)
+                    t = 1.0 - c
+                    motion[0, 0] = t * x * x + c
+                    motion[0, 1] = t * x * y - s * z
+                    motion[0, 2] = t * x * z + s * y
+                    motion[1, 0] = t * x * y + s * z
+                    motion[1, 1] = t * y * y + c
+                    motion[1, 2] = t * y * z - s * x
+                    motion[2, 0] = t * x * z - s * y
+                    motion[2, 1] = t * y * z + s * x
+                    motion[2, 2] = t * z * z + c
+                else:
+                    motion[0, 0] = 1.0
+                    motion[1, 1] = 1.0
+                    motion[2, 2] = 1.0
+                    motion[0, 3] = q * x
+                    motion[1, 3] = q * y
+                    motion[2, 3] = q * z
+                frame = np.dot(frame, motion)
+            frames[k, i] = frame
+    return frames
+
+
+@numba.jit(nopython=True, cache=True)
+def _joint_axes_and_points(frames, axes, joint_types):
+    """World joint axes and joint origins of a batch of link frames.
+
+    The axis of a joint is unchanged by the motion of the joint, and so is
+    the origin of a revolute joint. For prismatic joints the joint point is
+    not used.
+    """
+    num_configs, num_links = frames.shape[0], frames.shape[1]
+    z = np.zeros((num_configs, num_links, 3))
+    p = np.zeros((num_configs, num_links, 3))
+    for k in range(num_configs):
+        for i in range(num_links):
+            if joint_types[i] == JOINT_FIXED:
+                continue
+            for r in range(3):
+                z[k, i, r] = (frames[k, i, r, 0] * axes[i, 0]
+                              + frames[k, i, r, 1] * axes[i, 1]
+                              + frames[k, i, r, 2] * axes[i, 2])
+                p[k, i, r] = frames[k, i, r, 3]
+    return z, p
+
+
+@numba.jit(nopython=True, cache=True)
+def jacobian(frames, axes, joint_types, active):
+    """Geometric jacobian of the last frame for a batch of link frames.
+
+    Args:
+        frames: (m, n, 4, 4) link frames from link_frames.
+        axes: (n, 3) unit joint axes, in the joint frame.
+        joint_types: (n,) joint type ids.
+        active: (n,) indices of the links with a jacobian column, in
+            column order. Columns of fixed joints are zero.
+
+    Returns:
+        (m, 6, len(active)) jacobians, linear rows first.
+    """
+    num_configs, num_links = frames.shape[0], frames.shape[1]
+    z, p = _joint_axes_and_points(frames, axes, joint_types)
+    J = np.zeros((num_configs, 6, active.shape[0]))
+    for k in range(num_configs):
+        p_e = frames[k, num_links - 1, :3, 3]
+        for col in range(active.shape[0]):
+            i = active[col]
+            z_i = z[k, i]
+            if joint_types[i] == JOINT_REVOLUTE:
+                r = p_e - p[k, i]
+                J[k, 0, col] = z_i[1] * r[2] - z_i[2] * r[1]
+                J[k, 1, col] = z_i[2] * r[0] - z_i[0] * r[2]
+                J[k, 2, col] = z_i[0] * r[1] - z_i[1] * r[0]
+                J[k, 3:6, col] = z_i
+            elif joint_types[i] == JOINT_PRISMATIC:
+                J[k, 0:3, col] = z_i
+    return J
+
+
+@numba.jit(nopython=True, cache=True)
+def jacobian_dot(frames, axes, joint_types, active, velocities):
+    """Time derivative of the geometric jacobian for a batch of link frames.
+
+    Args:
+        frames: (m, n, 4, 4) link frames from link_frames.
+        axes: (n, 3) unit joint axes, in the joint frame.
+        joint_types: (n,) joint type ids.
+        active: (n,) indices of the links with a jacobian column.
+        velocities: (m, n) joint velocities.
+
+    Returns:
+        (m, 6, len(active)) jacobian derivatives, linear rows first.
+    """
+    num_configs, num_links = frames.shape[0], frames.shape[1]
+    z, p = _joint_axes_and_points(frames, axes, joint_types)
+    Jdot = np.zeros((num_configs, 6, active.shape[0]))
+    omega = np.zeros(3)
+    z_dot = np.zeros((num_links, 3))
+    p_dot = np.zeros((num_links, 3))
+    p_e_dot = np.zeros(3)
+    for k in range(num_configs):
+        p_e = frames[k, num_links - 1, :3, 3]
+
+        # Angular velocity of each frame before the joint motion, giving the
+        # derivative of the joint axis, and the velocity of the joint point.
+        omega[:] = 0.0
+        p_e_dot[:] = 0.0
+        for i in range(num_links):
+            z_dot[i, 0] = omega[1] * z[k, i, 2] - omega[2] * z[k, i, 1]
+            z_dot[i, 1] = omega[2] * z[k, i, 0] - omega[0] * z[k, i, 2]
+            z_dot[i, 2] = omega[0] * z[k, i, 1] - omega[1] * z[k, i, 0]
+            p_dot[i] = 0.0
+            if joint_types[i] == JOINT_REVOLUTE:
+                omega += velocities[k, i] * z[k, i]
+        for j in range(num_links):
+            if joint_types[j] == JOINT_FIXED:
+                continue
+            qd = velocities[k, j]
+            z_j = z[k, j]
+            if joint_types[j] == JOINT_PRISMATIC:
+                for i in range(j + 1, num_links):
+                    p_dot[i] += qd * z_j
+                p_e_dot += qd * z_j
+                continue
+            for i in range(j + 1, num_links):
+                r = p[k, i] - p[k, j]
+                p_dot[i, 0] += qd * (z_j[1] * r[2] - z_j[2] * r[1])
+                p_dot[i, 1] += qd * (z_j[2] * r[0] - z_j[0] * r[2])
+                p_dot[i, 2] += qd * (z_j[0] * r[1] - z_j[1] * r[0])
+            r = p_e - p[k, j]
+            p_e_dot[0] += qd * (z_j[1] * r[2] - z_j[2] * r[1])
+            p_e_dot[1] += qd * (z_j[2] * r[0] - z_j[0] * r[2])
+            p_e_dot[2] += qd * (z_j[0] * r[1] - z_j[1] * r[0])
+
+        for col in range(active.shape[0]):
+            i = active[col]
+            if joint_types[i] == JOINT_REVOLUTE:
+                z_i = z[k, i]
+                zd = z_dot[i]
+                r = p_e - p[k, i]
+                rd = p_e_dot - p_dot[i]
+                Jdot[k, 0, col] = (zd[1] * r[2] - zd[2] * r[1]
+                                   + z_i[1] * rd[2] - z_i[2] * rd[1])
+                Jdot[k, 1, col] = (zd[2] * r[0] - zd[0] * r[2]
+                                   + z_i[2] * rd[0] - z_i[0] * rd[2])
+                Jdot[k, 2, col] = (zd[0] * r[1] - zd[1] * r[0]
+                                   + z_i[0] * rd[1] - z_i[1] * rd[0])
+                Jdot[k, 3:6, col] = zd
+            elif joint_types[i] == JOINT_PRISMATIC:
+                Jdot[k, 0:3, col] = z_dot[i]
+    return Jdot
+
+
+class ChainKinematics(object):
+    """Compiled kinematics of a Chain.
+
+    Joint positions and velocities are full vectors, with an entry for
+    every link of the chain as in Chain.forward_kinematics. All methods
+    accept a single configuration of shape (n,) or a batch of shape (m, n)
+    and return results with a matching leading batch dimension.
+
+    Attributes:
+        origins: (n, 4, 4) fixed transforms of the joint origins.
+        axes: (n, 3) unit joint axes, in the joint frame.
+        joint_types: (n,) joint type ids.
+        active: indices of the active links, giving the jacobian columns.
+    """
+
+    def __init__(self, chain):
+        """Initialize.
+
+        Args:
+            chain: The Chain to compute the kinematics of. Links without a
+                joint type, such as an OriginLink, are treated as fixed.
+        """
+        num_links = len(chain.links)
+        self.origins = np.tile(np.eye(4), (num_links, 1, 1))
+        self.axes = np.zeros((num_links, 3))
+        self.joint_types = np.zeros(num_links, dtype=np.int64)
+
+        for index, link in enumerate(chain.links):
+            joint_type = JOINT_TYPES[getattr(link, 'joint_type', 'fixed')]
+            if not hasattr(link, 'translation'):
+                continue
+            self.origins[index] = np.dot(
+                geometry.homogeneous_translation_matrix(*link.translation),
+                geometry.cartesian_to_homogeneous(
+                    geometry.rpy_matrix(*link.orientation)))
+            axis_norm = np.linalg.norm(link.rotation)
+            if joint_type == JOINT_FIXED or axis_norm == 0:
+                continue
+            self.axes[index] = link.rotation / axis_norm
+            self.joint_types[index] = joint_type
+
+        self.active = np.flatnonzero(chain.active_links).astype(np.int64)
+
+    @property
+    def num_links(self):
+        return self.joint_types.shape[0]
+
+    def _as_batch(self, values, name):
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape[-1] != self.num_links or values.ndim not in (1, 2):
+            raise ValueError('%s should be shaped (%d,) or (m, %d), got %s'
+                             % (name, self.num_links, self.num_links,
+                                values.shape))
+        return np.ascontiguousarray(values.reshape(-1, self.num_links))
+
+    def link_frames(self, positions):
+        """Returns the frame of every link in the base frame.
+
+        Args:
+            positions: (n,) or (m, n) joint positions.
+
+        Returns:
+            (n, 4, 4) or (m, n, 4, 4) link frames.
+        """
+        batch = self._as_batch(positions, 'positions')
+        frames = link_frames(
+            self.origins, self.axes, self.joint_types, batch)
+        return frames.reshape(np.shape(positions)[:-1] + frames.shape[1:])
+
+    def forward_kinematics(self, positions):
+        """Returns the transformation matrix of the last frame.
+
+        Args:
+            positions: (n,) or (m, n) joint positions.
+
+        Returns:
+            (4, 4) or (m, 4, 4) transformation matrices.
+        """
+        return self.link_frames(positions)[..., -1, :, :]
+
+    def jacobian(self, positions):
+        """Returns the geometric jacobian of the last frame.
+
+        Args:
+            positions: (n,) or (m, n) joint positions.
+
+        Returns:
+            (6, a) or (m, 6, a) jacobians with a column per active link.
+        """
+        batch = self._as_batch(positions, 'positions')
+        frames = link_frames(
+            self.origins, self.axes, self.joint_types, batch)
+        J = jacobian(frames, self.axes, self.joint_types, self.active)
+        return J.reshape(np.shape(positions)[:-1] + J.shape[1:])
+
+    def jacobian_dot(self, positions, velocities):
+        """Returns the time derivative of the geometric jacobian.
+
+        Args:
+            positions: (n,) or (m, n) joint positions.
+            velocities: joint velocities, shaped as positions.
+
+        Returns:
+            (6, a) or (m, 6, a) jacobian derivatives.
+        """
+        batch = self._as_batch(positions, 'positions')
+        velocity_batch = self._as_batch(velocities, 'velocities')
+        if velocity_batch.shape != batch.shape:
+            raise ValueError('velocities shape %s != positions shape %s'
+                             % (np.shape(velocities), np.shape(positions)))
+        frames = link_frames(
+            self.origins, self.axes, self.joint_types, batch)
+        Jdot = jacobian_dot(frames, self.axes, self.joint_types, self.active,
+                            velocity_batch)
+        return Jdot.reshape(np.shape(positions)[:-1] + Jdot.shape[1:])
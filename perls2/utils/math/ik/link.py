@@ -2,10 +2,8 @@
 """
 
 import numpy as np
-import sympy
 
-import perls.math.geometry as geometry
-import perls.simulation.ik.sym_geometry as sym_geometry
+import perls2.utils.math.geometry as geometry
 
 
 class Link(object):
@@ -55,11 +53,19 @@ class URDFLink(Link):
         of the "origin" element).
     rotation: The rotation axis of the link. (In URDF, attribute "xyz" of
         the "axis" element).
+    joint_type: The type of the joint, one of 'revolute', 'continuous',
+        'prismatic' or 'fixed'. (In URDF, attribute "type" of the "joint"
+        element). Defaults to revolute.
+    mass: Optional : The mass of the link moved by the joint. Defaults to 0.
+    center_of_mass: Optional : The center of mass of the link, in the
+        frame of the link. Defaults to the origin.
+    inertia: Optional : The 3x3 rotational inertia of the link about its
+        center of mass, in the frame of the link. Defaults to zero.
     angle_representation: Optionnal : The representation used by the
     angle. Currently supported representations : rpy. Defaults to rpy, the URDF
         standard.
     use_symbolic_matrix: wether the transformation matrix is stored as a
-        Numpy array or as a Sympy symbolic matrix.
+        Numpy array or as a Sympy symbolic matrix. Requires sympy.
 
     Returns:
         The link object.
@@ -72,18 +78,31 @@ class URDFLink(Link):
                  rotation,
                  bounds=(None, None),
                  angle_representation='rpy',
-                 use_symbolic_matrix=True):
+                 use_symbolic_matrix=True,
+                 joint_type='revolute',
+                 mass=0.0,
+                 center_of_mass=(0, 0, 0),
+                 inertia=None):
 
         Link.__init__(self, name=name, bounds=bounds)
         self.use_symbolic_matrix = use_symbolic_matrix
         self.translation = np.array(translation)
         self.orientation = np.array(orientation)
         self.rotation = np.array(rotation)
+        self.joint_type = joint_type
+        self.mass = float(mass)
+        self.center_of_mass = np.array(center_of_mass, dtype=np.float64)
+        if inertia is None:
+            inertia = np.zeros((3, 3))
+        self.inertia = np.array(inertia, dtype=np.float64)
 
         self._length = np.linalg.norm(translation)
         self._axis_length = self._length
 
         if use_symbolic_matrix:
+            import sympy
+            import perls2.utils.math.ik.sym_geometry as sym_geometry
+
             theta = sympy.symbols('theta')
 
             symbolic_frame_matrix = np.eye(4)
@@ -3,7 +3,7 @@ Symbolic geometry utility functions for computing IK
 """
 
 import sympy
-from perls.math.geometry import Rx_matrix, Rz_matrix
+from perls2.utils.math.geometry import Rx_matrix, Rz_matrix
 
 
 def symbolic_Rz_matrix(symbolic_theta):
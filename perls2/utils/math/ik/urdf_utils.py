@@ -3,8 +3,15 @@
 
 import xml.etree.ElementTree as ET
 
+import numpy as np
+
+import perls2.utils.math.geometry as geometry
 from .link import URDFLink
 
+# pybullet loads links without inertial parameters with a mass of 1 and a
+# unit inertia diagonal.
+PYBULLET_DEFAULT_INERTIAL = (1.0, (1.0, 1.0, 1.0))
+
 
 def find_next_joint(root, current_link, next_joint_name):
     """Find the next joint in the URDF tree
@@ -60,20 +67,169 @@ def find_next_link(root, current_joint, next_link_name):
     return has_next, next_link
 
 
+def find_chain_elements(root, base_link, tip_link):
+    """Find the links and joints from a base link to a tip link.
+
+    Args:
+        base_link: The name of the base link.
+        tip_link: The name of the tip link.
+
+    Returns:
+        The alternating list of link and joint names from the base link
+        to the tip link.
+    """
+    parent_joints = dict(
+        (joint.find('child').attrib['link'], joint)
+        for joint in root.iter('joint'))
+
+    elements = [tip_link]
+    while elements[0] != base_link:
+        if elements[0] not in parent_joints:
+            raise ValueError('Link %s is not a descendant of link %s'
+                             % (tip_link, base_link))
+        joint = parent_joints[elements[0]]
+        elements[0:0] = [joint.find('parent').attrib['link'],
+                         joint.attrib['name']]
+    return elements
+
+
+def parse_origin(element):
+    """Parse the origin of an URDF element.
+
+    Args:
+        element: The URDF element with an optional "origin" child.
+
+    Returns:
+        The translation and rpy orientation of the origin.
+    """
+    origin = element.find('origin')
+    if origin is None:
+        return [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]
+    translation = [float(x) for x in origin.attrib.get('xyz', '0 0 0').split()]
+    orientation = [float(x) for x in origin.attrib.get('rpy', '0 0 0').split()]
+    return translation, orientation
+
+
+def parse_inertial(urdf_link, default_inertial=None):
+    """Parse the inertial parameters of an URDF link.
+
+    Args:
+        urdf_link: The URDF link.
+        default_inertial: Optional : (mass, inertia diagonal) of a link
+            without inertial parameters, at the link origin. Defaults to
+            no mass.
+
+    Returns:
+        The mass, the center of mass in the link frame and the rotational
+        inertia about the center of mass in the link frame.
+    """
+    inertial = urdf_link.find('inertial')
+    if inertial is None:
+        if default_inertial is None:
+            return 0.0, np.zeros(3), np.zeros((3, 3))
+        mass, inertia_diagonal = default_inertial
+        return float(mass), np.zeros(3), np.diag(np.array(inertia_diagonal, dtype=np.float64))
+
+    mass = float(inertial.find('mass').attrib['value'])
+    translation, orientation = parse_origin(inertial)
+    values = dict((key, float(value))
+                  for key, value in inertial.find('inertia').attrib.items())
+    inertia = np.array([
+        [values['ixx'], values['ixy'], values['ixz']],
+        [values['ixy'], values['iyy'], values['iyz']],
+        [values['ixz'], values['iyz'], values['izz']]])
+    rotation = geometry.rpy_matrix(*orientation)
+    return mass, np.array(translation), np.dot(rotation, np.dot(inertia, rotation.T))
+
+
+def combine_inertials(inertials):
+    """Combine the inertial parameters of rigidly attached bodies.
+
+    Args:
+        inertials: List of (mass, center of mass, inertia about the center
+            of mass), all in the same frame.
+
+    Returns:
+        The mass, center of mass and inertia about the center of mass of
+        the combined body.
+    """
+    mass = sum(m for m, _, _ in inertials)
+    center_of_mass = np.zeros(3)
+    if mass > 0:
+        center_of_mass = sum(m * c for m, c, _ in inertials) / mass
+    inertia = np.zeros((3, 3))
+    for m, c, I in inertials:
+        # Parallel axis theorem.
+        d = c - center_of_mass
+        inertia += I + m * (np.dot(d, d) * np.eye(3) - np.outer(d, d))
+    return mass, center_of_mass, inertia
+
+
+def get_subtree_inertial(root, link_name, excluded_joints=(), default_inertial=None):
+    """Get the combined inertial parameters of a link and its descendants.
+
+    Joints of the subtree are taken at position zero.
+
+    Args:
+        link_name: The name of the link at the root of the subtree.
+        excluded_joints: Names of joints whose child subtrees are left out.
+        default_inertial: Optional : (mass, inertia diagonal) of links
+            without inertial parameters.
+
+    Returns:
+        The mass, center of mass and inertia about the center of mass of
+        the subtree, in the frame of the link.
+    """
+    urdf_links = dict((link.attrib['name'], link) for link in root.iter('link'))
+    inertials = [parse_inertial(urdf_links[link_name], default_inertial)]
+    for joint in root.iter('joint'):
+        if (joint.find('parent').attrib['link'] != link_name or
+                joint.attrib['name'] in excluded_joints):
+            continue
+        mass, center_of_mass, inertia = get_subtree_inertial(
+            root, joint.find('child').attrib['link'], excluded_joints,
+            default_inertial)
+        translation, orientation = parse_origin(joint)
+        rotation = geometry.rpy_matrix(*orientation)
+        inertials.append((
+            mass,
+            np.dot(rotation, center_of_mass) + translation,
+            np.dot(rotation, np.dot(inertia, rotation.T))))
+    return combine_inertials(inertials)
+
+
 def get_urdf_parameters(urdf_file, base_elements=['base_link'],
-                        last_link_offset=None, base_element_type='link'):
+                        last_link_offset=None, base_element_type='link',
+                        use_symbolic_matrix=True, tip_link=None,
+                        default_inertial=None):
     """Returns translated parameters from the given URDF file
 
+    The inertial parameters of each link moved by a joint of the chain
+    include the links attached to it outside of the chain, such as the
+    fingers of a gripper, at joint position zero.
+
     Args:
         urdf_file: The path of the URDF file.
         base_elements: List of the links beginning the chain.
         last_link_offset: Optional : The translation vector of the tip.
+        use_symbolic_matrix: Store the link transformation matrices as
+            Sympy symbolic matrices.
+        tip_link: Optional : The link ending the chain. The chain then
+            follows the URDF tree from the first base element to this
+            link. Defaults to following the base elements to a leaf link.
+        default_inertial: Optional : (mass, inertia diagonal) of links
+            without inertial parameters, such as PYBULLET_DEFAULT_INERTIAL.
+            Defaults to no mass.
     """
     tree = ET.parse(urdf_file)
     root = tree.getroot()
     base_elements = list(base_elements)
     if base_elements == []:
         raise ValueError('base_elements cannot be the empty list []')
+    if tip_link is not None:
+        if base_element_type != 'link':
+            raise ValueError('tip_link requires a link as base element')
+        base_elements = find_chain_elements(root, base_elements[0], tip_link)
 
     joints = []
     links = []
@@ -91,6 +247,8 @@ def get_urdf_parameters(urdf_file, base_elements=['base_link'],
     while(has_next):
         if base_elements != []:
             next_element = base_elements.pop(0)
+        elif tip_link is not None:
+            break
         else:
             next_element = None
 
@@ -111,23 +269,21 @@ def get_urdf_parameters(urdf_file, base_elements=['base_link'],
                 links.append(current_link)
 
     parameters = []
+    chain_joints = [joint.attrib['name'] for joint in joints]
 
     # Save the joints in the good format
     for joint in joints:
-        translation = joint.find('origin').attrib['xyz'].split()
-        orientation = joint.find('origin').attrib['rpy'].split()
-        rotation = joint.find('axis').attrib['xyz'].split()
-
-        translation = [
-                float(translation[0]),
-                float(translation[1]),
-                float(translation[2])
-                ]
-        orientation = [
-                float(orientation[0]),
-                float(orientation[1]),
-                float(orientation[2])
-                ]
+        # Missing origin and axis elements default to the URDF defaults.
+        # Fixed joints do not rotate about their axis.
+        translation, orientation = parse_origin(joint)
+        axis = joint.find('axis')
+        if joint.attrib['type'] == 'fixed':
+            rotation = ['0', '0', '0']
+        elif axis is None:
+            rotation = ['1', '0', '0']
+        else:
+            rotation = axis.attrib['xyz'].split()
+
         rotation = [
                 float(rotation[0]),
                 float(rotation[1]),
@@ -136,17 +292,28 @@ def get_urdf_parameters(urdf_file, base_elements=['base_link'],
 
         if joint.attrib['type'] == 'fixed':
             bounds = (0.0, 0.0)
+        elif joint.attrib['type'] == 'continuous':
+            bounds = (None, None)
         else:
             lower_limit = joint.find('limit').attrib['lower']
             upper_limit = joint.find('limit').attrib['upper']
             bounds = (float(lower_limit), float(upper_limit))
 
+        mass, center_of_mass, inertia = get_subtree_inertial(
+            root, joint.find('child').attrib['link'], chain_joints,
+            default_inertial)
+
         link = URDFLink(
             translation=translation,
             orientation=orientation,
             rotation=rotation,
             bounds=bounds,
-            name=joint.attrib['name'])
+            name=joint.attrib['name'],
+            use_symbolic_matrix=use_symbolic_matrix,
+            joint_type=joint.attrib['type'],
+            mass=mass,
+            center_of_mass=center_of_mass,
+            inertia=inertia)
         parameters.append(link)
 
     # Add last_link_offset to parameters
@@ -155,7 +322,10 @@ def get_urdf_parameters(urdf_file, base_elements=['base_link'],
             translation=last_link_offset,
             orientation=[0, 0, 0],
             rotation=[0, 0, 0],
-            name='last_joint')
+            bounds=(0.0, 0.0),
+            name='last_joint',
+            use_symbolic_matrix=use_symbolic_matrix,
+            joint_type='fixed')
         parameters.append(link)
 
     return parameters
@@ -0,0 +1,47 @@
+"""Memory mapped files shared by a parent process and its workers.
+
+The parent creates the file, maps it and sends its path to the workers,
+which map it too. The file is removed once every worker has mapped it, so
+nothing is left behind if a process dies.
+"""
+import os
+import mmap
+import tempfile
+
+DEFAULT_SHM_DIR = '/dev/shm'
+
+# Byte alignment of each buffer in the shared memory.
+BUFFER_ALIGNMENT = 64
+
+
+def aligned_size(size):
+    """Size in bytes rounded up to the next BUFFER_ALIGNMENT.
+    """
+    return -(-size // BUFFER_ALIGNMENT) * BUFFER_ALIGNMENT
+
+
+def create_shared_file(prefix, size, shm_dir=None):
+    """Create and map a file for shared buffers.
+
+    Args:
+        prefix (str): prefix of the file name.
+        size (int): size of the file in bytes.
+        shm_dir (str): directory of the file. Defaults to /dev/shm if it
+            exists, otherwise the temp directory.
+
+    Returns:
+        (mmap.mmap, str): the mapped file and its path. The caller removes
+            the file once all workers have mapped it.
+    """
+    if shm_dir is None:
+        shm_dir = DEFAULT_SHM_DIR if os.path.isdir(DEFAULT_SHM_DIR) else tempfile.gettempdir()
+    fd, shm_path = tempfile.mkstemp(prefix=prefix, dir=shm_dir)
+    try:
+        os.ftruncate(fd, size)
+        mm = mmap.mmap(fd, size)
+    except Exception:
+        os.close(fd)
+        os.remove(shm_path)
+        raise
+    os.close(fd)
+    return mm, shm_path
@@ -0,0 +1,21 @@
+"""Token identifying the current simulation step, for state caches.
+"""
+
+
+class SimStepToken(object):
+    """Counter bumped whenever the simulation state changes.
+
+    Interfaces cache states computed from pybullet along with the token
+    value, and recompute them once it has been bumped. A BulletWorld owns
+    one token, shared by the interfaces it creates.
+
+    Attributes:
+        value (int): current simulation step.
+    """
+    def __init__(self):
+        self.value = 0
+
+    def bump(self):
+        """Invalidate states cached for the previous value.
+        """
+        self.value += 1
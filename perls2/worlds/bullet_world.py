@@ -14,7 +14,10 @@ from perls2.worlds.world import World
 from perls2.arenas.bullet_arena import BulletArena
 from perls2.robots.bullet_robot_interface import BulletRobotInterface
 from perls2.sensors.bullet_camera_interface import BulletCameraInterface
+from perls2.sensors.async_bullet_renderer import AsyncBulletRenderer
 from perls2.objects.bullet_object_interface import BulletObjectInterface
+from perls2.objects.bullet_object_registry import BulletObjectRegistry
+from perls2.utils.sim_step_token import SimStepToken
 
 
 class BulletWorld(World):
@@ -33,13 +36,29 @@ class BulletWorld(World):
         camera_interface (BulletCameraInterface): Retrieves camera images and
             executes changes to params (e.g. intrinsics/extrinsics)
 
+        camera_interfaces (dict): BulletCameraInterfaces keyed by name, the
+            camera_interface as 'camera' and any additional cameras in
+            config['sensor']['cameras'].
+
+        async_renderer (AsyncBulletRenderer): Renders the camera images in
+            worker processes if config['sensor']['async_render'] is set,
+            otherwise None.
+
         object_interfaces (dict): A dictionary of perls2.BulletObjectInterfaces currently in the simulation.
             Keys are string unique identifying names for the object.
 
+        object_registry (BulletObjectRegistry): states of all objects, read
+            in one pass at most once per step. See poses, velocities and
+            set_poses.
+
         physics_id (int): Unique id identifying physics client for Pybullet.
             Used to connect other interfaces when working with multiple
             simulations.
 
+        sim_step (SimStepToken): token of the current simulation step, shared
+            by the interfaces to key their state caches. Bumped whenever the
+            simulation is stepped or its state is restored.
+
         time_step: float
             Float defining timestep to increment Pybullet simulation during
             pybullet.stepSimulation() calls. Set in config file
@@ -110,25 +129,23 @@ class BulletWorld(World):
 
         self.controller_dict = self.config['controller']['Bullet']
 
+        self.sim_step = SimStepToken()
         self.robot_interface = BulletRobotInterface.create(
             config=self.config,
             physics_id=self._physics_id,
             arm_id=self.arena.arm_id,
             controlType=self.config['controller']['selected_type'])
+        self.robot_interface.sim_step = self.sim_step
 
         self.control_freq = self.config['control_freq']
+        self.camera_interfaces = {}
+        self.async_renderer = None
         if self.has_camera:
-            self.camera_interface = BulletCameraInterface(
-                physics_id=self._physics_id,
-                image_height=self.config['sensor']['camera']['image']['height'],
-                image_width=self.config['sensor']['camera']['image']['width'],
-                near=self.config['sensor']['camera']['intrinsics']['near_plane'],
-                far=self.config['sensor']['camera']['intrinsics']['far_plane'],
-                fov=self.config['sensor']['camera']['intrinsics']['fov'],
-                cameraEyePosition=self.config['sensor']['camera']['extrinsics']['eye_position'],
-                cameraTargetPosition=self.config['sensor']['camera']['extrinsics']['target_position'],
-                cameraUpVector=self.config['sensor']['camera']['extrinsics']['up_vector'])
+            self._load_camera_interfaces()
 
+        self.object_interfaces = {}
+        self.object_registry = BulletObjectRegistry(self._physics_id)
+        self.object_registry.sim_step = self.sim_step
         if self.has_object:
             self._load_object_interfaces()
         self.name = name
@@ -145,20 +162,17 @@ class BulletWorld(World):
         """ Reinitialize arenas, robot interfaces etc after reconnecting.
         """
         self.set_pb_physics()
-        self.arena = BulletArena(self.config, self._physics_id)
+        self.arena = BulletArena(self.config, self._physics_id, has_camera=self.has_camera)
 
         self.robot_interface = BulletRobotInterface.create(
             config=self.config,
             physics_id=self._physics_id,
             arm_id=self.arena.arm_id,
             controlType=self.config['controller']['selected_type'])
-        self.camera_interface = BulletCameraInterface(
-            physics_id=self._physics_id,
-            image_height=self.config['sensor']['camera']['image']['height'],
-            image_width=self.config['sensor']['camera']['image']['width'],
-            cameraEyePosition=self.config['sensor']['camera']['extrinsics']['eye_position'],
-            cameraTargetPosition=self.config['sensor']['camera']['extrinsics']['target_position'],
-            cameraUpVector=self.config['sensor']['camera']['extrinsics']['up_vector'])
+        self.robot_interface.sim_step = self.sim_step
+        if self.has_camera:
+            self._load_camera_interfaces()
+        self.object_registry.physics_id = self._physics_id
         self._load_object_interfaces()
         self.is_sim = True
 
@@ -173,20 +187,73 @@ class BulletWorld(World):
         pybullet.setTimeStep(self._time_step, physicsClientId=self._physics_id)
         pybullet.setPhysicsEngineParameter(deterministicOverlappingPairs=1, physicsClientId=self._physics_id)
 
+    def _create_camera_interface(self, name, camera_cfg):
+        """ Create a camera interface from a camera config.
+
+        Args:
+            name (str): name of the camera.
+            camera_cfg (dict): config with image, intrinsics and extrinsics,
+                as config['sensor']['camera']. Buffers are reused if
+                camera_cfg['reuse_buffers'] is set.
+        """
+        return BulletCameraInterface(
+            physics_id=self._physics_id,
+            image_height=camera_cfg['image']['height'],
+            image_width=camera_cfg['image']['width'],
+            near=camera_cfg['intrinsics']['near_plane'],
+            far=camera_cfg['intrinsics']['far_plane'],
+            fov=camera_cfg['intrinsics']['fov'],
+            cameraEyePosition=camera_cfg['extrinsics']['eye_position'],
+            cameraTargetPosition=camera_cfg['extrinsics']['target_position'],
+            cameraUpVector=camera_cfg['extrinsics']['up_vector'],
+            name=name,
+            reuse_buffers=camera_cfg.get('reuse_buffers', False))
+
+    def _load_camera_interfaces(self):
+        """ Create the camera interfaces, and the async renderer if
+        config['sensor']['async_render'] is set.
+
+        async_render may be True, or a dict with the num_workers of the
+        renderer.
+        """
+        sensor_cfg = self.config['sensor']
+        self.camera_interface = self._create_camera_interface('camera', sensor_cfg['camera'])
+        self.camera_interfaces = {'camera': self.camera_interface}
+        for name, camera_cfg in (sensor_cfg.get('cameras') or {}).items():
+            if name in self.camera_interfaces:
+                raise ValueError("Camera name {} is already used.".format(name))
+            self.camera_interfaces[name] = self._create_camera_interface(name, camera_cfg)
+
+        if self.async_renderer is not None:
+            self.async_renderer.close()
+            self.async_renderer = None
+        async_cfg = sensor_cfg.get('async_render', False)
+        if async_cfg:
+            num_workers = async_cfg.get('num_workers') if isinstance(async_cfg, dict) else None
+            self.async_renderer = AsyncBulletRenderer(
+                self.config, self._physics_id, list(self.camera_interfaces.values()),
+                num_workers=num_workers)
+            for camera_interface in self.camera_interfaces.values():
+                camera_interface.async_renderer = self.async_renderer
+
     def _load_object_interfaces(self):
         """ Create a dictionary of object interfaces.
 
         Uses arena to create object interfaces for each object.
         """
         self.object_interfaces = {}
+        self.object_registry.clear()
 
         # Create object interfaces for each of the objects found in the arena
         # dictionary
         for obj_idx, obj_name in enumerate(self.arena.object_dict):
+            self.object_registry.add(obj_name, self.arena.object_dict[obj_name])
             self.object_interfaces[obj_name] = BulletObjectInterface(
                 physics_id=self._physics_id,
                 obj_id=self.arena.object_dict[obj_name],
-                name=obj_name)
+                name=obj_name,
+                registry=self.object_registry,
+                clear_state_cache=self.clear_state_cache)
 
     def add_object(self, path, name, pose, scale=1.0, is_static=False):
         """ Add object to world explicitly.
@@ -212,15 +279,21 @@ class BulletWorld(World):
                                               scale=scale,
                                               is_static=False)
         self.arena.object_dict[name] = obj_id
+        self.object_registry.add(name, obj_id)
 
         # Create the BulletObject Interface
         object_interface = BulletObjectInterface(
             physics_id=self._physics_id,
             obj_id=obj_id,
-            name=name)
+            name=name,
+            registry=self.object_registry,
+            clear_state_cache=self.clear_state_cache)
         # Add to Objects dictionary
         self.object_interfaces[name] = object_interface
 
+        if self.async_renderer is not None:
+            self.async_renderer.add_object(obj_id, path, name, pose, scale, is_static=False)
+
         return object_interface
 
     def remove_object(self, name):
@@ -235,6 +308,10 @@ class BulletWorld(World):
         except KeyError:
             raise KeyError('Invalid name -- object interface not found')
         self.arena._remove_object(objectI.obj_id, objectI.physics_id)
+        if name in self.object_registry:
+            self.object_registry.remove(name)
+        if self.async_renderer is not None:
+            self.async_renderer.remove_object(objectI.obj_id)
 
     def reset(self):
         """Reset the world.
@@ -259,7 +336,9 @@ class BulletWorld(World):
             self._physics_id = pybullet.connect(pybullet.DIRECT)
         self.arena.physics_id = self._physics_id
         self.robot_interface.physics_id = self._physics_id
-        self.camera_interface.physics_id = self._physics_id
+        self.object_registry.physics_id = self._physics_id
+        for camera_interface in self.camera_interfaces.values():
+            camera_interface.set_physics_id(self._physics_id)
 
     def reboot(self):
         """ Reboot pybullet simulation by clearing all objects, urdfs and
@@ -271,6 +350,18 @@ class BulletWorld(World):
         pybullet.resetSimulation(physicsClientId=self._physics_id)
         self._reinitialize()
 
+    def clear_state_cache(self):
+        """Invalidate the states cached for the current simulation step.
+
+        Bumps sim_step, which clears the robot and object states, and
+        discards the frames requested from the async_renderer. Call after
+        changing the simulation state directly, e.g. with
+        pybullet.restoreState.
+        """
+        self.sim_step.bump()
+        if self.async_renderer is not None:
+            self.async_renderer.discard()
+
     def step(self, start=None):
         """Step the world(simulation) forward.
 
@@ -281,6 +372,10 @@ class BulletWorld(World):
 
         Step simulation forward a number of times per action
         to ensure smoothness when for collisions
+
+        With an async_renderer, the camera images of the new state are
+        requested at the end of the step and rendered while the rest of the
+        observation is computed.
         """
 
         # Prepare for next step by executing action
@@ -288,7 +383,45 @@ class BulletWorld(World):
         for exec_steps in range(self.ctrl_steps_per_action):
             self.robot_interface.step()
             pybullet.stepSimulation(physicsClientId=self._physics_id)
+            self.clear_state_cache()
         self.step_counter += 1
+        if self.async_renderer is not None:
+            self.async_renderer.request()
+
+    def poses(self, names=None):
+        """Poses of objects in the world frame.
+
+        Args:
+            names (list): names of the objects. Defaults to all objects, in
+                the order of object_registry.names.
+
+        Returns:
+            (n, 7) ndarray of [x, y, z, qx, qy, qz, w] poses.
+        """
+        return self.object_registry.poses(names)
+
+    def velocities(self, names=None):
+        """Velocities of objects in the world frame.
+
+        Args:
+            names (list): names of the objects. Defaults to all objects, in
+                the order of object_registry.names.
+
+        Returns:
+            (n, 6) ndarray of [vx, vy, vz, wx, wy, wz] velocities.
+        """
+        return self.object_registry.velocities(names)
+
+    def set_poses(self, names, poses):
+        """Reset the poses of objects. Does not check for collisions.
+
+        Args:
+            names (list): names of the objects.
+            poses (ndarray): (n, 7) [x, y, z, qx, qy, qz, w] poses in the
+                world frame.
+        """
+        self.object_registry.set_poses(names, poses)
+        self.clear_state_cache()
 
     def visualize(self, observation, action):
         """Visualize the action.
@@ -315,19 +448,16 @@ class BulletWorld(World):
         within respectives thresholds of 0.
 
         Args:
-            linear_velocity_threshold (float)
-            angular_velocity_threshold (float)
+            linear_velocity_threshold (float): max linear speed (m/s)
+            angular_velocity_threshold (float): max angular speed (rad/s)
             check_after_steps (int): min number of steps to wait before
                 checking object state
-            min_stable_step (int): min number of steps for object to be stable
-                before exiting
+            min_stable_steps (int): min number of consecutive steps for all
+                objects to be stable before exiting
             max_steps (int): max number of steps to wait for stable object
 
         Returns:
             None
-
-        :TODO:
-            * add check for angular velocity threshold
         """
         assert self.is_sim, 'This function is only used in simulation.'
 
@@ -338,19 +468,17 @@ class BulletWorld(World):
 
         while(1):
             pybullet.stepSimulation(physicsClientId=self._physics_id)
+            self.clear_state_cache()
             num_steps += 1
-            all_stable = True
 
             if num_steps < check_after_steps:
                 continue
 
-            for obj_idx, obj_key in enumerate(self.object_interfaces):
-                if (np.linalg.norm(self.object_interfaces[obj_key].linear_velocity) >=
-                        linear_velocity_threshold):
-                    all_stable = False
-
-                if all_stable:
-                    num_stable_steps +=1
+            if self.object_registry.is_stable(linear_velocity_threshold,
+                                              angular_velocity_threshold):
+                num_stable_steps += 1
+            else:
+                num_stable_steps = 0
 
             if ((num_stable_steps >= min_stable_steps) or (num_steps >= max_steps)):
 
@@ -374,4 +502,5 @@ class BulletWorld(World):
                 world / config, rather than trying to load an empty world.
         """
         pybullet.restoreState(fileName=filepath, physicsClientId=self.physics_id)
+        self.clear_state_cache()
 